@@ -25,12 +25,13 @@ from .config import Configuration
 from .entrypoint import EntryPoint
 from .lane import Facets, Pagination
 from .log import LogConfiguration
-from .model import Complaint, Identifier, Patron, get_one
+from .model import Complaint, Identifier, Patron, SessionManager, get_one
 from .opds import AcquisitionFeed, LookupAcquisitionFeed
 from .problem_details import *
 from .util.flask_util import OPDSFeedResponse, problem
 from .util.opds_writer import OPDSFeed, OPDSMessage
 from .util.problem_detail import ProblemDetail
+from .util.query_profile import QueryProfile
 
 
 def cdn_url_for(*args, **kwargs):
@@ -161,6 +162,24 @@ def compressible(f):
     return compressor
 
 
+def profile_sql_queries(app):
+    """Profile the SQL statements run while handling each request to
+    `app`, if profiling is turned on through QueryProfile.
+    """
+
+    @app.before_request
+    def start_query_profile():
+        flask.g.query_profile = QueryProfile.start(
+            "%s %s" % (flask.request.method, flask.request.path)
+        )
+
+    @app.teardown_request
+    def stop_query_profile(exception=None):
+        profile = flask.g.pop("query_profile", None)
+        if profile:
+            profile.stop()
+
+
 class ErrorHandler(object):
     def __init__(self, app, debug=False):
         """Constructor.
@@ -375,13 +394,37 @@ class URNLookupHandler(object):
             or Response.
 
         """
-        identifiers_by_urn, failures = Identifier.parse_urns(self._db, urns)
+        identifiers_by_urn, failures = self.parse_urns(urns)
         self.add_urn_failure_messages(failures)
 
         for urn, identifier in list(identifiers_by_urn.items()):
             self.process_identifier(identifier, urn, **process_urn_kwargs)
         self.post_lookup_hook()
 
+    def parse_urns(self, urns):
+        """Find the Identifiers for a list of URNs.
+
+        The Identifiers are looked up on a read replica if possible.
+        A replica may be behind, so any URN it doesn't know about is
+        looked up (and if necessary, created) in the primary database.
+
+        :return: A 2-tuple (identifiers_by_urn, failures), as with
+            Identifier.parse_urns.
+        """
+        with SessionManager.read_only_session(self._db) as reader:
+            if reader is self._db:
+                return Identifier.parse_urns(self._db, urns)
+            found, missing = Identifier.parse_urns(reader, urns, autocreate=False)
+            identifiers_by_urn = dict(
+                (urn, self._db.merge(identifier, load=False))
+                for urn, identifier in found.items()
+            )
+        if not missing:
+            return identifiers_by_urn, []
+        more, failures = Identifier.parse_urns(self._db, missing)
+        identifiers_by_urn.update(more)
+        return identifiers_by_urn, failures
+
     def add_urn_failure_messages(self, failures):
         for urn in failures:
             self.add_message(urn, 400, INVALID_URN.detail)
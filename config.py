@@ -83,6 +83,31 @@ class Configuration(ConfigurationConstants):
     DATABASE_TEST_ENVIRONMENT_VARIABLE = "SIMPLIFIED_TEST_DATABASE"
     DATABASE_PRODUCTION_ENVIRONMENT_VARIABLE = "SIMPLIFIED_PRODUCTION_DATABASE"
 
+    # Environment variables that contain comma-separated URLs to
+    # read-only replicas of the database.
+    DATABASE_TEST_REPLICAS_ENVIRONMENT_VARIABLE = "SIMPLIFIED_TEST_DATABASE_REPLICAS"
+    DATABASE_PRODUCTION_REPLICAS_ENVIRONMENT_VARIABLE = (
+        "SIMPLIFIED_PRODUCTION_DATABASE_REPLICAS"
+    )
+
+    # A replica that's more than this many seconds behind the primary
+    # database won't be used.
+    DATABASE_MAX_REPLICA_LAG_ENVIRONMENT_VARIABLE = (
+        "SIMPLIFIED_DATABASE_MAX_REPLICA_LAG"
+    )
+    DEFAULT_MAX_REPLICA_LAG = 30
+
+    # Environment variables that configure the database connection
+    # pool each process keeps for each database.
+    DATABASE_POOL_SIZE_ENVIRONMENT_VARIABLE = "SIMPLIFIED_DATABASE_POOL_SIZE"
+    DATABASE_MAX_OVERFLOW_ENVIRONMENT_VARIABLE = "SIMPLIFIED_DATABASE_MAX_OVERFLOW"
+    DATABASE_POOL_TIMEOUT_ENVIRONMENT_VARIABLE = "SIMPLIFIED_DATABASE_POOL_TIMEOUT"
+    DATABASE_POOL_RECYCLE_ENVIRONMENT_VARIABLE = "SIMPLIFIED_DATABASE_POOL_RECYCLE"
+    DATABASE_POOL_PRE_PING_ENVIRONMENT_VARIABLE = "SIMPLIFIED_DATABASE_POOL_PRE_PING"
+    DATABASE_STATEMENT_TIMEOUT_ENVIRONMENT_VARIABLE = (
+        "SIMPLIFIED_DATABASE_STATEMENT_TIMEOUT"
+    )
+
     # The version of the app.
     APP_VERSION = "app_version"
     VERSION_FILENAME = ".version"
@@ -502,6 +527,71 @@ class Configuration(ConfigurationConstants):
         logging.info("Connecting to database: %s" % url_obj.__to_string__())
         return url
 
+    @classmethod
+    def database_replica_urls(cls):
+        """Find the URLs of the read-only replicas of the database
+        configured for this site.
+
+        :return: A list of URLs, possibly empty.
+        """
+        if os.environ.get("TESTING", False):
+            environment_variable = cls.DATABASE_TEST_REPLICAS_ENVIRONMENT_VARIABLE
+        else:
+            environment_variable = cls.DATABASE_PRODUCTION_REPLICAS_ENVIRONMENT_VARIABLE
+        value = os.environ.get(environment_variable) or ""
+        return [url.strip() for url in value.split(",") if url.strip()]
+
+    @classmethod
+    def database_max_replica_lag(cls):
+        """How far behind the primary database, in seconds, a replica
+        may be before it stops being used.
+        """
+        value = os.environ.get(cls.DATABASE_MAX_REPLICA_LAG_ENVIRONMENT_VARIABLE)
+        if not value:
+            return cls.DEFAULT_MAX_REPLICA_LAG
+        try:
+            return float(value)
+        except ValueError:
+            raise CannotLoadConfiguration(
+                "Expected a number in environment variable %s, got %r."
+                % (cls.DATABASE_MAX_REPLICA_LAG_ENVIRONMENT_VARIABLE, value)
+            )
+
+    @classmethod
+    def database_pool_settings(cls):
+        """Find the configured settings for database connection pools.
+
+        :return: A dictionary of keyword arguments for
+            SessionManager.engine(). Settings that aren't configured
+            are left out, so the defaults are used.
+        """
+        settings = dict()
+        for key, environment_variable in (
+            ("pool_size", cls.DATABASE_POOL_SIZE_ENVIRONMENT_VARIABLE),
+            ("max_overflow", cls.DATABASE_MAX_OVERFLOW_ENVIRONMENT_VARIABLE),
+            ("pool_timeout", cls.DATABASE_POOL_TIMEOUT_ENVIRONMENT_VARIABLE),
+            ("pool_recycle", cls.DATABASE_POOL_RECYCLE_ENVIRONMENT_VARIABLE),
+            (
+                "statement_timeout",
+                cls.DATABASE_STATEMENT_TIMEOUT_ENVIRONMENT_VARIABLE,
+            ),
+        ):
+            value = os.environ.get(environment_variable)
+            if not value:
+                continue
+            try:
+                settings[key] = int(value)
+            except ValueError:
+                raise CannotLoadConfiguration(
+                    "Expected a number in environment variable %s, got %r."
+                    % (environment_variable, value)
+                )
+
+        pre_ping = os.environ.get(cls.DATABASE_POOL_PRE_PING_ENVIRONMENT_VARIABLE)
+        if pre_ping:
+            settings["pool_pre_ping"] = pre_ping.lower() in ("true", "1", "yes")
+        return settings
+
     @classmethod
     def app_version(cls):
         """Returns the git version of the app, if a .version file exists."""
@@ -1,5 +1,6 @@
 import logging
 import traceback
+from collections import defaultdict
 
 from sqlalchemy.orm.session import Session
 from sqlalchemy.sql.functions import func
@@ -10,6 +11,7 @@ from .model import (
     BaseCoverageRecord,
     Collection,
     CollectionMissing,
+    CoverageQueueItem,
     CoverageRecord,
     DataSource,
     Edition,
@@ -17,13 +19,19 @@ from .model import (
     Identifier,
     LicensePool,
     PresentationCalculationPolicy,
+    PresentationInputs,
+    SessionManager,
     Timestamp,
     Work,
     WorkCoverageRecord,
+    estimated_count,
     get_one,
     get_one_or_create,
 )
+from .util.adaptive_batch import AdaptiveBatchSize
 from .util.datetime_helpers import utc_now
+from .util.job_metrics import JobMetrics
+from .util.query_profile import QueryProfile
 from .util.worker_pools import DatabaseJob
 
 
@@ -93,10 +101,24 @@ class CoverageProviderProgress(TimestampData):
         # a single run of the CoverageProvider.
         self.offset = 0
 
+        # When items are processed in order of ID, this is the ID of
+        # the last item processed so far. Like the offset, it's only
+        # meaningful within a single run.
+        self.last_id = None
+
+        # If this is set, only items with IDs up to and including this
+        # one will be processed. Together with last_id, this lets the
+        # work be divided into disjoint ID ranges.
+        self.end_id = None
+
         self.successes = 0
         self.transient_failures = 0
         self.persistent_failures = 0
 
+        # If the CoverageProvider adjusts its batch size as it runs,
+        # this describes the batches it used.
+        self.batch_summary = None
+
     @property
     def achievements(self):
         """Represent the achievements of a CoverageProvider as a
@@ -104,12 +126,15 @@ class CoverageProviderProgress(TimestampData):
         """
         template = "Items processed: %d. Successes: %d, transient failures: %d, persistent failures: %d"
         total = self.successes + self.transient_failures + self.persistent_failures
-        return template % (
+        achievements = template % (
             total,
             self.successes,
             self.transient_failures,
             self.persistent_failures,
         )
+        if self.batch_summary:
+            achievements += ". " + self.batch_summary
+        return achievements
 
     @achievements.setter
     def achievements(self, value):
@@ -153,6 +178,29 @@ class BaseCoverageProvider(object):
     # doing this.
     DEFAULT_BATCH_SIZE = 100
 
+    # If this is set, the batch size will be adjusted as the provider
+    # runs, so that each batch takes about this many seconds. The
+    # batch size will stay between MIN_BATCH_SIZE and MAX_BATCH_SIZE.
+    TARGET_BATCH_SECONDS = None
+    MIN_BATCH_SIZE = 1
+    MAX_BATCH_SIZE = None
+
+    # Before run() starts working through the items that need
+    # coverage, it logs how many there are. EXACT_COUNT runs a COUNT
+    # query, which can take a long time when there are millions of
+    # items. ESTIMATED_COUNT asks the query planner for an estimate
+    # instead, and NO_COUNT doesn't count them at all.
+    EXACT_COUNT = "exact"
+    ESTIMATED_COUNT = "estimated"
+    NO_COUNT = None
+    COUNT_ITEMS = EXACT_COUNT
+
+    # If this is True and the provider has an item_id_column, the
+    # items that need coverage are processed in order of ID, and each
+    # batch picks up where the last one left off. Otherwise, each batch
+    # is found with LIMIT/OFFSET, which gets slower as the offset grows.
+    KEYSET_PAGINATION = True
+
     def __init__(
         self,
         _db,
@@ -184,10 +232,14 @@ class BaseCoverageProvider(object):
         if not batch_size or batch_size < 0:
             batch_size = self.DEFAULT_BATCH_SIZE
         self.batch_size = batch_size
+        self.batch_sizer = AdaptiveBatchSize.for_object(self, batch_size)
         self.cutoff_time = cutoff_time
         self.registered_only = registered_only
         self.collection_id = None
 
+        # A JobMetrics measuring the current run, if any.
+        self.metrics = None
+
     @property
     def log(self):
         if not hasattr(self, "_log"):
@@ -203,6 +255,33 @@ class BaseCoverageProvider(object):
             return None
         return get_one(self._db, Collection, id=self.collection_id)
 
+    @property
+    def item_id_column(self):
+        """The column that holds the IDs of the items this provider
+        covers, or None if the items can't be processed in order of ID.
+
+        Implemented in IdentifierCoverageProvider and
+        WorkCoverageProvider.
+        """
+        return None
+
+    @property
+    def queue_column(self):
+        """The CoverageQueueItem column that holds the IDs of the items
+        on this provider's queue.
+
+        Implemented in IdentifierCoverageProvider and
+        WorkCoverageProvider.
+        """
+        return None
+
+    @property
+    def queue(self):
+        """The keyword arguments that identify this provider's queue to
+        CoverageQueueItem.claim().
+        """
+        return dict(operation=self.operation)
+
     @property
     def operation(self):
         """Which operation should this CoverageProvider use to
@@ -229,6 +308,11 @@ class BaseCoverageProvider(object):
         ]
         start_time = utc_now()
         timestamp = self.timestamp
+        self.metrics = JobMetrics.for_job(
+            JobMetrics.COVERAGE_PROVIDER,
+            self,
+            previous_finish=timestamp.finish if timestamp else None,
+        )
 
         # We'll use this TimestampData object to track our progress
         # as we grant coverage to items.
@@ -244,6 +328,7 @@ class BaseCoverageProvider(object):
             # at the start of the database table.
             original_finish = progress.finish = None
             progress.offset = 0
+            progress.last_id = None
 
             # Call run_once() until we get an exception or
             # progress.finish is set.
@@ -281,6 +366,12 @@ class BaseCoverageProvider(object):
                 if not progress.exception:
                     progress.finish = original_finish
 
+        self.metrics.successes = progress.successes
+        self.metrics.transient_failures = progress.transient_failures
+        self.metrics.persistent_failures = progress.persistent_failures
+        self.metrics.failed = bool(progress.exception)
+        self.metrics.export()
+
         # TODO: We should be able to return a list of progress objects,
         # not just one.
         return progress
@@ -340,19 +431,49 @@ class BaseCoverageProvider(object):
         )
 
         qu = self.items_that_need_coverage(count_as_covered=count_as_covered)
-        self.log.info("%d items need coverage%s", qu.count(), count_as_covered_message)
-        batch = qu.limit(self.batch_size).offset(progress.offset)
 
-        if not batch.count():
+        # If the caller wants to skip some number of items -- perhaps
+        # because the work has been divided up by position -- the
+        # batch has to be found by offset.
+        id_column = None
+        if self.KEYSET_PAGINATION and not progress.offset:
+            id_column = self.item_id_column
+
+        if progress.last_id is None and not progress.offset:
+            # This is the first batch. Say how many items there are.
+            count = self.count_items_that_need_coverage(qu)
+            if self.metrics and count is not None:
+                self.metrics.queue_depth = count
+            if count is not None:
+                self.log.info(
+                    "%s%d items need coverage%s",
+                    "About " if self.COUNT_ITEMS == self.ESTIMATED_COUNT else "",
+                    count,
+                    count_as_covered_message,
+                )
+
+        batch_started_at = utc_now()
+        if id_column is not None:
+            qu = qu.order_by(None).order_by(id_column)
+            if progress.last_id is not None:
+                qu = qu.filter(id_column > progress.last_id)
+            if progress.end_id is not None:
+                qu = qu.filter(id_column <= progress.end_id)
+            batch = qu.limit(self.batch_size).all()
+        else:
+            batch = qu.limit(self.batch_size).offset(progress.offset).all()
+
+        if not batch:
             # The batch is empty. We're done.
             progress.finish = utc_now()
             return progress
 
-        (
-            successes,
-            transient_failures,
-            persistent_failures,
-        ), results = self.process_batch_and_handle_results(batch)
+        with QueryProfile.measure(self.service_name, log=self.log) as profile:
+            (
+                successes,
+                transient_failures,
+                persistent_failures,
+            ), results = self.process_batch_and_handle_results(batch)
 
         # Update the running totals so that the service's eventual timestamp
         # will have a useful .achievements.
@@ -360,6 +481,21 @@ class BaseCoverageProvider(object):
         progress.transient_failures += transient_failures
         progress.persistent_failures += persistent_failures
 
+        batch_seconds = (utc_now() - batch_started_at).total_seconds()
+        if self.metrics:
+            self.metrics.record_batch(len(batch), batch_seconds)
+            self.metrics.record_queries(profile)
+        if self.batch_sizer:
+            self.batch_size = self.batch_sizer.record(len(batch), batch_seconds)
+            progress.batch_summary = self.batch_sizer.achievements
+
+        if id_column is not None:
+            # The next batch will start after the last item in this
+            # one, so no matter what happened to these items, they
+            # won't show up again this run.
+            progress.last_id = max(getattr(item, id_column.key) for item in batch)
+            return progress
+
         if BaseCoverageRecord.SUCCESS not in count_as_covered:
             # If any successes happened in this batch, increase the
             # offset to ignore them, or they will just show up again
@@ -380,6 +516,125 @@ class BaseCoverageProvider(object):
 
         return progress
 
+    def run_queue(self):
+        """Cover the items on this provider's queue until it's empty.
+
+        This is much cheaper than run(), since nothing has to be
+        searched for, but it only finds items that were put on the
+        queue. run() is still needed every so often to pick up
+        anything that didn't make it onto the queue.
+
+        :return: A CoverageProviderProgress.
+        """
+        progress = CoverageProviderProgress(start=utc_now())
+        try:
+            while self.run_queue_once(progress):
+                pass
+        except Exception as e:
+            logging.error(
+                "CoverageProvider %s raised uncaught exception.",
+                self.service_name,
+                exc_info=e,
+            )
+            # Put the items that were being covered back on the queue.
+            self._db.rollback()
+            progress.exception = traceback.format_exc()
+        self.finalize_timestampdata(progress)
+        return progress
+
+    def run_queue_once(self, progress):
+        """Take one batch of items off this provider's queue and cover
+        them.
+
+        Items on the queue that turn out not to need coverage --
+        perhaps they were covered by a full run() in the meantime --
+        are dropped from the queue.
+
+        :return: The number of items taken off the queue. If this is
+            zero, the queue is empty.
+        """
+        ids = CoverageQueueItem.claim(
+            self._db, self.queue_column, self.batch_size, **self.queue
+        )
+        if not ids:
+            return 0
+
+        batch = self.items_that_need_coverage().filter(self.item_id_column.in_(ids))
+        batch = batch.all()
+        if not batch:
+            # Nothing to cover, but the items still need to come off
+            # the queue.
+            self._db.commit()
+            return len(ids)
+
+        with QueryProfile.measure(self.service_name, log=self.log):
+            (
+                successes,
+                transient_failures,
+                persistent_failures,
+            ), results = self.process_batch_and_handle_results(batch)
+        progress.successes += successes
+        progress.transient_failures += transient_failures
+        progress.persistent_failures += persistent_failures
+        return len(ids)
+
+    def count_items_that_need_coverage(self, qu):
+        """Count the items that need coverage, as specified by
+        COUNT_ITEMS.
+
+        :param qu: A query returning the items that need coverage.
+        :return: A number, or None if the items weren't counted.
+        """
+        if self.COUNT_ITEMS == self.EXACT_COUNT:
+            return qu.count()
+        if self.COUNT_ITEMS == self.ESTIMATED_COUNT:
+            return estimated_count(self._db, qu)
+        return None
+
+    def partition_items_that_need_coverage(self, partitions, count_as_covered=None):
+        """Divide the items that need coverage into contiguous ranges of
+        IDs, each containing about the same number of items, so that
+        the ranges can be covered in parallel without overlapping.
+
+        :param partitions: The number of ranges wanted.
+        :return: A list of 2-tuples (last_id, end_id), suitable for use
+            as CoverageProviderProgress.last_id and .end_id. The first
+            range has no lower bound and the last has no upper bound,
+            so items that come to need coverage during the run will be
+            covered by one range or another. If ID ranges can't be used,
+            the list will contain a single unbounded range.
+        """
+        id_column = self.item_id_column
+        if id_column is None or not self.KEYSET_PAGINATION or partitions < 2:
+            return [(None, None)]
+
+        count_as_covered = (
+            count_as_covered or BaseCoverageRecord.DEFAULT_COUNT_AS_COVERED
+        )
+        qu = self.items_that_need_coverage(count_as_covered=count_as_covered)
+        tiles = (
+            qu.order_by(None)
+            .with_entities(
+                id_column.label("id"),
+                func.ntile(partitions).over(order_by=id_column).label("tile"),
+            )
+            .subquery()
+        )
+        boundaries = [
+            end_id
+            for (end_id,) in self._db.query(func.max(tiles.c.id))
+            .group_by(tiles.c.tile)
+            .order_by(func.max(tiles.c.id))
+        ]
+
+        ranges = []
+        last_id = None
+        for end_id in boundaries[:-1]:
+            ranges.append((last_id, end_id))
+            last_id = end_id
+        ranges.append((last_id, None))
+        return ranges
+
     def process_batch_and_handle_results(self, batch):
         """:return: A 2-tuple (counts, records).
 
@@ -406,24 +661,22 @@ class BaseCoverageProvider(object):
 
         unhandled_items = set(batch)
         success_items = []
+        failures = []
         for item in results:
             if isinstance(item, CoverageFailure):
                 if item.obj in unhandled_items:
                     unhandled_items.remove(item.obj)
-                record = self.record_failure_as_coverage_record(item)
                 if item.transient:
                     self.log.warn(
                         "Transient failure covering %r: %s", item.obj, item.exception
                     )
-                    record.status = BaseCoverageRecord.TRANSIENT_FAILURE
                     transient_failures += 1
                 else:
                     self.log.error(
                         "Persistent failure covering %r: %s", item.obj, item.exception
                     )
-                    record.status = BaseCoverageRecord.PERSISTENT_FAILURE
                     persistent_failures += 1
-                records.append(record)
+                failures.append(item)
             else:
                 # Count this as a success and prepare to add a
                 # coverage record for it. It won't show up anymore, on
@@ -433,8 +686,6 @@ class BaseCoverageProvider(object):
                 successes += 1
                 success_items.append(item)
 
-        records.extend(self.add_coverage_records_for(success_items))
-
         # Perhaps some records were ignored--they neither succeeded nor
         # failed. Treat them as transient failures.
         for item in unhandled_items:
@@ -442,12 +693,13 @@ class BaseCoverageProvider(object):
                 "%r was ignored by a coverage provider that was supposed to cover it.",
                 item,
             )
-            failure = self.failure_for_ignored_item(item)
-            record = self.record_failure_as_coverage_record(failure)
-            record.status = BaseCoverageRecord.TRANSIENT_FAILURE
-            records.append(record)
+            failures.append(self.failure_for_ignored_item(item))
             num_ignored += 1
 
+        # Write the whole batch's coverage records at once.
+        records.extend(self.record_failures_as_coverage_records(failures))
+        records.extend(self.add_coverage_records_for(success_items))
+
         self.log.info(
             "Batch processed with %d successes, %d transient failures, %d persistent failures, %d ignored.",
             successes,
@@ -485,6 +737,23 @@ class BaseCoverageProvider(object):
         """
         return [self.add_coverage_record_for(item) for item in items]
 
+    def record_failures_as_coverage_records(self, failures):
+        """Convert a group of CoverageFailures from a batch into
+        coverage records.
+        """
+        records = []
+        for failure in failures:
+            record = self.record_failure_as_coverage_record(failure)
+            record.status = self._failure_status(failure)
+            records.append(record)
+        return records
+
+    @classmethod
+    def _failure_status(cls, failure):
+        if failure.transient:
+            return BaseCoverageRecord.TRANSIENT_FAILURE
+        return BaseCoverageRecord.PERSISTENT_FAILURE
+
     def handle_success(self, item):
         """Do something special to mark the successful coverage of the
         given item.
@@ -797,6 +1066,16 @@ class IdentifierCoverageProvider(BaseCoverageProvider):
             force=force,
         )
 
+        # Put the newly registered identifiers on the queue, so a
+        # worker can cover them right away.
+        CoverageQueueItem.enqueue(
+            _db,
+            [record.identifier for record in new_records],
+            data_source=data_source,
+            operation=cls.OPERATION,
+            collection=collection,
+        )
+
         return new_records, ignored_identifiers
 
     @classmethod
@@ -823,6 +1102,22 @@ class IdentifierCoverageProvider(BaseCoverageProvider):
         """
         return DataSource.lookup(self._db, self.DATA_SOURCE_NAME)
 
+    @property
+    def item_id_column(self):
+        return Identifier.id
+
+    @property
+    def queue_column(self):
+        return CoverageQueueItem.identifier_id
+
+    @property
+    def queue(self):
+        return dict(
+            data_source=self.data_source,
+            operation=self.operation,
+            collection=self.collection_or_not,
+        )
+
     def failure(self, identifier, error, transient=True):
         """Create a CoverageFailure object to memorialize an error."""
         return CoverageFailure(
@@ -1022,6 +1317,44 @@ class IdentifierCoverageProvider(BaseCoverageProvider):
 
         return qu
 
+    def add_coverage_records_for(self, items):
+        """Add CoverageRecords for a group of Editions/Identifiers from
+        a batch, each of which was successful.
+        """
+        return CoverageRecord.bulk_upsert(
+            self._db,
+            [(item, CoverageRecord.SUCCESS, None) for item in items],
+            data_source=self.data_source,
+            operation=self.operation,
+            collection=self.collection_or_not,
+        )
+
+    def record_failures_as_coverage_records(self, failures):
+        """Turn a group of CoverageFailures into CoverageRecords, with
+        one upsert for each data source and collection involved.
+        """
+        by_destination = defaultdict(list)
+        for failure in failures:
+            if not failure.data_source:
+                raise Exception(
+                    "Cannot convert coverage failure to CoverageRecord because it has no output source."
+                )
+            by_destination[(failure.data_source, failure.collection)].append(
+                (failure.obj, self._failure_status(failure), failure.exception)
+            )
+        records = []
+        for (data_source, collection), outcomes in list(by_destination.items()):
+            records.extend(
+                CoverageRecord.bulk_upsert(
+                    self._db,
+                    outcomes,
+                    data_source=data_source,
+                    operation=self.operation,
+                    collection=collection,
+                )
+            )
+        return records
+
     def add_coverage_record_for(self, item):
         """Record this CoverageProvider's coverage for the given
         Edition/Identifier, as a CoverageRecord.
@@ -1362,6 +1695,68 @@ class CollectionCoverageProviderJob(DatabaseJob):
         provider.finalize_timestampdata(self.progress)
 
 
+class CollectionCoverageProviderPartitionJob(object):
+    """Cover one range of IDs for a CollectionCoverageProvider, in a
+    worker process of its own.
+
+    This is a job for util.worker_pools.ProcessPool. After each batch
+    it reports the progress made by that batch, including the
+    last ID covered, so that if the process dies the job can be
+    restarted where it left off.
+    """
+
+    def __init__(
+        self,
+        database_url,
+        collection_id,
+        provider_class,
+        last_id=None,
+        end_id=None,
+        **provider_kwargs
+    ):
+        self.database_url = database_url
+        self.collection_id = collection_id
+        self.provider_class = provider_class
+        self.last_id = last_id
+        self.end_id = end_id
+        self.provider_kwargs = provider_kwargs
+
+    def __call__(self, report):
+        # Database connections can't be shared with the parent
+        # process, so this worker gets an engine of its own.
+        _db = SessionManager.sessionmaker(self.database_url)()
+        try:
+            self.run(_db, report)
+        finally:
+            _db.close()
+            _db.get_bind().dispose()
+
+    def run(self, _db, report):
+        collection = get_one(_db, Collection, id=self.collection_id)
+        provider = self.provider_class(collection, **self.provider_kwargs)
+        progress = CoverageProviderProgress(start=utc_now())
+        progress.last_id = self.last_id
+        progress.end_id = self.end_id
+        while not progress.is_complete:
+            before = (
+                progress.successes,
+                progress.transient_failures,
+                progress.persistent_failures,
+            )
+            new_progress = provider.run_once(progress)
+            if new_progress is not None:
+                progress = new_progress
+            report(
+                dict(
+                    last_id=progress.last_id,
+                    successes=progress.successes - before[0],
+                    transient_failures=progress.transient_failures - before[1],
+                    persistent_failures=progress.persistent_failures - before[2],
+                    exception=progress.exception,
+                )
+            )
+
+
 class CatalogCoverageProvider(CollectionCoverageProvider):
     """Most CollectionCoverageProviders provide coverage to Identifiers
     that are licensed through a given Collection.
@@ -1461,6 +1856,14 @@ class WorkCoverageProvider(BaseCoverageProvider):
 
         return qu
 
+    @property
+    def item_id_column(self):
+        return Work.id
+
+    @property
+    def queue_column(self):
+        return CoverageQueueItem.work_id
+
     def failure(self, work, error, transient=True):
         """Create a CoverageFailure object."""
         return CoverageFailure(work, error, transient=transient)
@@ -1477,12 +1880,21 @@ class WorkCoverageProvider(BaseCoverageProvider):
         """Add WorkCoverageRecords for a group of works from a batch,
         each of which was successful.
         """
-        WorkCoverageRecord.bulk_add(works, operation=self.operation)
+        return WorkCoverageRecord.bulk_upsert(
+            self._db,
+            [(work, WorkCoverageRecord.SUCCESS, None) for work in works],
+            operation=self.operation,
+        )
 
-        # We can't return the specific WorkCoverageRecords that were
-        # created, but it doesn't matter because they're not used except
-        # in tests.
-        return []
+    def record_failures_as_coverage_records(self, failures):
+        """Turn a group of CoverageFailures into WorkCoverageRecords
+        with a single upsert.
+        """
+        return WorkCoverageRecord.bulk_upsert(
+            self._db,
+            [(f.obj, self._failure_status(f), f.exception) for f in failures],
+            operation=self.operation,
+        )
 
     def add_coverage_record_for(self, work):
         """Record this CoverageProvider's coverage for the given
@@ -1568,6 +1980,9 @@ class WorkPresentationEditionCoverageProvider(WorkPresentationProvider):
 
     OPERATION = WorkCoverageRecord.CHOOSE_EDITION_OPERATION
 
+    # Set while a batch is being processed.
+    inputs = None
+
     POLICY = PresentationCalculationPolicy(
         choose_edition=True,
         set_edition_metadata=True,
@@ -1592,6 +2007,44 @@ class WorkPresentationEditionCoverageProvider(WorkPresentationProvider):
         update_search_index=True,
     )
 
+    def policy_for(self, work):
+        """Decide how much of a Work's presentation to recalculate.
+
+        If the Work knows which of its presentation inputs have
+        changed, only the parts that depend on them are recalculated.
+        Otherwise the presentation edition is rebuilt as per POLICY.
+        """
+        policy = work.presentation_policy_for_changes(
+            regenerate_opds_entries=self.POLICY.regenerate_opds_entries,
+            verbose=self.POLICY.verbose,
+        )
+        return policy or self.POLICY
+
+    def process_batch(self, batch):
+        """Recalculate the presentation for a batch of Works, loading
+        the information needed to do so for all of them at once.
+        """
+        policies = [self.policy_for(work) for work in batch]
+        if policies:
+            # Load everything that any of these Works will need.
+            parts = set(
+                part
+                for dependencies in PresentationCalculationPolicy.DEPENDENCIES.values()
+                for part in dependencies
+            )
+            policy = PresentationCalculationPolicy(
+                **{part: any(getattr(p, part) for p in policies) for part in parts}
+            )
+        else:
+            policy = self.POLICY
+        self.inputs = PresentationInputs(self._db, batch, policy)
+        try:
+            return super(WorkPresentationEditionCoverageProvider, self).process_batch(
+                batch
+            )
+        finally:
+            self.inputs = None
+
     def process_item(self, work):
         """Recalculate the presentation for a Work."""
 
@@ -1599,8 +2052,9 @@ class WorkPresentationEditionCoverageProvider(WorkPresentationProvider):
         # regenerate the OPDS feeds or update the search index.  So we
         # call calculate_presentation with a policy that ensures the
         # presentation edition will be reevaluated, but nothing
-        # expensive will happen.
-        work.calculate_presentation(self.POLICY)
+        # expensive will happen, unless we know that the inputs to
+        # the expensive parts have changed.
+        work.calculate_presentation(self.policy_for(work), inputs=self.inputs)
         return work
 
 
@@ -1627,3 +2081,7 @@ class WorkClassificationCoverageProvider(WorkPresentationEditionCoverageProvider
     # This is going to be expensive -- we might as well recalculate
     # everything.
     POLICY = PresentationCalculationPolicy.recalculate_everything()
+
+    def policy_for(self, work):
+        """This provider always recalculates everything."""
+        return self.POLICY
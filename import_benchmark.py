@@ -0,0 +1,466 @@
+# Measure how quickly OPDS feeds can be imported, using synthetic
+# feeds of a configurable size and shape.
+import datetime
+import json
+import logging
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from xml.sax.saxutils import escape, quoteattr
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm.session import Session
+from webpub_manifest_parser.opds2 import OPDS2FeedParserFactory
+
+from .model import Collection, ExternalIntegration, get_one_or_create
+from .opds2_import import OPDS2Importer, RWPMManifestParser, StreamingRWPMManifestParser
+from .opds_import import OPDSImporter
+from .util.datetime_helpers import utc_now
+from .util.opds_writer import AtomFeed
+
+
+class SyntheticFeed(object):
+    """Generates OPDS feeds full of made-up books.
+
+    Contributors and subjects are drawn from fixed-size pools, so
+    that (as in real feeds) many entries share the same ones.
+    """
+
+    FORMATS = [
+        "application/epub+zip",
+        "application/pdf",
+        "application/audiobook+json",
+        "application/kepub+zip",
+    ]
+
+    SUBJECT_SCHEME = "http://purl.org/dc/terms/LCSH"
+
+    CONTRIBUTOR_POOL_SIZE = 500
+    SUBJECT_POOL_SIZE = 200
+
+    def __init__(
+        self,
+        entries=100,
+        contributors=2,
+        subjects=3,
+        links=2,
+        formats=1,
+        update_ratio=0.0,
+        first_id=1,
+    ):
+        """Constructor.
+
+        :param entries: The number of entries in the feed.
+        :param contributors: The number of contributors for each entry.
+        :param subjects: The number of subjects for each entry.
+        :param links: The number of image links for each entry.
+        :param formats: The number of acquisition links for each
+            entry, each in a different format.
+        :param update_ratio: The share of entries that describe books
+            which have already been imported, by importing the seed
+            feed.
+        :param first_id: The number used to build the identifier of
+            the first entry. Use different values to make feeds that
+            don't overlap.
+        """
+        self.entries = entries
+        self.contributors = contributors
+        self.subjects = subjects
+        self.links = links
+        self.formats = min(formats, len(self.FORMATS))
+        self.update_ratio = update_ratio
+        self.first_id = first_id
+
+    @property
+    def updated_entries(self):
+        return int(round(self.entries * self.update_ratio))
+
+    @classmethod
+    def isbn(cls, number):
+        """Turn a number into a valid ISBN-13."""
+        digits = "978%09d" % number
+        total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+        return digits + str((10 - total % 10) % 10)
+
+    def _books(self, numbers, updated, title_prefix):
+        for number in numbers:
+            yield dict(
+                number=number,
+                urn="urn:isbn:%s" % self.isbn(number),
+                title="%s %d" % (title_prefix, number),
+                updated=updated,
+                contributors=[
+                    "Author %d" % ((number + i) % self.CONTRIBUTOR_POOL_SIZE)
+                    for i in range(self.contributors)
+                ],
+                subjects=[
+                    "%d" % ((number + i) % self.SUBJECT_POOL_SIZE)
+                    for i in range(self.subjects)
+                ],
+                images=[
+                    "http://example.com/%d/cover-%d.png" % (number, i)
+                    for i in range(self.links)
+                ],
+                formats=[
+                    ("http://example.com/%d/book-%d" % (number, i), self.FORMATS[i])
+                    for i in range(self.formats)
+                ],
+            )
+
+    def books(self):
+        """Describe the books in the feed.
+
+        The first `updated_entries` books are the ones described in the
+        seed feed, with a new title and a newer modification date.
+        """
+        numbers = range(self.first_id, self.first_id + self.entries)
+        return self._books(numbers, utc_now(), "Title")
+
+    def seed_books(self):
+        """Describe the books that need to be imported before the feed,
+        so that some of the feed's entries are updates.
+        """
+        numbers = range(self.first_id, self.first_id + self.updated_entries)
+        updated = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+        return self._books(numbers, updated, "Old title")
+
+    def opds1(self, seed=False):
+        """Generate an OPDS 1 feed.
+
+        :param seed: Generate the seed feed instead of the main feed.
+        """
+        books = self.seed_books() if seed else self.books()
+        entries = []
+        for book in books:
+            parts = [
+                "<id>%s</id>" % book["urn"],
+                "<title>%s</title>" % escape(book["title"]),
+                "<updated>%s</updated>" % AtomFeed._strftime(book["updated"]),
+                "<dcterms:language>en</dcterms:language>",
+                "<dcterms:publisher>Synthetic Press</dcterms:publisher>",
+            ]
+            for name in book["contributors"]:
+                parts.append("<author><name>%s</name></author>" % escape(name))
+            for code in book["subjects"]:
+                parts.append(
+                    '<category scheme="%s" term="sh%s" label="Subject %s"/>'
+                    % (self.SUBJECT_SCHEME, code, code)
+                )
+            for href in book["images"]:
+                parts.append(
+                    '<link rel="http://opds-spec.org/image" href=%s/>' % quoteattr(href)
+                )
+            for href, media_type in book["formats"]:
+                parts.append(
+                    '<link rel="http://opds-spec.org/acquisition/open-access" '
+                    "type=%s href=%s/>" % (quoteattr(media_type), quoteattr(href))
+                )
+            entries.append("<entry>%s</entry>" % "".join(parts))
+
+        return (
+            '<feed xmlns="http://www.w3.org/2005/Atom" '
+            'xmlns:dcterms="http://purl.org/dc/terms/" '
+            'xmlns:opds="http://opds-spec.org/2010/catalog">'
+            "<id>http://example.com/feed</id>"
+            "<title>Synthetic feed</title>"
+            "<updated>%s</updated>"
+            '<link rel="self" href="http://example.com/feed"/>'
+            "%s</feed>" % (AtomFeed._strftime(utc_now()), "".join(entries))
+        )
+
+    def opds2(self, seed=False):
+        """Generate an OPDS 2 feed.
+
+        :param seed: Generate the seed feed instead of the main feed.
+        """
+        books = self.seed_books() if seed else self.books()
+        publications = []
+        for book in books:
+            publications.append(
+                {
+                    "metadata": {
+                        "@type": "http://schema.org/Book",
+                        "title": book["title"],
+                        "identifier": book["urn"],
+                        "modified": book["updated"].isoformat(),
+                        "language": "en",
+                        "publisher": {"name": "Synthetic Press"},
+                        "author": [{"name": name} for name in book["contributors"]],
+                        "subject": [
+                            {
+                                "scheme": self.SUBJECT_SCHEME,
+                                "code": "sh%s" % code,
+                                "name": "Subject %s" % code,
+                            }
+                            for code in book["subjects"]
+                        ],
+                    },
+                    "links": [
+                        {
+                            "rel": "http://opds-spec.org/acquisition/open-access",
+                            "href": href,
+                            "type": media_type,
+                        }
+                        for href, media_type in book["formats"]
+                    ],
+                    "images": [
+                        {"href": href, "type": "image/png"} for href in book["images"]
+                    ],
+                }
+            )
+        return json.dumps(
+            {
+                "metadata": {"title": "Synthetic feed"},
+                "links": [
+                    {
+                        "rel": "self",
+                        "href": "http://example.com/feed",
+                        "type": "application/opds+json",
+                    }
+                ],
+                "publications": publications,
+            }
+        )
+
+    def as_dict(self):
+        return dict(
+            entries=self.entries,
+            contributors=self.contributors,
+            subjects=self.subjects,
+            links=self.links,
+            formats=self.formats,
+            update_ratio=self.update_ratio,
+        )
+
+
+class ImportBenchmark(object):
+    """Import a synthetic feed and measure how long it took, how many
+    SQL statements were run, and how much memory was used.
+
+    Every import happens inside a savepoint that is rolled back
+    afterwards, so a benchmark leaves the database the way it found it.
+    """
+
+    OPDS1 = "opds1"
+    OPDS2 = "opds2"
+    OPDS2_STREAMING = "opds2-streaming"
+    FORMATS = [OPDS1, OPDS2, OPDS2_STREAMING]
+
+    COLLECTION_NAME = "Import benchmark %s"
+    DATA_SOURCE_NAME = "Import benchmark"
+
+    def __init__(self, _db, feed_format, feed, repeat=3, measure_memory=True):
+        """Constructor.
+
+        :param _db: A database session.
+        :param feed_format: One of the FORMATS.
+        :param feed: A SyntheticFeed.
+        :param repeat: The number of times to time the import.
+        :param measure_memory: If this is True, the import will be run
+            one more time with tracemalloc turned on, to find the peak
+            memory use. This is kept separate from the timed runs,
+            since tracemalloc slows everything down.
+        """
+        if feed_format not in self.FORMATS:
+            raise ValueError("Unknown feed format: %s" % feed_format)
+        self._db = _db
+        self.feed_format = feed_format
+        self.feed = feed
+        self.repeat = repeat
+        self.measure_memory = measure_memory
+        self.log = logging.getLogger("Import benchmark")
+
+    def importer(self, _db):
+        """Create an importer for a Collection that exists only for the
+        benchmark.
+        """
+        if self.feed_format == self.OPDS1:
+            protocol = ExternalIntegration.OPDS_IMPORT
+        else:
+            protocol = ExternalIntegration.OPDS2_IMPORT
+        collection, is_new = get_one_or_create(
+            _db, Collection, name=self.COLLECTION_NAME % protocol
+        )
+        if is_new:
+            integration = collection.create_external_integration(protocol)
+            integration.goal = ExternalIntegration.LICENSE_GOAL
+            collection.data_source = self.DATA_SOURCE_NAME
+
+        if self.feed_format == self.OPDS1:
+            return OPDSImporter(_db, collection)
+        if self.feed_format == self.OPDS2:
+            parser = RWPMManifestParser(OPDS2FeedParserFactory())
+        else:
+            parser = StreamingRWPMManifestParser(OPDS2FeedParserFactory())
+        return OPDS2Importer(_db, collection, parser)
+
+    def content(self, seed=False):
+        if self.feed_format == self.OPDS1:
+            return self.feed.opds1(seed=seed)
+        return self.feed.opds2(seed=seed)
+
+    def _import(self, _db, importer, content):
+        editions, pools, works, failures = importer.import_from_feed(content)
+        _db.flush()
+        return editions, failures
+
+    def run_once(self, trace_memory=False):
+        """Import the feed once, inside a savepoint.
+
+        The importers commit as they go, so the savepoint is created on
+        the connection and the import is run in a separate Session bound
+        to that connection. The Session's commits then have no effect
+        on the database, and rolling back the savepoint undoes the
+        whole import.
+
+        :return: A dictionary of measurements.
+        """
+        seed = self.content(seed=True) if self.feed.updated_entries else None
+        content = self.content()
+
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        self._db.flush()
+        bind = self._db.get_bind()
+        if isinstance(bind, Connection):
+            connection = bind
+        else:
+            connection = bind.connect()
+        savepoint = connection.begin_nested()
+        _db = Session(connection)
+        try:
+            importer = self.importer(_db)
+            if seed:
+                self._import(_db, importer, seed)
+
+            event.listen(connection, "before_cursor_execute", count)
+            if trace_memory:
+                tracemalloc.start()
+            try:
+                start = time.perf_counter()
+                editions, failures = self._import(_db, importer, content)
+                seconds = time.perf_counter() - start
+                peak_memory = None
+                if trace_memory:
+                    current, peak_memory = tracemalloc.get_traced_memory()
+            finally:
+                if trace_memory:
+                    tracemalloc.stop()
+                event.remove(connection, "before_cursor_execute", count)
+        finally:
+            _db.close()
+            savepoint.rollback()
+            if connection is not bind:
+                connection.close()
+
+        return dict(
+            seconds=seconds,
+            sql_statements=len(statements),
+            peak_memory_bytes=peak_memory,
+            imported=len(editions),
+            failures=len(failures),
+        )
+
+    def run(self):
+        """Run the benchmark.
+
+        :return: A dictionary describing the benchmark and its results.
+        """
+        runs = [self.run_once() for i in range(self.repeat)]
+        seconds = sorted(run["seconds"] for run in runs)
+        best = seconds[0]
+        median = seconds[len(seconds) // 2]
+        entries = self.feed.entries
+        statements = runs[-1]["sql_statements"]
+
+        peak_memory = None
+        if self.measure_memory:
+            peak_memory = self.run_once(trace_memory=True)["peak_memory_bytes"]
+
+        result = dict(
+            format=self.feed_format,
+            feed=self.feed.as_dict(),
+            repeat=self.repeat,
+            seconds=seconds,
+            entries_per_second=entries / median if median else None,
+            best_entries_per_second=entries / best if best else None,
+            sql_statements=statements,
+            sql_statements_per_entry=statements / entries if entries else None,
+            peak_memory_bytes=peak_memory,
+            imported=runs[-1]["imported"],
+            failures=runs[-1]["failures"],
+        )
+        self.log.info(
+            "%s: %.1f entries/sec, %.1f SQL statements/entry, peak memory %s",
+            self.feed_format,
+            result["entries_per_second"] or 0,
+            result["sql_statements_per_entry"] or 0,
+            peak_memory,
+        )
+        return result
+
+
+def current_commit():
+    """Find the git commit of the code being benchmarked, if possible."""
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.DEVNULL,
+            )
+            .decode("ascii")
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_report(results):
+    """Wrap a list of benchmark results with the information needed to
+    compare them against results from other commits.
+    """
+    return dict(
+        commit=current_commit(),
+        timestamp=utc_now().isoformat(),
+        python=platform.python_version(),
+        results=results,
+    )
+
+
+def compare_reports(old, new):
+    """Compare two reports produced by benchmark_report.
+
+    :return: A list of dictionaries, one for each benchmark found in
+        both reports, giving the relative change in each measurement.
+    """
+
+    def key(result):
+        return (result["format"], json.dumps(result["feed"], sort_keys=True))
+
+    old_results = dict((key(x), x) for x in old["results"])
+    comparisons = []
+    for result in new["results"]:
+        previous = old_results.get(key(result))
+        if not previous:
+            continue
+        comparison = dict(format=result["format"], feed=result["feed"])
+        for field in (
+            "entries_per_second",
+            "sql_statements_per_entry",
+            "peak_memory_bytes",
+        ):
+            before = previous.get(field)
+            after = result.get(field)
+            change = None
+            if before and after is not None:
+                change = (after - before) / float(before)
+            comparison[field] = dict(before=before, after=after, change=change)
+        comparisons.append(comparison)
+    return comparisons
@@ -57,6 +57,7 @@ from .model import (
     LicensePool,
     LicensePoolDeliveryMechanism,
     Session,
+    SessionManager,
     Work,
     WorkGenre,
     directly_modified,
@@ -1893,9 +1894,24 @@ class WorkList(object):
         # performance isn't a big concern -- it's just ugly.
         wl = SpecificWorkList(work_ids)
         wl.initialize(self.get_library(_db))
-        qu = wl.works_from_database(_db, facets=facets)
         a = time.time()
-        all_works = qu.all()
+        with SessionManager.read_only_session(_db) as reader:
+            all_works = wl.works_from_database(reader, facets=facets).all()
+            if reader is not _db:
+                # The Works were loaded from a read replica. Move them
+                # into the main session without reloading them, so the
+                # caller can use them after the replica session closes.
+                all_works = [_db.merge(work, load=False) for work in all_works]
+
+                # A replica may be missing Works that were created
+                # recently. Look those up in the primary database.
+                missing = work_ids - set(w.id for w in all_works)
+                if missing:
+                    missing_wl = SpecificWorkList(missing)
+                    missing_wl.initialize(self.get_library(_db))
+                    all_works.extend(
+                        missing_wl.works_from_database(_db, facets=facets).all()
+                    )
 
         # Create a list of lists with the same membership as the original
         # `resultsets`, but with Hit objects replaced with Work objects.
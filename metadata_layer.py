@@ -15,7 +15,7 @@ from typing import Optional
 
 from dateutil.parser import parse
 from pymarc import MARCReader
-from sqlalchemy.orm import aliased
+from sqlalchemy.orm import aliased, selectinload
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.orm.session import Session
 from sqlalchemy.sql.expression import and_, or_
@@ -358,9 +358,13 @@ class ContributorData(object):
 
         return destination, made_changes
 
-    def find_sort_name(self, _db, identifiers, metadata_client):
+    def find_sort_name(self, _db, identifiers, metadata_client, resolver=None):
 
-        """Try as hard as possible to find this person's sort name."""
+        """Try as hard as possible to find this person's sort name.
+
+        :param resolver: A ContributorResolver that remembers what was
+            learned about other contributors earlier in the same run.
+        """
         log = logging.getLogger("Abstract metadata layer")
         if self.sort_name:
             # log.debug(
@@ -378,9 +382,12 @@ class ContributorData(object):
         # Is there a contributor already in the database with this
         # exact sort name? If so, use their display name.
         # If not, take our best guess based on the display name.
-        sort_name = self.display_name_to_sort_name_from_existing_contributor(
-            _db, self.display_name
-        )
+        if resolver:
+            sort_name = resolver.sort_name_for_display_name(self.display_name)
+        else:
+            sort_name = self.display_name_to_sort_name_from_existing_contributor(
+                _db, self.display_name
+            )
         if sort_name:
             self.sort_name = sort_name
             return True
@@ -390,7 +397,7 @@ class ContributorData(object):
         if metadata_client:
             try:
                 sort_name = self.display_name_to_sort_name_through_canonicalizer(
-                    _db, identifiers, metadata_client
+                    _db, identifiers, metadata_client, resolver
                 )
             except RemoteIntegrationException as e:
                 # There was some kind of problem with the metadata
@@ -471,21 +478,279 @@ class ContributorData(object):
         return sort_name
 
     def display_name_to_sort_name_through_canonicalizer(
-        self, _db, identifiers, metadata_client
+        self, _db, identifiers, metadata_client, resolver=None
     ):
+        def canonicalize(identifier_obj):
+            if resolver:
+                return resolver.canonicalize(self, metadata_client, identifier_obj)
+            return self._display_name_to_sort_name(_db, metadata_client, identifier_obj)
+
         sort_name = None
         for identifier in identifiers:
             if identifier.type != Identifier.ISBN:
                 continue
             identifier_obj, ignore = identifier.load(_db)
-            sort_name = self._display_name_to_sort_name(
-                _db, metadata_client, identifier_obj
-            )
+            sort_name = canonicalize(identifier_obj)
             if sort_name:
                 break
 
         if not sort_name:
-            sort_name = self._display_name_to_sort_name(_db, metadata_client, None)
+            sort_name = canonicalize(None)
+        return sort_name
+
+
+class ContributorResolver(object):
+    """Finds Contributors, and the sort names of contributors, over the
+    course of an import run.
+
+    The same contributors show up over and over again during an
+    import, and looking each one up separately means querying the
+    contributors table several times for every author of every
+    book. A ContributorResolver looks up the contributors for a whole
+    batch of ContributorData objects at once, and remembers what it
+    found -- including the names it didn't find and the answers given
+    by the metadata wrangler's author name canonicalizer -- for the
+    rest of the run.
+    """
+
+    SORT_NAME = "sort_name"
+    DISPLAY_NAME = "display_name"
+    VIAF_OR_LC = "viaf_or_lc"
+    CANONICALIZER = "canonicalizer"
+
+    def __init__(self, _db):
+        self._db = _db
+
+        # Sort name -> list of every Contributor with that sort name.
+        self._by_sort_name = {}
+
+        # Display name -> the sort name of a Contributor with that
+        # display name, or None if there is no such Contributor.
+        self._sort_names_by_display_name = {}
+
+        # VIAF or LC number -> list of every Contributor with that
+        # number. Only numbers that were prefetched are in here.
+        self._by_viaf = {}
+        self._by_lc = {}
+
+        # (VIAF, LC) -> the Contributor found by Contributor.lookup, or
+        # None if it found nothing.
+        self._by_viaf_and_lc = {}
+
+        # (Identifier ID, display name) -> the sort name found by the
+        # canonicalizer, or None if it found nothing.
+        self._canonicalized = {}
+
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+    @property
+    def hit_rates(self):
+        """The share of lookups of each kind that were answered without
+        going to the database or the canonicalizer.
+
+        :return: A dictionary mapping each kind of lookup to a number
+            between 0 and 1.
+        """
+        rates = {}
+        for kind in set(self.hits) | set(self.misses):
+            total = self.hits[kind] + self.misses[kind]
+            rates[kind] = self.hits[kind] / float(total)
+        return rates
+
+    def prefetch(self, contributor_datas):
+        """Look up every Contributor that might match any of the given
+        ContributorData objects, with a single query.
+        """
+        sort_names = set()
+        display_names = set()
+        viafs = set()
+        lcs = set()
+        for data in contributor_datas:
+            if data.sort_name and data.sort_name not in self._by_sort_name:
+                sort_names.add(data.sort_name)
+            if (
+                data.display_name
+                and not data.sort_name
+                and data.display_name not in self._sort_names_by_display_name
+            ):
+                display_names.add(data.display_name)
+            if data.viaf and data.viaf not in self._by_viaf:
+                viafs.add(data.viaf)
+            if data.lc and data.lc not in self._by_lc:
+                lcs.add(data.lc)
+
+        clauses = []
+        if sort_names:
+            clauses.append(Contributor.sort_name.in_(sort_names))
+        if display_names:
+            clauses.append(
+                and_(
+                    Contributor.display_name.in_(display_names),
+                    Contributor.sort_name != None,
+                )
+            )
+        if viafs:
+            clauses.append(Contributor.viaf.in_(viafs))
+        if lcs:
+            clauses.append(Contributor.lc.in_(lcs))
+        if not clauses:
+            return
+        contributors = self._db.query(Contributor).filter(or_(*clauses)).all()
+
+        # Anything that isn't found in the database is known not to be
+        # there.
+        for sort_name in sort_names:
+            self._by_sort_name[sort_name] = []
+        for display_name in display_names:
+            self._sort_names_by_display_name[display_name] = None
+        for viaf in viafs:
+            self._by_viaf[viaf] = []
+        for lc in lcs:
+            self._by_lc[lc] = []
+        for contributor in contributors:
+            self.add(contributor)
+
+    def add(self, contributor):
+        """Make sure lookups that ought to find the given Contributor
+        will find it.
+
+        This should be called after a Contributor is created or
+        modified, so that the negative results remembered earlier don't
+        go stale.
+        """
+
+        def add_to(index, key):
+            contributors = index.get(key)
+            if contributors is not None and contributor not in contributors:
+                contributors.append(contributor)
+
+        add_to(self._by_sort_name, contributor.sort_name)
+        add_to(self._by_viaf, contributor.viaf)
+        add_to(self._by_lc, contributor.lc)
+        for key in (
+            (contributor.viaf, contributor.lc),
+            (contributor.viaf, None),
+            (None, contributor.lc),
+        ):
+            if key in self._by_viaf_and_lc and not self._by_viaf_and_lc[key]:
+                self._by_viaf_and_lc[key] = contributor
+        if (
+            contributor.display_name
+            and contributor.sort_name
+            and not self._sort_names_by_display_name.get(contributor.display_name)
+        ):
+            self._sort_names_by_display_name[
+                contributor.display_name
+            ] = contributor.sort_name
+
+    def lookup(
+        self,
+        sort_name=None,
+        viaf=None,
+        lc=None,
+        aliases=None,
+        extra=None,
+        create_new=True,
+    ):
+        """Find or create Contributors, as Contributor.lookup does.
+
+        :return: A 2-tuple (list of Contributors, is_new).
+        """
+        if sort_name and not viaf and not lc:
+            contributors = self._by_sort_name.get(sort_name)
+            if contributors:
+                self.hits[self.SORT_NAME] += 1
+                return list(contributors), False
+            self.misses[self.SORT_NAME] += 1
+            contributors, is_new = Contributor.lookup(
+                self._db,
+                sort_name=sort_name,
+                aliases=aliases,
+                extra=extra,
+                create_new=create_new,
+            )
+            self._by_sort_name[sort_name] = list(contributors)
+            for contributor in contributors:
+                self.add(contributor)
+            return contributors, is_new
+
+        if not viaf and not lc:
+            # Let Contributor.lookup raise the appropriate error.
+            return Contributor.lookup(self._db, sort_name=sort_name)
+
+        key = (viaf, lc)
+        if (
+            key not in self._by_viaf_and_lc
+            and (not viaf or viaf in self._by_viaf)
+            and (not lc or lc in self._by_lc)
+        ):
+            # The prefetch found every Contributor with this VIAF or
+            # LC number.
+            candidates = self._by_viaf[viaf] if viaf else self._by_lc[lc]
+            matches = [
+                x
+                for x in candidates
+                if (not viaf or x.viaf == viaf) and (not lc or x.lc == lc)
+            ]
+            self._by_viaf_and_lc[key] = matches[0] if matches else None
+
+        if key in self._by_viaf_and_lc:
+            contributor = self._by_viaf_and_lc[key]
+            if contributor or not create_new:
+                self.hits[self.VIAF_OR_LC] += 1
+                return [contributor] if contributor else [], False
+
+        self.misses[self.VIAF_OR_LC] += 1
+        contributors, is_new = Contributor.lookup(
+            self._db,
+            sort_name=sort_name,
+            viaf=viaf,
+            lc=lc,
+            aliases=aliases,
+            extra=extra,
+            create_new=create_new,
+        )
+        self._by_viaf_and_lc[key] = contributors[0] if contributors else None
+        for contributor in contributors:
+            self.add(contributor)
+        return contributors, is_new
+
+    def sort_name_for_display_name(self, display_name):
+        """Find the sort name of a Contributor with the given display
+        name, as
+        ContributorData.display_name_to_sort_name_from_existing_contributor
+        does.
+        """
+        if display_name in self._sort_names_by_display_name:
+            self.hits[self.DISPLAY_NAME] += 1
+            return self._sort_names_by_display_name[display_name]
+        self.misses[self.DISPLAY_NAME] += 1
+        sort_name = ContributorData.display_name_to_sort_name_from_existing_contributor(
+            self._db, display_name
+        )
+        self._sort_names_by_display_name[display_name] = sort_name
+        return sort_name
+
+    def canonicalize(self, contributor_data, metadata_client, identifier_obj):
+        """Ask the canonicalizer for a contributor's sort name, unless it's
+        already been asked the same question during this run.
+
+        If the canonicalizer raises an exception, the question will be
+        asked again next time.
+        """
+        key = (
+            identifier_obj.id if identifier_obj else None,
+            contributor_data.display_name,
+        )
+        if key in self._canonicalized:
+            self.hits[self.CANONICALIZER] += 1
+            return self._canonicalized[key]
+        self.misses[self.CANONICALIZER] += 1
+        sort_name = contributor_data._display_name_to_sort_name(
+            self._db, metadata_client, identifier_obj
+        )
+        self._canonicalized[key] = sort_name
         return sort_name
 
 
@@ -1174,7 +1439,7 @@ class CirculationData(MetaToModelUtility):
             self.primary_identifier_obj = obj
         return self.primary_identifier_obj
 
-    def license_pool(self, _db, collection, analytics=None):
+    def license_pool(self, _db, collection, analytics=None, batch=None):
         """Find or create a LicensePool object for this CirculationData.
 
         :param collection: The LicensePool object will be associated with
@@ -1182,6 +1447,9 @@ class CirculationData(MetaToModelUtility):
 
         :param analytics: If the LicensePool is newly created, the event
             will be tracked with this.
+
+        :param batch: A MetadataBatch which may already contain the
+            LicensePool.
         """
         if not collection:
             raise ValueError("Cannot find license pool: no collection provided.")
@@ -1192,13 +1460,19 @@ class CirculationData(MetaToModelUtility):
             )
 
         data_source_obj = self.data_source(_db)
-        license_pool, is_new = LicensePool.for_foreign_id(
-            _db,
-            data_source=data_source_obj,
-            foreign_id_type=identifier.type,
-            foreign_id=identifier.identifier,
-            collection=collection,
-        )
+        license_pool = None
+        if batch:
+            license_pool = batch.license_pool(collection, data_source_obj, identifier)
+        if license_pool:
+            is_new = False
+        else:
+            license_pool, is_new = LicensePool.for_foreign_id(
+                _db,
+                data_source=data_source_obj,
+                foreign_id_type=identifier.type,
+                foreign_id=identifier.identifier,
+                collection=collection,
+            )
 
         if is_new:
             license_pool.open_access = self.has_open_access_link
@@ -1248,7 +1522,21 @@ class CirculationData(MetaToModelUtility):
             # We still haven't determined rights, so it's unknown.
             self.default_rights_uri = RightsStatus.UNKNOWN
 
-    def apply(self, _db, collection, replace=None):
+    @classmethod
+    def apply_batch(cls, _db, circulations, collection, replace=None):
+        """Apply a batch of CirculationData objects, looking up the
+        database objects they refer to with a MetadataBatch.
+
+        :return: A list of (pool, made_changes) 2-tuples, one for each
+            CirculationData.
+        """
+        batch = MetadataBatch(_db, circulations=circulations, collection=collection)
+        return [
+            circulation.apply(_db, collection, replace, batch=batch)
+            for circulation in circulations
+        ]
+
+    def apply(self, _db, collection, replace=None, batch=None):
         """Update the title with this CirculationData's information.
 
         :param collection: A Collection representing actual copies of
@@ -1257,6 +1545,9 @@ class CirculationData(MetaToModelUtility):
             this is not present, only delivery information (e.g. format
             information and open-access downloads) will be processed.
 
+        :param batch: A MetadataBatch containing the database objects
+            this CirculationData refers to, if they have already been
+            looked up.
         """
         # Immediately raise an exception if there is information that
         # can only be stored in a LicensePool, but we have no
@@ -1281,7 +1572,7 @@ class CirculationData(MetaToModelUtility):
 
         pool = None
         if collection:
-            pool, ignore = self.license_pool(_db, collection, analytics)
+            pool, ignore = self.license_pool(_db, collection, analytics, batch=batch)
 
         data_source = self.data_source(_db)
         identifier = self.primary_identifier(_db)
@@ -1299,6 +1590,7 @@ class CirculationData(MetaToModelUtility):
                     data_source=data_source,
                     media_type=link.media_type,
                     content=link.content,
+                    resource=batch.resource(link.href) if batch else None,
                 )
                 link_objects[link] = link_obj
 
@@ -1618,11 +1910,14 @@ class Metadata(MetaToModelUtility):
             if not (old_value and new_value[0].sort_name == Edition.UNKNOWN_AUTHOR):
                 setattr(self, "contributors", new_value)
 
-    def calculate_permanent_work_id(self, _db, metadata_client):
+    def calculate_permanent_work_id(self, _db, metadata_client, resolver=None):
         """Try to calculate a permanent work ID from this metadata.
 
         This may require asking a metadata wrangler to turn a display name
         into a sort name--thus the `metadata_client` argument.
+
+        :param resolver: A ContributorResolver to use when finding the
+            primary author's sort name.
         """
         primary_author = self.primary_author
 
@@ -1630,7 +1925,9 @@ class Metadata(MetaToModelUtility):
             return None, None
 
         if not primary_author.sort_name and metadata_client:
-            primary_author.find_sort_name(_db, self.identifiers, metadata_client)
+            primary_author.find_sort_name(
+                _db, self.identifiers, metadata_client, resolver
+            )
 
         sort_author = primary_author.sort_name
         pwid = Edition.calculate_permanent_work_id_for_title_and_author(
@@ -1777,6 +2074,51 @@ class Metadata(MetaToModelUtility):
     ]
     REL_REQUIRES_FULL_RECALCULATION = [LinkRelations.DESCRIPTION]
 
+    @classmethod
+    def apply_batch(
+        cls,
+        _db,
+        metadatas,
+        collection,
+        metadata_client=None,
+        replace=None,
+        contributor_resolver=None,
+    ):
+        """Find or create an Edition for each of a batch of Metadata
+        objects, and apply the metadata to it.
+
+        The database objects the Metadata objects refer to are looked
+        up (or created) up front with a MetadataBatch, rather than
+        one at a time.
+
+        :param contributor_resolver: A ContributorResolver to reuse
+            across several batches.
+
+        :return: A list of (edition, made_core_changes) 2-tuples, one
+            for each Metadata object.
+        """
+        batch = MetadataBatch(
+            _db,
+            metadatas,
+            collection=collection,
+            contributor_resolver=contributor_resolver,
+        )
+        results = []
+        for metadata in metadatas:
+            edition = batch.edition(metadata)
+            if not edition:
+                edition, ignore = metadata.edition(_db)
+            results.append(
+                metadata.apply(
+                    edition,
+                    collection,
+                    metadata_client=metadata_client,
+                    replace=replace,
+                    batch=batch,
+                )
+            )
+        return results
+
     # TODO: We need to change all calls to apply() to use a ReplacementPolicy
     # instead of passing in individual `replace` arguments. Once that's done,
     # we can get rid of the `replace` arguments.
@@ -1793,9 +2135,13 @@ class Metadata(MetaToModelUtility):
         replace_formats=False,
         replace_rights=False,
         force=False,
+        batch=None,
     ):
         """Apply this metadata to the given edition.
 
+        :param batch: A MetadataBatch containing the database objects
+            this Metadata refers to, if they have already been looked up.
+
         :return: (edition, made_core_changes), where edition is the newly-updated object, and made_core_changes
             answers the question: were any edition core fields harmed in the making of this update?
             So, if title changed, return True.
@@ -1804,14 +2150,15 @@ class Metadata(MetaToModelUtility):
         """
         _db = Session.object_session(edition)
 
-        # If summary, subjects, or measurements change, then any Work
-        # associated with this edition will need a full presentation
-        # recalculation.
-        work_requires_full_recalculation = False
+        # The kinds of information that go into the presentation of
+        # any Work associated with this edition, which have changed.
+        # Only the parts of the Work's presentation that depend on
+        # them will need to be recalculated.
+        presentation_changes = set()
 
-        # If any other data changes, then any Work associated with
-        # this edition will need to have its presentation edition
-        # regenerated, but we can do it on the cheap.
+        # If anything but subjects, descriptions or measurements
+        # changes, then any Work associated with this edition will
+        # need to have its presentation edition regenerated.
         work_requires_new_presentation_edition = False
 
         if replace is None:
@@ -1855,8 +2202,9 @@ class Metadata(MetaToModelUtility):
                     # The metadata has not changed since last time. Do nothing.
                     return edition, False
 
+        resolver = batch.contributor_resolver if batch else None
         if metadata_client and not self.permanent_work_id:
-            self.calculate_permanent_work_id(_db, metadata_client)
+            self.calculate_permanent_work_id(_db, metadata_client, resolver)
 
         identifier = edition.primary_identifier
 
@@ -1874,14 +2222,16 @@ class Metadata(MetaToModelUtility):
                     new_metadata_value = None
                 setattr(edition, field, new_metadata_value)
                 work_requires_new_presentation_edition = True
+                presentation_changes.add(PresentationCalculationPolicy.EDITIONS)
 
         # Create equivalencies between all given identifiers and
         # the edition's primary identifier.
         contributors_changed = self.update_contributions(
-            _db, edition, metadata_client, replace.contributions
+            _db, edition, metadata_client, replace.contributions, resolver
         )
         if contributors_changed:
             work_requires_new_presentation_edition = True
+            presentation_changes.add(PresentationCalculationPolicy.EDITIONS)
 
         # TODO: remove equivalencies when replace.identifiers is True.
         if self.identifiers is not None:
@@ -1894,9 +2244,11 @@ class Metadata(MetaToModelUtility):
                 ):
                     # These are the same identifier.
                     continue
-                new_identifier, ignore = Identifier.for_foreign_id(
-                    _db, identifier_data.type, identifier_data.identifier
-                )
+                new_identifier = batch.identifier(identifier_data) if batch else None
+                if not new_identifier:
+                    new_identifier, ignore = Identifier.for_foreign_id(
+                        _db, identifier_data.type, identifier_data.identifier
+                    )
                 identifier.equivalent_to(
                     data_source, new_identifier, identifier_data.weight
                 )
@@ -1920,7 +2272,9 @@ class Metadata(MetaToModelUtility):
                         # The data source has stopped claiming that
                         # this classification should exist.
                         _db.delete(classification)
-                        work_requires_full_recalculation = True
+                        presentation_changes.add(
+                            PresentationCalculationPolicy.CLASSIFICATIONS
+                        )
                     else:
                         # The data source maintains that this
                         # classification is a good idea. We don't have
@@ -1935,14 +2289,17 @@ class Metadata(MetaToModelUtility):
 
         # Apply all new subjects to the identifier.
         for subject in list(new_subjects.values()):
-            identifier.classify(
-                data_source,
-                subject.type,
-                subject.identifier,
-                subject.name,
-                weight=subject.weight,
-            )
-            work_requires_full_recalculation = True
+            if batch:
+                batch.classify(identifier, data_source, subject)
+            else:
+                identifier.classify(
+                    data_source,
+                    subject.type,
+                    subject.identifier,
+                    subject.name,
+                    weight=subject.weight,
+                )
+            presentation_changes.add(PresentationCalculationPolicy.CLASSIFICATIONS)
 
         # Associate all links with the primary identifier.
         if replace.links and self.links is not None:
@@ -1992,11 +2349,13 @@ class Metadata(MetaToModelUtility):
                     rights_explanation=link.rights_explanation,
                     original_resource=original_resource,
                     transformation_settings=link.transformation_settings,
+                    resource=batch.resource(link.href) if batch else None,
                 )
                 if link.rel in self.REL_REQUIRES_NEW_PRESENTATION_EDITION:
                     work_requires_new_presentation_edition = True
+                    presentation_changes.add(PresentationCalculationPolicy.LINKS)
                 elif link.rel in self.REL_REQUIRES_FULL_RECALCULATION:
-                    work_requires_full_recalculation = True
+                    presentation_changes.add(PresentationCalculationPolicy.LINKS)
 
             link_objects[link] = link_obj
             if link.thumbnail:
@@ -2008,8 +2367,10 @@ class Metadata(MetaToModelUtility):
                         data_source=data_source,
                         media_type=thumbnail.guessed_media_type,
                         content=thumbnail.content,
+                        resource=batch.resource(thumbnail.href) if batch else None,
                     )
                     work_requires_new_presentation_edition = True
+                    presentation_changes.add(PresentationCalculationPolicy.LINKS)
                     if thumbnail_obj.resource and thumbnail_obj.resource.representation:
                         thumbnail_obj.resource.representation.thumbnail_of = (
                             link_obj.resource.representation
@@ -2028,7 +2389,7 @@ class Metadata(MetaToModelUtility):
 
         # Apply all measurements to the primary identifier
         for measurement in self.measurements:
-            work_requires_full_recalculation = True
+            presentation_changes.add(PresentationCalculationPolicy.MEASUREMENTS)
             identifier.add_measurement(
                 data_source,
                 measurement.quantity_measured,
@@ -2051,6 +2412,7 @@ class Metadata(MetaToModelUtility):
                 edition.sort_author = primary_author.sort_name
                 edition.display_author = primary_author.display_name
                 work_requires_new_presentation_edition = True
+                presentation_changes.add(PresentationCalculationPolicy.EDITIONS)
 
         # The Metadata object may include a CirculationData object which
         # contains information about availability such as open-access
@@ -2058,7 +2420,7 @@ class Metadata(MetaToModelUtility):
         # that that Collection has a LicensePool for this book and that
         # its information is up-to-date.
         if self.circulation:
-            self.circulation.apply(_db, collection, replace)
+            self.circulation.apply(_db, collection, replace, batch=batch)
 
         # obtains a presentation_edition for the title, which will later be used to get a mirror link.
         has_image = any([link.rel == Hyperlink.IMAGE for link in self.links])
@@ -2087,6 +2449,7 @@ class Metadata(MetaToModelUtility):
         )
         if made_changes:
             work_requires_new_presentation_edition = True
+            presentation_changes.add(PresentationCalculationPolicy.EDITIONS)
 
         # The metadata wrangler doesn't need information from these data sources.
         # We don't need to send it information it originally provided, and
@@ -2135,7 +2498,7 @@ class Metadata(MetaToModelUtility):
             collection=None,
         )
 
-        if work_requires_full_recalculation or work_requires_new_presentation_edition:
+        if presentation_changes:
             # If there is a Work associated with the Edition's primary
             # identifier, mark it for recalculation.
 
@@ -2148,11 +2511,7 @@ class Metadata(MetaToModelUtility):
                 on_multiple="interchangeable",
             )
             if pool and pool.work:
-                work = pool.work
-                if work_requires_full_recalculation:
-                    work.needs_full_presentation_recalculation()
-                else:
-                    work.needs_new_presentation_edition()
+                pool.work.presentation_inputs_changed(*presentation_changes)
 
         return edition, work_requires_new_presentation_edition
 
@@ -2190,7 +2549,14 @@ class Metadata(MetaToModelUtility):
             )
         return thumbnail_obj
 
-    def update_contributions(self, _db, edition, metadata_client=None, replace=True):
+    def update_contributions(
+        self, _db, edition, metadata_client=None, replace=True, resolver=None
+    ):
+        """Replace or add to an Edition's Contributions.
+
+        :param resolver: A ContributorResolver to use when finding
+            Contributors, if this is part of a larger import.
+        """
         contributors_changed = False
         old_contributors = []
         new_contributors = []
@@ -2210,14 +2576,24 @@ class Metadata(MetaToModelUtility):
             edition.contributions = surviving_contributions
 
         for contributor_data in self.contributors:
-            contributor_data.find_sort_name(_db, self.identifiers, metadata_client)
+            contributor_data.find_sort_name(
+                _db, self.identifiers, metadata_client, resolver
+            )
             if (
                 contributor_data.sort_name
                 or contributor_data.lc
                 or contributor_data.viaf
             ):
+                name = contributor_data.sort_name
+                if resolver:
+                    contributors, is_new = resolver.lookup(
+                        sort_name=contributor_data.sort_name,
+                        lc=contributor_data.lc,
+                        viaf=contributor_data.viaf,
+                    )
+                    name = contributors[0]
                 contributor = edition.add_contributor(
-                    name=contributor_data.sort_name,
+                    name=name,
                     roles=contributor_data.roles,
                     lc=contributor_data.lc,
                     viaf=contributor_data.viaf,
@@ -2235,6 +2611,8 @@ class Metadata(MetaToModelUtility):
                     contributor.viaf = contributor_data.viaf
                 if contributor_data.wikipedia_name:
                     contributor.wikipedia_name = contributor_data.wikipedia_name
+                if resolver:
+                    resolver.add(contributor)
             else:
                 self.log.info(
                     "Not registering %s because no sort name, LC, or VIAF",
@@ -2268,6 +2646,268 @@ class Metadata(MetaToModelUtility):
             self.recommendations.remove(identifier_data)
 
 
+class MetadataBatch(object):
+    """The database objects needed to apply a batch of Metadata and
+    CirculationData objects, such as one page of an OPDS feed.
+
+    Applying a single Metadata object makes separate round trips to
+    find or create its Identifiers, its Edition, its Subjects and the
+    Resources behind its links. A MetadataBatch finds all of these for
+    the whole batch with a fixed number of set-based queries, and
+    creates any that are missing with bulk INSERT ... ON CONFLICT
+    statements. Metadata.apply() and CirculationData.apply() use the
+    objects found here, and fall back to looking up anything that's
+    not in the batch the normal way.
+    """
+
+    def __init__(
+        self,
+        _db,
+        metadatas=None,
+        circulations=None,
+        collection=None,
+        contributor_resolver=None,
+    ):
+        """Constructor.
+
+        :param metadatas: A list of Metadata objects.
+        :param circulations: A list of CirculationData objects. The
+            CirculationData associated with each Metadata object is
+            included automatically.
+        :param collection: If LicensePools are going to be created or
+            updated, the Collection they belong to.
+        :param contributor_resolver: A ContributorResolver that will be used
+            for the rest of the import run. If this is not provided, a
+            new one will be created for this batch.
+        """
+        self._db = _db
+        self.collection = collection
+        self.contributor_resolver = contributor_resolver or ContributorResolver(_db)
+
+        # (type, identifier) -> Identifier
+        self.identifiers = {}
+
+        # (data source ID, identifier ID) -> Edition
+        self.editions = {}
+
+        # (type, identifier) -> Subject
+        self.subjects = {}
+
+        # URL -> Resource
+        self.resources = {}
+
+        # (data source ID, identifier ID) -> LicensePool
+        self.license_pools = {}
+
+        metadatas = [x for x in metadatas or [] if x]
+        circulations = [x for x in circulations or [] if x]
+        circulations += [x.circulation for x in metadatas if x.circulation]
+        self._load(metadatas, circulations)
+
+    @classmethod
+    def _foreign_id(cls, identifier):
+        """Normalize an Identifier or IdentifierData into a
+        (type, identifier) 2-tuple, or None if it's not valid.
+        """
+        if not identifier:
+            return None
+        try:
+            foreign_id = Identifier.prepare_foreign_type_and_identifier(
+                identifier.type, identifier.identifier
+            )
+        except ValueError:
+            # Let the item-level code raise this error.
+            return None
+        if not all(foreign_id):
+            return None
+        return foreign_id
+
+    def _load(self, metadatas, circulations):
+        _db = self._db
+
+        # DataSources are cached by the data objects themselves.
+        for item in metadatas + circulations:
+            try:
+                item.data_source(_db)
+            except ValueError:
+                # Let the item-level code raise this error.
+                pass
+
+        # Identifiers.
+        foreign_ids = set()
+        for metadata in metadatas:
+            foreign_ids.add(self._foreign_id(metadata.primary_identifier))
+            for identifier_data in metadata.identifiers or []:
+                foreign_ids.add(self._foreign_id(identifier_data))
+        for circulation in circulations:
+            if not circulation.primary_identifier_obj:
+                foreign_ids.add(self._foreign_id(circulation._primary_identifier))
+        foreign_ids.discard(None)
+        self.identifiers = Identifier.for_foreign_ids(_db, foreign_ids)
+        for circulation in circulations:
+            if not circulation.primary_identifier_obj:
+                circulation.primary_identifier_obj = self.identifier(
+                    circulation._primary_identifier
+                )
+
+        # Editions. New Editions aren't created here, so that an item
+        # that fails to import doesn't leave an empty Edition behind.
+        primary_identifiers_by_data_source = defaultdict(list)
+        for metadata in metadatas:
+            identifier = self.identifier(metadata.primary_identifier)
+            if metadata.data_source_obj and identifier:
+                primary_identifiers_by_data_source[metadata.data_source_obj].append(
+                    identifier
+                )
+        for data_source, identifiers in primary_identifiers_by_data_source.items():
+            editions = Edition.for_foreign_ids(
+                _db, data_source, identifiers, create_if_not_exists=False
+            )
+            for identifier_id, edition in editions.items():
+                self.editions[(data_source.id, identifier_id)] = edition
+
+        # Load the classifications and links of the primary
+        # identifiers in bulk, so that replacing them can happen in
+        # memory.
+        primary_identifier_ids = set(
+            identifier.id
+            for identifiers in primary_identifiers_by_data_source.values()
+            for identifier in identifiers
+        )
+        primary_identifier_ids.update(
+            circulation.primary_identifier_obj.id
+            for circulation in circulations
+            if circulation.primary_identifier_obj
+        )
+        if primary_identifier_ids:
+            _db.query(Identifier).filter(
+                Identifier.id.in_(primary_identifier_ids)
+            ).options(
+                selectinload(Identifier.classifications).joinedload(
+                    Classification.subject
+                ),
+                selectinload(Identifier.links).joinedload(Hyperlink.resource),
+            ).all()
+
+        # Subjects.
+        self.subjects = Subject.bulk_lookup(
+            _db,
+            [
+                (subject.type, subject.identifier, subject.name)
+                for metadata in metadatas
+                for subject in metadata.subjects
+            ],
+        )
+
+        # Contributors.
+        self.contributor_resolver.prefetch(
+            [
+                contributor
+                for metadata in metadatas
+                for contributor in metadata.contributors
+            ]
+        )
+
+        # Resources. If a Resource has to be created, it's created
+        # with the same information Identifier.add_link would use.
+        rights_statuses = {}
+
+        def rights_status(uri):
+            if uri and uri not in rights_statuses:
+                rights_statuses[uri] = RightsStatus.lookup(_db, uri)
+            return rights_statuses.get(uri)
+
+        create_method_kwargs_by_url = {}
+        for metadata in metadatas:
+            for link in metadata.links:
+                if link.rel not in Hyperlink.METADATA_ALLOWED:
+                    continue
+                create_method_kwargs_by_url.setdefault(
+                    link.href,
+                    dict(
+                        data_source=metadata.data_source_obj,
+                        rights_status=rights_status(link.rights_uri),
+                        rights_explanation=link.rights_explanation,
+                    ),
+                )
+                thumbnail = link.thumbnail
+                if thumbnail and thumbnail.rel == Hyperlink.THUMBNAIL_IMAGE:
+                    create_method_kwargs_by_url.setdefault(
+                        thumbnail.href, dict(data_source=metadata.data_source_obj)
+                    )
+        for circulation in circulations:
+            for link in circulation.links:
+                if link.rel in Hyperlink.CIRCULATION_ALLOWED:
+                    create_method_kwargs_by_url.setdefault(
+                        link.href, dict(data_source=circulation.data_source_obj)
+                    )
+        self.resources = Resource.bulk_lookup(_db, create_method_kwargs_by_url)
+
+        # LicensePools. These aren't created here, since creating a
+        # LicensePool has side effects that need to happen one at a time.
+        if self.collection and primary_identifier_ids:
+            qu = _db.query(LicensePool).filter(
+                LicensePool.collection == self.collection,
+                LicensePool.identifier_id.in_(primary_identifier_ids),
+            )
+            for pool in qu:
+                self.license_pools[(pool.data_source_id, pool.identifier_id)] = pool
+
+    def identifier(self, identifier):
+        """Find the Identifier for an IdentifierData, if it's in the batch."""
+        return self.identifiers.get(self._foreign_id(identifier))
+
+    def edition(self, metadata):
+        """Find the Edition for a Metadata object, if it's in the batch."""
+        identifier = self.identifier(metadata.primary_identifier)
+        if not metadata.data_source_obj or not identifier:
+            return None
+        return self.editions.get((metadata.data_source_obj.id, identifier.id))
+
+    def subject(self, subject_data):
+        """Find the Subject for a SubjectData, if it's in the batch."""
+        return self.subjects.get((subject_data.type, subject_data.identifier))
+
+    def resource(self, url):
+        """Find the Resource for a URL, if it's in the batch."""
+        return self.resources.get(url)
+
+    def license_pool(self, collection, data_source, identifier):
+        """Find an existing LicensePool, if it's in the batch."""
+        if collection != self.collection or not data_source or not identifier:
+            return None
+        return self.license_pools.get((data_source.id, identifier.id))
+
+    def classify(self, identifier, data_source, subject_data):
+        """Classify an Identifier under a Subject, as Identifier.classify
+        does, but without going to the database to find the Subject or
+        any existing Classification.
+        """
+        subject = self.subject(subject_data)
+        if not subject:
+            return identifier.classify(
+                data_source,
+                subject_data.type,
+                subject_data.identifier,
+                subject_data.name,
+                weight=subject_data.weight,
+            )
+
+        for classification in identifier.classifications:
+            if (
+                classification.subject == subject
+                and classification.data_source == data_source
+            ):
+                break
+        else:
+            classification = Classification(
+                identifier=identifier, subject=subject, data_source=data_source
+            )
+            self._db.add(classification)
+        classification.weight = subject_data.weight
+        return classification
+
+
 class CSVFormatError(csv.Error):
     pass
 
@@ -0,0 +1,51 @@
+-- Materialize the closure of the equivalents graph, so that finding
+-- an Identifier's equivalents is an indexed lookup instead of a
+-- recursive walk. The table is kept up to date as Equivalencies
+-- change; bin/rebuild_equivalent_identifiers recalculates it from
+-- scratch.
+CREATE TABLE IF NOT EXISTS equivalentidentifiers (
+    identifier_id integer NOT NULL REFERENCES identifiers(id) ON DELETE CASCADE,
+    equivalent_id integer NOT NULL REFERENCES identifiers(id) ON DELETE CASCADE,
+    depth integer NOT NULL,
+    strength double precision,
+    PRIMARY KEY (identifier_id, equivalent_id, depth)
+);
+CREATE INDEX IF NOT EXISTS ix_equivalentidentifiers_equivalent_id ON equivalentidentifiers (equivalent_id);
+
+-- Fill it in. Paths of up to 5 Equivalencies with a strength above
+-- 0.5 are stored (see EquivalentIdentifier.MAX_LEVELS and
+-- EquivalentIdentifier.MIN_THRESHOLD).
+DELETE FROM equivalentidentifiers;
+WITH RECURSIVE walks(identifier_id, equivalent_id, strength, depth) AS (
+    SELECT id, id, 1::DOUBLE PRECISION, 0
+    FROM (SELECT input_id AS id FROM equivalents UNION SELECT output_id FROM equivalents) AS ids
+    WHERE id IS NOT NULL
+    UNION
+    SELECT w.identifier_id,
+        CASE WHEN e.input_id = w.equivalent_id THEN e.output_id ELSE e.input_id END,
+        w.strength * e.strength,
+        w.depth + 1
+    FROM walks w JOIN equivalents e
+        ON e.input_id = w.equivalent_id OR e.output_id = w.equivalent_id
+    WHERE w.depth < 5
+        AND e.enabled = true
+        AND e.input_id != e.output_id
+        AND w.strength * e.strength > 0.5
+),
+best AS (
+    SELECT identifier_id, equivalent_id, depth, max(strength) AS strength
+    FROM walks
+    WHERE identifier_id != equivalent_id
+    GROUP BY identifier_id, equivalent_id, depth
+),
+frontier AS (
+    SELECT *, max(strength) OVER (
+        PARTITION BY identifier_id, equivalent_id ORDER BY depth
+        ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+    ) AS shorter
+    FROM best
+)
+INSERT INTO equivalentidentifiers (identifier_id, equivalent_id, depth, strength)
+SELECT identifier_id, equivalent_id, depth, strength
+FROM frontier
+WHERE shorter IS NULL OR strength > shorter;
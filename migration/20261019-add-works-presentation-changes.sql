@@ -0,0 +1,4 @@
+-- Keep track of which kinds of information that go into a Work's
+-- presentation have changed, so that only the parts of the
+-- presentation that depend on them need to be recalculated.
+ALTER TABLE works ADD COLUMN IF NOT EXISTS presentation_changes varchar[];
@@ -0,0 +1,12 @@
+-- Keep HTTP validators separately for each collection, so that a
+-- collection importing a feed another collection already imported
+-- doesn't get a 304 for pages it has never seen.
+ALTER TABLE IF EXISTS httpvalidators ADD COLUMN IF NOT EXISTS collection_id integer REFERENCES collections(id) ON DELETE CASCADE;
+CREATE INDEX IF NOT EXISTS ix_httpvalidators_collection_id ON httpvalidators (collection_id);
+
+-- The URL alone is no longer unique.
+ALTER TABLE IF EXISTS httpvalidators DROP CONSTRAINT IF EXISTS httpvalidators_url_key;
+DROP INDEX IF EXISTS ix_httpvalidators_url;
+CREATE INDEX IF NOT EXISTS ix_httpvalidators_url ON httpvalidators (url);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_httpvalidators_url_no_collection ON httpvalidators (url) WHERE collection_id IS NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS ix_httpvalidators_url_collection_id ON httpvalidators (url, collection_id);
@@ -1,18 +1,25 @@
 # encoding: utf-8
 
+import contextlib
+import json
 import logging
 import os
+import random
+import time
 import warnings
 
 from psycopg2.extensions import adapt as sqlescape
 from psycopg2.extras import NumericRange
-from sqlalchemy import create_engine
-from sqlalchemy.exc import IntegrityError, SAWarning
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import DisconnectionError, IntegrityError, SAWarning
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
-from sqlalchemy.sql import compiler, select
-from sqlalchemy.sql.expression import literal_column, table
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql import compiler, func, select
+from sqlalchemy.sql.expression import literal, literal_column, table
 
 Base = declarative_base()
 
@@ -109,6 +116,44 @@ def get_one_or_create(db, model, create_method="", create_method_kwargs=None, **
             return db.query(model).filter_by(**kwargs).one(), False
 
 
+def unnested(name, **columns):
+    """Build a table out of parallel lists of values, so that a batch
+    of values can be looked up with a single indexed join instead of
+    a long chain of OR clauses.
+
+    e.g. unnested("requested", type=(types, String), identifier=(ids, String))
+    becomes SELECT unnest(ARRAY[...]) AS type, unnest(ARRAY[...]) AS identifier
+
+    :param name: The alias of the resulting table.
+    :param columns: Maps column names to 2-tuples (values, SQL type).
+        All the lists of values must be the same length.
+    """
+    return select(
+        [
+            func.unnest(literal(list(values), ARRAY(type))).label(column)
+            for column, (values, type) in columns.items()
+        ]
+    ).alias(name)
+
+
+def estimated_count(_db, query):
+    """Ask the query planner how many rows a query will return, without
+    running the query.
+
+    This is much faster than query.count() when there are a lot of
+    rows, but it's only an estimate, based on the table statistics.
+    """
+    compiled = query.statement.compile(dialect=_db.get_bind().dialect)
+    [[plan]] = (
+        _db.connection()
+        .execute("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params)
+        .fetchall()
+    )
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]["Plan Rows"]
+
+
 def numericrange_to_string(r):
     """Helper method to convert a NumericRange to a human-readable string."""
     if not r:
@@ -159,6 +204,28 @@ class PresentationCalculationPolicy(object):
     DEFAULT_THRESHOLD = 0.5
     DEFAULT_CUTOFF = 1000
 
+    # The kinds of information that go into a Work's presentation.
+    EDITIONS = "editions"
+    CLASSIFICATIONS = "classifications"
+    MEASUREMENTS = "measurements"
+    LINKS = "links"
+    LICENSE_POOLS = "license-pools"
+
+    # For each kind of information, the parts of a Work's
+    # presentation that need to be recalculated when it changes.
+    DEPENDENCIES = {
+        EDITIONS: ["choose_edition", "set_edition_metadata", "choose_cover"],
+        CLASSIFICATIONS: ["classify"],
+        MEASUREMENTS: ["calculate_quality"],
+        LINKS: ["choose_summary", "choose_cover"],
+        LICENSE_POOLS: [
+            "choose_edition",
+            "classify",
+            "choose_summary",
+            "calculate_quality",
+        ],
+    }
+
     def __init__(
         self,
         choose_edition=True,
@@ -255,6 +322,31 @@ class PresentationCalculationPolicy(object):
             update_search_index=True,
         )
 
+    @classmethod
+    def for_changes(cls, changes, **kwargs):
+        """A PresentationCalculationPolicy that recalculates only the
+        parts of a Work's presentation that depend on information
+        that has changed.
+
+        :param changes: Some of the kinds of information listed in
+            DEPENDENCIES, e.g. MEASUREMENTS.
+        :param kwargs: Other arguments to the constructor.
+        """
+        parts = set()
+        for change in changes:
+            parts.update(cls.DEPENDENCIES[change])
+        for part in set(
+            part for dependencies in cls.DEPENDENCIES.values() for part in dependencies
+        ):
+            kwargs.setdefault(part, part in parts)
+        return cls(**kwargs)
+
+    def recalculates(self, change):
+        """Will this policy recalculate every part of a Work's
+        presentation that depends on the given kind of information?
+        """
+        return all(getattr(self, part) for part in self.DEPENDENCIES[change])
+
     @classmethod
     def reset_cover(cls):
         """A PresentationCalculationPolicy that only resets covers
@@ -288,18 +380,283 @@ def dump_query(query):
 DEBUG = False
 
 
+class InstrumentedQueuePool(QueuePool):
+    """A QueuePool that keeps track of how often connections are checked
+    out and how long it takes to get one.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(InstrumentedQueuePool, self).__init__(*args, **kwargs)
+        self.reset_statistics()
+
+    def reset_statistics(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def recreate(self):
+        # dispose() replaces the pool; the statistics carry over.
+        pool = super(InstrumentedQueuePool, self).recreate()
+        for name in ("checkouts", "timeouts", "wait_seconds", "max_wait_seconds"):
+            setattr(pool, name, getattr(self, name))
+        return pool
+
+    def _do_get(self):
+        started = time.time()
+        try:
+            connection = super(InstrumentedQueuePool, self)._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.time() - started
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        self.checkouts += 1
+        return connection
+
+
 class SessionManager(object):
 
     # A function that calculates recursively equivalent identifiers
     # is also defined in SQL.
     RECURSIVE_EQUIVALENTS_FUNCTION = "recursive_equivalents.sql"
 
+    # So is a function that looks them up in the equivalentidentifiers
+    # table instead.
+    EQUIVALENT_IDENTIFIERS_FUNCTION = "equivalent_identifiers.sql"
+
+    # The SQL functions, and the files that define them.
+    SQL_FUNCTIONS = [
+        ("fn_recursive_equivalents", RECURSIVE_EQUIVALENTS_FUNCTION),
+        ("fn_equivalent_identifiers", EQUIVALENT_IDENTIFIERS_FUNCTION),
+    ]
+
+    # Engines for databases that have been fully initialized, by URL.
     engine_for_url = {}
 
+    # The engine for each database URL, shared by everything in this
+    # process that uses that database, and the ID of the process that
+    # created it.
+    engines = {}
+
+    # The key in a connection's info that says its current transaction
+    # has written something.
+    WROTE = "wrote"
+
+    # Statements that start with these words don't write anything.
+    READ_STATEMENTS = ("SELECT", "SHOW", "SET ")
+
+    # How often to check how far behind each read replica is, and the
+    # most recent answer for each replica URL.
+    REPLICA_LAG_CHECK_SECONDS = 5
+    replica_lags = {}
+
+    # Engines inherited from a parent process. Their connections
+    # belong to the parent, so they're kept here, unused, rather than
+    # being closed or garbage-collected out from under it.
+    abandoned_engines = []
+
+    @classmethod
+    def engine(cls, url=None, **settings):
+        """Find or create the engine for a database.
+
+        Every caller in a process gets the same engine, and so shares
+        its connection pool. A process that was forked from another
+        gets engines of its own.
+
+        :param settings: Override Configuration.database_pool_settings().
+            These only take effect when the engine is created.
+        """
+        url = str(url or Configuration.database_url())
+        pid = os.getpid()
+        if url in cls.engines:
+            engine_pid, engine = cls.engines[url]
+            if engine_pid == pid:
+                return engine
+            cls.abandoned_engines.append(engine)
+
+        engine = cls.create_engine(url, **settings)
+        cls.engines[url] = (pid, engine)
+        return engine
+
+    @classmethod
+    def create_engine(cls, url, **settings):
+        """Create an engine with a connection pool configured through
+        Configuration.database_pool_settings().
+
+        :param read_only: If this is True, every transaction on the
+            engine is read-only.
+        """
+        settings = dict(Configuration.database_pool_settings(), **settings)
+        options = []
+        statement_timeout = settings.pop("statement_timeout", None)
+        if statement_timeout:
+            options.append("-c statement_timeout=%d" % statement_timeout)
+        if settings.pop("read_only", False):
+            options.append("-c default_transaction_read_only=on")
+        connect_args = dict()
+        if options:
+            connect_args["options"] = " ".join(options)
+        engine = create_engine(
+            url,
+            echo=DEBUG,
+            poolclass=InstrumentedQueuePool,
+            connect_args=connect_args,
+            **settings
+        )
+
+        # A forked process may have copies of its parent's pooled
+        # connections. It must never use them, since the connection
+        # would then be shared by two processes.
+        @event.listens_for(engine, "connect")
+        def connect(dbapi_connection, connection_record):
+            connection_record.info["pid"] = os.getpid()
+
+        @event.listens_for(engine, "checkout")
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            pid = os.getpid()
+            if connection_record.info["pid"] != pid:
+                connection_record.connection = connection_proxy.connection = None
+                raise DisconnectionError(
+                    "Connection belongs to process %s, not %s."
+                    % (connection_record.info["pid"], pid)
+                )
+
+        # Keep track of whether each connection's current transaction
+        # has written anything, so reads that need to see the writes
+        # aren't sent to a replica.
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(
+            connection, cursor, statement, parameters, context, executemany
+        ):
+            if not statement.lstrip()[:10].upper().startswith(cls.READ_STATEMENTS):
+                connection.info[cls.WROTE] = True
+
+        @event.listens_for(engine, "commit")
+        @event.listens_for(engine, "rollback")
+        def transaction_end(connection):
+            connection.info.pop(cls.WROTE, None)
+
+        @event.listens_for(engine, "checkin")
+        def checkin(dbapi_connection, connection_record):
+            connection_record.info.pop(cls.WROTE, None)
+
+        return engine
+
     @classmethod
-    def engine(cls, url=None):
-        url = url or Configuration.database_url()
-        return create_engine(url, echo=DEBUG)
+    def has_written(cls, _db):
+        """Has this session changed anything that the rest of the world
+        can't see yet?
+
+        This includes changes that haven't been flushed, as well as
+        writes to the database that haven't been committed.
+        """
+        if _db.new or _db.dirty or _db.deleted:
+            return True
+        return bool(_db.connection().info.get(cls.WROTE))
+
+    @classmethod
+    def replica_lag(cls, url):
+        """Find how many seconds a read replica is behind the primary
+        database.
+
+        The answer is cached for REPLICA_LAG_CHECK_SECONDS.
+
+        :return: A number of seconds, or None if the replica can't be
+            reached.
+        """
+        now = time.time()
+        if url in cls.replica_lags:
+            checked_at, lag = cls.replica_lags[url]
+            if now - checked_at < cls.REPLICA_LAG_CHECK_SECONDS:
+                return lag
+
+        # If no transactions are being replayed, the replica is
+        # caught up, no matter how long ago the last one was.
+        query = text(
+            "SELECT CASE "
+            "WHEN NOT pg_is_in_recovery() THEN 0 "
+            "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) "
+            "END"
+        )
+        try:
+            with cls.engine(url, read_only=True).connect() as connection:
+                lag = connection.execute(query).scalar()
+            lag = float(lag) if lag is not None else None
+        except Exception as e:
+            logging.warning("Could not check replica lag: %s", e)
+            lag = None
+        cls.replica_lags[url] = (now, lag)
+        return lag
+
+    @classmethod
+    def replica_engine(cls, _db):
+        """Choose a read replica that can stand in for `_db`.
+
+        :return: An Engine, or None if the read should go to the
+            primary database: because no replicas are configured,
+            because `_db` has written something the replicas can't see,
+            or because every replica is too far behind.
+        """
+        urls = Configuration.database_replica_urls()
+        if not urls or cls.has_written(_db):
+            return None
+        max_lag = Configuration.database_max_replica_lag()
+        for url in random.sample(urls, len(urls)):
+            lag = cls.replica_lag(url)
+            if lag is not None and lag <= max_lag:
+                return cls.engine(url, read_only=True)
+        logging.info("No read replica is available; reading from the primary.")
+        return None
+
+    @classmethod
+    @contextlib.contextmanager
+    def read_only_session(cls, _db):
+        """Get a session to use for reads that could go to a replica.
+
+        Since a replica may be a little behind, the code using the
+        session must be prepared for things to be missing or out of
+        date, and check with `_db` if that matters.
+
+        :param _db: A session on the primary database.
+        :yield: A read-only session on a replica, which is closed
+            afterwards, or `_db` itself if no replica can be used.
+        """
+        engine = cls.replica_engine(_db)
+        if engine is None:
+            yield _db
+            return
+        session = Session(bind=engine)
+        try:
+            yield session
+        finally:
+            session.close()
+
+    @classmethod
+    def pool_status(cls):
+        """Describe the connection pool of every engine this process has
+        created.
+
+        :return: A dictionary mapping each database URL (without its
+            password) to a dictionary of statistics.
+        """
+        status = dict()
+        for url, (pid, engine) in cls.engines.items():
+            pool = engine.pool
+            status[engine.url.__to_string__()] = dict(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+                checkouts=getattr(pool, "checkouts", None),
+                timeouts=getattr(pool, "timeouts", None),
+                wait_seconds=getattr(pool, "wait_seconds", None),
+                max_wait_seconds=getattr(pool, "max_wait_seconds", None),
+            )
+        return status
 
     @classmethod
     def sessionmaker(cls, url=None, session=None):
@@ -338,27 +695,26 @@ class SessionManager(object):
             cls.initialize_schema(engine)
         connection = engine.connect()
 
-        # Check if the recursive equivalents function exists already.
-        query = (
-            select([literal_column("proname")])
-            .select_from(table("pg_proc"))
-            .where(literal_column("proname") == "fn_recursive_equivalents")
-        )
-        result = connection.execute(query)
-        result = list(result)
-
-        # If it doesn't, create it.
-        if not result and initialize_data:
-            resource_file = os.path.join(
-                cls.resource_directory(), cls.RECURSIVE_EQUIVALENTS_FUNCTION
+        for function_name, filename in cls.SQL_FUNCTIONS:
+            # Check if the function exists already.
+            query = (
+                select([literal_column("proname")])
+                .select_from(table("pg_proc"))
+                .where(literal_column("proname") == function_name)
             )
-            if not os.path.exists(resource_file):
-                raise IOError(
-                    "Could not load recursive equivalents function from %s: file does not exist."
-                    % resource_file
-                )
-            sql = open(resource_file).read()
-            connection.execute(sql)
+            result = connection.execute(query)
+            result = list(result)
+
+            # If it doesn't, create it.
+            if not result and initialize_data:
+                resource_file = os.path.join(cls.resource_directory(), filename)
+                if not os.path.exists(resource_file):
+                    raise IOError(
+                        "Could not load %s function from %s: file does not exist."
+                        % (function_name, resource_file)
+                    )
+                sql = open(resource_file).read()
+                connection.execute(sql)
 
         if initialize_data:
             session = Session(connection)
@@ -487,17 +843,25 @@ from .collection import (
 from .complaint import Complaint
 from .configuration import (
     ConfigurationSetting,
+    ConfigurationSettingResolver,
     ExternalIntegration,
     ExternalIntegrationLink,
 )
 from .contributor import Contribution, Contributor
-from .coverage import BaseCoverageRecord, CoverageRecord, Timestamp, WorkCoverageRecord
+from .coverage import (
+    BaseCoverageRecord,
+    CoverageQueueItem,
+    CoverageQueueListener,
+    CoverageRecord,
+    Timestamp,
+    WorkCoverageRecord,
+)
 from .credential import Credential, DelegatedPatronIdentifier, DRMDeviceIdentifier
 from .customlist import CustomList, CustomListEntry
 from .datasource import DataSource
 from .edition import Edition
 from .hassessioncache import HasSessionCache
-from .identifier import Equivalency, Identifier
+from .identifier import Equivalency, EquivalentIdentifier, Identifier
 from .integrationclient import IntegrationClient
 from .library import Library
 from .licensing import (
@@ -518,5 +882,11 @@ from .patron import (
     Patron,
     PatronProfileStorage,
 )
-from .resource import Hyperlink, Representation, Resource, ResourceTransformation
-from .work import Work, WorkGenre
+from .resource import (
+    HTTPValidators,
+    Hyperlink,
+    Representation,
+    Resource,
+    ResourceTransformation,
+)
+from .work import PresentationInputs, Work, WorkGenre
@@ -10,7 +10,7 @@ from sqlalchemy.sql.expression import and_
 
 from ..util.datetime_helpers import utc_now
 from ..util.flask_util import OPDSFeedResponse
-from . import Base, flush, get_one, get_one_or_create
+from . import Base, SessionManager, flush, get_one, get_one_or_create
 
 
 class CachedFeed(Base):
@@ -136,14 +136,22 @@ class CachedFeed(Base):
             pagination=keys.pagination_key,
         )
         feed_data = None
+        feed_obj = None
         if max_age is cls.IGNORE_CACHE or isinstance(max_age, int) and max_age <= 0:
             # Don't even bother checking for a CachedFeed: we're
             # just going to replace it.
-            feed_obj = None
+            pass
         else:
-            feed_obj = get_one(_db, cls, **kwargs)
-
-        should_refresh = cls._should_refresh(feed_obj, max_age)
+            if not raw:
+                # If all we need is the content of a fresh feed, it can
+                # come from a read replica.
+                feed_data = cls._fetch_content_from_replica(_db, max_age, kwargs)
+            if feed_data is None:
+                # A replica may be behind, so if it didn't have a
+                # fresh feed, the primary database might.
+                feed_obj = get_one(_db, cls, **kwargs)
+
+        should_refresh = feed_data is None and cls._should_refresh(feed_obj, max_age)
         if should_refresh:
             # This is a cache miss. Either feed_obj is None or
             # it's no good. We need to generate a new feed.
@@ -203,6 +211,22 @@ class CachedFeed(Base):
 
         return OPDSFeedResponse(response=feed_data, **response_kwargs)
 
+    @classmethod
+    def _fetch_content_from_replica(cls, _db, max_age, kwargs):
+        """Look up a cached feed on a read replica of the database.
+
+        :param kwargs: The arguments that identify the feed to get_one().
+        :return: The content of the feed, or None if there's no replica,
+            or the replica has no fresh copy of the feed.
+        """
+        with SessionManager.read_only_session(_db) as reader:
+            if reader is _db:
+                return None
+            feed_obj = get_one(reader, cls, **kwargs)
+            if feed_obj is None or cls._should_refresh(feed_obj, max_age):
+                return None
+            return feed_obj.content
+
     @classmethod
     def feed_type(cls, worklist, facets):
         """Determine the 'type' of the feed.
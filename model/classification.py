@@ -13,10 +13,11 @@ from sqlalchemy import (
     Unicode,
     UniqueConstraint,
 )
-from sqlalchemy.dialects.postgresql import INT4RANGE
+from sqlalchemy.dialects.postgresql import INT4RANGE, insert
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm.session import Session
+from sqlalchemy.sql.expression import and_
 from sqlalchemy.sql.functions import func
 
 from .. import classifier
@@ -28,6 +29,7 @@ from . import (
     numericrange_to_string,
     numericrange_to_tuple,
     tuple_to_numericrange,
+    unnested,
 )
 from .constants import DataSourceConstants
 from .hassessioncache import HasSessionCache
@@ -229,6 +231,65 @@ class Subject(Base):
             subject.name = name
         return subject, new
 
+    @classmethod
+    def bulk_lookup(cls, _db, subjects, autocreate=True):
+        """Turn a batch of subject types and identifiers into Subjects.
+
+        This is the batch equivalent of lookup(), with the difference
+        that only subjects with an identifier can be looked up this
+        way -- type + name is not unique.
+
+        :param subjects: A list of (type, identifier, name) 3-tuples.
+        :return: A dictionary mapping (type, identifier) 2-tuples
+            to Subjects.
+        """
+        names = {}
+        for type, identifier, name in subjects:
+            if not type or not identifier:
+                continue
+            if name or (type, identifier) not in names:
+                names[(type, identifier)] = name
+        if not names:
+            return {}
+
+        def find(keys):
+            types, identifiers = list(zip(*keys))
+            requested = unnested(
+                "requested", type=(types, Unicode), identifier=(identifiers, Unicode)
+            )
+            qu = _db.query(Subject).join(
+                requested,
+                and_(
+                    Subject.type == requested.c.type,
+                    Subject.identifier == requested.c.identifier,
+                ),
+            )
+            return {(s.type, s.identifier): s for s in qu}
+
+        by_key = find(names.keys())
+        missing = set(names.keys()) - set(by_key.keys())
+        if missing and autocreate:
+            insert_stmt = (
+                insert(Subject.__table__)
+                .values(
+                    [
+                        dict(type=key[0], identifier=key[1], name=names[key])
+                        for key in missing
+                    ]
+                )
+                .on_conflict_do_nothing(index_elements=["type", "identifier"])
+            )
+            _db.execute(insert_stmt)
+            by_key.update(find(missing))
+
+        for key, subject in by_key.items():
+            name = names[key]
+            if name and not subject.name:
+                # We just discovered the name of a subject that previously
+                # had only an ID.
+                subject.name = name
+        return by_key
+
     @classmethod
     def common_but_not_assigned_to_genre(
         cls, _db, min_occurances=1000, type_restriction=None
@@ -464,6 +525,7 @@ class Genre(Base, HasSessionCache):
     """
 
     __tablename__ = "genres"
+    PROCESS_CACHE = True
     id = Column(Integer, primary_key=True)
     name = Column(Unicode, unique=True, index=True)
 
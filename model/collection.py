@@ -44,6 +44,7 @@ class Collection(Base, HasSessionCache):
     """A Collection is a set of LicensePools obtained through some mechanism."""
 
     __tablename__ = "collections"
+    PROCESS_CACHE = True
     id = Column(Integer, primary_key=True)
 
     name = Column(Unicode, unique=True, nullable=False, index=True)
@@ -1,5 +1,6 @@
 # encoding: utf-8
-# ExternalIntegration, ExternalIntegrationLink, ConfigurationSetting
+# ExternalIntegration, ExternalIntegrationLink, ConfigurationSetting,
+# ConfigurationSettingResolver
 import inspect
 import json
 import logging
@@ -12,7 +13,7 @@ from sqlalchemy import Column, ForeignKey, Index, Integer, Unicode
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm.session import Session
-from sqlalchemy.sql.expression import and_
+from sqlalchemy.sql.expression import and_, or_
 
 from ..config import CannotLoadConfiguration, Configuration
 from ..mirror import MirrorUploader
@@ -26,6 +27,7 @@ from .library import Library
 class ExternalIntegrationLink(Base, HasSessionCache):
 
     __tablename__ = "externalintegrationslinks"
+    PROCESS_CACHE = True
 
     NO_MIRROR_INTEGRATION = "NO_MIRROR"
     # Possible purposes that a storage external integration can be used for.
@@ -563,6 +565,7 @@ class ConfigurationSetting(Base, HasSessionCache):
     """
 
     __tablename__ = "configurationsettings"
+    PROCESS_CACHE = True
     id = Column(Integer, primary_key=True)
     external_integration_id = Column(
         Integer, ForeignKey("externalintegrations.id"), index=True
@@ -828,12 +831,156 @@ class ConfigurationSetting(Base, HasSessionCache):
         Most methods like this go into Configuration, but this one needs
         to reference data model objects for its default value.
         """
-        value = cls.sitewide(_db, Configuration.EXCLUDED_AUDIO_DATA_SOURCES).json_value
+        value = ConfigurationSettingResolver.for_library(_db).json_value(
+            Configuration.EXCLUDED_AUDIO_DATA_SOURCES
+        )
         if value is None:
             value = cls.EXCLUDED_AUDIO_DATA_SOURCES_DEFAULT
         return value
 
 
+class ConfigurationSettingResolver:
+    """Every ConfigurationSetting that applies to one Library, loaded
+    with a single query. If no Library is given, only the settings
+    that don't belong to any particular Library are loaded.
+
+    Reading a value through a resolver never goes to the database,
+    and never creates a ConfigurationSetting that doesn't exist: a
+    missing setting just has no value. The parsed values returned by
+    bool_value(), int_value(), float_value() and json_value() are
+    cached, so don't modify them.
+
+    Resolvers are kept in the session's `info` dictionary. The
+    listeners in model/listeners.py throw them out whenever a
+    setting's value changes or part of the site configuration is
+    created or destroyed.
+    """
+
+    INFO_KEY = "_palace_configuration_resolvers"
+
+    def __init__(self, _db, library=None):
+        self._db = _db
+        self.library_id = library.id if library else None
+
+        qu = _db.query(ConfigurationSetting).filter(
+            or_(
+                ConfigurationSetting.library_id == None,
+                ConfigurationSetting.library_id == self.library_id,
+            )
+        )
+
+        # Index the settings the same way the session cache does, and
+        # put them in the session cache, so that any code that looks
+        # up one of them the usual way won't have to go to the
+        # database either.
+        cache = ConfigurationSetting._cache_from_session(_db)
+        self.settings = {}
+        for setting in qu:
+            key = (setting.library_id, setting.external_integration_id, setting.key)
+            self.settings[key] = setting
+            cache.id[setting.id] = setting
+            cache.key[key] = setting
+
+        # Parsed values, keyed by (type, library ID, integration ID, key).
+        self._values = {}
+
+    @classmethod
+    def for_library(cls, _db, library=None):
+        """Find or create the resolver for a Library in this session.
+
+        If no Library is given, any resolver in this session will do,
+        since they all have the settings that don't belong to a Library.
+        """
+        resolvers = _db.info.setdefault(cls.INFO_KEY, {})
+        if library is None and resolvers:
+            return next(iter(resolvers.values()))
+        if library is not None and library.id is None:
+            # The Library needs an ID before its settings can be found.
+            _db.flush()
+        library_id = library.id if library else None
+        if library_id not in resolvers:
+            resolvers[library_id] = cls(_db, library)
+        return resolvers[library_id]
+
+    @classmethod
+    def reset(cls, _db):
+        """Throw out every resolver in a session.
+
+        :param _db: A Session, or an ORM object that might be in one.
+        """
+        if isinstance(_db, Base):
+            _db = Session.object_session(_db)
+        if _db is not None:
+            _db.info.pop(cls.INFO_KEY, None)
+
+    def _ids(self, library, external_integration):
+        library_id = library.id if library else None
+        if library_id is not None and library_id != self.library_id:
+            raise ValueError(
+                "This resolver doesn't have the settings for library %s." % library_id
+            )
+        external_integration_id = (
+            external_integration.id if external_integration else None
+        )
+        return library_id, external_integration_id
+
+    def setting(self, key, library=None, external_integration=None):
+        """Find a ConfigurationSetting.
+
+        :return: A ConfigurationSetting, or None if there is no such
+            setting.
+        """
+        library_id, external_integration_id = self._ids(library, external_integration)
+        return self.settings.get((library_id, external_integration_id, key))
+
+    def value(self, key, library=None, external_integration=None):
+        """Find the value of a setting, inheriting a default value the
+        same way ConfigurationSetting.value does.
+        """
+        setting = self.setting(key, library, external_integration)
+        if setting is not None and setting._value:
+            return setting._value
+        if library and external_integration:
+            # Use the value set on the ExternalIntegration as a default.
+            return self.value(key, None, external_integration)
+        elif library:
+            # Use the site-wide value as a default.
+            return self.value(key)
+        return None
+
+    def _parsed_value(self, type, parse, key, library, external_integration):
+        library_id, external_integration_id = self._ids(library, external_integration)
+        cache_key = (type, library_id, external_integration_id, key)
+        if cache_key not in self._values:
+            value = self.value(key, library, external_integration)
+            self._values[cache_key] = parse(value) if value else None
+        return self._values[cache_key]
+
+    def bool_value(self, key, library=None, external_integration=None):
+        """Like ConfigurationSetting.bool_value."""
+        return self._parsed_value(
+            "bool",
+            lambda value: value.lower() in ConfigurationSetting.MEANS_YES,
+            key,
+            library,
+            external_integration,
+        )
+
+    def int_value(self, key, library=None, external_integration=None):
+        """Like ConfigurationSetting.int_value."""
+        return self._parsed_value("int", int, key, library, external_integration)
+
+    def float_value(self, key, library=None, external_integration=None):
+        """Like ConfigurationSetting.float_value."""
+        return self._parsed_value("float", float, key, library, external_integration)
+
+    def json_value(self, key, library=None, external_integration=None):
+        """Like ConfigurationSetting.json_value."""
+        return self._parsed_value(
+            "json", json.loads, key, library, external_integration
+        )
+
+
 class HasExternalIntegration(metaclass=ABCMeta):
     """Interface allowing to get access to an external integration"""
 
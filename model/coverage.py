@@ -1,5 +1,8 @@
 # encoding: utf-8
-# BaseCoverageRecord, Timestamp, CoverageRecord, WorkCoverageRecord
+# BaseCoverageRecord, Timestamp, CoverageRecord, WorkCoverageRecord,
+# CoverageQueueItem, CoverageQueueListener
+import select as select_module
+
 from sqlalchemy import (
     Column,
     DateTime,
@@ -10,12 +13,16 @@ from sqlalchemy import (
     String,
     Unicode,
     UniqueConstraint,
+    cast,
+    select,
+    text,
 )
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm.session import Session
 from sqlalchemy.sql.expression import and_, literal, literal_column, or_
 
 from ..util.datetime_helpers import utc_now
-from . import Base, get_one, get_one_or_create
+from . import Base, get_one, get_one_or_create, unnested
 
 
 class BaseCoverageRecord(object):
@@ -398,6 +405,35 @@ class CoverageRecord(Base, BaseCoverageRecord):
             on_multiple="interchangeable",
         )
 
+    @classmethod
+    def lookup_for_identifiers(
+        cls, _db, identifiers, data_source, operation=None, collection=None
+    ):
+        """Find the CoverageRecords for a batch of Identifiers with a
+        single query.
+
+        :param identifiers: A list of Identifiers.
+        :return: A dictionary mapping Identifier IDs to CoverageRecords.
+            Identifiers that have no matching CoverageRecord are not
+            present in the dictionary.
+        """
+        from .datasource import DataSource
+
+        identifier_ids = [i.id for i in identifiers if i is not None]
+        if not identifier_ids:
+            return {}
+
+        if isinstance(data_source, (bytes, str)):
+            data_source = DataSource.lookup(_db, data_source)
+
+        qu = _db.query(cls).filter(
+            cls.identifier_id.in_(identifier_ids),
+            cls.data_source == data_source,
+            cls.operation == operation,
+            cls.collection == collection,
+        )
+        return {record.identifier_id: record for record in qu}
+
     @classmethod
     def add_for(
         self,
@@ -559,6 +595,137 @@ class CoverageRecord(Base, BaseCoverageRecord):
 
         return new_records, ignored_identifiers
 
+    @classmethod
+    def bulk_upsert(
+        cls, _db, outcomes, data_source, operation=None, collection=None, timestamp=None
+    ):
+        """Create or update a CoverageRecord for each of a batch of
+        Identifiers, using one UPDATE and one INSERT ... ON CONFLICT
+        DO UPDATE instead of a flush per record.
+
+        Existing records are updated first, because when `operation`
+        or `collection` is null the unique indexes can't detect a
+        conflict.
+
+        :param outcomes: A list of 3-tuples (Identifier or Edition,
+            status, exception). If an Identifier shows up more than
+            once, the last outcome wins.
+        :return: A list of CoverageRecords, one per distinct Identifier,
+            in the order the outcomes were given.
+        """
+        if not outcomes:
+            return []
+        timestamp = timestamp or utc_now()
+        collection_id = collection.id if collection else None
+
+        by_identifier = dict()
+        for obj, status, exception in outcomes:
+            by_identifier[cls._identifier_for(obj).id] = (status, exception)
+
+        # The raw statements below won't see pending changes.
+        _db.flush()
+
+        def outcome_table(identifier_ids):
+            return unnested(
+                "outcome",
+                identifier_id=(identifier_ids, Integer),
+                status=([by_identifier[i][0] for i in identifier_ids], String),
+                exception=([by_identifier[i][1] for i in identifier_ids], Unicode),
+            )
+
+        table = cls.__table__
+        outcome = outcome_table(sorted(by_identifier))
+        update = (
+            table.update()
+            .where(
+                and_(
+                    table.c.identifier_id == outcome.c.identifier_id,
+                    table.c.data_source_id == data_source.id,
+                    table.c.operation.isnot_distinct_from(operation),
+                    table.c.collection_id.isnot_distinct_from(collection_id),
+                )
+            )
+            .values(
+                status=cast(outcome.c.status, cls.status_enum),
+                exception=outcome.c.exception,
+                timestamp=timestamp,
+            )
+            .returning(*table.c)
+        )
+        records = cls._load_returned(_db, update)
+
+        missing = sorted(set(by_identifier) - set(records))
+        if missing:
+            outcome = outcome_table(missing)
+            insert = pg_insert(table).from_select(
+                [
+                    "identifier_id",
+                    "data_source_id",
+                    "operation",
+                    "collection_id",
+                    "timestamp",
+                    "status",
+                    "exception",
+                ],
+                select(
+                    [
+                        outcome.c.identifier_id,
+                        literal(data_source.id, type_=Integer),
+                        literal(operation, type_=String(255)),
+                        literal(collection_id, type_=Integer),
+                        literal(timestamp, type_=DateTime(timezone=True)),
+                        cast(outcome.c.status, cls.status_enum),
+                        outcome.c.exception,
+                    ]
+                ),
+            )
+            # Another process may have created some of these records
+            # since the UPDATE ran.
+            if collection_id is None:
+                conflict = dict(
+                    index_elements=["identifier_id", "data_source_id", "operation"],
+                    index_where=table.c.collection_id.is_(None),
+                )
+            else:
+                conflict = dict(
+                    index_elements=[
+                        "identifier_id",
+                        "data_source_id",
+                        "operation",
+                        "collection_id",
+                    ]
+                )
+            insert = insert.on_conflict_do_update(
+                set_=dict(
+                    status=insert.excluded.status,
+                    exception=insert.excluded.exception,
+                    timestamp=insert.excluded.timestamp,
+                ),
+                **conflict
+            ).returning(*table.c)
+            records.update(cls._load_returned(_db, insert))
+
+        return [records[i] for i in by_identifier if i in records]
+
+    @classmethod
+    def _identifier_for(cls, obj):
+        from .edition import Edition
+        from .identifier import Identifier
+
+        if isinstance(obj, Identifier):
+            return obj
+        elif isinstance(obj, Edition):
+            return obj.primary_identifier
+        raise ValueError("Cannot create a coverage record for %r." % obj)
+
+    @classmethod
+    def _load_returned(cls, _db, statement):
+        """Run a statement that RETURNs whole CoverageRecord rows and
+        load them, keyed by identifier ID.
+        """
+        records = _db.query(cls).populate_existing().instances(_db.execute(statement))
+        return {record.identifier_id: record for record in records}
+
 
 Index(
     "ix_coveragerecords_data_source_id_operation_identifier_id",
@@ -717,9 +884,318 @@ class WorkCoverageRecord(Base, BaseCoverageRecord):
         )
         _db.execute(insert)
 
+    @classmethod
+    def bulk_upsert(cls, _db, outcomes, operation, timestamp=None):
+        """Create or update a WorkCoverageRecord for each of a batch of
+        Works, using one UPDATE and one INSERT ... ON CONFLICT DO UPDATE
+        instead of a flush per record.
+
+        :param outcomes: A list of 3-tuples (Work, status, exception).
+            If a Work shows up more than once, the last outcome wins.
+        :return: A list of WorkCoverageRecords, one per distinct Work,
+            in the order the outcomes were given.
+        """
+        if not outcomes:
+            return []
+        timestamp = timestamp or utc_now()
+
+        by_work = dict()
+        for work, status, exception in outcomes:
+            by_work[work.id] = (status, exception)
+
+        # The raw statements below won't see pending changes.
+        _db.flush()
+
+        def outcome_table(work_ids):
+            return unnested(
+                "outcome",
+                work_id=(work_ids, Integer),
+                status=([by_work[i][0] for i in work_ids], String),
+                exception=([by_work[i][1] for i in work_ids], Unicode),
+            )
+
+        table = cls.__table__
+        outcome = outcome_table(sorted(by_work))
+
+        # As in bulk_add, lock the existing records in ascending order
+        # to avoid deadlocks.
+        locked = (
+            _db.query(cls.id)
+            .filter(cls.work_id.in_(list(by_work)))
+            .filter(cls.operation.isnot_distinct_from(operation))
+            .order_by(cls.id)
+            .with_for_update()
+        )
+        update = (
+            table.update()
+            .where(
+                and_(
+                    table.c.id.in_(locked),
+                    table.c.work_id == outcome.c.work_id,
+                )
+            )
+            .values(
+                status=cast(outcome.c.status, cls.status_enum),
+                exception=outcome.c.exception,
+                timestamp=timestamp,
+            )
+            .returning(*table.c)
+        )
+        records = cls._load_returned(_db, update)
+
+        missing = sorted(set(by_work) - set(records))
+        if missing:
+            outcome = outcome_table(missing)
+            insert = pg_insert(table).from_select(
+                ["work_id", "operation", "timestamp", "status", "exception"],
+                select(
+                    [
+                        outcome.c.work_id,
+                        literal(operation, type_=String(255)),
+                        literal(timestamp, type_=DateTime(timezone=True)),
+                        cast(outcome.c.status, cls.status_enum),
+                        outcome.c.exception,
+                    ]
+                ),
+            )
+            insert = insert.on_conflict_do_update(
+                index_elements=["work_id", "operation"],
+                set_=dict(
+                    status=insert.excluded.status,
+                    exception=insert.excluded.exception,
+                    timestamp=insert.excluded.timestamp,
+                ),
+            ).returning(*table.c)
+            records.update(cls._load_returned(_db, insert))
+
+        return [records[i] for i in by_work if i in records]
+
+    @classmethod
+    def _load_returned(cls, _db, statement):
+        """Run a statement that RETURNs whole WorkCoverageRecord rows
+        and load them, keyed by work ID.
+        """
+        records = _db.query(cls).populate_existing().instances(_db.execute(statement))
+        return {record.work_id: record for record in records}
+
 
 Index(
     "ix_workcoveragerecords_operation_work_id",
     WorkCoverageRecord.operation,
     WorkCoverageRecord.work_id,
 )
+
+
+class CoverageQueueItem(Base):
+    """An item waiting for coverage from a coverage provider.
+
+    Finding the items that need coverage with
+    items_that_need_coverage() means an outer join against the
+    coverage records, which is expensive even when there's nothing to
+    do. Items put on a queue can be found without that join, and
+    workers waiting on the queue are woken up with a NOTIFY as soon
+    as something is added to it.
+
+    A queue is identified the same way a coverage record is, by data
+    source, operation and collection. Identifiers are put on queues
+    that have a data source; Works on queues that don't.
+
+    The queue is only a shortcut. An item may be put on a queue more
+    than once, or put on a queue nobody is watching, and an item that
+    never makes it onto a queue will still be found the next time its
+    coverage provider runs in full.
+    """
+
+    __tablename__ = "coveragequeueitems"
+
+    # Workers LISTEN on this channel to find out when items are added
+    # to any queue.
+    CHANNEL = "coverage_queue"
+
+    id = Column(Integer, primary_key=True)
+    identifier_id = Column(
+        Integer, ForeignKey("identifiers.id", ondelete="CASCADE"), index=True
+    )
+    work_id = Column(Integer, ForeignKey("works.id", ondelete="CASCADE"), index=True)
+    data_source_id = Column(
+        Integer, ForeignKey("datasources.id", ondelete="CASCADE"), nullable=True
+    )
+    operation = Column(String(255), default=None)
+    collection_id = Column(
+        Integer, ForeignKey("collections.id", ondelete="CASCADE"), nullable=True
+    )
+    created = Column(DateTime(timezone=True), index=True)
+
+    def __repr__(self):
+        return "<CoverageQueueItem: identifier_id=%s work_id=%s operation=%s>" % (
+            self.identifier_id,
+            self.work_id,
+            self.operation,
+        )
+
+    @classmethod
+    def queue(cls, data_source=None, operation=None, collection=None):
+        """A clause matching the items on one queue."""
+        return and_(
+            cls.data_source_id == (data_source.id if data_source else None),
+            cls.operation == operation,
+            cls.collection_id == (collection.id if collection else None),
+        )
+
+    @classmethod
+    def enqueue(cls, _db, items, data_source=None, operation=None, collection=None):
+        """Put Identifiers, Editions or Works on a queue, and wake up any
+        workers waiting for items.
+
+        Workers only see the new items once the transaction is
+        committed; the NOTIFY is delivered at the same time.
+        """
+        from .work import Work
+
+        identifier_ids = []
+        work_ids = []
+        for item in items:
+            if isinstance(item, Work):
+                identifier_ids.append(None)
+                work_ids.append(item.id)
+            else:
+                identifier_ids.append(CoverageRecord._identifier_for(item).id)
+                work_ids.append(None)
+        if not work_ids:
+            return
+
+        # The unnested IDs have to exist by the time the INSERT runs.
+        _db.flush()
+        queued = unnested(
+            "queued",
+            identifier_id=(identifier_ids, Integer),
+            work_id=(work_ids, Integer),
+        )
+        insert = cls.__table__.insert().from_select(
+            [
+                "identifier_id",
+                "work_id",
+                "data_source_id",
+                "operation",
+                "collection_id",
+                "created",
+            ],
+            select(
+                [
+                    queued.c.identifier_id,
+                    queued.c.work_id,
+                    literal(data_source.id if data_source else None, type_=Integer),
+                    literal(operation, type_=String(255)),
+                    literal(collection.id if collection else None, type_=Integer),
+                    literal(utc_now(), type_=DateTime(timezone=True)),
+                ]
+            ),
+        )
+        _db.execute(insert)
+        cls.notify(_db)
+
+    @classmethod
+    def enqueue_record(cls, connection, record):
+        """Put the item covered by a CoverageRecord or WorkCoverageRecord
+        on the corresponding queue.
+
+        This is called while the record is being flushed, so it
+        works directly on the flush's connection.
+        """
+        connection.execute(
+            cls.__table__.insert().values(
+                identifier_id=getattr(record, "identifier_id", None),
+                work_id=getattr(record, "work_id", None),
+                data_source_id=getattr(record, "data_source_id", None),
+                operation=record.operation,
+                collection_id=getattr(record, "collection_id", None),
+                created=utc_now(),
+            )
+        )
+        cls.notify(connection)
+
+    @classmethod
+    def notify(cls, connection):
+        """Tell workers waiting on CHANNEL that there are new items.
+
+        Postgres only sends one copy of an identical notification per
+        transaction, so this is cheap to call repeatedly.
+        """
+        connection.execute(text("NOTIFY %s" % cls.CHANNEL))
+
+    @classmethod
+    def claim(
+        cls, _db, column, limit, data_source=None, operation=None, collection=None
+    ):
+        """Take up to `limit` items off a queue.
+
+        The items are deleted from the queue, but they only disappear
+        for good when the transaction is committed. If it's rolled
+        back, they go back on the queue. In the meantime, other
+        workers skip over the rows instead of waiting for them
+        (FOR UPDATE SKIP LOCKED), so any number of workers can take
+        items off the same queue without getting in each other's way.
+
+        :param column: CoverageQueueItem.identifier_id or
+            CoverageQueueItem.work_id, depending on the kind of item
+            the queue holds.
+        :return: A sorted list of the distinct IDs taken off the queue.
+        """
+        # The raw DELETE won't see pending changes, including items
+        # queued as their coverage records were registered.
+        _db.flush()
+        claimed = (
+            _db.query(cls.id)
+            .filter(cls.queue(data_source, operation, collection))
+            .order_by(cls.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        delete = cls.__table__.delete().where(cls.id.in_(claimed)).returning(column)
+        return sorted(set(row[0] for row in _db.execute(delete) if row[0] is not None))
+
+
+Index(
+    "ix_coveragequeueitems_queue",
+    CoverageQueueItem.data_source_id,
+    CoverageQueueItem.operation,
+    CoverageQueueItem.collection_id,
+    CoverageQueueItem.id,
+)
+
+
+class CoverageQueueListener(object):
+    """Wait for items to be put on a coverage queue.
+
+    LISTEN only works on a connection that stays open and idle
+    between notifications, so this uses a connection of its own,
+    outside of any Session and detached from the connection pool.
+    """
+
+    def __init__(self, _db, channel=CoverageQueueItem.CHANNEL):
+        bind = _db.get_bind()
+        engine = getattr(bind, "engine", bind)
+        self.connection = engine.raw_connection()
+        self.connection.detach()
+        self.dbapi_connection = self.connection.connection
+        self.dbapi_connection.autocommit = True
+        cursor = self.dbapi_connection.cursor()
+        cursor.execute("LISTEN %s" % channel)
+        cursor.close()
+
+    def wait(self, timeout):
+        """Wait up to `timeout` seconds for a notification.
+
+        :return: A list of the payloads of the notifications received.
+            An empty list means the wait timed out.
+        """
+        connection = self.dbapi_connection
+        if not connection.notifies:
+            select_module.select([connection], [], [], timeout)
+            connection.poll()
+        payloads = [notify.payload for notify in connection.notifies]
+        del connection.notifies[:]
+        return payloads
+
+    def close(self):
+        self.connection.close()
@@ -21,6 +21,7 @@ class DataSource(Base, HasSessionCache, DataSourceConstants):
     """A source for information about books, and possibly the books themselves."""
 
     __tablename__ = "datasources"
+    PROCESS_CACHE = True
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True, index=True)
     offers_licenses = Column(Boolean, default=False)
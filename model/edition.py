@@ -6,7 +6,7 @@ import logging
 from collections import defaultdict
 
 from sqlalchemy import Column, Date, Enum, ForeignKey, Index, Integer, String, Unicode
-from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy.dialects.postgresql import JSON, insert
 from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm.session import Session
@@ -265,6 +265,51 @@ class Edition(Base, EditionConstants):
         )
         return r
 
+    @classmethod
+    def for_foreign_ids(cls, _db, data_source, identifiers, create_if_not_exists=True):
+        """Find the Editions representing the given data source's view of
+        a batch of Identifiers.
+
+        The Editions are found with a single query, and any that don't
+        exist yet are created with a single INSERT ... ON CONFLICT DO
+        NOTHING.
+
+        :param identifiers: A list of Identifiers.
+        :return: A dictionary mapping Identifier IDs to Editions.
+        """
+        if isinstance(data_source, (bytes, str)):
+            data_source = DataSource.lookup(_db, data_source)
+
+        identifier_ids = set(i.id for i in identifiers if i is not None)
+        if not identifier_ids:
+            return {}
+
+        def find(identifier_ids):
+            qu = _db.query(Edition).filter(
+                Edition.data_source == data_source,
+                Edition.primary_identifier_id.in_(identifier_ids),
+            )
+            return {edition.primary_identifier_id: edition for edition in qu}
+
+        by_identifier_id = find(identifier_ids)
+        missing = identifier_ids - set(by_identifier_id.keys())
+        if missing and create_if_not_exists:
+            insert_stmt = (
+                insert(Edition.__table__)
+                .values(
+                    [
+                        dict(data_source_id=data_source.id, primary_identifier_id=id)
+                        for id in missing
+                    ]
+                )
+                .on_conflict_do_nothing(
+                    index_elements=["data_source_id", "primary_identifier_id"]
+                )
+            )
+            _db.execute(insert_stmt)
+            by_identifier_id.update(find(missing))
+        return by_identifier_id
+
     @property
     def license_pools(self):
         """The LicensePools that provide access to the book described
@@ -441,7 +486,9 @@ class Edition(Base, EditionConstants):
         if isinstance(name, Contributor):
             contributor = name
         else:
-            contributor, was_new = Contributor.lookup(_db, name, lc, viaf, aliases)
+            contributor, was_new = Contributor.lookup(
+                _db, name, viaf=viaf, lc=lc, aliases=aliases
+            )
             if isinstance(contributor, list):
                 # Contributor was looked up/created by name,
                 # which returns a list.
@@ -529,26 +576,41 @@ class Edition(Base, EditionConstants):
                 if similarity >= threshold:
                     yield candidate
 
-    def best_cover_within_distance(self, distance, rel=None, policy=None):
+    # First look for a cover associated with an Edition's primary
+    # identifier, then look further afield.
+    COVER_DISTANCES = (0, 5)
+
+    @classmethod
+    def cover_policy(cls, distance, policy=None):
+        """The PresentationCalculationPolicy to use when looking for
+        covers among the identifiers within `distance` of an
+        Edition's primary identifier.
+        """
+        if policy is None:
+            return PresentationCalculationPolicy()
+        return PresentationCalculationPolicy(
+            equivalent_identifier_levels=distance,
+            equivalent_identifier_cutoff=policy.equivalent_identifier_cutoff,
+            equivalent_identifier_threshold=policy.equivalent_identifier_threshold,
+        )
+
+    def best_cover_within_distance(self, distance, rel=None, policy=None, inputs=None):
         _db = Session.object_session(self)
         identifier_ids = [self.primary_identifier.id]
 
         if distance > 0:
-            if policy is None:
-                new_policy = PresentationCalculationPolicy()
+            new_policy = self.cover_policy(distance, policy)
+            if inputs is None:
+                identifier_ids_dict = Identifier.recursively_equivalent_identifier_ids(
+                    _db, identifier_ids, policy=new_policy
+                )
             else:
-                new_policy = PresentationCalculationPolicy(
-                    equivalent_identifier_levels=distance,
-                    equivalent_identifier_cutoff=policy.equivalent_identifier_cutoff,
-                    equivalent_identifier_threshold=policy.equivalent_identifier_threshold,
+                identifier_ids_dict = inputs.recursively_equivalent_identifier_ids(
+                    identifier_ids, policy=new_policy
                 )
-
-            identifier_ids_dict = Identifier.recursively_equivalent_identifier_ids(
-                _db, identifier_ids, policy=new_policy
-            )
             identifier_ids += identifier_ids_dict[self.primary_identifier.id]
 
-        return Identifier.best_cover_for(_db, identifier_ids, rel=rel)
+        return Identifier.best_cover_for(_db, identifier_ids, rel=rel, inputs=inputs)
 
     @property
     def title_for_permanent_work_id(self):
@@ -614,8 +676,12 @@ class Edition(Base, EditionConstants):
 
     UNKNOWN_AUTHOR = "[Unknown]"
 
-    def calculate_presentation(self, policy=None):
-        """Make sure the presentation of this Edition is up-to-date."""
+    def calculate_presentation(self, policy=None, inputs=None):
+        """Make sure the presentation of this Edition is up-to-date.
+
+        :param inputs: A PresentationInputs that may have already
+            loaded the candidate covers.
+        """
         _db = Session.object_session(self)
         changed = False
         if policy is None:
@@ -642,7 +708,7 @@ class Edition(Base, EditionConstants):
             )
 
         if policy.choose_cover:
-            self.choose_cover(policy=policy)
+            self.choose_cover(policy=policy, inputs=inputs)
 
         if (
             self.author != old_author
@@ -706,16 +772,16 @@ class Edition(Base, EditionConstants):
             sort_author = self.UNKNOWN_AUTHOR
         return author, sort_author
 
-    def choose_cover(self, policy=None):
+    def choose_cover(self, policy=None, inputs=None):
         """Try to find a cover that can be used for this Edition."""
         self.cover_full_url = None
         self.cover_thumbnail_url = None
-        for distance in (0, 5):
+        for distance in self.COVER_DISTANCES:
             # If there's a cover directly associated with the
             # Edition's primary ID, use it. Otherwise, find the
             # best cover associated with any related identifier.
             best_cover, covers = self.best_cover_within_distance(
-                distance=distance, policy=policy
+                distance=distance, policy=policy, inputs=inputs
             )
 
             if best_cover:
@@ -752,11 +818,12 @@ class Edition(Base, EditionConstants):
             # thumbnail are different Resources on the same
             # Identifier. Try to find a thumbnail the same way we'd
             # look for a cover.
-            for distance in (0, 5):
+            for distance in self.COVER_DISTANCES:
                 best_thumbnail, thumbnails = self.best_cover_within_distance(
                     distance=distance,
                     policy=policy,
                     rel=LinkRelations.THUMBNAIL_IMAGE,
+                    inputs=inputs,
                 )
                 if best_thumbnail:
                     if not best_thumbnail.representation:
@@ -0,0 +1,22 @@
+CREATE OR REPLACE FUNCTION fn_equivalent_identifiers(parent INT, recursion_depth INT, strength_threshold DOUBLE PRECISION, cutoff INT DEFAULT null)
+RETURNS TABLE
+        (
+        equivalent INT
+        )
+AS
+$$
+        SELECT $1
+        UNION
+        SELECT e.equivalent_id
+        FROM (
+                SELECT equivalent_id, depth,
+                        row_number() OVER (ORDER BY depth, strength DESC) AS r
+                FROM equivalentidentifiers
+                WHERE identifier_id = $1
+                        AND depth <= $2
+                        AND strength > $3
+        ) e
+        WHERE e.depth <= 1 OR $4 IS NULL OR e.r <= $4
+$$
+LANGUAGE 'sql'
+STABLE;
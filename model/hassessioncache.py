@@ -1,14 +1,19 @@
 # encoding: utf-8
-# HasSessionCache
+# HasSessionCache, ProcessCache
 import logging
+import os
 import sys
 from collections import namedtuple
+from threading import RLock
 from types import SimpleNamespace
 from typing import Callable, Hashable, Iterable, Optional, Tuple
 
+from sqlalchemy import inspect
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
 
+from ..config import Configuration
 from . import Base, get_one
 
 # Import Protocol from typing extensions for older versions of Python
@@ -26,10 +31,131 @@ class CacheableObject(Protocol):
         ...
 
 
+class ProcessCache:
+    """Snapshots of HasSessionCache objects, shared by every session in
+    the process.
+
+    A session's own cache starts out empty, so without this every
+    request and every job looks up the same DataSources, Libraries
+    and ConfigurationSettings all over again. A snapshot is a
+    detached copy of an object's column values. It's never handed
+    out; instead, it's merged into the session that asks for it,
+    which doesn't touch the database.
+
+    The snapshots are thrown out whenever the site configuration
+    changes, which is checked at most once every CHECK_SECONDS. A
+    change to a cached object made in this process throws out the
+    snapshots for its class immediately. Classes that aren't part of
+    the site configuration should only use this cache if their rows
+    are almost never changed once they're created, as with DataSource
+    and Genre.
+
+    This is turned on by setting the SIMPLIFIED_PROCESS_CACHE
+    environment variable.
+    """
+
+    ENVIRONMENT_VARIABLE = "SIMPLIFIED_PROCESS_CACHE"
+
+    # How often to check with the database whether the site
+    # configuration has changed.
+    CHECK_SECONDS = 60
+
+    def __init__(self):
+        self.lock = RLock()
+        self.version = None
+
+        # For each class, a CacheTuple mapping IDs to (snapshot,
+        # cache key) and cache keys to IDs.
+        self.snapshots = {}
+
+        # For each class, the outcome of every lookup in every session.
+        self.stats = {}
+
+    @property
+    def enabled(self):
+        return bool(os.environ.get(self.ENVIRONMENT_VARIABLE))
+
+    def stats_for(self, cls):
+        """The lookup statistics for a class, across every session.
+
+        `hits` were found in a session's own cache, `process_hits` in
+        this cache, and `misses` had to be looked up in the database.
+        """
+        with self.lock:
+            if cls.__name__ not in self.stats:
+                self.stats[cls.__name__] = SimpleNamespace(
+                    hits=0, process_hits=0, misses=0
+                )
+            return self.stats[cls.__name__]
+
+    def clear(self, cls=None):
+        """Throw out the snapshots for one class, or for every class."""
+        with self.lock:
+            if cls is None:
+                self.snapshots.clear()
+            else:
+                self.snapshots.pop(cls.__name__, None)
+
+    def _snapshots_for(self, db, cls):
+        version = Configuration.site_configuration_last_update(
+            db, timeout=self.CHECK_SECONDS
+        )
+        with self.lock:
+            if version != self.version:
+                # The site configuration has changed.
+                self.snapshots.clear()
+                self.version = version
+            if cls.__name__ not in self.snapshots:
+                self.snapshots[cls.__name__] = HasSessionCache.CacheTuple({}, {}, None)
+            return self.snapshots[cls.__name__]
+
+    def get(self, db, cls, cache_name, cache_key):
+        """Find a snapshot and merge it into `db`.
+
+        :return: A 2-tuple (object, cache key), or (None, None).
+        """
+        snapshots = self._snapshots_for(db, cls)
+        id = cache_key if cache_name == "id" else snapshots.key.get(cache_key)
+        if id not in snapshots.id:
+            return None, None
+        snapshot, key = snapshots.id[id]
+        obj = db.identity_map.get(inspect(snapshot).key)
+        if obj is None:
+            obj = db.merge(snapshot, load=False)
+        elif obj in db.deleted:
+            return None, None
+        return obj, key
+
+    def put(self, db, cls, obj, key):
+        """Store a snapshot of an object that was just loaded from the
+        database.
+        """
+        state = inspect(obj)
+        if not state.persistent or state.modified:
+            # The object might not be in the database (or not look
+            # like this) once the session's transaction is over.
+            return
+        snapshot = state.mapper.class_manager.new_instance()
+        for attr in state.mapper.column_attrs:
+            if attr.key in state.dict:
+                set_committed_value(snapshot, attr.key, state.dict[attr.key])
+        make_transient_to_detached(snapshot)
+        snapshots = self._snapshots_for(db, cls)
+        with self.lock:
+            snapshots.id[obj.id] = (snapshot, key)
+            snapshots.key[key] = obj.id
+
+
 class HasSessionCache:
     CacheTuple = namedtuple("CacheTuple", ["id", "key", "stats"])
     CACHE_ATTRIBUTE = "_palace_cache"
 
+    # Whether snapshots of this class's objects may be shared between
+    # sessions through the ProcessCache.
+    PROCESS_CACHE = False
+
+    process_cache = ProcessCache()
+
     """
     A mixin class for ORM classes that maintain an in-memory cache of
     items previously requested from the database table for performance reasons.
@@ -44,6 +170,10 @@ class HasSessionCache:
     def log(cls):
         return logging.getLogger(cls.__class__.__name__)
 
+    @classmethod
+    def _uses_process_cache(cls):
+        return cls.PROCESS_CACHE and cls.process_cache.enabled
+
     @classmethod
     def cache_warm(
         cls,
@@ -103,6 +233,7 @@ class HasSessionCache:
         keep track of cache hits and misses.
         """
         lookup_cache = getattr(cache, cache_name)
+        stats = cls.process_cache.stats_for(cls)
         if cache_key in lookup_cache:
             obj = lookup_cache[cache_key]
             if obj not in db or obj in db.deleted:
@@ -116,13 +247,24 @@ class HasSessionCache:
             else:
                 # Object is good, return it from cache
                 cache.stats.hits += 1
+                stats.hits += 1
                 return obj, False
 
         else:
             cache.stats.misses += 1
+            if cls._uses_process_cache():
+                obj, key = cls.process_cache.get(db, cls, cache_name, cache_key)
+                if obj is not None:
+                    stats.process_hits += 1
+                    cache.id[obj.id] = obj
+                    cache.key[key] = obj
+                    return obj, False
+            stats.misses += 1
             obj, new = cache_miss_hook()
             if obj is not None:
                 cls._cache_insert(obj, cache)
+                if cls._uses_process_cache() and not new:
+                    cls.process_cache.put(db, cls, obj, obj.cache_key())
             return obj, new
 
     @classmethod
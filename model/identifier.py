@@ -1,5 +1,5 @@
 # encoding: utf-8
-# Identifier, Equivalency
+# Identifier, Equivalency, EquivalentIdentifier
 import logging
 import random
 from abc import ABCMeta, abstractmethod
@@ -17,16 +17,25 @@ from sqlalchemy import (
     String,
     UniqueConstraint,
     func,
+    text,
 )
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import joinedload, relationship
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 from sqlalchemy.orm.session import Session
-from sqlalchemy.sql import select
+from sqlalchemy.sql import select, union
 from sqlalchemy.sql.expression import and_, or_
 
 from ..util.datetime_helpers import utc_now
 from ..util.summary import SummaryEvaluator
-from . import Base, PresentationCalculationPolicy, create, get_one, get_one_or_create
+from . import (
+    Base,
+    PresentationCalculationPolicy,
+    create,
+    get_one,
+    get_one_or_create,
+    unnested,
+)
 from .classification import Classification, Subject
 from .constants import IdentifierConstants, LinkRelations
 from .coverage import CoverageRecord
@@ -158,6 +167,66 @@ class Identifier(Base, IdentifierConstants):
         else:
             return result, False
 
+    @classmethod
+    def for_foreign_ids(cls, _db, foreign_ids, autocreate=True):
+        """Turn a batch of foreign IDs into Identifiers.
+
+        The Identifiers are found with a single query, and any that
+        don't exist yet are created with a single INSERT ... ON
+        CONFLICT DO NOTHING. This does not commit the transaction.
+
+        :param foreign_ids: A list of (type, identifier) 2-tuples. These
+            must already have gone through
+            `prepare_foreign_type_and_identifier`.
+        :param autocreate: Create an Identifier for a foreign ID if none
+            presently exists.
+        :return: A dictionary mapping (type, identifier) 2-tuples to
+            Identifiers. If `autocreate` is False, foreign IDs with no
+            corresponding Identifier are not present in the dictionary.
+        """
+        foreign_ids = set(x for x in foreign_ids if all(x))
+        if not foreign_ids:
+            return {}
+
+        def requested(foreign_ids):
+            types, identifiers = list(zip(*foreign_ids))
+            return unnested(
+                "requested", type=(types, String), identifier=(identifiers, String)
+            )
+
+        def find(foreign_ids):
+            table = requested(foreign_ids)
+            qu = _db.query(cls).join(
+                table,
+                and_(
+                    cls.type == table.c.type,
+                    cls.identifier == table.c.identifier,
+                ),
+            )
+            return {(i.type, i.identifier): i for i in qu}
+
+        by_foreign_id = find(foreign_ids)
+        missing = foreign_ids - set(by_foreign_id.keys())
+        if missing and autocreate:
+            table = requested(missing)
+            insert_stmt = (
+                insert(cls.__table__)
+                .from_select(
+                    ["type", "identifier"], select([table.c.type, table.c.identifier])
+                )
+                .on_conflict_do_nothing(index_elements=["type", "identifier"])
+                .returning(*cls.__table__.columns)
+            )
+            created = _db.query(cls).instances(_db.execute(insert_stmt))
+            by_foreign_id.update({(i.type, i.identifier): i for i in created})
+
+            # Anything that wasn't inserted was created by someone
+            # else in the meantime.
+            conflicts = missing - set(by_foreign_id.keys())
+            if conflicts:
+                by_foreign_id.update(find(conflicts))
+        return by_foreign_id
+
     @classmethod
     def prepare_foreign_type_and_identifier(cls, foreign_type, foreign_identifier):
         if not foreign_type or not foreign_identifier:
@@ -307,57 +376,20 @@ class Identifier(Base, IdentifierConstants):
             except ValueError as e:
                 failures.append(urn)
 
+        # Find (or create) every Identifier at once. Several URNs may
+        # turn out to refer to the same Identifier.
+        by_foreign_id = cls.for_foreign_ids(
+            _db, identifier_details.values(), autocreate=autocreate
+        )
         identifiers_by_urn = dict()
-
-        def find_existing_identifiers(identifier_details):
-            if not identifier_details:
-                return
-            and_clauses = list()
-            for type, identifier in identifier_details:
-                and_clauses.append(and_(cls.type == type, cls.identifier == identifier))
-
-            identifiers = _db.query(cls).filter(or_(*and_clauses)).all()
-            for identifier in identifiers:
+        for urn, details in identifier_details.items():
+            identifier = by_foreign_id.get(details)
+            if identifier:
                 identifiers_by_urn[identifier.urn] = identifier
-
-        # Find identifiers that are already in the database.
-        find_existing_identifiers(list(identifier_details.values()))
-
-        # Remove the existing identifiers from the identifier_details list,
-        # regardless of whether the provided URN was accurate.
-        existing_details = [
-            (i.type, i.identifier) for i in list(identifiers_by_urn.values())
-        ]
-        identifier_details = {
-            k: v
-            for k, v in list(identifier_details.items())
-            if v not in existing_details and k not in list(identifiers_by_urn.keys())
-        }
-
-        if not autocreate:
-            # Don't make new identifiers. Send back unfound urns as failures.
-            failures.extend(list(identifier_details.keys()))
-            return identifiers_by_urn, failures
-
-        # Find any identifier details that don't correspond to an existing
-        # identifier. Try to create them.
-        new_identifiers = list()
-        new_identifiers_details = set([])
-        for urn, details in list(identifier_details.items()):
-            if details in new_identifiers_details:
-                # For some reason, this identifier is here twice.
-                # Don't try to insert it twice.
-                continue
-            new_identifiers.append(dict(type=details[0], identifier=details[1]))
-            new_identifiers_details.add(details)
-
-        # Insert new identifiers into the database, then add them to the
-        # results.
-        if new_identifiers:
-            _db.bulk_insert_mappings(cls, new_identifiers)
-            _db.commit()
-        find_existing_identifiers(list(identifier_details.values()))
-
+            else:
+                # There's no such Identifier, and we weren't allowed
+                # to create one.
+                failures.append(urn)
         return identifiers_by_urn, failures
 
     @classmethod
@@ -478,7 +510,8 @@ class Identifier(Base, IdentifierConstants):
         `identifier_id_column` can be a single Identifier ID, or a column
         like `Edition.primary_identifier_id` if the query will be used as
         a subquery.
-        This uses the function defined in files/recursive_equivalents.sql.
+        This uses one of the functions defined in files/; see
+        _recursively_equivalent_identifier_ids_query.
         """
         fn = cls._recursively_equivalent_identifier_ids_query(
             identifier_id_column, policy
@@ -494,15 +527,22 @@ class Identifier(Base, IdentifierConstants):
         threshold = policy.equivalent_identifier_threshold
         cutoff = policy.equivalent_identifier_cutoff
 
-        return func.fn_recursive_equivalents(
-            identifier_id_column, levels, threshold, cutoff
-        )
+        if EquivalentIdentifier.covers(policy):
+            # Look the equivalents up in the closure table, using the
+            # function defined in files/equivalent_identifiers.sql.
+            fn = func.fn_equivalent_identifiers
+        else:
+            # Walk the graph, using the function defined in
+            # files/recursive_equivalents.sql.
+            fn = func.fn_recursive_equivalents
+        return fn(identifier_id_column, levels, threshold, cutoff)
 
     @classmethod
     def recursively_equivalent_identifier_ids(cls, _db, identifier_ids, policy=None):
         """All Identifier IDs equivalent to the given set of Identifier
         IDs at the given confidence threshold.
-        This uses the function defined in files/recursive_equivalents.sql.
+        This uses one of the functions defined in files/; see
+        _recursively_equivalent_identifier_ids_query.
         Four levels is enough to go from a Gutenberg text to an ISBN.
         Gutenberg ID -> OCLC Work IS -> OCLC Number -> ISBN
         Returns a dictionary mapping each ID in the original to a
@@ -547,12 +587,16 @@ class Identifier(Base, IdentifierConstants):
         rights_explanation=None,
         original_resource=None,
         transformation_settings=None,
+        resource=None,
     ):
         """Create a link between this Identifier and a (potentially new)
         Resource.
         TODO: There's some code in metadata_layer for automatically
         fetching, mirroring and scaling Representations as links are
         created. It might be good to move that code into here.
+
+        :param resource: The Resource for `href`, if it has already
+            been looked up (e.g. as part of a batch).
         """
         from .resource import Hyperlink, Representation, Resource
 
@@ -561,19 +605,20 @@ class Identifier(Base, IdentifierConstants):
         # Find or create the Resource.
         if not href:
             href = Hyperlink.generic_uri(data_source, self, rel, content)
-        rights_status = None
-        if rights_status_uri:
-            rights_status = RightsStatus.lookup(_db, rights_status_uri)
-        resource, new_resource = get_one_or_create(
-            _db,
-            Resource,
-            url=href,
-            create_method_kwargs=dict(
-                data_source=data_source,
-                rights_status=rights_status,
-                rights_explanation=rights_explanation,
-            ),
-        )
+        if resource is None or resource.url != href:
+            rights_status = None
+            if rights_status_uri:
+                rights_status = RightsStatus.lookup(_db, rights_status_uri)
+            resource, new_resource = get_one_or_create(
+                _db,
+                Resource,
+                url=href,
+                create_method_kwargs=dict(
+                    data_source=data_source,
+                    rights_status=rights_status,
+                    rights_explanation=rights_explanation,
+                ),
+            )
 
         # Find or create the Hyperlink.
         link, new_link = get_one_or_create(
@@ -743,15 +788,25 @@ class Identifier(Base, IdentifierConstants):
         return classifications.options(joinedload("subject"))
 
     @classmethod
-    def best_cover_for(cls, _db, identifier_ids, rel=None):
-        # Find all image resources associated with any of
-        # these identifiers.
+    def best_cover_for(cls, _db, identifier_ids, rel=None, inputs=None):
+        """Find the best image associated with any of these identifiers.
+
+        :param inputs: A PresentationInputs that may have already
+            loaded the images.
+        """
         from .resource import Hyperlink, Resource
 
         rel = rel or Hyperlink.IMAGE
-        images = cls.resources_for_identifier_ids(_db, identifier_ids, rel)
-        images = images.join(Resource.representation)
-        images = images.all()
+        if inputs is None:
+            images = cls.resources_for_identifier_ids(_db, identifier_ids, rel)
+            images = images.join(Resource.representation)
+            images = images.all()
+        else:
+            images = [
+                r
+                for r in inputs.resources_for_identifier_ids(identifier_ids, rel)
+                if r.representation
+            ]
 
         champions = Resource.best_covers_among(images)
         if not champions:
@@ -765,7 +820,7 @@ class Identifier(Base, IdentifierConstants):
 
     @classmethod
     def evaluate_summary_quality(
-        cls, _db, identifier_ids, privileged_data_sources=None
+        cls, _db, identifier_ids, privileged_data_sources=None, inputs=None
     ):
         """Evaluate the summaries for the given group of Identifier IDs.
         This is an automatic evaluation based solely on the content of
@@ -778,6 +833,8 @@ class Identifier(Base, IdentifierConstants):
         :param privileged_data_sources: If present, a summary from one
         of these data source will be instantly chosen, short-circuiting the
         decision process. Data sources are in order of priority.
+        :param inputs: A PresentationInputs that may have already
+        loaded the summaries.
         :return: The single highest-rated summary Resource.
         """
         evaluator = SummaryEvaluator()
@@ -790,9 +847,14 @@ class Identifier(Base, IdentifierConstants):
         # Find all rel="description" resources associated with any of
         # these records.
         rels = [LinkRelations.DESCRIPTION, LinkRelations.SHORT_DESCRIPTION]
-        descriptions = cls.resources_for_identifier_ids(
-            _db, identifier_ids, rels, privileged_data_source
-        ).all()
+        if inputs is None:
+            descriptions = cls.resources_for_identifier_ids(
+                _db, identifier_ids, rels, privileged_data_source
+            ).all()
+        else:
+            descriptions = inputs.resources_for_identifier_ids(
+                identifier_ids, rels, privileged_data_source
+            )
 
         champion = None
         # Add each resource's content to the evaluator's corpus.
@@ -814,7 +876,7 @@ class Identifier(Base, IdentifierConstants):
             # We could not find any descriptions from the privileged
             # data source. Try relaxing that restriction.
             return cls.evaluate_summary_quality(
-                _db, identifier_ids, privileged_data_sources[1:]
+                _db, identifier_ids, privileged_data_sources[1:], inputs=inputs
             )
         return champion, descriptions
 
@@ -999,3 +1061,209 @@ class Equivalency(Base):
         if exclude_ids:
             q = q.filter(~Equivalency.id.in_(exclude_ids))
         return q
+
+
+class EquivalentIdentifier(Base):
+    """A materialized closure of the `equivalents` graph.
+
+    Finding every Identifier equivalent to a given Identifier means
+    walking the graph of Equivalencies, multiplying their strengths as
+    we go. Doing that with a recursive query every time a Work's
+    presentation is calculated or its search document is built is
+    expensive, so the results of the walk are stored here and kept up
+    to date as Equivalencies change.
+
+    Each row says that `equivalent_id` can be reached from
+    `identifier_id` by following `depth` Equivalencies with a combined
+    strength of `strength`. A pair of Identifiers may have more than
+    one row, if a longer path between them is stronger than a shorter
+    one. Only paths no longer than MAX_LEVELS and stronger than
+    MIN_THRESHOLD are stored; a lookup that needs to go further falls
+    back to the recursive query.
+
+    The closure is symmetric, and an Identifier is never stored as
+    equivalent to itself.
+
+    A PresentationCalculationPolicy's equivalent_identifier_cutoff is
+    handled differently here than by fn_recursive_equivalents. The
+    recursive walk numbers the rows found at each step in no
+    particular order, and stops following rows numbered at or above
+    the cutoff, so which equivalents it drops depends on the order
+    Postgres happens to find them in. fn_equivalent_identifiers sorts
+    the equivalents by depth, strongest first within each depth, and
+    keeps the first `cutoff` of them, along with every direct
+    equivalent. It may return different equivalents than the walk
+    would, but it always returns the same ones.
+    """
+
+    __tablename__ = "equivalentidentifiers"
+
+    # The longest path and the weakest strength stored. These cover
+    # the PresentationCalculationPolicy defaults, as well as the
+    # longer search Edition.choose_cover() does.
+    MAX_LEVELS = 5
+    MIN_THRESHOLD = PresentationCalculationPolicy.DEFAULT_THRESHOLD
+
+    identifier_id = Column(
+        Integer,
+        ForeignKey("identifiers.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    equivalent_id = Column(
+        Integer,
+        ForeignKey("identifiers.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    )
+    depth = Column(Integer, primary_key=True)
+    strength = Column(Float)
+
+    # Every path from the identifiers in :identifier_ids, as a
+    # 4-tuple (identifier_id, equivalent_id, strength, depth).
+    WALKS = """
+WITH RECURSIVE walks(identifier_id, equivalent_id, strength, depth) AS (
+    SELECT id, id, 1::DOUBLE PRECISION, 0
+    FROM identifiers WHERE id = ANY(:identifier_ids)
+    UNION
+    SELECT w.identifier_id,
+        CASE WHEN e.input_id = w.equivalent_id THEN e.output_id ELSE e.input_id END,
+        w.strength * e.strength,
+        w.depth + 1
+    FROM walks w JOIN equivalents e
+        ON e.input_id = w.equivalent_id OR e.output_id = w.equivalent_id
+    WHERE w.depth < :max_levels
+        AND e.enabled = true
+        AND e.input_id != e.output_id
+        AND w.strength * e.strength > :min_threshold
+)
+"""
+
+    # Store the strongest path of each length, but only if it's
+    # stronger than every shorter path between the same Identifiers.
+    INSERT = (
+        WALKS
+        + """,
+best AS (
+    SELECT identifier_id, equivalent_id, depth, max(strength) AS strength
+    FROM walks
+    WHERE identifier_id != equivalent_id
+    GROUP BY identifier_id, equivalent_id, depth
+),
+frontier AS (
+    SELECT *, max(strength) OVER (
+        PARTITION BY identifier_id, equivalent_id ORDER BY depth
+        ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+    ) AS shorter
+    FROM best
+)
+INSERT INTO equivalentidentifiers (identifier_id, equivalent_id, depth, strength)
+SELECT identifier_id, equivalent_id, depth, strength
+FROM frontier
+WHERE shorter IS NULL OR strength > shorter
+"""
+    )
+
+    # Every Identifier whose closure might be affected by a change
+    # to the Equivalencies of the identifiers in :identifier_ids:
+    # everything near them before the change, and everything near
+    # them after it.
+    AFFECTED = (
+        WALKS
+        + """
+SELECT equivalent_id FROM walks
+UNION
+SELECT equivalent_id FROM equivalentidentifiers
+WHERE identifier_id = ANY(:identifier_ids)
+"""
+    )
+
+    def __repr__(self):
+        return "<EquivalentIdentifier %s=%s depth=%d strength=%.2f>" % (
+            self.identifier_id,
+            self.equivalent_id,
+            self.depth,
+            self.strength,
+        )
+
+    @classmethod
+    def covers(cls, policy):
+        """Can the equivalents a PresentationCalculationPolicy calls for
+        be found in this table?
+        """
+        return (
+            policy.equivalent_identifier_levels <= cls.MAX_LEVELS
+            and policy.equivalent_identifier_threshold >= cls.MIN_THRESHOLD
+        )
+
+    @classmethod
+    def _parameters(cls, identifier_ids):
+        return dict(
+            identifier_ids=list(identifier_ids),
+            max_levels=cls.MAX_LEVELS,
+            min_threshold=cls.MIN_THRESHOLD,
+        )
+
+    @classmethod
+    def calculate(cls, _db, identifier_ids):
+        """Recalculate the closure for some Identifiers.
+
+        :param _db: A Session or Connection.
+        :param identifier_ids: Recalculate the rows for these
+            Identifier IDs.
+        """
+        identifier_ids = list(identifier_ids)
+        if not identifier_ids:
+            return
+        _db.execute(cls.__table__.delete().where(cls.identifier_id.in_(identifier_ids)))
+        _db.execute(text(cls.INSERT), cls._parameters(identifier_ids))
+
+    @classmethod
+    def refresh(cls, _db, identifier_ids):
+        """Bring the closure up to date after the Equivalencies of some
+        Identifiers have changed.
+
+        :param _db: A Session or Connection.
+        :param identifier_ids: The Identifiers at either end of the
+            Equivalencies that changed.
+        """
+        identifier_ids = set(identifier_ids)
+        if not identifier_ids:
+            return
+        affected = _db.execute(text(cls.AFFECTED), cls._parameters(identifier_ids))
+        identifier_ids.update(row[0] for row in affected)
+        cls.calculate(_db, identifier_ids)
+
+    @classmethod
+    def _identifier_ids_with_equivalencies(cls):
+        return union(
+            select([Equivalency.input_id.label("id")]).where(
+                Equivalency.input_id != None
+            ),
+            select([Equivalency.output_id.label("id")]).where(
+                Equivalency.output_id != None
+            ),
+        )
+
+    @classmethod
+    def identifier_ids_to_rebuild(cls, _db, after=None, batch_size=1000):
+        """Find the next batch of Identifiers that have Equivalencies, in
+        ID order, so the whole closure can be rebuilt a batch at a time.
+
+        :param after: Only find Identifiers with IDs higher than this.
+        """
+        ids = cls._identifier_ids_with_equivalencies().alias("equivalent_ids")
+        qu = select([ids.c.id]).order_by(ids.c.id).limit(batch_size)
+        if after is not None:
+            qu = qu.where(ids.c.id > after)
+        return [row[0] for row in _db.execute(qu)]
+
+    @classmethod
+    def delete_stale(cls, _db):
+        """Delete the rows for Identifiers that no longer have any
+        Equivalencies.
+
+        :return: The number of rows deleted.
+        """
+        ids = cls._identifier_ids_with_equivalencies()
+        result = _db.execute(cls.__table__.delete().where(~cls.identifier_id.in_(ids)))
+        return result.rowcount
@@ -35,6 +35,7 @@ class Library(Base, HasSessionCache):
     """
 
     __tablename__ = "libraries"
+    PROCESS_CACHE = True
 
     id = Column(Integer, primary_key=True)
 
@@ -210,6 +211,17 @@ class Library(Base, HasSessionCache):
 
         return ConfigurationSetting.for_library(key, self)
 
+    @property
+    def settings_resolver(self):
+        """A ConfigurationSettingResolver with all of this Library's
+        settings, for reading them without going to the database.
+        """
+        from .configuration import ConfigurationSettingResolver
+
+        return ConfigurationSettingResolver.for_library(
+            Session.object_session(self), self
+        )
+
     @property
     def all_collections(self):
         for collection in self.collections:
@@ -244,7 +256,7 @@ class Library(Base, HasSessionCache):
     @property
     def allow_holds(self):
         """Does this library allow patrons to put items on hold?"""
-        value = self.setting(self.ALLOW_HOLDS).bool_value
+        value = self.settings_resolver.bool_value(self.ALLOW_HOLDS, self)
         if value is None:
             # If the library has not set a value for this setting,
             # holds are allowed.
@@ -254,7 +266,7 @@ class Library(Base, HasSessionCache):
     @property
     def minimum_featured_quality(self):
         """The minimum quality a book must have to be 'featured'."""
-        value = self.setting(self.MINIMUM_FEATURED_QUALITY).float_value
+        value = self.settings_resolver.float_value(self.MINIMUM_FEATURED_QUALITY, self)
         if value is None:
             value = 0.65
         return value
@@ -262,7 +274,7 @@ class Library(Base, HasSessionCache):
     @property
     def featured_lane_size(self):
         """The minimum quality a book must have to be 'featured'."""
-        value = self.setting(self.FEATURED_LANE_SIZE).int_value
+        value = self.settings_resolver.int_value(self.FEATURED_LANE_SIZE, self)
         if value is None:
             value = 15
         return value
@@ -270,7 +282,7 @@ class Library(Base, HasSessionCache):
     @property
     def entrypoints(self):
         """The EntryPoints enabled for this library."""
-        values = self.setting(EntryPoint.ENABLED_SETTING).json_value
+        values = self.settings_resolver.json_value(EntryPoint.ENABLED_SETTING, self)
         if values is None:
             # No decision has been made about enabled EntryPoints.
             for cls in EntryPoint.DEFAULT_ENABLED:
@@ -285,18 +297,21 @@ class Library(Base, HasSessionCache):
 
     def enabled_facets(self, group_name):
         """Look up the enabled facets for a given facet group."""
-        setting = self.enabled_facets_setting(group_name)
+        key = self.ENABLED_FACETS_KEY_PREFIX + group_name
+        resolver = self.settings_resolver
         value = None
 
         try:
-            value = setting.json_value
+            value = resolver.json_value(key, self)
         except ValueError as e:
             logging.error(
-                "Invalid list of enabled facets for %s: %s", group_name, setting.value
+                "Invalid list of enabled facets for %s: %s",
+                group_name,
+                resolver.value(key, self),
             )
         if value is None:
-            value = list(FacetConstants.DEFAULT_ENABLED_FACETS.get(group_name, []))
-        return value
+            value = FacetConstants.DEFAULT_ENABLED_FACETS.get(group_name, [])
+        return list(value)
 
     def enabled_facets_setting(self, group_name):
         key = self.ENABLED_FACETS_KEY_PREFIX + group_name
@@ -386,7 +401,8 @@ class Library(Base, HasSessionCache):
 
     def default_facet(self, group_name):
         """Look up the default facet for a given facet group."""
-        value = self.default_facet_setting(group_name).value
+        key = self.DEFAULT_FACET_KEY_PREFIX + group_name
+        value = self.settings_resolver.value(key, self)
         if not value:
             value = FacetConstants.DEFAULT_FACET.get(group_name)
         return value
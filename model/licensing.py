@@ -520,7 +520,7 @@ class LicensePool(Base):
         else:
             self.open_access = False
 
-    def set_presentation_edition(self, equivalent_editions=None):
+    def set_presentation_edition(self, equivalent_editions=None, inputs=None):
         """Create or update the presentation Edition for this LicensePool.
         The presentation Edition is made of metadata from all Editions
         associated with the LicensePool's identifier.
@@ -528,6 +528,8 @@ class LicensePool(Base):
         that don't share this LicensePool's identifier but are associated
         with its equivalent identifiers in some way. This option is used
         to create Works on the Metadata Wrangler.
+        :param inputs: A PresentationInputs that may have already
+        loaded the candidate covers.
         :return: A boolean explaining whether any of the presentation
         information associated with this LicensePool actually changed.
         """
@@ -577,7 +579,9 @@ class LicensePool(Base):
             )
             changed = changed or edition_core_changed
 
-        presentation_changed = self.presentation_edition.calculate_presentation()
+        presentation_changed = self.presentation_edition.calculate_presentation(
+            inputs=inputs
+        )
         changed = changed or presentation_changed
 
         # if the license pool is associated with a work, and the work currently has no presentation edition,
@@ -1725,6 +1729,7 @@ class DeliveryMechanism(Base, HasSessionCache):
     }
 
     __tablename__ = "deliverymechanisms"
+    PROCESS_CACHE = True
     id = Column(Integer, primary_key=True)
     content_type = Column(String)
     drm_scheme = Column(String)
@@ -4,18 +4,31 @@ import datetime
 from pdb import set_trace
 from threading import RLock
 
-from sqlalchemy import event, text
+from sqlalchemy import event, inspect, text
 from sqlalchemy.orm.base import NO_VALUE
 from sqlalchemy.orm.session import Session
 
 from ..config import Configuration
 from ..util.datetime_helpers import to_utc, utc_now
-from . import Base
+from . import Base, PresentationCalculationPolicy
 from .admin import Admin, AdminRole
 from .classification import Genre
 from .collection import Collection
-from .configuration import ConfigurationSetting, ExternalIntegration
+from .configuration import (
+    ConfigurationSetting,
+    ConfigurationSettingResolver,
+    ExternalIntegration,
+    ExternalIntegrationLink,
+)
+from .coverage import (
+    BaseCoverageRecord,
+    CoverageQueueItem,
+    CoverageRecord,
+    WorkCoverageRecord,
+)
 from .datasource import DataSource
+from .hassessioncache import HasSessionCache
+from .identifier import Equivalency, EquivalentIdentifier
 from .library import Library
 from .licensing import DeliveryMechanism, LicensePool
 from .work import Work
@@ -126,6 +139,7 @@ def directly_modified(obj):
 @event.listens_for(Library.settings, "append")
 @event.listens_for(Library.settings, "remove")
 def configuration_relevant_collection_change(target, value, initiator):
+    ConfigurationSettingResolver.reset(target)
     site_configuration_has_changed(target)
 
 
@@ -137,7 +151,10 @@ def configuration_relevant_collection_change(target, value, initiator):
 @event.listens_for(Collection, "after_delete")
 @event.listens_for(ConfigurationSetting, "after_insert")
 @event.listens_for(ConfigurationSetting, "after_delete")
+@event.listens_for(ExternalIntegrationLink, "after_insert")
+@event.listens_for(ExternalIntegrationLink, "after_delete")
 def configuration_relevant_lifecycle_event(mapper, connection, target):
+    ConfigurationSettingResolver.reset(target)
     site_configuration_has_changed(target)
 
 
@@ -145,11 +162,41 @@ def configuration_relevant_lifecycle_event(mapper, connection, target):
 @event.listens_for(ExternalIntegration, "after_update")
 @event.listens_for(Collection, "after_update")
 @event.listens_for(ConfigurationSetting, "after_update")
+@event.listens_for(ExternalIntegrationLink, "after_update")
 def configuration_relevant_update(mapper, connection, target):
     if directly_modified(target):
+        ConfigurationSettingResolver.reset(target)
         site_configuration_has_changed(target)
 
 
+@event.listens_for(ConfigurationSetting._value, "set")
+def configuration_setting_value_changed(target, value, oldvalue, initiator):
+    """A ConfigurationSettingResolver may have parsed the old value."""
+    ConfigurationSettingResolver.reset(target)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_soft_rollback")
+def configuration_settings_expired(session, *args):
+    """Once a session's objects are expired, reading the settings in
+    a ConfigurationSettingResolver would mean reloading them one at a
+    time. It's cheaper to build a new resolver.
+    """
+    ConfigurationSettingResolver.reset(session)
+
+
+@event.listens_for(HasSessionCache, "after_update", propagate=True)
+@event.listens_for(HasSessionCache, "after_delete", propagate=True)
+def cached_object_changed(mapper, connection, target):
+    """When an object that might be in the process cache changes,
+    throw out the snapshots for its class.
+
+    Other processes will find out when the site configuration changes.
+    """
+    if target.PROCESS_CACHE:
+        HasSessionCache.process_cache.clear(type(target))
+
+
 # When a pool gets a work and a presentation edition for the first time,
 # the work should be added to any custom lists associated with the pool's
 # collection.
@@ -192,9 +239,14 @@ def add_work_to_customlists_for_collection(pool_or_work, value, oldvalue, initia
 @event.listens_for(Work.license_pools, "append")
 @event.listens_for(Work.license_pools, "remove")
 def licensepool_removed_from_work(target, value, initiator):
-    """When a Work gains or loses a LicensePool, it needs to be reindexed."""
+    """When a Work gains or loses a LicensePool, it needs to be reindexed,
+    and much of its presentation depends on its LicensePools.
+    """
     if target:
         target.external_index_needs_updating()
+        target.presentation_inputs_changed(
+            PresentationCalculationPolicy.LICENSE_POOLS, register=False
+        )
 
 
 @event.listens_for(LicensePool, "after_delete")
@@ -245,3 +297,68 @@ def last_update_time_change(target, value, oldvalue, initator):
     information changes.
     """
     target.external_index_needs_updating()
+
+
+# Whenever an item is registered for coverage through the ORM, it's
+# put on the corresponding coverage queue, so a worker can pick it up
+# right away.
+
+
+@event.listens_for(CoverageRecord, "after_insert")
+@event.listens_for(CoverageRecord, "after_update")
+@event.listens_for(WorkCoverageRecord, "after_insert")
+@event.listens_for(WorkCoverageRecord, "after_update")
+def coverage_record_registered(mapper, connection, target):
+    """When a coverage record goes into the REGISTERED state, put its
+    item on a coverage queue.
+    """
+    if target.status != BaseCoverageRecord.REGISTERED:
+        return
+    if not inspect(target).attrs.status.history.has_changes():
+        # The record was already registered, so the item is
+        # already on the queue.
+        return
+    CoverageQueueItem.enqueue_record(connection, target)
+
+
+# When an Equivalency is created, changed or deleted, the closure of
+# the equivalents graph is brought up to date for the Identifiers near
+# it. This happens once per flush, so that a batch of new
+# Equivalencies is handled all at once.
+
+
+def equivalency_identifier_ids(equivalency, changed_only):
+    """Find the Identifiers at either end of an Equivalency, before and
+    after any change to it.
+
+    :param changed_only: If this is True, an Equivalency that hasn't
+        changed in a way that affects the closure is ignored.
+    """
+    state = inspect(equivalency)
+    if changed_only and not any(
+        state.attrs[attr].history.has_changes()
+        for attr in ("input_id", "output_id", "strength", "enabled")
+    ):
+        return []
+    identifier_ids = []
+    for attr in ("input_id", "output_id"):
+        identifier_ids.extend(
+            x for x in state.attrs[attr].history.sum() if x is not None
+        )
+    return identifier_ids
+
+
+@event.listens_for(Session, "after_flush")
+def equivalencies_changed(session, flush_context):
+    identifier_ids = set()
+    for obj in session.new:
+        if isinstance(obj, Equivalency):
+            identifier_ids.update(equivalency_identifier_ids(obj, False))
+    for obj in session.deleted:
+        if isinstance(obj, Equivalency):
+            identifier_ids.update(equivalency_identifier_ids(obj, False))
+    for obj in session.dirty:
+        if isinstance(obj, Equivalency):
+            identifier_ids.update(equivalency_identifier_ids(obj, True))
+    if identifier_ids:
+        EquivalentIdentifier.refresh(session.connection(), identifier_ids)
@@ -1,5 +1,5 @@
 # encoding: utf-8
-# Resource, ResourceTransformation, Hyperlink, Representation
+# Resource, ResourceTransformation, Hyperlink, Representation, HTTPValidators
 
 
 import datetime
@@ -21,11 +21,12 @@ from sqlalchemy import (
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
     Unicode,
     UniqueConstraint,
 )
-from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy.dialects.postgresql import JSON, insert
 from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.orm import backref, relationship
 from sqlalchemy.orm.session import Session
@@ -142,6 +143,48 @@ class Resource(Base):
     # URL must be unique.
     __table_args__ = (UniqueConstraint("url"),)
 
+    @classmethod
+    def bulk_lookup(cls, _db, create_method_kwargs_by_url, autocreate=True):
+        """Find or create the Resources for a batch of URLs.
+
+        :param create_method_kwargs_by_url: A dictionary mapping each URL
+            to the `data_source`, `rights_status` and `rights_explanation`
+            to use if a new Resource has to be created for that URL.
+        :return: A dictionary mapping URLs to Resources.
+        """
+        urls = set(url for url in create_method_kwargs_by_url if url)
+        if not urls:
+            return {}
+
+        def find(urls):
+            qu = _db.query(Resource).filter(Resource.url.in_(urls))
+            return {resource.url: resource for resource in qu}
+
+        by_url = find(urls)
+        missing = urls - set(by_url.keys())
+        if missing and autocreate:
+            values = []
+            for url in missing:
+                kwargs = create_method_kwargs_by_url[url] or {}
+                data_source = kwargs.get("data_source")
+                rights_status = kwargs.get("rights_status")
+                values.append(
+                    dict(
+                        url=url,
+                        data_source_id=data_source.id if data_source else None,
+                        rights_status_id=rights_status.id if rights_status else None,
+                        rights_explanation=kwargs.get("rights_explanation"),
+                    )
+                )
+            insert_stmt = (
+                insert(Resource.__table__)
+                .values(values)
+                .on_conflict_do_nothing(index_elements=["url"])
+            )
+            _db.execute(insert_stmt)
+            by_url.update(find(missing))
+        return by_url
+
     @property
     def final_url(self):
         """URL to the final, mirrored version of this resource, suitable
@@ -1533,3 +1576,108 @@ class Representation(Base, MediaTypes):
             elif not champion:
                 champion = thumbnail
         return champion
+
+
+class HTTPValidators(Base):
+    """The validators (the ETag and Last-Modified headers) last sent
+    along with a document that we process but don't keep around as a
+    Representation, such as a page of an OPDS feed we poll for new
+    titles.
+
+    Sending them back in a conditional request lets the server answer
+    304 Not Modified if nothing has changed, instead of sending the
+    whole document again.
+
+    Validators are kept separately for each Collection, since two
+    Collections that import the same feed each need to see every page
+    of it at least once.
+    """
+
+    __tablename__ = "httpvalidators"
+    id = Column(Integer, primary_key=True)
+    url = Column(Unicode, nullable=False, index=True)
+
+    # The collection, if any, whose import made the request.
+    collection_id = Column(
+        Integer,
+        ForeignKey("collections.id", ondelete="CASCADE"),
+        index=True,
+        nullable=True,
+    )
+    etag = Column(Unicode)
+    last_modified = Column(Unicode)
+    updated_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        Index(
+            "ix_httpvalidators_url_no_collection",
+            url,
+            unique=True,
+            postgresql_where=collection_id.is_(None),
+        ),
+        Index(
+            "ix_httpvalidators_url_collection_id",
+            url,
+            collection_id,
+            unique=True,
+        ),
+    )
+
+    def __repr__(self):
+        return "<HTTPValidators %s (collection %s): etag=%s last_modified=%s>" % (
+            self.url,
+            self.collection_id,
+            self.etag,
+            self.last_modified,
+        )
+
+    @classmethod
+    def _key(cls, url, collection):
+        return dict(url=url, collection_id=collection.id if collection else None)
+
+    @classmethod
+    def request_headers(cls, _db, url, collection=None):
+        """Find the headers that will turn a request for `url` into a
+        conditional request.
+
+        :param collection: Use the validators stored for this
+            Collection.
+        :return: A dictionary of HTTP headers, possibly empty.
+        """
+        headers = {}
+        validators = get_one(_db, cls, **cls._key(url, collection))
+        if validators:
+            if validators.etag:
+                headers["If-None-Match"] = validators.etag
+            if validators.last_modified:
+                headers["If-Modified-Since"] = validators.last_modified
+        return headers
+
+    @classmethod
+    def update(cls, _db, url, headers, collection=None):
+        """Record the validators sent along with a response for `url`.
+
+        :param headers: The headers of the response.
+        :param collection: Store the validators for this Collection.
+        :return: An HTTPValidators object, or None if the response
+            didn't have any validators.
+        """
+        headers = dict((k.lower(), v) for k, v in (headers or {}).items())
+        etag = headers.get("etag")
+        last_modified = headers.get("last-modified")
+
+        validators = get_one(_db, cls, **cls._key(url, collection))
+        if not etag and not last_modified:
+            # Any validators we had are no longer any good.
+            if validators:
+                _db.delete(validators)
+            return None
+
+        if not validators:
+            validators, ignore = get_one_or_create(
+                _db, cls, **cls._key(url, collection)
+            )
+        validators.etag = etag
+        validators.last_modified = last_modified
+        validators.updated_at = utc_now()
+        return validators
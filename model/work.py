@@ -1,8 +1,8 @@
 # encoding: utf-8
-# WorkGenre, Work
+# WorkGenre, Work, PresentationInputs
 
 import logging
-from collections import Counter
+from collections import Counter, defaultdict
 
 from sqlalchemy import (
     Boolean,
@@ -16,9 +16,9 @@ from sqlalchemy import (
     String,
     Unicode,
 )
-from sqlalchemy.dialects.postgresql import INT4RANGE
+from sqlalchemy.dialects.postgresql import ARRAY, INT4RANGE
 from sqlalchemy.ext.associationproxy import association_proxy
-from sqlalchemy.orm import contains_eager, relationship
+from sqlalchemy.orm import contains_eager, joinedload, relationship, selectinload
 from sqlalchemy.orm.session import Session
 from sqlalchemy.sql.expression import and_, case, join, literal_column, or_, select
 from sqlalchemy.sql.functions import func
@@ -30,13 +30,14 @@ from ..util.datetime_helpers import utc_now
 from . import (
     Base,
     PresentationCalculationPolicy,
+    SessionManager,
     flush,
     get_one_or_create,
     numericrange_to_string,
     numericrange_to_tuple,
     tuple_to_numericrange,
 )
-from .constants import DataSourceConstants
+from .constants import DataSourceConstants, LinkRelations
 from .contributor import Contribution, Contributor
 from .coverage import CoverageRecord, WorkCoverageRecord
 from .datasource import DataSource
@@ -179,6 +180,11 @@ class Work(Base):
     # The last time the availability or metadata changed for this Work.
     last_update_time = Column(DateTime(timezone=True), index=True)
 
+    # The kinds of information that have changed since this Work's
+    # presentation was last calculated, e.g.
+    # PresentationCalculationPolicy.MEASUREMENTS.
+    presentation_changes = Column(ARRAY(Unicode), default=None)
+
     # This is set to True once all metadata and availability
     # information has been obtained for this Work. Until this is True,
     # the work will not show up in feeds.
@@ -761,18 +767,25 @@ class Work(Base):
         """
         return [lp.identifier.id for lp in self.license_pools if lp.identifier]
 
-    def all_identifier_ids(self, policy=None):
+    def all_identifier_ids(self, policy=None, inputs=None):
         """Return all Identifier IDs associated with this Work.
 
         :param policy: A `PresentationCalculationPolicy`.
+        :param inputs: A `PresentationInputs` that may have already
+             loaded the equivalent identifiers.
         :return: A set containing all Identifier IDs associated
              with this Work (as per the rules set down in `policy`).
         """
         _db = Session.object_session(self)
         # Get a dict that maps identifier ids to lists of their equivalents.
-        equivalent_lists = Identifier.recursively_equivalent_identifier_ids(
-            _db, self._direct_identifier_ids, policy=policy
-        )
+        if inputs is None:
+            equivalent_lists = Identifier.recursively_equivalent_identifier_ids(
+                _db, self._direct_identifier_ids, policy=policy
+            )
+        else:
+            equivalent_lists = inputs.recursively_equivalent_identifier_ids(
+                self._direct_identifier_ids, policy=policy
+            )
 
         all_identifier_ids = set()
         for equivs in list(equivalent_lists.values()):
@@ -818,7 +831,7 @@ class Work(Base):
         for pool in self.presentation_edition.is_presentation_for:
             pool.work = self
 
-    def calculate_presentation_edition(self, policy=None):
+    def calculate_presentation_edition(self, policy=None, inputs=None):
         """Which of this Work's Editions should be used as the default?
         First, every LicensePool associated with this work must have
         its presentation edition set.
@@ -848,7 +861,7 @@ class Work(Base):
 
             # make sure the pool has most up-to-date idea of its presentation edition,
             # and then ask what it is.
-            pool_edition_changed = pool.set_presentation_edition()
+            pool_edition_changed = pool.set_presentation_edition(inputs=inputs)
             edition_metadata_changed = edition_metadata_changed or pool_edition_changed
             potential_presentation_edition = pool.presentation_edition
 
@@ -904,6 +917,7 @@ class Work(Base):
         exclude_search=False,
         default_fiction=None,
         default_audience=None,
+        inputs=None,
     ):
         """Make a Work ready to show to patrons.
         Call calculate_presentation_edition() to find the best-quality presentation edition
@@ -914,6 +928,10 @@ class Work(Base):
         * The intended audience for the work.
         * The best available summary for the work.
         * The overall popularity of the work.
+
+        :param inputs: A PresentationInputs that has already loaded
+            some of the information needed to make these decisions.
+            See calculate_presentation_for_works().
         """
         if not default_audience:
             default_audience = self._get_default_audience()
@@ -926,7 +944,7 @@ class Work(Base):
 
         policy = policy or PresentationCalculationPolicy()
 
-        edition_changed = self.calculate_presentation_edition(policy)
+        edition_changed = self.calculate_presentation_edition(policy, inputs=inputs)
 
         if not self.presentation_edition:
             # Without a presentation edition, we can't calculate presentation
@@ -934,7 +952,9 @@ class Work(Base):
             return
 
         if policy.choose_cover or policy.set_edition_metadata:
-            cover_changed = self.presentation_edition.calculate_presentation(policy)
+            cover_changed = self.presentation_edition.calculate_presentation(
+                policy, inputs=inputs
+            )
             edition_changed = edition_changed or cover_changed
 
         summary = self.summary
@@ -958,7 +978,7 @@ class Work(Base):
             _db = Session.object_session(self)
 
             direct_identifier_ids = self._direct_identifier_ids
-            all_identifier_ids = self.all_identifier_ids(policy=policy)
+            all_identifier_ids = self.all_identifier_ids(policy=policy, inputs=inputs)
         else:
             # Don't bother.
             direct_identifier_ids = all_identifier_ids = []
@@ -968,6 +988,7 @@ class Work(Base):
                 all_identifier_ids,
                 default_fiction=default_fiction,
                 default_audience=default_audience,
+                inputs=inputs,
             )
             WorkCoverageRecord.add_for(
                 self, operation=WorkCoverageRecord.CLASSIFY_OPERATION
@@ -975,7 +996,10 @@ class Work(Base):
 
         if policy.choose_summary:
             self._choose_summary(
-                direct_identifier_ids, all_identifier_ids, licensed_data_sources
+                direct_identifier_ids,
+                all_identifier_ids,
+                licensed_data_sources,
+                inputs=inputs,
             )
 
         if policy.calculate_quality:
@@ -996,7 +1020,7 @@ class Work(Base):
                 # if we still haven't found anything of a quality measurement,
                 # then at least make it an integer zero, not none.
                 default_quality = 0
-            self.calculate_quality(all_identifier_ids, default_quality)
+            self.calculate_quality(all_identifier_ids, default_quality, inputs=inputs)
 
         if self.summary_text:
             if isinstance(self.summary_text, str):
@@ -1020,6 +1044,17 @@ class Work(Base):
             # change it.
             self.last_update_time = utc_now()
 
+        if self.presentation_changes:
+            # Forget about the changes that have now been taken into
+            # account.
+            remaining = [
+                change
+                for change in self.presentation_changes
+                if not policy.recalculates(change)
+            ]
+            if remaining != self.presentation_changes:
+                self.presentation_changes = remaining or None
+
         if changed or policy.regenerate_opds_entries:
             self.calculate_opds_entries()
 
@@ -1045,8 +1080,32 @@ class Work(Base):
         # title.
         self.set_presentation_ready_based_on_content()
 
+    @classmethod
+    def calculate_presentation_for_works(cls, works, policy=None, **kwargs):
+        """Make a number of Works ready to show to patrons.
+
+        This does the same thing as calling calculate_presentation()
+        on each Work, but the Editions, equivalent identifiers,
+        classifications, measurements, summaries and covers that go
+        into those decisions are loaded for all the Works at once.
+
+        :param kwargs: Passed into calculate_presentation() for each Work.
+        """
+        works = list(works)
+        if not works:
+            return
+        _db = Session.object_session(works[0])
+        policy = policy or PresentationCalculationPolicy()
+        inputs = PresentationInputs(_db, works, policy)
+        for work in works:
+            work.calculate_presentation(policy, inputs=inputs, **kwargs)
+
     def _choose_summary(
-        self, direct_identifier_ids, all_identifier_ids, licensed_data_sources
+        self,
+        direct_identifier_ids,
+        all_identifier_ids,
+        licensed_data_sources,
+        inputs=None,
     ):
         """Helper method for choosing a summary as part of presentation
         calculation.
@@ -1067,6 +1126,9 @@ class Work(Base):
         :param licensed_data_sources: A list of DataSources that should be
             given priority -- either because they provided the books or because
             they are trusted sources such as library staff.
+
+        :param inputs: A PresentationInputs that may have already
+            loaded the candidate summaries.
         """
         _db = Session.object_session(self)
         staff_data_source = DataSource.lookup(_db, DataSourceConstants.LIBRARY_STAFF)
@@ -1074,7 +1136,7 @@ class Work(Base):
         summary = None
         for id_set in (direct_identifier_ids, all_identifier_ids):
             summary, summaries = Identifier.evaluate_summary_quality(
-                _db, id_set, data_sources
+                _db, id_set, data_sources, inputs=inputs
             )
             if summary:
                 # We found a summary.
@@ -1247,7 +1309,42 @@ class Work(Base):
         calling needs_full_presentation_recalculation, but it will
         not update a Work's quality score, summary, or genre classification.
         """
-        return self._reset_coverage(WorkCoverageRecord.CHOOSE_EDITION_OPERATION)
+        return self.presentation_inputs_changed(PresentationCalculationPolicy.EDITIONS)
+
+    def presentation_inputs_changed(self, *changes, register=True):
+        """Record that some of the information that goes into this
+        Work's presentation has changed.
+
+        The next time the Work's presentation is recalculated by
+        WorkPresentationEditionCoverageProvider, only the parts that
+        depend on this information will be recalculated.
+
+        :param changes: Some of the kinds of information listed in
+            PresentationCalculationPolicy.DEPENDENCIES.
+        :param register: If this is True, the Work is also marked as
+            needing to have its presentation recalculated.
+        :return: A WorkCoverageRecord, if one was registered.
+        """
+        recorded = set(self.presentation_changes or [])
+        if not recorded.issuperset(changes):
+            self.presentation_changes = sorted(recorded.union(changes))
+        if register:
+            return self._reset_coverage(WorkCoverageRecord.CHOOSE_EDITION_OPERATION)
+
+    def presentation_policy_for_changes(self, **kwargs):
+        """The PresentationCalculationPolicy that will bring this
+        Work's presentation up to date with the changes recorded by
+        presentation_inputs_changed().
+
+        :param kwargs: Other arguments to the policy's constructor.
+        :return: A PresentationCalculationPolicy, or None if no
+            changes have been recorded.
+        """
+        if not self.presentation_changes:
+            return None
+        return PresentationCalculationPolicy.for_changes(
+            self.presentation_changes, **kwargs
+        )
 
     def set_presentation_ready(
         self, as_of=None, search_index_client=None, exclude_search=False
@@ -1298,8 +1395,9 @@ class Work(Base):
         else:
             self.set_presentation_ready(search_index_client=search_index_client)
 
-    def calculate_quality(self, identifier_ids, default_quality=0):
-        _db = Session.object_session(self)
+    @classmethod
+    def quality_measurements(cls, _db, identifier_ids):
+        """Find the Measurements that go into a Work's quality score."""
         # Relevant Measurements are direct measurements of popularity
         # and quality, plus any quantity that might be mapppable to the 0..1
         # range -- ratings, and measurements with an associated percentile
@@ -1308,14 +1406,20 @@ class Work(Base):
             [Measurement.POPULARITY, Measurement.QUALITY, Measurement.RATING]
         )
         quantities = quantities.union(list(Measurement.PERCENTILE_SCALES.keys()))
-        measurements = (
+        return (
             _db.query(Measurement)
             .filter(Measurement.identifier_id.in_(identifier_ids))
             .filter(Measurement.is_most_recent == True)
             .filter(Measurement.quantity_measured.in_(quantities))
-            .all()
         )
 
+    def calculate_quality(self, identifier_ids, default_quality=0, inputs=None):
+        _db = Session.object_session(self)
+        if inputs is None:
+            measurements = self.quality_measurements(_db, identifier_ids).all()
+        else:
+            measurements = inputs.quality_measurements(identifier_ids)
+
         self.quality = Measurement.overall_quality(
             measurements, default_value=default_quality
         )
@@ -1326,9 +1430,12 @@ class Work(Base):
         identifier_ids,
         default_fiction=False,
         default_audience=Classifier.AUDIENCE_ADULT,
+        inputs=None,
     ):
         """Set classification information for this work based on the
         subquery to get equivalent identifiers.
+        :param inputs: A PresentationInputs that may have already
+        loaded the classifications.
         :return: A boolean explaining whether or not any data actually
         changed.
         """
@@ -1339,9 +1446,12 @@ class Work(Base):
         old_target_age = self.target_age
 
         _db = Session.object_session(self)
-        classifications = Identifier.classifications_for_identifier_ids(
-            _db, identifier_ids
-        )
+        if inputs is None:
+            classifications = Identifier.classifications_for_identifier_ids(
+                _db, identifier_ids
+            )
+        else:
+            classifications = inputs.classifications_for_identifier_ids(identifier_ids)
         for classification in classifications:
             classifier.add(classification)
 
@@ -1447,11 +1557,6 @@ class Work(Base):
 
         _db = Session.object_session(works[0])
 
-        # If this is a batch of search documents, postgres needs extra working
-        # memory to process the query quickly.
-        if len(works) > 50:
-            _db.execute("set work_mem='200MB'")
-
         # This query gets relevant columns from Work and Edition for the Works we're
         # interested in. The work_id, edition_id, and identifier_id columns are used
         # by other subqueries to filter, and the remaining columns are used directly
@@ -1801,9 +1906,18 @@ class Work(Base):
         # Finally, convert everything to json.
         search_json = query_to_json(search_data)
 
-        result = _db.execute(search_json)
-        if result:
-            return [r[0] for r in result]
+        # The query only reads, so it can go to a read replica, unless
+        # this session has changed something the replica can't see yet
+        # -- probably the Works themselves.
+        with SessionManager.read_only_session(_db) as reader:
+            # If this is a batch of search documents, postgres needs extra working
+            # memory to process the query quickly.
+            if len(works) > 50:
+                reader.execute("set work_mem='200MB'")
+
+            result = reader.execute(search_json)
+            if result:
+                return [r[0] for r in result]
 
     @classmethod
     def target_age_query(self, foreign_work_id_field):
@@ -1927,3 +2041,207 @@ class Work(Base):
         if search_index is not None:
             search_index.remove_work(self)
         _db.delete(self)
+
+
+class PresentationInputs:
+    """The information Work.calculate_presentation() needs about a
+    number of Works, loaded with a fixed number of queries.
+
+    The methods of this class stand in for the Identifier and Work
+    methods of the same names. A question about an Identifier that
+    wasn't loaded up front is passed on to the database.
+    """
+
+    SUMMARY_RELS = [LinkRelations.DESCRIPTION, LinkRelations.SHORT_DESCRIPTION]
+    COVER_RELS = [LinkRelations.IMAGE, LinkRelations.THUMBNAIL_IMAGE]
+
+    def __init__(self, _db, works, policy=None):
+        self._db = _db
+        self.policy = policy or PresentationCalculationPolicy()
+        works = list(works)
+
+        # Equivalent identifier IDs, keyed by the policy settings used
+        # to find them, then by identifier ID.
+        self._equivalents = {}
+
+        # For each kind of item, the identifier IDs whose items were
+        # loaded, and the items keyed by identifier ID.
+        self._loaded = {}
+        self._hyperlink_rels = set()
+
+        if not works:
+            return
+        self._load_works(works)
+
+        direct_identifier_ids = set()
+        edition_identifier_ids = set()
+        for work in works:
+            direct_identifier_ids.update(work._direct_identifier_ids)
+            edition_identifier_ids.update(work._direct_identifier_ids)
+            if work.presentation_edition and (
+                work.presentation_edition.primary_identifier_id
+            ):
+                edition_identifier_ids.add(
+                    work.presentation_edition.primary_identifier_id
+                )
+
+        policy = self.policy
+        identifier_ids = set()
+        if policy.classify or policy.choose_summary or policy.calculate_quality:
+            for equivalents in self.recursively_equivalent_identifier_ids(
+                direct_identifier_ids, policy
+            ).values():
+                identifier_ids.update(equivalents)
+
+        rels = []
+        link_identifier_ids = set(identifier_ids)
+        if policy.choose_summary:
+            rels.extend(self.SUMMARY_RELS)
+        if policy.choose_cover:
+            rels.extend(self.COVER_RELS)
+            link_identifier_ids.update(edition_identifier_ids)
+            for distance in Edition.COVER_DISTANCES:
+                if not distance:
+                    continue
+                for equivalents in self.recursively_equivalent_identifier_ids(
+                    edition_identifier_ids, Edition.cover_policy(distance, policy)
+                ).values():
+                    link_identifier_ids.update(equivalents)
+
+        if policy.classify:
+            self._load(
+                "classifications",
+                identifier_ids,
+                Identifier.classifications_for_identifier_ids(_db, identifier_ids),
+            )
+        if policy.calculate_quality:
+            self._load(
+                "measurements",
+                identifier_ids,
+                Work.quality_measurements(_db, identifier_ids),
+            )
+        if rels:
+            self._load_hyperlinks(link_identifier_ids, rels)
+
+    def _load_works(self, works):
+        """Load the LicensePools for every Work, along with their
+        Identifiers and all the Editions those Identifiers identify.
+        """
+        (
+            self._db.query(Work)
+            .filter(Work.id.in_([work.id for work in works]))
+            .options(
+                selectinload(Work.license_pools)
+                .joinedload("identifier")
+                .selectinload("primarily_identifies"),
+                selectinload(Work.license_pools).joinedload("collection"),
+                selectinload(Work.license_pools).joinedload("presentation_edition"),
+            )
+            .all()
+        )
+
+    def _load_hyperlinks(self, identifier_ids, rels):
+        from .resource import Hyperlink
+
+        hyperlinks = (
+            self._db.query(Hyperlink)
+            .filter(Hyperlink.identifier_id.in_(identifier_ids))
+            .filter(Hyperlink.rel.in_(rels))
+            .options(joinedload("resource").joinedload("representation"))
+        )
+        self._load("hyperlinks", identifier_ids, hyperlinks)
+        self._hyperlink_rels = set(rels)
+
+    def _load(self, name, identifier_ids, items):
+        by_identifier = defaultdict(list)
+        for item in items:
+            by_identifier[item.identifier_id].append(item)
+        self._loaded[name] = (set(identifier_ids), by_identifier)
+
+    def _lookup(self, name, identifier_ids):
+        """Find the loaded items of one kind for some identifiers.
+
+        :return: A list of items, or None if they weren't all loaded.
+        """
+        if name not in self._loaded:
+            return None
+        loaded, by_identifier = self._loaded[name]
+        identifier_ids = set(identifier_ids)
+        if not identifier_ids.issubset(loaded):
+            return None
+        items = []
+        for identifier_id in identifier_ids:
+            items.extend(by_identifier.get(identifier_id, []))
+        return items
+
+    @classmethod
+    def _policy_key(cls, policy):
+        policy = policy or PresentationCalculationPolicy()
+        return (
+            policy.equivalent_identifier_levels,
+            policy.equivalent_identifier_threshold,
+            policy.equivalent_identifier_cutoff,
+        )
+
+    def recursively_equivalent_identifier_ids(self, identifier_ids, policy=None):
+        """Like Identifier.recursively_equivalent_identifier_ids."""
+        equivalents = self._equivalents.setdefault(self._policy_key(policy), {})
+        missing = [x for x in identifier_ids if x not in equivalents]
+        if missing:
+            found = Identifier.recursively_equivalent_identifier_ids(
+                self._db, missing, policy=policy
+            )
+            for identifier_id in missing:
+                equivalents[identifier_id] = found.get(identifier_id, [])
+        result = defaultdict(list)
+        for identifier_id in identifier_ids:
+            result[identifier_id] = equivalents[identifier_id]
+        return result
+
+    def classifications_for_identifier_ids(self, identifier_ids):
+        """Like Identifier.classifications_for_identifier_ids."""
+        classifications = self._lookup("classifications", identifier_ids)
+        if classifications is None:
+            classifications = Identifier.classifications_for_identifier_ids(
+                self._db, identifier_ids
+            ).all()
+        return classifications
+
+    def quality_measurements(self, identifier_ids):
+        """Like Work.quality_measurements."""
+        measurements = self._lookup("measurements", identifier_ids)
+        if measurements is None:
+            measurements = Work.quality_measurements(self._db, identifier_ids).all()
+        return measurements
+
+    def resources_for_identifier_ids(self, identifier_ids, rel=None, data_source=None):
+        """Like Identifier.resources_for_identifier_ids, but returns a list."""
+        rels = rel if isinstance(rel, list) else [rel]
+        hyperlinks = None
+        if rel and set(rels).issubset(self._hyperlink_rels):
+            hyperlinks = self._lookup("hyperlinks", identifier_ids)
+        if hyperlinks is None:
+            return Identifier.resources_for_identifier_ids(
+                self._db, identifier_ids, rel, data_source
+            ).all()
+
+        data_source_ids = None
+        if data_source:
+            if isinstance(data_source, DataSource):
+                data_source = [data_source]
+            data_source_ids = set(d.id for d in data_source)
+
+        resources = []
+        seen = set()
+        for hyperlink in hyperlinks:
+            if hyperlink.rel not in rels:
+                continue
+            if data_source_ids is not None and (
+                hyperlink.data_source_id not in data_source_ids
+            ):
+                continue
+            if hyperlink.resource_id in seen:
+                continue
+            seen.add(hyperlink.resource_id)
+            resources.append(hyperlink.resource)
+        return resources
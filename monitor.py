@@ -1,9 +1,11 @@
 import datetime
 import logging
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 from sqlalchemy.orm import defer
 from sqlalchemy.sql.expression import and_, or_
+from sqlalchemy.sql.functions import func
 
 from . import log  # This sets the appropriate log format and level.
 from .config import Configuration
@@ -13,6 +15,7 @@ from .model import (
     CirculationEvent,
     Collection,
     CollectionMissing,
+    CoverageQueueItem,
     CoverageRecord,
     Credential,
     CustomListEntry,
@@ -22,6 +25,7 @@ from .model import (
     Measurement,
     Patron,
     PresentationCalculationPolicy,
+    SessionManager,
     Subject,
     Timestamp,
     Work,
@@ -29,7 +33,11 @@ from .model import (
     get_one_or_create,
 )
 from .model.configuration import ConfigurationSetting
+from .util.adaptive_batch import AdaptiveBatchSize
 from .util.datetime_helpers import utc_now
+from .util.job_metrics import JobMetrics
+from .util.query_profile import QueryProfile
+from .util.worker_pools import ProcessPool
 
 
 class CollectionMonitorLogger(logging.LoggerAdapter):
@@ -107,6 +115,15 @@ class Monitor(object):
         if collection:
             self.collection_id = collection.id
 
+        # If this is set, a Monitor that can stop partway through its
+        # work will stop once it's been running for this many
+        # seconds, and pick up where it left off on the next run.
+        self.time_budget = None
+        self.run_started_at = None
+
+        # A JobMetrics measuring the current run, if any.
+        self.metrics = None
+
     @property
     def log(self):
         if not hasattr(self, "_log"):
@@ -160,6 +177,13 @@ class Monitor(object):
         )
         return timestamp
 
+    def out_of_time(self):
+        """Has this Monitor used up its time budget for the current run?"""
+        if self.time_budget is None or self.run_started_at is None:
+            return False
+        elapsed = (utc_now() - self.run_started_at).total_seconds()
+        return elapsed >= self.time_budget
+
     def run(self):
         """Do all the work that has piled up since the
         last time the Monitor ran to completion.
@@ -171,52 +195,72 @@ class Monitor(object):
         progress = timestamp_obj.to_data()
 
         this_run_start = utc_now()
+        self.run_started_at = this_run_start
+        self.metrics = JobMetrics.for_job(
+            JobMetrics.MONITOR, self, previous_finish=timestamp_obj.finish
+        )
+        profile = QueryProfile.start(self.service_name)
         exception = None
 
         ignorable = (None, TimestampData.CLEAR_VALUE)
         try:
-            new_timestamp = self.run_once(progress)
-            this_run_finish = utc_now()
-            if new_timestamp is None:
-                # Assume this Monitor has no special needs surrounding
-                # its timestamp.
-                new_timestamp = TimestampData()
-            if new_timestamp.achievements not in ignorable:
-                # This eliminates the need to create similar-looking
-                # strings for TimestampData.achievements and for the log.
-                self.log.info(new_timestamp.achievements)
-            if new_timestamp.exception in ignorable:
-                # run_once() completed with no exceptions being raised.
-                # We can run the cleanup code and finalize the timestamp.
-                self.cleanup()
-                new_timestamp.finalize(
-                    service=self.service_name,
-                    service_type=Timestamp.MONITOR_TYPE,
-                    collection=self.collection,
-                    start=this_run_start,
-                    finish=this_run_finish,
-                    exception=None,
+            try:
+                new_timestamp = self.run_once(progress)
+                this_run_finish = utc_now()
+                if new_timestamp is None:
+                    # Assume this Monitor has no special needs surrounding
+                    # its timestamp.
+                    new_timestamp = TimestampData()
+                if new_timestamp.achievements not in ignorable:
+                    # This eliminates the need to create similar-looking
+                    # strings for TimestampData.achievements and for the log.
+                    self.log.info(new_timestamp.achievements)
+                if new_timestamp.exception in ignorable:
+                    # run_once() completed with no exceptions being raised.
+                    # We can run the cleanup code and finalize the timestamp.
+                    self.cleanup()
+                    new_timestamp.finalize(
+                        service=self.service_name,
+                        service_type=Timestamp.MONITOR_TYPE,
+                        collection=self.collection,
+                        start=this_run_start,
+                        finish=this_run_finish,
+                        exception=None,
+                    )
+                    new_timestamp.apply(self._db)
+                else:
+                    # This will be treated the same as an unhandled
+                    # exception, below.
+                    exception = new_timestamp.exception
+            except Exception:
+                this_run_finish = utc_now()
+                self.log.exception(
+                    "Error running %s monitor. Timestamp will not be updated.",
+                    self.service_name,
                 )
-                new_timestamp.apply(self._db)
-            else:
-                # This will be treated the same as an unhandled
-                # exception, below.
-                exception = new_timestamp.exception
-        except Exception:
-            this_run_finish = utc_now()
-            self.log.exception(
-                "Error running %s monitor. Timestamp will not be updated.",
-                self.service_name,
-            )
-            exception = traceback.format_exc()
-        if exception is not None:
-            # We will update Timestamp.exception but not go through
-            # the whole TimestampData.apply() process, which might
-            # erase the information the Monitor needs to recover from
-            # this failure.
-            timestamp_obj.exception = exception
+                exception = traceback.format_exc()
+            if exception is not None:
+                # We will update Timestamp.exception but not go through
+                # the whole TimestampData.apply() process, which might
+                # erase the information the Monitor needs to recover from
+                # this failure.
+                timestamp_obj.exception = exception
 
-        self._db.commit()
+            self._db.commit()
+        finally:
+            # However this run ends, its profile must not go on
+            # measuring the statements that come after it.
+            if profile:
+                if self.metrics.batch_count:
+                    # Each batch was profiled on its own.
+                    profile.stop(log=False)
+                else:
+                    profile.stop(log=self.log)
+                    self.metrics.record_queries(profile)
+
+        self.metrics.finish = this_run_finish
+        self.metrics.failed = exception is not None
+        self.metrics.export()
 
         duration = this_run_finish - this_run_start
         self.log.info(
@@ -418,6 +462,11 @@ class SweepMonitor(CollectionMonitor):
     the Monitor crashes, the next time the Monitor is run, it starts
     at the item that caused the crash, rather than starting from the
     beginning of the table.
+
+    A big table can be swept in partitions: ranges of ID that are
+    swept at the same time by separate worker processes. Each
+    partition keeps track of its progress in a Timestamp of its own,
+    and the sweep is complete once every partition is complete.
     """
 
     # The completion of each individual item should be logged at
@@ -427,6 +476,13 @@ class SweepMonitor(CollectionMonitor):
     # Items will be processed in batches of this size.
     DEFAULT_BATCH_SIZE = 100
 
+    # If this is set, the batch size will be adjusted as the Monitor
+    # runs, so that each batch takes about this many seconds. The
+    # batch size will stay between MIN_BATCH_SIZE and MAX_BATCH_SIZE.
+    TARGET_BATCH_SECONDS = None
+    MIN_BATCH_SIZE = 1
+    MAX_BATCH_SIZE = None
+
     DEFAULT_COUNTER = 0
 
     # The model class corresponding to the database table that this
@@ -434,17 +490,52 @@ class SweepMonitor(CollectionMonitor):
     # `id` field.
     MODEL_CLASS = None
 
-    def __init__(self, _db, collection=None, batch_size=None):
+    # If this is more than 1, each sweep is divided into this many
+    # partitions, which are swept in parallel. A partitioned Monitor
+    # must be able to be created with only the arguments taken by
+    # SweepMonitor's constructor.
+    PARTITIONS = 1
+
+    # If this is True, the next batch is looked up on a separate
+    # database connection while the current batch is being
+    # processed. This helps when processing a batch spends most of
+    # its time waiting on something other than the database. Since the
+    # lookup happens before the current batch is committed, an item
+    # that only comes to need processing because of the current batch
+    # will be left for the next sweep.
+    PREFETCH = False
+
+    def __init__(
+        self, _db, collection=None, batch_size=None, partitions=None, prefetch=None
+    ):
         cls = self.__class__
         if not batch_size or batch_size < 0:
             batch_size = cls.DEFAULT_BATCH_SIZE
         self.batch_size = batch_size
+        self.batch_sizer = AdaptiveBatchSize.for_object(self, batch_size)
         if not cls.MODEL_CLASS:
             raise ValueError("%s must define MODEL_CLASS" % cls.__name__)
         self.model_class = cls.MODEL_CLASS
+        self.partitions = partitions or cls.PARTITIONS
+        if prefetch is None:
+            prefetch = cls.PREFETCH
+        self.prefetch = prefetch
+
+        # The offset and eventual list of IDs for the batch being
+        # prefetched, if any.
+        self.next_batch = None
+        self.prefetch_executor = None
+        self.prefetch_session_factory = None
+
+        # While a single partition is being swept, items with IDs
+        # higher than this are left for another partition.
+        self.end_id = None
         super(SweepMonitor, self).__init__(_db, collection=collection)
 
     def run_once(self, *ignore):
+        if self.partitions > 1:
+            return self.run_partitions()
+
         timestamp = self.timestamp()
         offset = timestamp.counter
         new_offset = offset
@@ -459,42 +550,173 @@ class SweepMonitor(CollectionMonitor):
         timestamp.start = run_started_at
 
         total_processed = 0
-        while True:
-            old_offset = offset
-            batch_started_at = utc_now()
-            new_offset, batch_size = self.process_batch(offset)
-            total_processed += batch_size
-            batch_ended_at = utc_now()
-
-            self.log.debug(
-                "%s monitor went from offset %s to %s in %.2f sec",
-                self.service_name,
-                offset,
-                new_offset,
-                (batch_ended_at - batch_started_at).total_seconds(),
-            )
-            achievements = "Records processed: %d." % total_processed
-
-            offset = new_offset
-            if offset == 0:
-                # We completed a sweep. We're done.
-                break
+        try:
+            while True:
+                old_offset = offset
+                batch_started_at = utc_now()
+                with QueryProfile.measure(self.service_name, log=self.log) as profile:
+                    new_offset, batch_size = self.process_batch(offset)
+                total_processed += batch_size
+                batch_ended_at = utc_now()
+                batch_seconds = (batch_ended_at - batch_started_at).total_seconds()
+
+                self.log.debug(
+                    "%s monitor went from offset %s to %s in %.2f sec",
+                    self.service_name,
+                    offset,
+                    new_offset,
+                    batch_seconds,
+                )
+                achievements = "Records processed: %d." % total_processed
+                if self.metrics:
+                    self.metrics.record_batch(batch_size, batch_seconds)
+                    self.metrics.record_queries(profile)
+                if self.batch_sizer:
+                    self.batch_size = self.batch_sizer.record(batch_size, batch_seconds)
+                    achievements += " " + self.batch_sizer.achievements
+
+                offset = new_offset
+                if offset == 0:
+                    # We completed a sweep. We're done.
+                    break
+
+                # We need to do another batch. If it should raise an exception,
+                # we don't want to lose the progress we've already made.
+                timestamp.update(
+                    counter=new_offset, finish=batch_ended_at, achievements=achievements
+                )
+                self._db.commit()
 
-            # We need to do another batch. If it should raise an exception,
-            # we don't want to lose the progress we've already made.
-            timestamp.update(
-                counter=new_offset, finish=batch_ended_at, achievements=achievements
-            )
-            self._db.commit()
+                if self.out_of_time():
+                    # The next run will pick up at the current offset.
+                    self.log.info(
+                        "Out of time at offset %s; the next run will continue.", offset
+                    )
+                    break
+        finally:
+            # However the run ends, don't leave a prefetch behind for
+            # the next run to pick up.
+            self.stop_prefetching()
 
         # We're done with this run. The run() method will do the final
         # update.
         return TimestampData(counter=offset, achievements=achievements)
 
+    def run_partitions(self, pool=None):
+        """Sweep the table in partitions, each in its own worker process.
+
+        When a sweep starts, the highest ID in the table is stored in
+        this Monitor's Timestamp, and the IDs up to that one are divided
+        evenly between the partitions. Items created after that will be
+        handled by the next sweep. If some partitions fail to finish,
+        the next run will resume each of them where it left off.
+
+        :param pool: A ProcessPool (or other) object for use in testing
+            environments.
+        """
+        timestamp = self.timestamp()
+        max_id = timestamp.counter
+        if not max_id:
+            # This is a new sweep.
+            max_id = self._db.query(func.max(self.model_class.id)).scalar() or 0
+            timestamp.counter = max_id
+            for index in range(self.partitions):
+                self.partition_timestamp(index).counter = None
+            self._db.commit()
+
+        jobs = [
+            SweepMonitorPartitionJob(
+                self._db.get_bind().engine.url,
+                self.__class__,
+                self.collection_id,
+                self.batch_size,
+                index,
+                self.partitions,
+                max_id,
+                self.prefetch,
+            )
+            for index in range(self.partitions)
+        ]
+        processed = []
+        failed = (pool or ProcessPool(self.partitions)).run(
+            jobs, lambda index, batch_size: processed.append(batch_size)
+        )
+        achievements = "Records processed: %d." % sum(processed)
+        if self.metrics:
+            self.metrics.items_processed = sum(processed)
+        if failed:
+            return TimestampData(
+                counter=max_id,
+                achievements=achievements,
+                exception="%d of %d partitions failed to finish."
+                % (len(failed), len(jobs)),
+            )
+
+        # Every partition is complete, so the sweep is complete.
+        return TimestampData(counter=0, achievements=achievements)
+
+    def partition_range(self, index, max_id):
+        """Find the range of IDs covered by one partition of a sweep.
+
+        :return: A 2-tuple (last_id, end_id). The partition covers the
+            IDs greater than last_id, up to and including end_id.
+        """
+        return (
+            max_id * index // self.partitions,
+            max_id * (index + 1) // self.partitions,
+        )
+
+    def partition_timestamp(self, index):
+        """Find or create the Timestamp that tracks the progress of one
+        partition of a sweep.
+        """
+        timestamp, new = get_one_or_create(
+            self._db,
+            Timestamp,
+            service="%s (partition %d of %d)"
+            % (self.service_name, index + 1, self.partitions),
+            service_type=Timestamp.MONITOR_TYPE,
+            collection=self.collection,
+            create_method_kwargs=dict(start=utc_now(), finish=None, counter=None),
+        )
+        return timestamp
+
+    def sweep_partition(self, index, max_id, report):
+        """Sweep one partition, starting wherever it left off.
+
+        :param report: A function to be called with the size of each
+            batch processed.
+        """
+        last_id, end_id = self.partition_range(index, max_id)
+        timestamp = self.partition_timestamp(index)
+        offset = max(timestamp.counter or 0, last_id)
+        self.end_id = end_id
+        try:
+            while offset < end_id:
+                batch_started_at = utc_now()
+                with QueryProfile.measure(self.service_name, log=self.log):
+                    new_offset, batch_size = self.process_batch(offset)
+                if self.batch_sizer:
+                    self.batch_size = self.batch_sizer.record(
+                        batch_size, (utc_now() - batch_started_at).total_seconds()
+                    )
+                if not batch_size:
+                    # There's nothing left in this partition.
+                    new_offset = end_id
+                timestamp.update(counter=new_offset, finish=utc_now())
+                self._db.commit()
+                report(batch_size)
+                offset = new_offset
+        finally:
+            self.stop_prefetching()
+
     def process_batch(self, offset):
         """Process one batch of work."""
         offset = offset or 0
-        items = self.fetch_batch(offset).all()
+        if self.prefetch:
+            items = self.fetch_prefetched_batch(offset)
+        else:
+            items = self.fetch_batch(offset).all()
         if items:
             self.process_items(items)
             # We've completed a batch. Return the ID of the last item
@@ -513,13 +735,79 @@ class SweepMonitor(CollectionMonitor):
 
     def fetch_batch(self, offset):
         """Retrieve one batch of work from the database."""
-        q = (
-            self.item_query()
-            .filter(self.model_class.id > offset)
-            .order_by(self.model_class.id)
-            .limit(self.batch_size)
+        q = self.item_query().filter(self.model_class.id > offset)
+        if self.end_id is not None:
+            q = q.filter(self.model_class.id <= self.end_id)
+        return q.order_by(self.model_class.id).limit(self.batch_size)
+
+    def fetch_prefetched_batch(self, offset):
+        """Retrieve one batch of work, using the IDs prefetched for it
+        if there are any, and start prefetching the batch after it.
+        """
+        ids = None
+        if self.next_batch:
+            next_offset, future = self.next_batch
+            self.next_batch = None
+            if next_offset == offset:
+                ids = future.result()
+
+        if ids is None:
+            items = self.fetch_batch(offset).all()
+        elif ids:
+            items = (
+                self._db.query(self.model_class)
+                .filter(self.model_class.id.in_(ids))
+                .order_by(self.model_class.id)
+                .all()
+            )
+        else:
+            items = []
+
+        if items:
+            self.start_prefetching(items[-1].id)
+        else:
+            # This is the end of the sweep.
+            self.stop_prefetching()
+        return items
+
+    def start_prefetching(self, offset):
+        """Start looking up the IDs of the batch that comes after
+        `offset`, on a separate database connection.
+        """
+        if not self.prefetch_executor:
+            self.prefetch_executor = ThreadPoolExecutor(max_workers=1)
+        if not self.prefetch_session_factory:
+            self.prefetch_session_factory = SessionManager.sessionmaker(
+                session=self._db
+            )
+        # The query is built here, since building it may use this
+        # Monitor's session, but it's run in the background.
+        query = self.fetch_batch(offset).with_entities(self.model_class.id)
+        self.next_batch = (
+            offset,
+            self.prefetch_executor.submit(self._fetch_ids, query),
         )
-        return q
+
+    def _fetch_ids(self, query):
+        _db = self.prefetch_session_factory()
+        try:
+            return [id for (id,) in query.with_session(_db)]
+        finally:
+            _db.close()
+
+    def stop_prefetching(self):
+        """Wait for any prefetch in progress, discard it, and shut down
+        the background thread.
+
+        This is called whenever a sweep stops, for whatever reason. A
+        prefetch left over from one run could otherwise be used by the
+        next run, which starts at the same offset, even though the
+        table may have changed in between.
+        """
+        self.next_batch = None
+        if self.prefetch_executor:
+            self.prefetch_executor.shutdown()
+            self.prefetch_executor = None
 
     def item_query(self):
         """Find the items that need to be processed in the sweep.
@@ -549,6 +837,59 @@ class SweepMonitor(CollectionMonitor):
         raise NotImplementedError()
 
 
+class SweepMonitorPartitionJob(object):
+    """Sweep one partition for a SweepMonitor, in a worker process of
+    its own.
+
+    This is a job for util.worker_pools.ProcessPool. The partition's
+    progress is stored in its own Timestamp, so if the process dies,
+    the restarted job picks up where it left off.
+    """
+
+    def __init__(
+        self,
+        database_url,
+        monitor_class,
+        collection_id,
+        batch_size,
+        index,
+        partitions,
+        max_id,
+        prefetch=False,
+    ):
+        self.database_url = database_url
+        self.monitor_class = monitor_class
+        self.collection_id = collection_id
+        self.batch_size = batch_size
+        self.index = index
+        self.partitions = partitions
+        self.max_id = max_id
+        self.prefetch = prefetch
+
+    def __call__(self, report):
+        # Database connections can't be shared with the parent
+        # process, so this worker gets an engine of its own.
+        _db = SessionManager.sessionmaker(self.database_url)()
+        try:
+            self.run(_db, report)
+        finally:
+            _db.close()
+            _db.get_bind().dispose()
+
+    def run(self, _db, report):
+        collection = None
+        if self.collection_id:
+            collection = get_one(_db, Collection, id=self.collection_id)
+        monitor = self.monitor_class(
+            _db,
+            collection=collection,
+            batch_size=self.batch_size,
+            partitions=self.partitions,
+            prefetch=self.prefetch,
+        )
+        monitor.sweep_partition(self.index, self.max_id, report)
+
+
 class IdentifierSweepMonitor(SweepMonitor):
     """A Monitor that does some work for every Identifier."""
 
@@ -813,6 +1154,17 @@ class ReaperMonitor(Monitor):
     A subclass of ReaperMonitor MAY define values for the following constants:
     * BATCH_SIZE - The number of rows to fetch for deletion in a single
     batch. The default is 1000.
+    * TARGET_BATCH_SECONDS - If this is set, the batch size is adjusted
+    so that each batch takes about this long, staying between
+    MIN_BATCH_SIZE and MAX_BATCH_SIZE.
+    * SET_BASED - If this is True, each batch of rows is deleted with a
+    single DELETE statement, without loading the rows as ORM objects.
+    This is much faster, but delete() is never called and the ORM
+    can't cascade the deletion, so it's only suitable for tables the
+    database can delete from on its own.
+    * MAX_RUN_SECONDS - If this is set, a run stops starting new
+    batches after this many seconds, and leaves the remaining rows
+    for the next run.
 
     If your model class has fields that might contain a lot of data
     and aren't important to the reaping process, put their field names
@@ -824,6 +1176,11 @@ class ReaperMonitor(Monitor):
     TIMESTAMP_FIELD = None
     MAX_AGE = None
     BATCH_SIZE = 1000
+    TARGET_BATCH_SECONDS = None
+    MIN_BATCH_SIZE = 1
+    MAX_BATCH_SIZE = None
+    SET_BASED = False
+    MAX_RUN_SECONDS = None
 
     REGISTRY = []
 
@@ -853,21 +1210,94 @@ class ReaperMonitor(Monitor):
         return self.timestamp_field < self.cutoff
 
     def run_once(self, *args, **kwargs):
-        rows_deleted = 0
+        if self.SET_BASED:
+            delete_batch = self.delete_batch
+        else:
+            delete_batch = self.delete_batch_one_by_one
+        rows_deleted, notes = self.run_in_batches(delete_batch)
+        return TimestampData(achievements="Items deleted: %d" % rows_deleted + notes)
+
+    def run_in_batches(self, process_batch):
+        """Process rows a batch at a time, committing after each batch,
+        until a batch comes up short or MAX_RUN_SECONDS (or the
+        Monitor's time budget, if that's shorter) have passed.
+
+        :param process_batch: A function that takes a batch size, deals
+            with up to that many rows, and returns the number of rows
+            it dealt with.
+        :return: A 2-tuple (number of rows, string to be appended to
+            the Timestamp achievements).
+        """
+        # The batches may run raw SQL, which won't see pending changes.
+        self._db.flush()
+        run_started_at = utc_now()
+        max_run_seconds = min(
+            (x for x in (self.MAX_RUN_SECONDS, self.time_budget) if x is not None),
+            default=None,
+        )
+        batch_size = self.BATCH_SIZE
+        batch_sizer = AdaptiveBatchSize.for_object(self, batch_size)
+        total = 0
+        notes = []
+        while True:
+            batch_started_at = utc_now()
+            with QueryProfile.measure(self.service_name, log=self.log) as profile:
+                count = process_batch(batch_size)
+                self._db.commit()
+            total += count
+            batch_ended_at = utc_now()
+            if self.metrics:
+                self.metrics.record_batch(
+                    count, (batch_ended_at - batch_started_at).total_seconds()
+                )
+                self.metrics.record_queries(profile)
+            next_batch_size = batch_size
+            if batch_sizer:
+                next_batch_size = batch_sizer.record(
+                    count, (batch_ended_at - batch_started_at).total_seconds()
+                )
+            if count < batch_size:
+                # There's nothing left to do.
+                break
+            batch_size = next_batch_size
+            if (
+                max_run_seconds is not None
+                and (batch_ended_at - run_started_at).total_seconds() >= max_run_seconds
+            ):
+                self.log.info(
+                    "Out of time after %d rows; the next run will continue.", total
+                )
+                notes.append("Stopped after %d seconds" % max_run_seconds)
+                break
+        if batch_sizer:
+            notes.append(batch_sizer.achievements)
+        return total, "".join(". " + note for note in notes)
+
+    def delete_batch(self, batch_size):
+        """Delete up to `batch_size` rows with a single DELETE statement.
+
+        :return: The number of rows deleted.
+        """
+        table = self.MODEL_CLASS.__table__
+        ids = self.query().with_entities(self.MODEL_CLASS.id).limit(batch_size)
+        delete = table.delete().where(table.c.id.in_(ids)).returning(table.c.id)
+        return len(self._db.execute(delete).fetchall())
+
+    def delete_batch_one_by_one(self, batch_size):
+        """Load up to `batch_size` rows as ORM objects and delete them
+        with delete().
+
+        :return: The number of rows deleted.
+        """
         qu = self.query()
         to_defer = getattr(self.MODEL_CLASS, "LARGE_FIELDS", [])
         for x in to_defer:
             qu = qu.options(defer(x))
-        count = qu.count()
-        self.log.info("Deleting %d row(s)", count)
-        while count > 0:
-            for i in qu.limit(self.BATCH_SIZE):
-                self.log.info("Deleting %r", i)
-                self.delete(i)
-                rows_deleted += 1
-            self._db.commit()
-            count = qu.count()
-        return TimestampData(achievements="Items deleted: %d" % rows_deleted)
+        rows = qu.limit(batch_size).all()
+        for row in rows:
+            self.log.info("Deleting %r", row)
+            self.delete(row)
+        return len(rows)
 
     def delete(self, row):
         """Delete a row from the database.
@@ -891,11 +1321,28 @@ class CachedFeedReaper(ReaperMonitor):
     MODEL_CLASS = CachedFeed
     TIMESTAMP_FIELD = "timestamp"
     MAX_AGE = 30
+    SET_BASED = True
 
 
 ReaperMonitor.REGISTRY.append(CachedFeedReaper)
 
 
+class CoverageQueueReaper(ReaperMonitor):
+    """Remove items that have sat on a coverage queue for a week.
+
+    Nobody is taking items off that queue, and the next full run of
+    the coverage provider will find the items anyway.
+    """
+
+    MODEL_CLASS = CoverageQueueItem
+    TIMESTAMP_FIELD = "created"
+    MAX_AGE = 7
+    SET_BASED = True
+
+
+ReaperMonitor.REGISTRY.append(CoverageQueueReaper)
+
+
 class CredentialReaper(ReaperMonitor):
     """Remove Credentials that expired more than a day ago."""
 
@@ -977,6 +1424,7 @@ class MeasurementReaper(ReaperMonitor):
     """Remove measurements that are not the most recent"""
 
     MODEL_CLASS = Measurement
+    SET_BASED = True
 
     def run(self):
         enabled = ConfigurationSetting.sitewide(
@@ -995,11 +1443,6 @@ class MeasurementReaper(ReaperMonitor):
     def where_clause(self):
         return Measurement.is_most_recent == False
 
-    def run_once(self, *args, **kwargs):
-        rows_deleted = self.query().delete()
-        self._db.commit()
-        return TimestampData(achievements="Items deleted: %d" % rows_deleted)
-
 
 ReaperMonitor.REGISTRY.append(MeasurementReaper)
 
@@ -1030,17 +1473,24 @@ class ScrubberMonitor(ReaperMonitor):
 
     def run_once(self, *args, **kwargs):
         """Find all rows that need to be scrubbed, and scrub them."""
-        rows_scrubbed = 0
+        rows_scrubbed, notes = self.run_in_batches(self.scrub_batch)
+        return TimestampData(achievements="Items scrubbed: %d" % rows_scrubbed + notes)
+
+    def scrub_batch(self, batch_size):
+        """Scrub up to `batch_size` rows with a single UPDATE statement.
+
+        :return: The number of rows scrubbed.
+        """
         cls = self.MODEL_CLASS
+        table = cls.__table__
+        ids = self._db.query(cls.id).filter(self.where_clause).limit(batch_size)
         update = (
-            cls.__table__.update()
-            .where(self.where_clause)
+            table.update()
+            .where(table.c.id.in_(ids))
             .values({self.SCRUB_FIELD: None})
-            .returning(cls.id)
+            .returning(table.c.id)
         )
-        scrubbed = self._db.execute(update).fetchall()
-        self._db.commit()
-        return TimestampData(achievements="Items scrubbed: %d" % len(scrubbed))
+        return len(self._db.execute(update).fetchall())
 
     @property
     def where_clause(self):
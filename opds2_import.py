@@ -41,6 +41,7 @@ from .model import (
 )
 from .opds_import import OPDSImporter, OPDSImportMonitor
 from .util.http import BadResponseException
+from .util.json_stream import decode_value, iterate_array, iterate_object
 from .util.opds_writer import OPDSFeed
 
 
@@ -99,6 +100,82 @@ class RWPMManifestParser(object):
 
         return result
 
+    def parse_publications(self, manifest):
+        """Parse the feed into a sequence of RPWM-like AST objects, which
+        between them contain all of the feed's publications.
+
+        This implementation parses the entire feed at once.
+
+        :param manifest: RWPM-like manifest
+        :type manifest: Union[str, Dict, webpub_manifest_parser.core.ast.Manifestlike]
+
+        :return: Parsed RWPM-like manifests
+        :rtype: Iterable[webpub_manifest_parser.core.ManifestParserResult]
+        """
+        yield self.parse_manifest(manifest)
+
+
+class StreamingRWPMManifestParser(RWPMManifestParser):
+    """Parses an RWPM-like feed one publication at a time.
+
+    RWPMManifestParser builds an AST object for the entire feed before
+    any publication can be imported, which takes a lot of memory for
+    feeds containing thousands of publications. This parser decodes
+    the feed's publications one at a time and validates each of them
+    on its own, as part of a copy of the feed containing only that
+    publication. Memory use is bounded by the size of the largest
+    publication, and an invalid publication doesn't affect the others.
+
+    Groups are parsed one group at a time.
+    """
+
+    STREAMED_KEYS = ("publications", "groups")
+
+    def parse_publications(self, manifest):
+        """Parse the feed into a sequence of RPWM-like AST objects, each
+        containing a single publication or group.
+
+        :param manifest: RWPM-like manifest
+        :type manifest: Union[str, Dict, webpub_manifest_parser.core.ast.Manifestlike]
+
+        :return: Parsed RWPM-like manifests
+        :rtype: Iterable[webpub_manifest_parser.core.ManifestParserResult]
+        """
+        if isinstance(manifest, bytes):
+            manifest = manifest.decode("utf-8")
+        if not isinstance(manifest, str):
+            # There's nothing to gain by streaming something that has
+            # already been decoded.
+            yield from super(StreamingRWPMManifestParser, self).parse_publications(
+                manifest
+            )
+            return
+
+        # Decode everything except the publications and groups.
+        feed = {}
+        streamed = []
+        for key, start, end in iterate_object(manifest):
+            if key in self.STREAMED_KEYS and manifest[start] == "[":
+                streamed.append((key, start))
+            else:
+                feed[key], ignore = decode_value(manifest, start)
+
+        parsed = False
+        for key, start in streamed:
+            for item in iterate_array(manifest, start):
+                parsed = True
+                try:
+                    yield self.parse_manifest(dict(feed, **{key: [item]}))
+                except BaseError:
+                    # parse_manifest has already logged this. Move on to
+                    # the next publication.
+                    continue
+
+        if not parsed:
+            # The feed is empty, but it may still have feed-level
+            # information such as links.
+            yield self.parse_manifest(feed)
+
 
 class OPDS2Importer(OPDSImporter):
     """Imports editions and license pools from an OPDS 2.0 feed."""
@@ -889,8 +966,10 @@ class OPDS2Importer(OPDSImporter):
         :return: List of "next" links
         :rtype: List[str]
         """
-        parser_result = self._parser.parse_manifest(feed)
-        parsed_feed = parser_result.root
+        # Every parser result contains the feed-level links, so there's
+        # no need to look past the first one.
+        parser_result = next(iter(self._parser.parse_publications(feed)), None)
+        parsed_feed = parser_result.root if parser_result else None
 
         if not parsed_feed:
             return []
@@ -909,17 +988,19 @@ class OPDS2Importer(OPDSImporter):
         :return: A list of 2-tuples containing publication's identifiers and their last modified dates
         :rtype: List[Tuple[str, datetime.datetime]]
         """
-        parser_result = self._parser.parse_manifest(feed)
-        parsed_feed = parser_result.root
+        dates = []
 
-        if not parsed_feed:
-            return []
+        for parser_result in self._parser.parse_publications(feed):
+            parsed_feed = parser_result.root
+
+            if not parsed_feed:
+                continue
 
-        dates = [
-            (publication.metadata.identifier, publication.metadata.modified)
-            for publication in self._get_publications(parsed_feed)
-            if publication.metadata.modified
-        ]
+            dates.extend(
+                (publication.metadata.identifier, publication.metadata.modified)
+                for publication in self._get_publications(parsed_feed)
+                if publication.metadata.modified
+            )
 
         return dates
 
@@ -932,10 +1013,36 @@ class OPDS2Importer(OPDSImporter):
         :param feed_url: Feed URL used to resolve relative links
         :type feed_url: Optional[str]f
         """
-        parser_result = self._parser.parse_manifest(feed)
-        feed = parser_result.root
         publication_metadata_dictionary = {}
         failures = {}
+        feed_errors = set()
+
+        for parser_result in self._parser.parse_publications(feed):
+            self._extract_parser_result_data(
+                parser_result, publication_metadata_dictionary, failures, feed_errors
+            )
+
+        return publication_metadata_dictionary, failures
+
+    def _extract_parser_result_data(
+        self, parser_result, publication_metadata_dictionary, failures, feed_errors
+    ):
+        """Turn the publications in a single parser result into Metadata
+        objects and coverage failures.
+
+        :param parser_result: Parsed RWPM-like manifest
+        :type parser_result: webpub_manifest_parser.core.ManifestParserResult
+
+        :param publication_metadata_dictionary: Dictionary mapping publication identifiers to Metadata objects
+        :type publication_metadata_dictionary: Dict[str, Metadata]
+
+        :param failures: Dictionary mapping publication identifiers to corresponding CoverageFailure objects
+        :type failures: Dict[str, List[CoverageFailure]]
+
+        :param feed_errors: Messages describing feed-level errors that have already been logged
+        :type feed_errors: Set[str]
+        """
+        feed = parser_result.root
 
         for publication in self._get_publications(feed):
             recognized_identifier = self._extract_identifier(publication)
@@ -972,11 +1079,12 @@ class OPDS2Importer(OPDSImporter):
                     self._record_coverage_failure(
                         failures, recognized_identifier, error.error_message
                     )
-            else:
+            elif error.error_message not in feed_errors:
+                # A streaming parser reports feed-level errors once per
+                # publication, but they only need to be logged once.
+                feed_errors.add(error.error_message)
                 self._logger.warning(f"{error.error_message}")
 
-        return publication_metadata_dictionary, failures
-
 
 class OPDS2ImportMonitor(OPDSImportMonitor):
     PROTOCOL = ExternalIntegration.OPDS2_IMPORT
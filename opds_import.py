@@ -17,10 +17,12 @@ from .coverage import CoverageFailure
 from .metadata_layer import (
     CirculationData,
     ContributorData,
+    ContributorResolver,
     IdentifierData,
     LinkData,
     MeasurementData,
     Metadata,
+    MetadataBatch,
     ReplacementPolicy,
     SubjectData,
     TimestampData,
@@ -33,6 +35,7 @@ from .model import (
     Edition,
     Equivalency,
     ExternalIntegration,
+    HTTPValidators,
     Hyperlink,
     Identifier,
     LicensePool,
@@ -107,10 +110,20 @@ class SimplifiedOPDSLookup(object):
             return None
         return cls(integration.url)
 
-    def __init__(self, base_url):
+    def __init__(self, base_url, _db=None):
+        """Constructor.
+
+        :param base_url: The base URL of the lookup service.
+        :param _db: A database session. If this is provided, the
+            validators sent along with each response are stored, and
+            requests for the same URL are made conditional. The caller
+            must then be prepared to get a 304 response, meaning there
+            is nothing new at that URL.
+        """
         if not base_url.endswith("/"):
             base_url += "/"
         self.base_url = base_url
+        self._db = _db
 
     @property
     def lookup_endpoint(self):
@@ -121,7 +134,14 @@ class SimplifiedOPDSLookup(object):
         kwargs["timeout"] = kwargs.get("timeout", 300)
         kwargs["allowed_response_codes"] = kwargs.get("allowed_response_codes", [])
         kwargs["allowed_response_codes"] += ["2xx", "3xx"]
-        return HTTP.get_with_timeout(url, **kwargs)
+        if self._db:
+            headers = HTTPValidators.request_headers(self._db, url)
+            headers.update(kwargs.get("headers") or {})
+            kwargs["headers"] = headers
+        response = HTTP.get_with_timeout(url, **kwargs)
+        if self._db and response.status_code // 100 == 2:
+            HTTPValidators.update(self._db, url, response.headers)
+        return response
 
     def urn_args(self, identifiers):
         return "&".join(set("urn=%s" % i.urn for i in identifiers))
@@ -640,6 +660,11 @@ class OPDSImporter(object):
             data_source_name = data_source_name or DataSource.METADATA_WRANGLER
         self.data_source_name = data_source_name
         self.identifier_mapping = identifier_mapping
+
+        # Contributors looked up during one feed are likely to show up
+        # again in the next, so keep track of them for as long as this
+        # importer is in use.
+        self.contributor_resolver = ContributorResolver(_db)
         try:
             self.metadata_client = (
                 metadata_client
@@ -806,6 +831,20 @@ class OPDSImporter(object):
         # If parsing the overall feed throws an exception, we should address that before
         # moving on. Let the exception propagate.
         metadata_objs, failures = self.extract_feed_data(feed, feed_url)
+
+        # Look up the database objects needed by every item in the
+        # feed at once, rather than one item at a time.
+        batch = MetadataBatch(
+            self._db,
+            [
+                metadata
+                for key, metadata in metadata_objs.items()
+                if key not in failures
+            ],
+            collection=self.collection,
+            contributor_resolver=self.contributor_resolver,
+        )
+
         # make editions.  if have problem, make sure associated pool and work aren't created.
         for key, metadata in metadata_objs.items():
             # key is identifier.urn here
@@ -816,7 +855,7 @@ class OPDSImporter(object):
 
             try:
                 # Create an edition. This will also create a pool if there's circulation data.
-                edition = self.import_edition_from_metadata(metadata)
+                edition = self.import_edition_from_metadata(metadata, batch)
                 if edition:
                     imported_editions[key] = edition
             except Exception as e:
@@ -862,13 +901,18 @@ class OPDSImporter(object):
             failures,
         )
 
-    def import_edition_from_metadata(self, metadata):
+    def import_edition_from_metadata(self, metadata, batch=None):
         """For the passed-in Metadata object, see if can find or create an Edition
         in the database. Also create a LicensePool if the Metadata has
         CirculationData in it.
+
+        :param batch: A MetadataBatch containing the database objects
+            this Metadata refers to, if they have already been looked up.
         """
         # Locate or create an Edition for this book.
-        edition, is_new_edition = metadata.edition(self._db)
+        edition = batch.edition(metadata) if batch else None
+        if not edition:
+            edition, is_new_edition = metadata.edition(self._db)
 
         policy = ReplacementPolicy(
             subjects=True,
@@ -887,6 +931,7 @@ class OPDSImporter(object):
             collection=self.collection,
             metadata_client=self.metadata_client,
             replace=policy,
+            batch=batch,
         )
 
         return edition
@@ -1913,6 +1958,10 @@ class OPDSImportMonitor(CollectionMonitor, HasSelfTests):
         self.password = collection.external_integration.password
         self.custom_accept_header = collection.external_integration.custom_accept_header
 
+        # The validators sent along with feed pages that still need to
+        # be imported, keyed by URL.
+        self._pending_validators = {}
+
         self.importer = import_class(_db, collection=collection, **import_class_kwargs)
         super(OPDSImportMonitor, self).__init__(_db, collection)
 
@@ -2003,6 +2052,47 @@ class OPDSImportMonitor(CollectionMonitor, HasSelfTests):
         """
         return collection.data_source
 
+    def _parse_identifiers(self, identifiers):
+        """Extract a batch of publications' identifiers from their metadata.
+
+        Unlike _parse_identifier, this never creates new Identifiers,
+        and it looks up all the Identifiers with a single query.
+
+        :param identifiers: List of strings containing identifiers
+        :type identifiers: List[str]
+
+        :return: A 2-tuple (identifiers_by_string, failures).
+            `identifiers_by_string` maps every string that could be parsed
+            to the corresponding Identifier, or to None if that Identifier
+            is not in the database yet. `failures` is a list of strings
+            that could not be turned into Identifiers at all.
+        :rtype: Tuple[Dict[str, Optional[Identifier]], List[str]]
+        """
+        details_by_string = {}
+        failures = []
+        for identifier in identifiers:
+            try:
+                details = Identifier.prepare_foreign_type_and_identifier(
+                    *Identifier.type_and_identifier_for_urn(identifier)
+                )
+            except Exception:
+                details = (None, None)
+            if all(details):
+                details_by_string[identifier] = details
+            else:
+                failures.append(identifier)
+
+        existing, ignore = Identifier.parse_urns(
+            self._db, list(details_by_string.keys()), autocreate=False
+        )
+        existing_by_details = {(i.type, i.identifier): i for i in existing.values()}
+
+        identifiers_by_string = {
+            identifier: existing_by_details.get(details)
+            for identifier, details in details_by_string.items()
+        }
+        return identifiers_by_string, failures
+
     def feed_contains_new_data(self, feed):
         """Does the given feed contain any entries that haven't been imported
         yet?
@@ -2016,21 +2106,39 @@ class OPDSImportMonitor(CollectionMonitor, HasSelfTests):
         # item was last updated.
         last_update_dates = self.importer.extract_last_update_dates(feed)
 
-        new_data = False
-        for identifier, remote_updated in last_update_dates:
+        # Look up every Identifier on the page, and all of their
+        # CoverageRecords, up front, so that the decisions below can
+        # be made without going back to the database.
+        identifiers_by_urn, failures = self._parse_identifiers(
+            [urn for urn, remote_updated in last_update_dates]
+        )
+        records = CoverageRecord.lookup_for_identifiers(
+            self._db,
+            list(identifiers_by_urn.values()),
+            self.importer.data_source,
+            operation=CoverageRecord.IMPORT_OPERATION,
+        )
 
-            identifier = self._parse_identifier(identifier)
-            if not identifier:
+        for urn, remote_updated in last_update_dates:
+            if urn not in identifiers_by_urn:
                 # Maybe this is new, maybe not, but we can't associate
                 # the information with an Identifier, so we can't do
                 # anything about it.
-                self.log.info("Ignoring %s because unable to turn into an Identifier.")
+                self.log.info(
+                    "Ignoring %s because unable to turn into an Identifier.", urn
+                )
                 continue
 
-            if self.identifier_needs_import(identifier, remote_updated):
-                new_data = True
-                break
-        return new_data
+            identifier = identifiers_by_urn[urn]
+            if not identifier:
+                # We have never even seen this Identifier before.
+                self.log.info("Counting %s as new because it has no Identifier.", urn)
+                return True
+
+            record = records.get(identifier.id)
+            if self.coverage_record_needs_import(identifier, record, remote_updated):
+                return True
+        return False
 
     def identifier_needs_import(self, identifier, last_updated_remote):
         """Does the remote side have new information about this Identifier?
@@ -2047,7 +2155,20 @@ class OPDSImportMonitor(CollectionMonitor, HasSelfTests):
             self.importer.data_source,
             operation=CoverageRecord.IMPORT_OPERATION,
         )
+        return self.coverage_record_needs_import(
+            identifier, record, last_updated_remote
+        )
+
+    def coverage_record_needs_import(self, identifier, record, last_updated_remote):
+        """Given the import CoverageRecord for an Identifier, does the remote
+        side have new information about that Identifier?
 
+        :param identifier: An Identifier.
+        :param record: The Identifier's import CoverageRecord, or None
+            if there isn't one.
+        :param last_update_remote: The last time the remote side updated
+            the OPDS entry for this Identifier.
+        """
         if not record:
             # We have no record of importing this Identifier. Import
             # it now.
@@ -2093,6 +2214,7 @@ class OPDSImportMonitor(CollectionMonitor, HasSelfTests):
                     last_updated_remote,
                 )
                 return True
+        return False
 
     def _verify_media_type(self, url, status_code, headers, feed):
         # Make sure we got an OPDS feed, and not an error page that was
@@ -2116,7 +2238,21 @@ class OPDSImportMonitor(CollectionMonitor, HasSelfTests):
         """
         self.log.info("Following next link: %s", url)
         get = do_get or self._get
-        status_code, headers, feed = get(url, {})
+
+        # If this page hasn't changed since we last imported it, the
+        # server can tell us so instead of sending the whole page.
+        request_headers = {}
+        if not self.force_reimport:
+            request_headers = HTTPValidators.request_headers(
+                self._db, url, self.collection
+            )
+        status_code, headers, feed = get(url, request_headers)
+
+        if status_code == 304:
+            # There's nothing new, so we don't need to parse this feed
+            # or check the next page.
+            self.log.info("Not modified since last import.")
+            return [], None
 
         self._verify_media_type(url, status_code, headers, feed)
 
@@ -2124,13 +2260,16 @@ class OPDSImportMonitor(CollectionMonitor, HasSelfTests):
 
         if new_data:
             # There's something new on this page, so we need to check
-            # the next page as well.
+            # the next page as well. We can't start making conditional
+            # requests for this page until it's been imported.
+            self._pending_validators[url] = headers
             next_links = self.importer.extract_next_links(feed)
             return next_links, feed
         else:
             # There's nothing new, so we don't need to import this
             # feed or check the next page.
             self.log.info("No new data.")
+            HTTPValidators.update(self._db, url, headers, self.collection)
             return [], None
 
     def import_one_feed(self, feed):
@@ -2194,6 +2333,9 @@ class OPDSImportMonitor(CollectionMonitor, HasSelfTests):
         return feeds
 
     def run_once(self, progress_ignore):
+        # Contributors are only remembered for the length of a run.
+        self.importer.contributor_resolver = ContributorResolver(self._db)
+
         feeds = self._get_feeds()
         total_imported = 0
         total_failures = 0
@@ -2203,8 +2345,24 @@ class OPDSImportMonitor(CollectionMonitor, HasSelfTests):
             imported_editions, failures = self.import_one_feed(feed)
             total_imported += len(imported_editions)
             total_failures += len(failures)
+            headers = self._pending_validators.pop(link, None)
+            if headers is not None and not failures:
+                # Next time, this page only needs to be downloaded if
+                # it has changed. A page with failures is always
+                # downloaded again, so the failures can be retried.
+                HTTPValidators.update(self._db, link, headers, self.collection)
             self._db.commit()
 
+        hit_rates = self.importer.contributor_resolver.hit_rates
+        if hit_rates:
+            self.log.info(
+                "Contributor lookup hit rates: %s",
+                ", ".join(
+                    "%s %.0f%%" % (kind, rate * 100)
+                    for kind, rate in sorted(hit_rates.items())
+                ),
+            )
+
         achievements = "Items imported: %d. Failures: %d." % (
             total_imported,
             total_failures,
@@ -1,4 +1,5 @@
 import argparse
+import json
 import logging
 import os
 import random
@@ -10,6 +11,7 @@ import unicodedata
 import uuid
 from collections import defaultdict
 from enum import Enum
+from functools import partial
 from pdb import set_trace
 
 from sqlalchemy import and_, exists, text
@@ -18,8 +20,18 @@ from sqlalchemy.orm import Session
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 
 from .config import CannotLoadConfiguration, Configuration
-from .coverage import CollectionCoverageProviderJob, CoverageProviderProgress
+from .coverage import (
+    CollectionCoverageProviderJob,
+    CollectionCoverageProviderPartitionJob,
+    CoverageProviderProgress,
+)
 from .external_search import ExternalSearchIndex, Filter, SearchIndexCoverageProvider
+from .import_benchmark import (
+    ImportBenchmark,
+    SyntheticFeed,
+    benchmark_report,
+    compare_reports,
+)
 from .lane import Lane
 from .metadata_layer import (
     LinkData,
@@ -35,9 +47,11 @@ from .model import (
     Complaint,
     ConfigurationSetting,
     Contributor,
+    CoverageQueueListener,
     CustomList,
     DataSource,
     Edition,
+    EquivalentIdentifier,
     ExternalIntegration,
     Hyperlink,
     Identifier,
@@ -64,7 +78,7 @@ from .opds_import import OPDSImporter, OPDSImportMonitor
 from .util import fast_query_count
 from .util.datetime_helpers import strptime_utc, to_utc, utc_now
 from .util.personal_names import contributor_name_match_ratio, display_name_to_sort_name
-from .util.worker_pools import DatabasePool
+from .util.worker_pools import DatabasePool, Pool, ProcessPool
 
 
 class Script(object):
@@ -224,23 +238,45 @@ class RunMonitorScript(Script):
 
 
 class RunMultipleMonitorsScript(Script):
-    """Run a number of monitors in sequence.
+    """Run a number of monitors.
 
-    Currently the Monitors are run one at a time. It should be
-    possible to take a command-line argument that runs all the
-    Monitors in batches, each in its own thread. Unfortunately, it's
-    tough to know in a given situation that this won't overload the
-    system.
+    By default the Monitors are run one at a time. With a
+    `concurrency` above 1, up to that many Monitors run at once, each
+    in its own thread with its own database session, so one slow
+    Monitor doesn't hold up all the others. The Monitors that have gone
+    longest without finishing a run are started first.
     """
 
-    def __init__(self, _db=None, **kwargs):
+    # How many Monitors to run at once.
+    CONCURRENCY = 1
+
+    # If this is set, each Monitor is asked to stop after running for
+    # this many seconds. Monitors that can stop partway through their
+    # work will pick up where they left off on their next run.
+    TIME_BUDGET = None
+
+    def __init__(self, _db=None, concurrency=None, time_budget=None, **kwargs):
         """Constructor.
 
+        :param concurrency: How many Monitors to run at once.
+        :param time_budget: How many seconds each Monitor may run.
         :param kwargs: Keyword arguments to pass into the `monitors` method
             when building the Monitor objects.
         """
         super(RunMultipleMonitorsScript, self).__init__(_db)
+        self.concurrency = concurrency or self.CONCURRENCY
+        if time_budget is None:
+            time_budget = self.TIME_BUDGET
+        self.time_budget = time_budget
         self.kwargs = kwargs
+        self._session_factory = None
+
+    @property
+    def session_factory(self):
+        """Creates the sessions used by Monitors run concurrently."""
+        if not self._session_factory:
+            self._session_factory = SessionManager.sessionmaker(session=self._db)
+        return self._session_factory
 
     def monitors(self, **kwargs):
         """Find all the Monitors that need to be run.
@@ -249,25 +285,87 @@ class RunMultipleMonitorsScript(Script):
         """
         raise NotImplementedError()
 
-    def do_run(self):
-        for monitor in self.monitors(**self.kwargs):
-            try:
-                monitor.run()
-            except Exception as e:
-                # This is bad, but not so bad that we should give up trying
-                # to run the other Monitors.
-                if monitor.collection:
-                    collection_name = monitor.collection.name
-                else:
-                    collection_name = None
-                monitor.exception = e
-                self.log.error(
-                    "Error running monitor %s for collection %s: %s",
-                    self.name,
-                    collection_name,
-                    e,
-                    exc_info=e,
-                )
+    def do_run(self, pool=None):
+        """Run every Monitor.
+
+        :param pool: A Pool (or other) object for use in testing
+            environments.
+        """
+        monitors = self.monitors(**self.kwargs)
+        if self.concurrency <= 1 and not pool:
+            for monitor in monitors:
+                self.run_monitor(monitor)
+            return
+
+        monitors = self.by_priority(monitors)
+
+        # The Monitors' sessions can't see anything this session
+        # hasn't committed.
+        self._db.commit()
+        with (pool or Pool(self.concurrency)) as job_queue:
+            for monitor in monitors:
+                job_queue.put(partial(self.run_in_own_session, monitor))
+
+    def by_priority(self, monitors):
+        """Sort Monitors so that the ones that have gone longest
+        without finishing a run come first.
+
+        Monitors that have never finished a run come before all the
+        others.
+        """
+
+        def last_finished(monitor):
+            timestamp = Timestamp.lookup(
+                self._db,
+                monitor.service_name,
+                Timestamp.MONITOR_TYPE,
+                monitor.collection,
+            )
+            finish = timestamp.finish if timestamp else None
+            return (finish is not None, finish)
+
+        return sorted(monitors, key=last_finished)
+
+    def run_in_own_session(self, monitor):
+        """Run a Monitor with a database session of its own."""
+        _db = self.session_factory()
+        try:
+            self.run_monitor(self.monitor_for_session(monitor, _db))
+        finally:
+            _db.close()
+
+    def monitor_for_session(self, monitor, _db):
+        """Create a Monitor like `monitor` that uses the session `_db`.
+
+        By default, this calls the Monitor's constructor with its
+        collection and the keyword arguments passed into this script's
+        constructor. Subclasses whose Monitors are created some other
+        way must override this.
+        """
+        collection = None
+        if monitor.collection_id:
+            collection = get_one(_db, Collection, id=monitor.collection_id)
+        return monitor.__class__(_db, collection=collection, **self.kwargs)
+
+    def run_monitor(self, monitor):
+        monitor.time_budget = self.time_budget
+        try:
+            monitor.run()
+        except Exception as e:
+            # This is bad, but not so bad that we should give up trying
+            # to run the other Monitors.
+            if monitor.collection:
+                collection_name = monitor.collection.name
+            else:
+                collection_name = None
+            monitor.exception = e
+            self.log.error(
+                "Error running monitor %s for collection %s: %s",
+                self.name,
+                collection_name,
+                e,
+                exc_info=e,
+            )
 
 
 class RunReaperMonitorsScript(RunMultipleMonitorsScript):
@@ -332,8 +430,54 @@ class RunCollectionCoverageProviderScript(RunCoverageProvidersScript):
         return list(provider_class.all(_db, **kwargs))
 
 
+class RunCoverageQueueScript(RunCollectionCoverageProviderScript):
+    """Cover items as soon as they're put on the providers' coverage
+    queues, instead of periodically searching for items that need
+    coverage.
+
+    This runs until it's killed. When every queue is empty, it sleeps
+    until it's notified that something was added to one of them.
+    """
+
+    # Even if no notification arrives, check the queues this often.
+    WAIT_SECONDS = 60
+
+    def do_run(self, listener=None, stop_after=None):
+        """Cover queued items as they come in.
+
+        :param listener: A CoverageQueueListener. By default, a new
+            one is created and closed when the script stops.
+        :param stop_after: Stop once the queues are empty and this
+            many seconds have passed. Mainly for tests.
+        """
+        if not self.providers:
+            self.log.info("No CoverageProviders to run.")
+            return
+        started = utc_now()
+        close_listener = listener is None
+        listener = listener or CoverageQueueListener(self._db)
+        try:
+            while True:
+                for provider in self.providers:
+                    provider.run_queue()
+                wait = self.WAIT_SECONDS
+                if stop_after is not None:
+                    elapsed = (utc_now() - started).total_seconds()
+                    if elapsed >= stop_after:
+                        break
+                    wait = min(wait, stop_after - elapsed)
+                listener.wait(wait)
+        finally:
+            if close_listener:
+                listener.close()
+
+
 class RunThreadedCollectionCoverageProviderScript(Script):
-    """Run coverage providers in multiple threads."""
+    """Run coverage providers in multiple threads.
+
+    The threads share the GIL, so for CPU-heavy providers
+    RunMultiprocessCollectionCoverageProviderScript is a better choice.
+    """
 
     DEFAULT_WORKER_SIZE = 5
 
@@ -397,6 +541,72 @@ class RunThreadedCollectionCoverageProviderScript(Script):
         return fast_query_count(qu), provider.batch_size
 
 
+class RunMultiprocessCollectionCoverageProviderScript(Script):
+    """Run coverage providers in multiple worker processes.
+
+    The items that need coverage are divided into disjoint ranges of
+    IDs, one per worker, and each worker covers its range with a
+    database session of its own. Progress from all the workers is
+    collected into a single Timestamp for each collection, and a
+    worker that dies is restarted where it left off.
+    """
+
+    def __init__(self, provider_class, worker_size=None, _db=None, **provider_kwargs):
+        super(RunMultiprocessCollectionCoverageProviderScript, self).__init__(_db)
+        self.worker_size = worker_size or os.cpu_count() or 1
+        self.provider_class = provider_class
+        self.provider_kwargs = provider_kwargs
+
+    def run(self, pool=None):
+        """Run the coverage provider for every relevant collection.
+
+        :param pool: A ProcessPool (or other) object for use in testing
+            environments.
+        """
+        for collection in self.provider_class.collections(self._db):
+            self.run_for_collection(collection, pool or ProcessPool(self.worker_size))
+
+    def run_for_collection(self, collection, pool):
+        provider = self.provider_class(collection, **self.provider_kwargs)
+        progress = CoverageProviderProgress(start=utc_now())
+        database_url = self._db.get_bind().engine.url
+        jobs = [
+            CollectionCoverageProviderPartitionJob(
+                database_url,
+                collection.id,
+                self.provider_class,
+                last_id=last_id,
+                end_id=end_id,
+                **self.provider_kwargs,
+            )
+            for last_id, end_id in provider.partition_items_that_need_coverage(
+                self.worker_size
+            )
+        ]
+
+        # The workers can't see anything this session hasn't committed.
+        self._db.commit()
+
+        def on_message(index, message):
+            # A restarted job will pick up after the last item it covered.
+            jobs[index].last_id = message["last_id"]
+            progress.successes += message["successes"]
+            progress.transient_failures += message["transient_failures"]
+            progress.persistent_failures += message["persistent_failures"]
+            if message["exception"]:
+                progress.exception = message["exception"]
+
+        failed = pool.run(jobs, on_message)
+        if failed and not progress.exception:
+            progress.exception = "%d of %d workers failed to finish." % (
+                len(failed),
+                len(jobs),
+            )
+        progress.finish = utc_now()
+        provider.finalize_timestampdata(progress)
+        return progress
+
+
 class RunWorkCoverageProviderScript(RunCollectionCoverageProviderScript):
     """Run a WorkCoverageProvider on every relevant Work in the system."""
 
@@ -1565,12 +1775,17 @@ class WorkProcessingScript(IdentifierInputScript):
         offset = 0
         while works:
             works = self.query.offset(offset).limit(self.batch_size).all()
-            for work in works:
-                self.process_work(work)
+            if works:
+                self.process_works(works)
             offset += self.batch_size
             self._db.commit()
         self._db.commit()
 
+    def process_works(self, works):
+        """Process one batch of Works."""
+        for work in works:
+            self.process_work(work)
+
     def process_work(self, work):
         raise NotImplementedError()
 
@@ -1625,6 +1840,9 @@ class WorkPresentationScript(TimestampScript, WorkProcessingScript):
     # Do a complete recalculation of the presentation.
     policy = PresentationCalculationPolicy()
 
+    def process_works(self, works):
+        Work.calculate_presentation_for_works(works, policy=self.policy)
+
     def process_work(self, work):
         work.calculate_presentation(policy=self.policy)
 
@@ -1865,6 +2083,131 @@ class OPDSImportScript(CollectionInputScript):
         monitor.run()
 
 
+class ImportBenchmarkScript(Script):
+    """Measure OPDS import throughput with synthetic feeds.
+
+    Nothing the benchmark imports is committed, but it should still be
+    run against a local database rather than a production one.
+    """
+
+    name = "Benchmark OPDS import with synthetic feeds."
+
+    @classmethod
+    def arg_parser(cls):
+        parser = argparse.ArgumentParser()
+        parser.add_argument(
+            "--format",
+            help="Feed format to benchmark. May be repeated. Default: all formats.",
+            action="append",
+            choices=ImportBenchmark.FORMATS,
+            dest="formats",
+        )
+        parser.add_argument(
+            "--entries", help="Entries per feed.", type=int, default=100
+        )
+        parser.add_argument(
+            "--contributors", help="Contributors per entry.", type=int, default=2
+        )
+        parser.add_argument(
+            "--subjects", help="Subjects per entry.", type=int, default=3
+        )
+        parser.add_argument(
+            "--links", help="Image links per entry.", type=int, default=2
+        )
+        parser.add_argument(
+            "--acquisition-formats",
+            help="Acquisition links (in different formats) per entry.",
+            type=int,
+            default=1,
+        )
+        parser.add_argument(
+            "--update-ratio",
+            help="Share of entries that update books which were already imported.",
+            type=float,
+            default=0.0,
+        )
+        parser.add_argument(
+            "--repeat", help="Number of timed runs.", type=int, default=3
+        )
+        parser.add_argument(
+            "--no-memory",
+            help="Don't measure peak memory use.",
+            action="store_true",
+        )
+        parser.add_argument(
+            "--output",
+            help="Append the results, as a line of JSON, to this file.",
+        )
+        parser.add_argument(
+            "--compare",
+            help="Compare the results against the last line of this file.",
+        )
+        return parser
+
+    def do_run(self, _db=None, cmd_args=None, output=sys.stdout):
+        _db = _db or self._db
+        args = self.parse_command_line(_db, cmd_args=cmd_args)
+        feed = SyntheticFeed(
+            entries=args.entries,
+            contributors=args.contributors,
+            subjects=args.subjects,
+            links=args.links,
+            formats=args.acquisition_formats,
+            update_ratio=args.update_ratio,
+        )
+
+        results = []
+        for feed_format in args.formats or ImportBenchmark.FORMATS:
+            benchmark = ImportBenchmark(
+                _db,
+                feed_format,
+                feed,
+                repeat=args.repeat,
+                measure_memory=not args.no_memory,
+            )
+            result = benchmark.run()
+            results.append(result)
+            output.write(
+                "%s: %.1f entries/sec, %.1f SQL statements/entry, "
+                "peak memory %s bytes\n"
+                % (
+                    feed_format,
+                    result["entries_per_second"] or 0,
+                    result["sql_statements_per_entry"] or 0,
+                    result["peak_memory_bytes"],
+                )
+            )
+
+        # Read the baseline before writing this run's report, since
+        # --output and --compare may name the same file.
+        old = None
+        if args.compare:
+            with open(args.compare) as previous:
+                lines = [line for line in previous if line.strip()]
+            if lines:
+                old = json.loads(lines[-1])
+
+        report = benchmark_report(results)
+        if args.output:
+            with open(args.output, "a") as out:
+                out.write(json.dumps(report) + "\n")
+
+        if old:
+            output.write("Compared to commit %s:\n" % old.get("commit"))
+            for comparison in compare_reports(old, report):
+                changes = []
+                for field in (
+                    "entries_per_second",
+                    "sql_statements_per_entry",
+                    "peak_memory_bytes",
+                ):
+                    change = comparison[field]["change"]
+                    if change is not None:
+                        changes.append("%s %+.1f%%" % (field, change * 100))
+                output.write("%s: %s\n" % (comparison["format"], ", ".join(changes)))
+        return report
+
+
 class MirrorResourcesScript(CollectionInputScript):
     """Make sure that all mirrorable resources in a collection have
     in fact been mirrored.
@@ -3417,6 +3760,39 @@ class SearchIndexCoverageRemover(TimestampScript, RemovesSearchCoverage):
         )
 
 
+class RebuildEquivalentIdentifiersScript(TimestampScript):
+    """Recalculate the closure of the equivalents graph (see
+    EquivalentIdentifier) from scratch.
+
+    The closure is kept up to date as Equivalencies change through the
+    ORM, but not when they're changed directly in SQL.
+    """
+
+    BATCH_SIZE = 1000
+
+    def do_run(self):
+        processed = 0
+        last_id = None
+        while True:
+            identifier_ids = EquivalentIdentifier.identifier_ids_to_rebuild(
+                self._db, after=last_id, batch_size=self.BATCH_SIZE
+            )
+            if not identifier_ids:
+                break
+            EquivalentIdentifier.calculate(self._db, identifier_ids)
+            self._db.commit()
+            processed += len(identifier_ids)
+            last_id = identifier_ids[-1]
+            self.log.info("Recalculated equivalents for %d identifiers.", processed)
+
+        deleted = EquivalentIdentifier.delete_stale(self._db)
+        self._db.commit()
+        return TimestampData(
+            achievements="Identifiers processed: %d. Stale rows deleted: %d."
+            % (processed, deleted)
+        )
+
+
 class MockStdin(object):
     """Mock a list of identifiers passed in on standard input."""
 
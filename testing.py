@@ -1,3 +1,4 @@
+import contextlib
 import inspect
 import json
 import logging
@@ -70,8 +71,10 @@ from .model import (
 )
 from .model.configuration import ExternalIntegrationLink
 from .model.constants import MediaTypes
+from .model.hassessioncache import HasSessionCache
 from .model.licensing import LicenseStatus
 from .util.datetime_helpers import datetime_utc, utc_now
+from .util.query_profile import QueryProfile
 
 
 class LogCaptureHandler(logging.Handler):
@@ -228,6 +231,63 @@ class DatabaseTest(object):
             if key in Configuration.instance:
                 del Configuration.instance[key]
 
+        # Throw out any objects shared between this test's sessions.
+        HasSessionCache.process_cache.clear()
+
+    @contextlib.contextmanager
+    def _mock_read_replica(self):
+        """Make SessionManager.read_only_session() yield a second
+        session on the test connection, standing in for a session on a
+        read replica.
+
+        :yield: A list that will contain every replica session that's
+            created.
+        """
+        sessions = []
+
+        @contextlib.contextmanager
+        def read_only_session(_db):
+            session = Session(self.connection)
+            sessions.append(session)
+            try:
+                yield session
+            finally:
+                session.close()
+
+        with mock.patch.object(
+            SessionManager, "read_only_session", side_effect=read_only_session
+        ):
+            yield sessions
+
+    @contextlib.contextmanager
+    def assert_query_budget(self, max_statements=None, n_plus_one_threshold=None):
+        """Assert that the code inside a `with` block stays within a
+        budget of SQL statements.
+
+        :param max_statements: Fail if more than this many statements
+            are run.
+        :param n_plus_one_threshold: Fail if more than this many
+            statements of the same shape are run. By default,
+            QueryProfile.N_PLUS_ONE_THRESHOLD is used.
+        :yield: The QueryProfile.
+        """
+        with QueryProfile.measure(
+            "test", force=True, log=False, n_plus_one_threshold=n_plus_one_threshold
+        ) as profile:
+            yield profile
+        if max_statements is not None:
+            assert (
+                profile.statements <= max_statements
+            ), "Expected at most %d SQL statements, got %d:\n%s" % (
+                max_statements,
+                profile.statements,
+                "\n".join(
+                    "%d x %s" % (count, shape)
+                    for shape, count in profile.shapes.most_common()
+                ),
+            )
+        assert [] == profile.n_plus_one
+
     def time_eq(self, a, b):
         "Assert that two times are *approximately* the same -- within 2 seconds."
         if a < b:
@@ -621,6 +621,36 @@ class TestCachedFeed(DatabaseTest):
         feed = CachedFeed.fetch(*args, max_age=CachedFeed.CACHE_FOREVER, raw=True)
         assert "This is feed #2" == feed.content
 
+    def test_fetch_from_read_replica(self):
+        facets = Facets.default(self._default_library)
+        pagination = Pagination.default()
+        lane = self._lane()
+        refresher = MockFeedGenerator()
+        args = (self._db, lane, facets, pagination, refresher)
+        feed = CachedFeed.fetch(*args, max_age=0, raw=True)
+        self._db.flush()
+
+        with self._mock_read_replica() as replicas:
+            # A fresh cached feed is read from the replica.
+            r = CachedFeed.fetch(*args, max_age=1000)
+            assert "This is feed #1" == str(r)
+            assert 1 == len(replicas)
+
+            # If the replica's copy is stale -- perhaps the replica is
+            # behind -- the primary database is checked, and the feed
+            # is regenerated there.
+            feed.timestamp = utc_now() - datetime.timedelta(days=1)
+            self._db.flush()
+            r = CachedFeed.fetch(*args, max_age=1000)
+            assert "This is feed #2" == str(r)
+            assert 2 == len(replicas)
+            assert "This is feed #2" == feed.content
+
+            # A caller that wants the CachedFeed itself gets it from
+            # the primary database.
+            assert feed == CachedFeed.fetch(*args, max_age=1000, raw=True)
+            assert 2 == len(replicas)
+
     def test_lifecycle_with_worklist(self):
         facets = Facets.default(self._default_library)
         pagination = Pagination.default()
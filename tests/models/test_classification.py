@@ -57,6 +57,34 @@ class TestSubject(DatabaseTest):
         assert subject in [s1, s2]
         assert False == is_new
 
+    def test_bulk_lookup(self):
+        existing = self._subject(Subject.TAG, "i1")
+        subjects = [
+            (Subject.TAG, "i1", "A tag"),
+            (Subject.DDC, "300", "Social sciences"),
+            (Subject.TAG, None, "Only a name"),
+        ]
+
+        # Subjects with an identifier are found or created. Subjects
+        # with only a name are ignored.
+        found = Subject.bulk_lookup(self._db, subjects)
+        assert 2 == len(found)
+        assert existing == found[(Subject.TAG, "i1")]
+        ddc = found[(Subject.DDC, "300")]
+        assert "Social sciences" == ddc.name
+        assert (ddc, False) == Subject.lookup(
+            self._db, Subject.DDC, "300", "Social sciences"
+        )
+
+        # A name is filled in for a Subject that didn't have one.
+        assert "A tag" == existing.name
+
+        # With autocreate=False, missing Subjects are left out.
+        found = Subject.bulk_lookup(
+            self._db, [(Subject.DDC, "400", None)], autocreate=False
+        )
+        assert {} == found
+
     def test_assign_to_genre_can_remove_genre(self):
         # Here's a Subject that identifies children's books.
         subject, was_new = Subject.lookup(
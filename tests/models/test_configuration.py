@@ -19,6 +19,7 @@ from ...model.configuration import (
     ConfigurationMetadata,
     ConfigurationOption,
     ConfigurationSetting,
+    ConfigurationSettingResolver,
     ConfigurationStorage,
     ExternalIntegration,
     ExternalIntegrationLink,
@@ -342,6 +343,87 @@ nonsecret_setting='2'"""
         assert "nonsecret_setting" in without_secrets
 
 
+class TestConfigurationSettingResolver(DatabaseTest):
+    def test_values(self):
+        library = self._default_library
+        other_library = self._library()
+        integration = self._external_integration(self._str)
+        ConfigurationSetting.sitewide(self._db, "size").value = "10"
+        ConfigurationSetting.sitewide(self._db, "list").value = json.dumps([1, 2])
+        library.setting("size").value = "20"
+        other_library.setting("size").value = "30"
+        integration.setting("enabled").value = "yes"
+        ConfigurationSetting.for_library_and_externalintegration(
+            self._db, "enabled", library, integration
+        ).value = "no"
+        self._db.commit()
+        for obj in (library, integration):
+            self._db.refresh(obj)
+
+        # All the settings that apply to a library are loaded at once.
+        with self.assert_query_budget(max_statements=1):
+            resolver = ConfigurationSettingResolver.for_library(self._db, library)
+            assert 10 == resolver.int_value("size")
+            assert 20 == resolver.int_value("size", library)
+            assert 20.0 == resolver.float_value("size", library)
+            assert [1, 2] == resolver.json_value("list", library)
+            assert True == resolver.bool_value("enabled", None, integration)
+            assert False == resolver.bool_value("enabled", library, integration)
+
+            # A setting that doesn't exist has no value, and isn't created.
+            assert None == resolver.setting("nonexistent", library)
+            assert None == resolver.value("nonexistent", library)
+            assert None == resolver.int_value("nonexistent", library)
+
+            # The same resolver is used for the rest of the session,
+            # and the settings it loaded are in the session cache.
+            assert resolver == ConfigurationSettingResolver.for_library(
+                self._db, library
+            )
+            assert resolver == ConfigurationSettingResolver.for_library(self._db)
+            assert "20" == library.setting("size").value
+
+        # Settings that belong to another library weren't loaded.
+        assert 30 == ConfigurationSettingResolver.for_library(
+            self._db, other_library
+        ).int_value("size", other_library)
+        with pytest.raises(ValueError):
+            resolver.value("size", other_library)
+
+    def test_parsed_values_are_cached(self):
+        library = self._default_library
+        library.setting("list").value = json.dumps(["a"])
+        resolver = ConfigurationSettingResolver.for_library(self._db, library)
+        value = resolver.json_value("list", library)
+        assert ["a"] == value
+        assert value is resolver.json_value("list", library)
+
+    def test_reset(self):
+        library = self._default_library
+        setting = library.setting("size")
+        setting.value = "1"
+        resolver = ConfigurationSettingResolver.for_library(self._db, library)
+        assert 1 == resolver.int_value("size", library)
+
+        # Changing a value throws out the session's resolvers.
+        setting.value = "2"
+        new_resolver = ConfigurationSettingResolver.for_library(self._db, library)
+        assert new_resolver != resolver
+        assert 2 == new_resolver.int_value("size", library)
+
+        # So does creating a new setting.
+        library.setting("new")
+        assert new_resolver != ConfigurationSettingResolver.for_library(
+            self._db, library
+        )
+
+        # So does committing the session, since that expires every
+        # setting the resolver loaded.
+        resolver = ConfigurationSettingResolver.for_library(self._db, library)
+        self._db.commit()
+        assert resolver != ConfigurationSettingResolver.for_library(self._db, library)
+
+
 class TestUniquenessConstraints(DatabaseTest):
     def test_duplicate_sitewide_setting(self):
         # You can't create two sitewide settings with the same key.
@@ -3,6 +3,8 @@ import datetime
 
 from ...model.coverage import (
     BaseCoverageRecord,
+    CoverageQueueItem,
+    CoverageQueueListener,
     CoverageRecord,
     Timestamp,
     WorkCoverageRecord,
@@ -267,6 +269,42 @@ class TestCoverageRecord(DatabaseTest):
         )
         assert None == result
 
+    def test_lookup_for_identifiers(self):
+        source = DataSource.lookup(self._db, DataSource.OCLC)
+        operation = "foo"
+        covered = self._identifier()
+        other_operation = self._identifier()
+        uncovered = self._identifier()
+        record = self._coverage_record(covered, source, operation)
+        self._coverage_record(other_operation, source, "other operation")
+
+        # Only the record that matches the data source and operation
+        # is found, and it's keyed by Identifier ID.
+        identifiers = [covered, other_operation, uncovered]
+        result = CoverageRecord.lookup_for_identifiers(
+            self._db, identifiers, source, operation
+        )
+        assert {covered.id: record} == result
+
+        # The data source can be given by name.
+        assert result == CoverageRecord.lookup_for_identifiers(
+            self._db, identifiers, source.name, operation
+        )
+
+        # The collection has to match too.
+        assert {} == CoverageRecord.lookup_for_identifiers(
+            self._db,
+            identifiers,
+            source,
+            operation,
+            collection=self._default_collection,
+        )
+
+        # No identifiers, no query, no results.
+        assert {} == CoverageRecord.lookup_for_identifiers(
+            self._db, [], source, operation
+        )
+
     def test_add_for(self):
         source = DataSource.lookup(self._db, DataSource.OCLC)
         edition = self._edition()
@@ -427,6 +465,73 @@ class TestCoverageRecord(DatabaseTest):
         assert operation == new_record.operation
         assert "Oh no" == new_record.exception
 
+    def test_bulk_upsert(self):
+        source = DataSource.lookup(self._db, DataSource.GUTENBERG)
+        collection = self._default_collection
+
+        # An identifier with no coverage, and one whose previous
+        # attempt failed. Neither has an operation, so the unique
+        # indexes can't be used to find the existing record.
+        new = self._identifier()
+        failed = self._identifier()
+        existing = self._coverage_record(
+            failed,
+            source,
+            status=CoverageRecord.TRANSIENT_FAILURE,
+            exception="Try again",
+        )
+
+        # A record for the same identifier in a collection is left alone.
+        in_collection = self._coverage_record(failed, source, collection=collection)
+
+        edition = self._edition()
+        records = CoverageRecord.bulk_upsert(
+            self._db,
+            [
+                (new, CoverageRecord.PERSISTENT_FAILURE, "Broken"),
+                (failed, CoverageRecord.SUCCESS, None),
+                (edition, CoverageRecord.SUCCESS, None),
+            ],
+            source,
+        )
+
+        # One record per identifier, in the order they were given.
+        assert [new, failed, edition.primary_identifier] == [
+            x.identifier for x in records
+        ]
+        new_record, updated, edition_record = records
+        assert CoverageRecord.PERSISTENT_FAILURE == new_record.status
+        assert "Broken" == new_record.exception
+        assert source == new_record.data_source
+        assert None == new_record.collection
+
+        # The existing record was updated rather than duplicated.
+        assert existing == updated
+        assert CoverageRecord.SUCCESS == existing.status
+        assert None == existing.exception
+        assert 2 == len(failed.coverage_records)
+        assert None == in_collection.exception
+
+        # Records for a specific operation and collection are upserted
+        # separately. If an identifier shows up twice, the last
+        # outcome wins.
+        [record] = CoverageRecord.bulk_upsert(
+            self._db,
+            [
+                (failed, CoverageRecord.SUCCESS, None),
+                (failed, CoverageRecord.TRANSIENT_FAILURE, "Oops"),
+            ],
+            source,
+            operation="testing",
+            collection=collection,
+        )
+        assert in_collection != record
+        assert "testing" == record.operation
+        assert collection == record.collection
+        assert CoverageRecord.TRANSIENT_FAILURE == record.status
+
+        assert [] == CoverageRecord.bulk_upsert(self._db, [], source)
+
 
 class TestWorkCoverageRecord(DatabaseTest):
     def test_lookup(self):
@@ -550,3 +655,158 @@ class TestWorkCoverageRecord(DatabaseTest):
         # a different operation.
         assert WorkCoverageRecord.SUCCESS == irrelevant_record.status
         assert irrelevant_record.timestamp < new_timestamp
+
+    def test_bulk_upsert(self):
+        operation = "relevant"
+        not_covered = self._work()
+        covered = self._work()
+        existing, ignore = WorkCoverageRecord.add_for(
+            covered, operation, status=WorkCoverageRecord.TRANSIENT_FAILURE
+        )
+        existing.exception = "Some exception"
+        irrelevant, ignore = WorkCoverageRecord.add_for(covered, "irrelevant")
+
+        timestamp = utc_now()
+        records = WorkCoverageRecord.bulk_upsert(
+            self._db,
+            [
+                (not_covered, WorkCoverageRecord.PERSISTENT_FAILURE, "Broken"),
+                (covered, WorkCoverageRecord.SUCCESS, None),
+            ],
+            operation,
+            timestamp=timestamp,
+        )
+        new_record, updated = records
+        assert not_covered == new_record.work
+        assert operation == new_record.operation
+        assert WorkCoverageRecord.PERSISTENT_FAILURE == new_record.status
+        assert "Broken" == new_record.exception
+        assert timestamp == new_record.timestamp
+
+        # The existing record was updated in place, and its exception
+        # removed.
+        assert existing == updated
+        assert WorkCoverageRecord.SUCCESS == existing.status
+        assert None == existing.exception
+        assert timestamp == existing.timestamp
+
+        # Records for other operations are untouched.
+        assert irrelevant.timestamp < timestamp
+
+
+class TestCoverageQueueItem(DatabaseTest):
+    def queued(self):
+        return [
+            (
+                x.identifier_id,
+                x.work_id,
+                x.data_source_id,
+                x.operation,
+                x.collection_id,
+            )
+            for x in self._db.query(CoverageQueueItem).order_by(CoverageQueueItem.id)
+        ]
+
+    def test_enqueue_and_claim(self):
+        source = DataSource.lookup(self._db, DataSource.OCLC)
+        collection = self._default_collection
+        i1 = self._identifier()
+        edition = self._edition()
+        work = self._work()
+
+        CoverageQueueItem.enqueue(
+            self._db, [i1, edition], data_source=source, operation="op"
+        )
+        CoverageQueueItem.enqueue(
+            self._db, [i1], data_source=source, operation="op", collection=collection
+        )
+        CoverageQueueItem.enqueue(self._db, [work], operation="op")
+        CoverageQueueItem.enqueue(self._db, [])
+        assert [
+            (i1.id, None, source.id, "op", None),
+            (edition.primary_identifier.id, None, source.id, "op", None),
+            (i1.id, None, source.id, "op", collection.id),
+            (None, work.id, None, "op", None),
+        ] == self.queued()
+
+        # Items are claimed from one queue at a time, a limited number
+        # at a time.
+        def claim(column, limit, **kwargs):
+            return CoverageQueueItem.claim(self._db, column, limit, **kwargs)
+
+        identifier_id = CoverageQueueItem.identifier_id
+        assert [] == claim(identifier_id, 10, data_source=source, operation="other")
+        assert [i1.id] == claim(identifier_id, 1, data_source=source, operation="op")
+        assert [edition.primary_identifier.id] == claim(
+            identifier_id, 10, data_source=source, operation="op"
+        )
+        assert [] == claim(identifier_id, 10, data_source=source, operation="op")
+        assert [work.id] == claim(CoverageQueueItem.work_id, 10, operation="op")
+
+        # Claimed items are gone from the queue.
+        assert [(i1.id, None, source.id, "op", collection.id)] == self.queued()
+
+    def test_registered_records_are_queued(self):
+        source = DataSource.lookup(self._db, DataSource.OCLC)
+        identifier = self._identifier()
+        work = self._work()
+        self._db.flush()
+        assert [] == self.queued()
+
+        # Coverage records that are created or updated through the ORM
+        # put their items on a queue when they're registered.
+        record, ignore = CoverageRecord.add_for(
+            identifier, source, operation="op", status=CoverageRecord.REGISTERED
+        )
+        work_record, ignore = WorkCoverageRecord.add_for(
+            work, "op", status=WorkCoverageRecord.REGISTERED
+        )
+        self._db.flush()
+        expect = [
+            (identifier.id, None, source.id, "op", None),
+            (None, work.id, None, "op", None),
+        ]
+        assert sorted(expect, key=str) == sorted(self.queued(), key=str)
+
+        # Other changes to the records don't.
+        record.timestamp = utc_now()
+        work_record.status = WorkCoverageRecord.SUCCESS
+        self._db.flush()
+        assert 2 == len(self.queued())
+
+        # Registering a record again puts its item back on the queue.
+        work_record.status = WorkCoverageRecord.REGISTERED
+        self._db.flush()
+        assert 3 == len(self.queued())
+
+        # Deleting an item removes it from the queue.
+        self._db.delete(work_record)
+        self._db.delete(work)
+        self._db.flush()
+        assert [expect[0]] == self.queued()
+
+
+class TestCoverageQueueListener(DatabaseTest):
+    def test_wait(self):
+        listener = CoverageQueueListener(self._db)
+        try:
+            # Nothing has been added to any queue.
+            assert [] == listener.wait(0)
+
+            # The notifications sent when items are queued are only
+            # delivered when the transaction is committed, which never
+            # happens in a test, so send one from another connection.
+            engine = self._db.get_bind().engine
+            connection = engine.raw_connection()
+            connection.detach()
+            try:
+                connection.connection.autocommit = True
+                cursor = connection.cursor()
+                cursor.execute("NOTIFY %s, 'hello'" % CoverageQueueItem.CHANNEL)
+                cursor.close()
+            finally:
+                connection.close()
+            assert ["hello"] == listener.wait(5)
+            assert [] == listener.wait(0)
+        finally:
+            listener.close()
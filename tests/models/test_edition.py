@@ -30,6 +30,33 @@ class TestEdition(DatabaseTest):
 
         assert Edition.BOOK_MEDIUM == m(DeliveryMechanism.ADOBE_DRM)
 
+    def test_for_foreign_ids(self):
+        gutenberg = DataSource.lookup(self._db, DataSource.GUTENBERG)
+        overdrive = DataSource.lookup(self._db, DataSource.OVERDRIVE)
+        existing = self._edition(data_source_name=DataSource.GUTENBERG)
+        i1 = existing.primary_identifier
+        i2 = self._identifier()
+
+        # An Edition that exists is found; an Edition that doesn't
+        # exist is created.
+        editions = Edition.for_foreign_ids(self._db, gutenberg, [i1, i2])
+        assert existing == editions[i1.id]
+        new = editions[i2.id]
+        assert gutenberg == new.data_source
+        assert i2 == new.primary_identifier
+        assert (new, False) == Edition.for_foreign_id(
+            self._db, gutenberg, i2.type, i2.identifier
+        )
+
+        # Editions are specific to a data source.
+        editions = Edition.for_foreign_ids(
+            self._db, overdrive, [i1], create_if_not_exists=False
+        )
+        assert {} == editions
+        [od_edition] = Edition.for_foreign_ids(self._db, overdrive, [i1]).values()
+        assert overdrive == od_edition.data_source
+        assert 3 == self._db.query(Edition).count()
+
     def test_license_pools(self):
         # Here are two collections that provide access to the same book.
         c1 = self._collection()
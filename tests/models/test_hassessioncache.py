@@ -2,10 +2,13 @@
 from unittest.mock import MagicMock, PropertyMock
 
 import pytest
+from sqlalchemy.orm import Session
 
-from ...model import ConfigurationSetting
-from ...model.hassessioncache import HasSessionCache
+from ...config import Configuration
+from ...model import ConfigurationSetting, DataSource
+from ...model.hassessioncache import HasSessionCache, ProcessCache
 from ...testing import DatabaseTest
+from ...util.datetime_helpers import utc_now
 
 
 class TestHasSessionCache:
@@ -294,3 +297,74 @@ class TestHasFullTableCacheDatabase(DatabaseTest):
         assert cached is None
         assert len(cache.id) == 0
         assert len(cache.key) == 0
+
+
+class TestProcessCache(DatabaseTest):
+    def test_shared_between_sessions(self, monkeypatch):
+        monkeypatch.setenv(ProcessCache.ENVIRONMENT_VARIABLE, "true")
+        source = DataSource.lookup(self._db, "A source", autocreate=True)
+        self._db.flush()
+        stats = HasSessionCache.process_cache.stats_for(DataSource)
+        process_hits = stats.process_hits
+
+        # The first session to look up the DataSource has to go to
+        # the database; its snapshot is kept for the rest of the process.
+        session1 = Session(self.connection)
+        in_session1 = DataSource.lookup(session1, "A source")
+        assert source.id == in_session1.id
+        assert process_hits == stats.process_hits
+
+        # Another session gets a copy of the DataSource without
+        # running any SQL at all.
+        session2 = Session(self.connection)
+        with self.assert_query_budget(max_statements=0):
+            in_session2 = DataSource.lookup(session2, "A source")
+            assert in_session2 is DataSource.by_id(session2, source.id)
+        assert process_hits + 1 == stats.process_hits
+        assert in_session2 is not in_session1
+        assert in_session2 in session2
+        assert source.id == in_session2.id
+        assert "A source" == in_session2.name
+
+        # Changing a cached object throws out the snapshots for its class.
+        in_session2.offers_licenses = True
+        session2.flush()
+        assert "DataSource" not in HasSessionCache.process_cache.snapshots
+        in_session3 = DataSource.lookup(Session(self.connection), "A source")
+        assert process_hits + 1 == stats.process_hits
+        assert True == in_session3.offers_licenses
+
+    def test_site_configuration_change(self, monkeypatch):
+        monkeypatch.setenv(ProcessCache.ENVIRONMENT_VARIABLE, "true")
+        source = DataSource.lookup(self._db, "A source", autocreate=True)
+        self._db.flush()
+        DataSource.lookup(Session(self.connection), "A source")
+        assert source.id in HasSessionCache.process_cache.snapshots["DataSource"].id
+
+        # When the site configuration changes, every snapshot is
+        # thrown out.
+        Configuration.site_configuration_last_update(self._db, known_value=utc_now())
+        DataSource.lookup(Session(self.connection), "A source")
+        cache = HasSessionCache.process_cache
+        assert cache.version == Configuration._site_configuration_last_update()
+        assert [source.id] == list(cache.snapshots["DataSource"].id)
+
+    def test_new_objects_not_shared(self, monkeypatch):
+        monkeypatch.setenv(ProcessCache.ENVIRONMENT_VARIABLE, "true")
+
+        # An object created by a session might never be committed, so
+        # other sessions don't get to see it.
+        DataSource.lookup(Session(self.connection), "A source", autocreate=True)
+        assert {} == HasSessionCache.process_cache.snapshots["DataSource"].id
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.delenv(ProcessCache.ENVIRONMENT_VARIABLE, raising=False)
+        DataSource.lookup(self._db, "A source", autocreate=True)
+        self._db.flush()
+        DataSource.lookup(Session(self.connection), "A source")
+        assert {} == HasSessionCache.process_cache.snapshots
+
+        # Classes that don't opt in never use the process cache.
+        monkeypatch.setenv(ProcessCache.ENVIRONMENT_VARIABLE, "true")
+        assert True == DataSource._uses_process_cache()
+        assert False == HasSessionCache._uses_process_cache()
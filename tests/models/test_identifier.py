@@ -4,13 +4,14 @@ import datetime
 import feedparser
 import pytest
 from lxml import etree
-from mock import PropertyMock, create_autospec
+from mock import PropertyMock, create_autospec, patch
 from parameterized import parameterized
+from sqlalchemy import func, select
 
 from ...model import PresentationCalculationPolicy
 from ...model.datasource import DataSource
 from ...model.edition import Edition
-from ...model.identifier import Identifier
+from ...model.identifier import Equivalency, EquivalentIdentifier, Identifier
 from ...model.resource import Hyperlink, Representation
 from ...testing import DatabaseTest
 from ...util.datetime_helpers import utc_now
@@ -38,6 +39,40 @@ class TestIdentifier(DatabaseTest):
         # If we pass in no data we get nothing back.
         assert None == Identifier.for_foreign_id(self._db, None, None)
 
+    def test_for_foreign_ids(self):
+        existing = self._identifier(Identifier.ISBN, "9781937063012")
+        foreign_ids = [
+            (Identifier.ISBN, "9781937063012"),
+            (Identifier.GUTENBERG_ID, "1234"),
+            (None, None),
+        ]
+
+        # Identifiers that exist are found; identifiers that don't
+        # exist are created.
+        found = Identifier.for_foreign_ids(self._db, foreign_ids)
+        assert 2 == len(found)
+        assert existing == found[(Identifier.ISBN, "9781937063012")]
+        gutenberg = found[(Identifier.GUTENBERG_ID, "1234")]
+        assert Identifier.GUTENBERG_ID == gutenberg.type
+        assert "1234" == gutenberg.identifier
+        assert (gutenberg, False) == Identifier.for_foreign_id(
+            self._db, Identifier.GUTENBERG_ID, "1234"
+        )
+
+        # Doing it again doesn't create anything new.
+        assert found == Identifier.for_foreign_ids(self._db, foreign_ids)
+        assert 2 == self._db.query(Identifier).count()
+
+        # With autocreate=False, missing Identifiers are left out.
+        found = Identifier.for_foreign_ids(
+            self._db,
+            [(Identifier.ISBN, "9781937063012"), (Identifier.OVERDRIVE_ID, "abc")],
+            autocreate=False,
+        )
+        assert {(Identifier.ISBN, "9781937063012"): existing} == found
+
+        assert {} == Identifier.for_foreign_ids(self._db, [])
+
     def test_for_foreign_id_by_deprecated_type(self):
         threem_id, is_new = Identifier.for_foreign_id(self._db, "3M ID", self._str)
         assert Identifier.BIBLIOTHECA_ID == threem_id.type
@@ -185,6 +220,28 @@ class TestIdentifier(DatabaseTest):
         assert new_urn in failure
         assert isbn_urn in failure
 
+    def test_parse_urns_in_bulk(self):
+        existing = self._identifier(Identifier.GUTENBERG_ID, "1")
+        urns = [
+            Identifier.URN_SCHEME_PREFIX + "Gutenberg%%20ID/%d" % i
+            for i in range(1, 2001)
+        ]
+        # The same URN might be requested twice.
+        urns.append(existing.urn)
+
+        # The lookup doesn't commit the caller's transaction.
+        with patch.object(self._db, "commit") as commit:
+            identifiers_by_urn, failures = Identifier.parse_urns(self._db, urns)
+        assert False == commit.called
+
+        assert [] == failures
+        assert 2000 == len(identifiers_by_urn)
+        assert existing == identifiers_by_urn[existing.urn]
+        assert 2000 == self._db.query(Identifier).count()
+        assert set(str(i) for i in range(1, 2001)) == set(
+            x.identifier for x in identifiers_by_urn.values()
+        )
+
     def test_parse_urn(self):
 
         # We can parse our custom URNs back into identifiers.
@@ -756,3 +813,181 @@ class TestIdentifier(DatabaseTest):
         # NOTE: we are not interested in the result returned by repr,
         # we just want to make sure that repr doesn't throw any unexpected exceptions
         _ = repr(identifier)
+
+
+class TestEquivalentIdentifier(DatabaseTest):
+    def setup_method(self):
+        super(TestEquivalentIdentifier, self).setup_method()
+        self.data_source = DataSource.lookup(self._db, DataSource.MANUAL)
+
+    def closure(self, identifier):
+        """The rows for `identifier`, as (equivalent, depth, strength)
+        tuples.
+        """
+        rows = (
+            self._db.query(EquivalentIdentifier)
+            .filter(EquivalentIdentifier.identifier_id == identifier.id)
+            .order_by(EquivalentIdentifier.equivalent_id, EquivalentIdentifier.depth)
+        )
+        return [(row.equivalent_id, row.depth, round(row.strength, 3)) for row in rows]
+
+    def equivalent_to(self, a, b, strength):
+        equivalency = a.equivalent_to(self.data_source, b, strength)
+        self._db.flush()
+        return equivalency
+
+    def test_covers(self):
+        m = EquivalentIdentifier.covers
+        assert True == m(PresentationCalculationPolicy())
+        assert True == m(
+            PresentationCalculationPolicy(
+                equivalent_identifier_levels=1, equivalent_identifier_threshold=0.999
+            )
+        )
+        assert False == m(
+            PresentationCalculationPolicy(
+                equivalent_identifier_levels=EquivalentIdentifier.MAX_LEVELS + 1
+            )
+        )
+        assert False == m(
+            PresentationCalculationPolicy(equivalent_identifier_threshold=0.1)
+        )
+
+    def test_kept_up_to_date(self):
+        a, b, c, d = [self._identifier() for i in range(4)]
+
+        # An Identifier with no Equivalencies has no rows.
+        assert [] == self.closure(a)
+
+        # A new Equivalency adds rows in both directions.
+        ab = self.equivalent_to(a, b, 0.9)
+        assert [(b.id, 1, 0.9)] == self.closure(a)
+        assert [(a.id, 1, 0.9)] == self.closure(b)
+
+        # A path through another Identifier multiplies the strengths.
+        bc = self.equivalent_to(b, c, 0.8)
+        assert [(b.id, 1, 0.9), (c.id, 2, 0.72)] == self.closure(a)
+
+        # A path that's too weak isn't stored.
+        self.equivalent_to(c, d, 0.6)
+        assert [(b.id, 1, 0.9), (c.id, 2, 0.72)] == self.closure(a)
+        assert [(a.id, 2, 0.72), (b.id, 1, 0.8), (d.id, 1, 0.6)] == self.closure(c)
+
+        # A longer path is stored alongside a shorter one, but only if
+        # it's stronger.
+        self.equivalent_to(a, c, 0.5)
+        assert [(a.id, 2, 0.72), (b.id, 1, 0.8), (d.id, 1, 0.6)] == self.closure(c)
+        self.equivalent_to(a, c, 0.6)
+        assert [
+            (a.id, 1, 0.6),
+            (a.id, 2, 0.72),
+            (b.id, 1, 0.8),
+            (d.id, 1, 0.6),
+        ] == self.closure(c)
+
+        # Changing the strength of an Equivalency changes the rows for
+        # every Identifier whose paths go through it.
+        ab.strength = 0.4
+        self._db.flush()
+        assert [(c.id, 1, 0.6)] == self.closure(a)
+
+        # So does disabling or deleting one.
+        bc.enabled = False
+        self._db.flush()
+        assert [] == self.closure(b)
+        self._db.delete(bc)
+        self._db.flush()
+        assert [] == self.closure(b)
+        assert [(a.id, 1, 0.6), (d.id, 1, 0.6)] == self.closure(c)
+
+    def test_lookup(self):
+        # With the default policy, equivalents are looked up in the
+        # closure table, and found the same way the recursive
+        # function finds them.
+        a, b, c, d, e = [self._identifier() for i in range(5)]
+        self.equivalent_to(a, b, 0.9)
+        self.equivalent_to(b, c, 0.9)
+        self.equivalent_to(c, d, 1)
+        self.equivalent_to(d, e, 0.5)
+
+        policy = PresentationCalculationPolicy()
+        query = Identifier._recursively_equivalent_identifier_ids_query(
+            Identifier.id, policy
+        )
+        assert "fn_equivalent_identifiers" == query.name
+
+        ids = [x.id for x in (a, b, c, d, e)]
+        from_closure = Identifier.recursively_equivalent_identifier_ids(
+            self._db, ids, policy
+        )
+        recursive = func.fn_recursive_equivalents(
+            Identifier.id,
+            policy.equivalent_identifier_levels,
+            policy.equivalent_identifier_threshold,
+            policy.equivalent_identifier_cutoff,
+        )
+        for identifier in (a, b, c, d, e):
+            expect = [
+                row[0]
+                for row in self._db.execute(
+                    select([recursive]).where(Identifier.id == identifier.id)
+                )
+            ]
+            assert set(expect) == set(from_closure[identifier.id])
+        assert set([a.id, b.id, c.id, d.id]) == set(from_closure[a.id])
+
+        # A policy that goes further than the closure table uses the
+        # recursive function.
+        policy = PresentationCalculationPolicy(
+            equivalent_identifier_levels=4, equivalent_identifier_threshold=0.4
+        )
+        query = Identifier._recursively_equivalent_identifier_ids_query(
+            Identifier.id, policy
+        )
+        assert "fn_recursive_equivalents" == query.name
+        equivs = Identifier.recursively_equivalent_identifier_ids(
+            self._db, [a.id], policy
+        )
+        assert set([a.id, b.id, c.id, d.id, e.id]) == set(equivs[a.id])
+
+    def test_rebuild(self):
+        a, b, c = [self._identifier() for i in range(3)]
+        self.equivalent_to(a, b, 1)
+        self.equivalent_to(b, c, 1)
+
+        # Equivalencies changed directly in SQL aren't reflected in
+        # the closure...
+        self._db.execute(
+            Equivalency.__table__.update()
+            .where(Equivalency.input_id == b.id)
+            .values(enabled=False)
+        )
+        self._db.execute(
+            EquivalentIdentifier.__table__.insert().values(
+                identifier_id=c.id, equivalent_id=a.id, depth=4, strength=1
+            )
+        )
+        assert [(b.id, 1, 1), (c.id, 2, 1)] == self.closure(a)
+
+        # ...until the closure is rebuilt.
+        ids = EquivalentIdentifier.identifier_ids_to_rebuild(self._db, batch_size=2)
+        assert [a.id, b.id] == ids
+        assert [c.id] == EquivalentIdentifier.identifier_ids_to_rebuild(
+            self._db, after=b.id, batch_size=2
+        )
+        EquivalentIdentifier.calculate(self._db, [a.id, b.id, c.id])
+        assert [(b.id, 1, 1)] == self.closure(a)
+        assert [] == self.closure(c)
+
+        # Rows for Identifiers that no longer have any Equivalencies
+        # are deleted.
+        self._db.execute(
+            EquivalentIdentifier.__table__.insert().values(
+                identifier_id=c.id, equivalent_id=a.id, depth=1, strength=1
+            )
+        )
+        self._db.execute(
+            Equivalency.__table__.delete().where(Equivalency.input_id == b.id)
+        )
+        assert 1 == EquivalentIdentifier.delete_stale(self._db)
+        assert [] == self.closure(c)
@@ -1,5 +1,6 @@
 # encoding: utf-8
 import datetime
+import os
 
 import pytest
 from psycopg2.extras import NumericRange
@@ -13,6 +14,8 @@ from ...model import (
     DataSource,
     Edition,
     Genre,
+    InstrumentedQueuePool,
+    PresentationCalculationPolicy,
     SessionManager,
     Timestamp,
     get_one,
@@ -70,6 +73,68 @@ class TestDatabaseInterface(DatabaseTest):
         assert old_timestamp == timestamp.finish
 
 
+class TestSessionManager(DatabaseTest):
+    def test_engine(self):
+        url = Configuration.database_url()
+
+        # Every caller in a process gets the same engine.
+        engine = SessionManager.engine(url)
+        assert engine is SessionManager.engine(url)
+        assert engine is SessionManager.sessionmaker(url)().get_bind()
+        assert isinstance(engine.pool, InstrumentedQueuePool)
+
+        # A forked process gets an engine of its own, and the parent's
+        # engine is kept out of its way.
+        pid, engine = SessionManager.engines[url]
+        SessionManager.engines[url] = (-1, engine)
+        try:
+            new_engine = SessionManager.engine(url)
+            assert new_engine is not engine
+            assert engine in SessionManager.abandoned_engines
+        finally:
+            SessionManager.abandoned_engines.remove(engine)
+            SessionManager.engines[url] = (pid, engine)
+            new_engine.dispose()
+
+    def test_create_engine(self):
+        url = Configuration.database_url()
+        engine = SessionManager.create_engine(
+            url, pool_size=2, max_overflow=1, statement_timeout=12345
+        )
+        try:
+            assert 2 == engine.pool.size()
+            with engine.connect() as connection:
+                assert (
+                    "12345ms" == connection.execute("SHOW statement_timeout").scalar()
+                )
+
+            # A connection created in another process is never used.
+            connection = engine.connect()
+            connection.connection._connection_record.info["pid"] = -1
+            connection.close()
+            with engine.connect() as connection:
+                record = connection.connection._connection_record
+                assert os.getpid() == record.info["pid"]
+        finally:
+            engine.dispose()
+
+    def test_pool_status(self):
+        url = Configuration.database_url()
+        engine = SessionManager.engine(url)
+        before = SessionManager.pool_status()[engine.url.__to_string__()]
+
+        with engine.connect():
+            during = SessionManager.pool_status()[engine.url.__to_string__()]
+        assert during["checked_out"] == before["checked_out"] + 1
+        assert during["checkouts"] == before["checkouts"] + 1
+        assert during["wait_seconds"] >= before["wait_seconds"]
+
+        # The password isn't part of the description.
+        for description in SessionManager.pool_status():
+            if engine.url.password:
+                assert engine.url.password not in description
+
+
 class TestNumericRangeConversion(object):
     """Test the helper functions that convert between tuples and NumericRange
     objects.
@@ -103,3 +168,63 @@ class TestNumericRangeConversion(object):
         assert (2, 6) == m(two_to_six_inclusive)
         two_to_six_exclusive = NumericRange(2, 6, "()")
         assert (3, 5) == m(two_to_six_exclusive)
+
+
+class TestPresentationCalculationPolicy(object):
+    def test_for_changes(self):
+        P = PresentationCalculationPolicy
+
+        # If nothing has changed, nothing needs to be recalculated.
+        policy = P.for_changes([])
+        assert not any(
+            [
+                policy.choose_edition,
+                policy.set_edition_metadata,
+                policy.classify,
+                policy.choose_summary,
+                policy.calculate_quality,
+                policy.choose_cover,
+            ]
+        )
+
+        # A change to a Work's measurements only affects its quality.
+        policy = P.for_changes([P.MEASUREMENTS])
+        assert True == policy.calculate_quality
+        assert False == policy.classify
+        assert False == policy.choose_edition
+
+        # The parts that depend on several changes are recalculated
+        # if any one of them changed.
+        policy = P.for_changes([P.CLASSIFICATIONS, P.LINKS])
+        assert True == policy.classify
+        assert True == policy.choose_summary
+        assert True == policy.choose_cover
+        assert False == policy.calculate_quality
+        assert False == policy.choose_edition
+
+        # Other arguments are passed into the constructor, and they
+        # take precedence.
+        policy = P.for_changes(
+            [P.MEASUREMENTS], calculate_quality=False, regenerate_opds_entries=True
+        )
+        assert False == policy.calculate_quality
+        assert True == policy.regenerate_opds_entries
+
+    def test_recalculates(self):
+        P = PresentationCalculationPolicy
+
+        # The default policy takes every change into account.
+        policy = P()
+        for change in P.DEPENDENCIES:
+            assert True == policy.recalculates(change)
+
+        # A policy that only rebuilds the presentation edition doesn't
+        # take a Work's new classifications into account.
+        policy = P.for_changes([P.EDITIONS])
+        assert True == policy.recalculates(P.EDITIONS)
+        assert False == policy.recalculates(P.CLASSIFICATIONS)
+
+        # Every part that depends on a change must be recalculated.
+        policy = P(choose_summary=False)
+        assert False == policy.recalculates(P.LINKS)
+        assert True == policy.recalculates(P.MEASUREMENTS)
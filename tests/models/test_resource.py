@@ -8,7 +8,7 @@ from ...model.datasource import DataSource
 from ...model.edition import Edition
 from ...model.identifier import Identifier
 from ...model.licensing import RightsStatus
-from ...model.resource import Hyperlink, Representation, Resource
+from ...model.resource import HTTPValidators, Hyperlink, Representation, Resource
 from ...testing import DatabaseTest, DummyHTTPClient, MockRequestsResponse
 
 
@@ -118,6 +118,38 @@ class TestResource(DatabaseTest):
         [unrelated] = w2.license_pools
         assert None == lpdm.resource.as_delivery_mechanism_for(unrelated)
 
+    def test_bulk_lookup(self):
+        gutenberg = DataSource.lookup(self._db, DataSource.GUTENBERG)
+        public_domain = RightsStatus.lookup(self._db, RightsStatus.PUBLIC_DOMAIN_USA)
+        existing, ignore = create(self._db, Resource, url="http://existing/")
+
+        found = Resource.bulk_lookup(
+            self._db,
+            {
+                "http://existing/": dict(data_source=gutenberg),
+                "http://new/": dict(
+                    data_source=gutenberg,
+                    rights_status=public_domain,
+                    rights_explanation="explanation",
+                ),
+            },
+        )
+
+        # The existing Resource is found, and not modified.
+        assert existing == found["http://existing/"]
+        assert None == existing.data_source
+
+        # The new Resource is created with the information provided.
+        new = found["http://new/"]
+        assert gutenberg == new.data_source
+        assert public_domain == new.rights_status
+        assert "explanation" == new.rights_explanation
+
+        # With autocreate=False, missing Resources are left out.
+        assert {} == Resource.bulk_lookup(
+            self._db, {"http://missing/": {}}, autocreate=False
+        )
+
 
 class TestRepresentation(DatabaseTest):
     def test_normalized_content_path(self):
@@ -1142,3 +1174,72 @@ class TestCoverResource(DatabaseTest):
         assert 1 / 2.0 == f(ideal_width, ideal_height * 2)
         assert 1 / 4.0 == f(ideal_width * 4, ideal_height)
         assert 1 / 4.0 == f(ideal_width, ideal_height * 4)
+
+
+class TestHTTPValidators(DatabaseTest):
+    def test_request_headers_and_update(self):
+        url = self._url
+
+        # If there are no validators for a URL, there's nothing to send.
+        assert {} == HTTPValidators.request_headers(self._db, url)
+        assert None == HTTPValidators.update(self._db, url, {"Content-Type": "a/b"})
+
+        # Validators from a response are stored...
+        validators = HTTPValidators.update(
+            self._db, url, {"ETag": '"abc"', "Last-Modified": "a date"}
+        )
+        assert '"abc"' == validators.etag
+        assert "a date" == validators.last_modified
+        assert validators.updated_at is not None
+
+        # ...and turned into conditional request headers.
+        assert {
+            "If-None-Match": '"abc"',
+            "If-Modified-Since": "a date",
+        } == HTTPValidators.request_headers(self._db, url)
+
+        # Newer validators replace older ones.
+        assert validators == HTTPValidators.update(self._db, url, {"etag": "def"})
+        assert "def" == validators.etag
+        assert None == validators.last_modified
+        assert {"If-None-Match": "def"} == HTTPValidators.request_headers(self._db, url)
+
+        # If a response has no validators, the old ones are removed.
+        HTTPValidators.update(self._db, url, {})
+        assert {} == HTTPValidators.request_headers(self._db, url)
+        assert [] == self._db.query(HTTPValidators).all()
+
+    def test_validators_are_kept_per_collection(self):
+        url = self._url
+        c1 = self._default_collection
+        c2 = self._collection()
+
+        v1 = HTTPValidators.update(self._db, url, {"ETag": "one"}, c1)
+        assert c1.id == v1.collection_id
+
+        # Another collection has never seen this URL, so its requests
+        # aren't conditional...
+        assert {} == HTTPValidators.request_headers(self._db, url, c2)
+
+        # ...and neither are requests made on behalf of no collection
+        # in particular.
+        assert {} == HTTPValidators.request_headers(self._db, url)
+
+        # Each collection gets its own validators.
+        v2 = HTTPValidators.update(self._db, url, {"ETag": "two"}, c2)
+        v3 = HTTPValidators.update(self._db, url, {"ETag": "three"})
+        assert 3 == len(set([v1, v2, v3]))
+        assert {"If-None-Match": "one"} == HTTPValidators.request_headers(
+            self._db, url, c1
+        )
+        assert {"If-None-Match": "two"} == HTTPValidators.request_headers(
+            self._db, url, c2
+        )
+        assert {"If-None-Match": "three"} == HTTPValidators.request_headers(
+            self._db, url
+        )
+
+        # Removing one collection's validators leaves the others alone.
+        HTTPValidators.update(self._db, url, {}, c1)
+        assert {} == HTTPValidators.request_headers(self._db, url, c1)
+        assert set([v2, v3]) == set(self._db.query(HTTPValidators))
@@ -9,7 +9,11 @@ from psycopg2.extras import NumericRange
 
 from ...classifier import Classifier, Fantasy, Romance, Science_Fiction
 from ...external_search import MockExternalSearchIndex
-from ...model import get_one_or_create, tuple_to_numericrange
+from ...model import (
+    PresentationCalculationPolicy,
+    get_one_or_create,
+    tuple_to_numericrange,
+)
 from ...model.classification import Genre, Subject
 from ...model.complaint import Complaint
 from ...model.contributor import Contributor
@@ -18,8 +22,9 @@ from ...model.datasource import DataSource
 from ...model.edition import Edition
 from ...model.identifier import Identifier
 from ...model.licensing import LicensePool
+from ...model.measurement import Measurement
 from ...model.resource import Hyperlink, Representation, Resource
-from ...model.work import Work, WorkGenre
+from ...model.work import PresentationInputs, Work, WorkGenre
 from ...testing import DatabaseTest
 from ...util.datetime_helpers import datetime_utc, from_timestamp, utc_now
 
@@ -1554,6 +1559,69 @@ class TestWork(DatabaseTest):
             record = find_record(work)
             assert registered == record.status
 
+    def test_presentation_inputs_changed(self):
+        P = PresentationCalculationPolicy
+        WCR = WorkCoverageRecord
+        work = self._work()
+        work.presentation_changes = None
+
+        # Nothing has changed, so there's no policy.
+        assert None == work.presentation_policy_for_changes()
+
+        # Recording a change registers the Work for a new
+        # presentation edition.
+        record = work.presentation_inputs_changed(P.MEASUREMENTS)
+        assert WCR.CHOOSE_EDITION_OPERATION == record.operation
+        assert WCR.REGISTERED == record.status
+        assert [P.MEASUREMENTS] == work.presentation_changes
+
+        # Changes accumulate.
+        record.status = WCR.SUCCESS
+        assert None == work.presentation_inputs_changed(
+            P.CLASSIFICATIONS, P.MEASUREMENTS, register=False
+        )
+        assert WCR.SUCCESS == record.status
+        assert [P.CLASSIFICATIONS, P.MEASUREMENTS] == work.presentation_changes
+
+        # needs_new_presentation_edition records a change to the
+        # Work's editions.
+        work.needs_new_presentation_edition()
+        assert WCR.REGISTERED == record.status
+        assert [
+            P.CLASSIFICATIONS,
+            P.EDITIONS,
+            P.MEASUREMENTS,
+        ] == work.presentation_changes
+
+        # The policy for the changes recalculates only what depends on
+        # them.
+        policy = work.presentation_policy_for_changes(regenerate_opds_entries=True)
+        assert True == policy.classify
+        assert True == policy.calculate_quality
+        assert True == policy.choose_edition
+        assert False == policy.choose_summary
+        assert True == policy.regenerate_opds_entries
+
+        # Once the presentation is calculated with a policy, the
+        # changes it took into account are forgotten.
+        work.calculate_presentation(
+            P.for_changes([P.EDITIONS, P.MEASUREMENTS]), exclude_search=True
+        )
+        assert [P.CLASSIFICATIONS] == work.presentation_changes
+
+        work.calculate_presentation(exclude_search=True)
+        assert None == work.presentation_changes
+
+    def test_licensepool_change_is_recorded(self):
+        # A Work's presentation depends on its LicensePools.
+        work = self._work()
+        work.presentation_changes = None
+        edition, pool = self._edition(with_license_pool=True)
+        work.license_pools.append(pool)
+        assert [
+            PresentationCalculationPolicy.LICENSE_POOLS
+        ] == work.presentation_changes
+
     def test_reset_coverage(self):
         # Test the methods that reset coverage for works, indicating
         # that some task needs to be performed again.
@@ -2779,3 +2847,67 @@ class TestWorkConsolidation(DatabaseTest):
         # Even if the LicensePool had a work before, it gets removed.
         assert (None, False) == lp.calculate_work()
         assert None == lp.work
+
+
+class TestPresentationInputs(DatabaseTest):
+    def test_answers_without_database(self):
+        source = DataSource.lookup(self._db, DataSource.OVERDRIVE)
+        other_source = DataSource.lookup(self._db, DataSource.GUTENBERG)
+        work = self._work(with_license_pool=True)
+        identifier = work.license_pools[0].identifier
+        equivalent = self._identifier()
+        identifier.equivalent_to(source, equivalent, 1)
+        classification = equivalent.classify(source, Subject.TAG, "some tag")
+        measurement, ignore = equivalent.add_measurement(source, Measurement.RATING, 5)
+        link, ignore = equivalent.add_link(
+            Hyperlink.DESCRIPTION, None, source, content="A summary"
+        )
+        self._db.flush()
+
+        policy = PresentationCalculationPolicy.recalculate_everything()
+        inputs = PresentationInputs(self._db, [work], policy)
+
+        # Everything calculate_presentation() needs to know about the
+        # Work's identifiers was loaded up front.
+        with self.assert_query_budget(max_statements=0):
+            ids = work.all_identifier_ids(policy=policy, inputs=inputs)
+            assert {identifier.id, equivalent.id} == ids
+            assert [classification] == inputs.classifications_for_identifier_ids(ids)
+            assert [measurement] == inputs.quality_measurements(ids)
+            assert [link.resource] == inputs.resources_for_identifier_ids(
+                ids, Hyperlink.DESCRIPTION, source
+            )
+            assert [] == inputs.resources_for_identifier_ids(
+                ids, [Hyperlink.DESCRIPTION], [other_source]
+            )
+
+        # Anything else is looked up in the database.
+        other = self._identifier()
+        other_measurement, ignore = other.add_measurement(source, Measurement.RATING, 1)
+        assert [other_measurement] == inputs.quality_measurements([other.id])
+        equivalents = inputs.recursively_equivalent_identifier_ids([other.id])
+        assert other.id in equivalents[other.id]
+
+    def test_calculate_presentation_for_works(self):
+        source = DataSource.lookup(self._db, DataSource.OVERDRIVE)
+        works = [self._work(with_license_pool=True) for i in range(2)]
+        for i, work in enumerate(works):
+            identifier = work.license_pools[0].identifier
+            identifier.add_link(
+                Hyperlink.DESCRIPTION, None, source, content="Summary %d" % i
+            )
+            identifier.add_measurement(source, Measurement.POPULARITY, 0.2 * (i + 1))
+        policy = PresentationCalculationPolicy.recalculate_everything()
+
+        Work.calculate_presentation_for_works(works, policy)
+        batched = [(work.summary_text, work.quality) for work in works]
+        assert ["Summary 0", "Summary 1"] == [x[0] for x in batched]
+
+        # The results are the same as if each Work were handled on
+        # its own.
+        for work in works:
+            work.calculate_presentation(policy)
+        assert batched == [(work.summary_text, work.quality) for work in works]
+
+        # Calculating presentation for no Works does nothing.
+        Work.calculate_presentation_for_works([], policy)
@@ -17,6 +17,7 @@ from ..app_server import (
     compressible,
     load_facets_from_request,
     load_pagination_from_request,
+    profile_sql_queries,
 )
 from ..config import Configuration
 from ..entrypoint import AudiobooksEntryPoint, EbooksEntryPoint, EntryPoint
@@ -27,6 +28,7 @@ from ..opds import TestAnnotator
 from ..problem_details import INVALID_INPUT, INVALID_URN
 from ..testing import DatabaseTest
 from ..util.opds_writer import OPDSFeed, OPDSMessage
+from ..util.query_profile import QueryProfile
 
 
 class TestHeartbeatController(object):
@@ -108,6 +110,29 @@ class TestURNLookupHandler(DatabaseTest):
         # The result is a 404 message.
         self.assert_one_message(urn, 404, self.handler.UNRECOGNIZED_IDENTIFIER)
 
+    def test_parse_urns_from_read_replica(self):
+        identifier = self._identifier()
+        self._db.flush()
+        new_urn = Identifier.GUTENBERG_URN_SCHEME_PREFIX + "Gutenberg%20ID/000"
+        invalid_urn = "not even a URN"
+
+        with self._mock_read_replica() as replicas:
+            found, failures = self.handler.parse_urns(
+                [identifier.urn, new_urn, invalid_urn]
+            )
+        assert 1 == len(replicas)
+
+        # The Identifier found on the replica was moved into the
+        # handler's session.
+        assert identifier is found[identifier.urn]
+
+        # The replica didn't know about the other URN, so it was looked
+        # up in the primary database, which created an Identifier for it.
+        [new_identifier] = [x for urn, x in found.items() if urn != identifier.urn]
+        assert new_identifier in self._db
+        assert "000" == new_identifier.identifier
+        assert [invalid_urn] == failures
+
     def test_process_identifier_no_license_pool(self):
         # Give the handler a URN that corresponds to an Identifier
         # which has no LicensePool.
@@ -544,3 +569,29 @@ class TestCompressibleAnnotator(object):
         response = ask_for_compression("gzip", "Accept-Transfer-Encoding")
         assert value == response.data
         assert "Content-Encoding" not in response.headers
+
+
+class TestProfileSQLQueries(DatabaseTest):
+    def test_profile_sql_queries(self, monkeypatch):
+        app = Flask(__name__)
+        profile_sql_queries(app)
+        profiles = []
+
+        @app.route("/identifiers")
+        def identifiers():
+            profiles.append(flask.g.query_profile)
+            return str(self._db.query(Identifier).count())
+
+        # By default, requests aren't profiled.
+        monkeypatch.delenv(QueryProfile.ENVIRONMENT_VARIABLE, raising=False)
+        app.test_client().get("/identifiers")
+        assert [None] == profiles
+
+        # Once profiling is turned on, each request gets a profile
+        # that stops when the request is done.
+        monkeypatch.setenv(QueryProfile.ENVIRONMENT_VARIABLE, "true")
+        app.test_client().get("/identifiers")
+        profile = profiles[-1]
+        assert "GET /identifiers" == profile.name
+        assert 1 == profile.statements
+        assert [] == QueryProfile.running()
@@ -1,7 +1,9 @@
 import os
 
+import pytest
 from sqlalchemy.orm.session import Session
 
+from ..config import CannotLoadConfiguration
 from ..config import Configuration as BaseConfiguration
 from ..model import ConfigurationSetting, ExternalIntegration
 from ..testing import DatabaseTest
@@ -56,6 +58,76 @@ class TestConfiguration(DatabaseTest):
         assert "ba.na.na" == result
         assert "ba.na.na" == self.Conf.get(self.Conf.APP_VERSION)
 
+    def test_database_pool_settings(self, monkeypatch):
+        for name in (
+            "POOL_SIZE",
+            "MAX_OVERFLOW",
+            "POOL_TIMEOUT",
+            "POOL_RECYCLE",
+            "POOL_PRE_PING",
+            "STATEMENT_TIMEOUT",
+        ):
+            monkeypatch.delenv("SIMPLIFIED_DATABASE_%s" % name, raising=False)
+
+        # Settings that aren't configured are left out.
+        assert {} == self.Conf.database_pool_settings()
+
+        monkeypatch.setenv(self.Conf.DATABASE_POOL_SIZE_ENVIRONMENT_VARIABLE, "10")
+        monkeypatch.setenv(self.Conf.DATABASE_MAX_OVERFLOW_ENVIRONMENT_VARIABLE, "0")
+        monkeypatch.setenv(self.Conf.DATABASE_POOL_RECYCLE_ENVIRONMENT_VARIABLE, "300")
+        monkeypatch.setenv(
+            self.Conf.DATABASE_POOL_PRE_PING_ENVIRONMENT_VARIABLE, "True"
+        )
+        monkeypatch.setenv(
+            self.Conf.DATABASE_STATEMENT_TIMEOUT_ENVIRONMENT_VARIABLE, "60000"
+        )
+        assert (
+            dict(
+                pool_size=10,
+                max_overflow=0,
+                pool_recycle=300,
+                pool_pre_ping=True,
+                statement_timeout=60000,
+            )
+            == self.Conf.database_pool_settings()
+        )
+
+        monkeypatch.setenv(self.Conf.DATABASE_POOL_SIZE_ENVIRONMENT_VARIABLE, "lots")
+        with pytest.raises(CannotLoadConfiguration) as excinfo:
+            self.Conf.database_pool_settings()
+        assert "SIMPLIFIED_DATABASE_POOL_SIZE, got 'lots'" in str(excinfo.value)
+
+    def test_database_replicas(self, monkeypatch):
+        monkeypatch.setenv("TESTING", "True")
+        monkeypatch.delenv(
+            self.Conf.DATABASE_TEST_REPLICAS_ENVIRONMENT_VARIABLE, raising=False
+        )
+        monkeypatch.delenv(
+            self.Conf.DATABASE_MAX_REPLICA_LAG_ENVIRONMENT_VARIABLE, raising=False
+        )
+        assert [] == self.Conf.database_replica_urls()
+        assert self.Conf.DEFAULT_MAX_REPLICA_LAG == self.Conf.database_max_replica_lag()
+
+        monkeypatch.setenv(
+            self.Conf.DATABASE_TEST_REPLICAS_ENVIRONMENT_VARIABLE,
+            "postgres://replica1/db, postgres://replica2/db,",
+        )
+        assert [
+            "postgres://replica1/db",
+            "postgres://replica2/db",
+        ] == self.Conf.database_replica_urls()
+
+        monkeypatch.setenv(
+            self.Conf.DATABASE_MAX_REPLICA_LAG_ENVIRONMENT_VARIABLE, "2.5"
+        )
+        assert 2.5 == self.Conf.database_max_replica_lag()
+
+        monkeypatch.setenv(
+            self.Conf.DATABASE_MAX_REPLICA_LAG_ENVIRONMENT_VARIABLE, "soon"
+        )
+        with pytest.raises(CannotLoadConfiguration):
+            self.Conf.database_max_replica_lag()
+
     def test_load_cdns(self):
         """Test our ability to load CDN configuration from the database."""
         self._external_integration(
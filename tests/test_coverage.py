@@ -7,6 +7,7 @@ from ..coverage import (
     BibliographicCoverageProvider,
     CatalogCoverageProvider,
     CollectionCoverageProvider,
+    CollectionCoverageProviderPartitionJob,
     CoverageFailure,
     CoverageProviderProgress,
     IdentifierCoverageProvider,
@@ -30,6 +31,7 @@ from ..model import (
     Collection,
     CollectionMissing,
     Contributor,
+    CoverageQueueItem,
     CoverageRecord,
     DataSource,
     DeliveryMechanism,
@@ -38,6 +40,7 @@ from ..model import (
     Hyperlink,
     Identifier,
     PresentationCalculationPolicy,
+    PresentationInputs,
     Representation,
     RightsStatus,
     Subject,
@@ -61,7 +64,9 @@ from ..testing import (
     TransientFailureCoverageProvider,
     TransientFailureWorkCoverageProvider,
 )
+from ..util.adaptive_batch import AdaptiveBatchSize
 from ..util.datetime_helpers import datetime_utc, utc_now
+from ..util.job_metrics import JobMetrics
 
 
 class TestCoverageFailure(DatabaseTest):
@@ -352,6 +357,45 @@ class TestBaseCoverageProvider(CoverageProviderTest):
 
         assert "Exception: Unhandled exception" in timestamp.exception
 
+        # The failed run was measured for export as metrics.
+        assert JobMetrics.COVERAGE_PROVIDER == provider.metrics.job_type
+        assert True == provider.metrics.failed
+
+    def test_run_once_and_update_timestamp_measures_run(self):
+        provider = AlwaysSuccessfulCoverageProvider(self._db)
+        provider.batch_size = 2
+        identifiers = [self._identifier() for i in range(3)]
+        provider.run_once_and_update_timestamp()
+
+        metrics = provider.metrics
+        assert JobMetrics.COVERAGE_PROVIDER == metrics.job_type
+        assert provider.service_name == metrics.service_name
+        assert 3 == metrics.items_processed
+        assert 2 == metrics.batch_count
+        assert 3 == metrics.successes
+        assert 0 == metrics.transient_failures
+        assert False == metrics.failed
+
+        # The items counted are the three identifiers, which are now
+        # covered.
+        for identifier in identifiers:
+            assert [CoverageRecord.SUCCESS] == [
+                x.status for x in identifier.coverage_records
+            ]
+
+        # The provider's first run has no lag.
+        assert None == metrics.lag_seconds
+
+        # The number of items needing coverage was counted at the
+        # start of the last pass, after these three were covered.
+        assert 0 == metrics.queue_depth
+
+        # The next run measures how long it's been since this one
+        # finished.
+        provider.run_once_and_update_timestamp()
+        assert provider.metrics.lag_seconds >= 0
+        assert 0 == provider.metrics.items_processed
+
     def test_run_once_and_update_timestamp_handled_exception(self):
         # Test that run_once_and_update_timestamp handles the
         # case where the run_once() implementation sets TimestampData.exception
@@ -389,8 +433,11 @@ class TestBaseCoverageProvider(CoverageProviderTest):
         uncovered = self._identifier()
         covered = self._identifier()
 
-        # This provider will try to cover them.
+        # This provider will try to cover them. It pages through the
+        # items with LIMIT/OFFSET; keyset pagination is tested in
+        # test_run_once_keyset_pagination.
         provider = AlwaysSuccessfulCoverageProvider(self._db)
+        provider.KEYSET_PAGINATION = False
         data_source = provider.data_source
 
         # We previously tried to cover one of them, but got a
@@ -476,6 +523,101 @@ class TestBaseCoverageProvider(CoverageProviderTest):
         # this run.
         assert 4 == progress.offset
 
+    def test_run_once_keyset_pagination(self):
+        identifiers = [self._identifier() for i in range(5)]
+        provider = TransientFailureCoverageProvider(self._db, batch_size=2)
+        provider.COUNT_ITEMS = provider.NO_COUNT
+
+        # The items are processed in order of ID, two at a time, and
+        # each batch starts where the last one left off -- even
+        # though the failed items still need coverage.
+        progress = CoverageProviderProgress()
+        provider.run_once(progress)
+        assert identifiers[:2] == provider.attempts
+        assert identifiers[1].id == progress.last_id
+        assert 0 == progress.offset
+
+        provider.run_once(progress)
+        provider.run_once(progress)
+        assert identifiers == provider.attempts
+        assert identifiers[-1].id == progress.last_id
+        assert None == progress.finish
+
+        # Once there's nothing left, the run is over.
+        provider.run_once(progress)
+        assert 5 == len(provider.attempts)
+        assert progress.finish is not None
+
+        # If a caller sets the offset, LIMIT/OFFSET is used instead.
+        progress = CoverageProviderProgress()
+        progress.offset = 4
+        provider.run_once(progress)
+        assert identifiers[-1] == provider.attempts[-1]
+
+    def test_run_once_adaptive_batch_size(self):
+        identifiers = [self._identifier() for i in range(3)]
+        provider = TransientFailureCoverageProvider(self._db, batch_size=1)
+        provider.COUNT_ITEMS = provider.NO_COUNT
+        provider.TARGET_BATCH_SECONDS = 1000
+        provider.batch_sizer = AdaptiveBatchSize.for_object(provider, 1)
+
+        # Each batch is much faster than the target, so the next batch
+        # is twice as big.
+        progress = CoverageProviderProgress()
+        provider.run_once(progress)
+        assert 2 == provider.batch_size
+        provider.run_once(progress)
+        assert identifiers == provider.attempts
+        assert 4 == provider.batch_size
+
+        # The batch sizes are part of the progress report.
+        assert progress.achievements.startswith(
+            "Items processed: 3. Successes: 0, transient failures: 3, "
+            "persistent failures: 0. Batch sizes: 1-2, next 4."
+        )
+
+    def test_count_items_that_need_coverage(self):
+        for i in range(3):
+            self._identifier()
+        provider = AlwaysSuccessfulCoverageProvider(self._db)
+        qu = provider.items_that_need_coverage()
+
+        assert 3 == provider.count_items_that_need_coverage(qu)
+
+        provider.COUNT_ITEMS = provider.ESTIMATED_COUNT
+        estimate = provider.count_items_that_need_coverage(qu)
+        assert isinstance(estimate, int)
+
+        provider.COUNT_ITEMS = provider.NO_COUNT
+        assert None == provider.count_items_that_need_coverage(qu)
+
+    def test_partition_items_that_need_coverage(self):
+        identifiers = [self._identifier() for i in range(5)]
+        provider = TransientFailureCoverageProvider(self._db)
+        provider.COUNT_ITEMS = provider.NO_COUNT
+
+        # The items are divided into contiguous, disjoint ranges of ID.
+        ranges = provider.partition_items_that_need_coverage(2)
+        assert [
+            (None, identifiers[2].id),
+            (identifiers[2].id, None),
+        ] == ranges
+
+        # Covering each range covers every item exactly once.
+        for last_id, end_id in ranges:
+            progress = CoverageProviderProgress()
+            progress.last_id = last_id
+            progress.end_id = end_id
+            while not progress.finish:
+                provider.run_once(progress)
+        assert identifiers == provider.attempts
+
+        # If there's no way to page through items by ID, there's
+        # only one range.
+        assert [(None, None)] == provider.partition_items_that_need_coverage(1)
+        provider.KEYSET_PAGINATION = False
+        assert [(None, None)] == provider.partition_items_that_need_coverage(2)
+
     def test_run_once_records_successes_and_failures(self):
         class Mock(AlwaysSuccessfulCoverageProvider):
             def process_batch_and_handle_results(self, batch):
@@ -639,6 +781,46 @@ class TestBaseCoverageProvider(CoverageProviderTest):
         assert [succeed, fail] == provider.processed
         assert [succeed] == provider.successes
 
+    def test_run_queue(self):
+        provider = AlwaysSuccessfulCoverageProvider(self._db)
+        provider.batch_size = 2
+
+        # Three identifiers are registered for coverage, which puts
+        # them on the provider's queue.
+        registered = [self._identifier() for i in range(3)]
+        provider.bulk_register(registered)
+
+        # This identifier is on the queue, but it's already covered.
+        covered = self._identifier()
+        provider.add_coverage_record_for(covered)
+        CoverageQueueItem.enqueue(
+            self._db,
+            [covered],
+            data_source=provider.data_source,
+            operation=provider.operation,
+        )
+
+        # This identifier needs coverage, but it's not on the queue.
+        not_queued = self._identifier()
+
+        progress = provider.run_queue()
+        assert 3 == progress.successes
+        assert set(registered) == set(provider.attempts)
+        assert [] == not_queued.coverage_records
+        for identifier in registered:
+            [record] = identifier.coverage_records
+            assert CoverageRecord.SUCCESS == record.status
+        assert [] == self._db.query(CoverageQueueItem).all()
+
+        # The provider's timestamp was updated.
+        assert (
+            "Items processed: 3. Successes: 3, transient failures: 0, persistent failures: 0"
+            == provider.timestamp.achievements
+        )
+
+        # When the queue is empty, there's nothing to do.
+        assert 0 == provider.run_queue().successes
+
     def test_should_update(self):
         """Verify that should_update gives the correct answer when we
         ask if a CoverageRecord needs to be updated.
@@ -1912,6 +2094,51 @@ class TestCollectionCoverageProvider(CoverageProviderTest):
         assert True == pool.work.presentation_ready
 
 
+class TestCollectionCoverageProviderPartitionJob(CoverageProviderTest):
+    def test_run(self):
+        collection = self._collection()
+        editions = [
+            self._edition(collection=collection, with_license_pool=True)[0]
+            for i in range(3)
+        ]
+        [i1, i2, i3] = [e.primary_identifier for e in editions]
+        existing = [x.id for x in self._db.query(CoverageRecord)]
+        job = CollectionCoverageProviderPartitionJob(
+            None,
+            collection.id,
+            AlwaysSuccessfulCollectionCoverageProvider,
+            last_id=i1.id,
+            end_id=i2.id,
+        )
+
+        # The job covers only the identifiers in its range, and reports
+        # its progress after each batch.
+        messages = []
+        job.run(self._db, messages.append)
+        assert [
+            dict(
+                last_id=i2.id,
+                successes=1,
+                transient_failures=0,
+                persistent_failures=0,
+                exception=None,
+            ),
+            dict(
+                last_id=i2.id,
+                successes=0,
+                transient_failures=0,
+                persistent_failures=0,
+                exception=None,
+            ),
+        ] == messages
+        assert [i2] == [
+            x.identifier
+            for x in self._db.query(CoverageRecord).filter(
+                CoverageRecord.id.notin_(existing)
+            )
+        ]
+
+
 class TestCatalogCoverageProvider(CoverageProviderTest):
     def test_items_that_need_coverage(self):
 
@@ -2016,6 +2243,25 @@ class TestWorkCoverageProvider(DatabaseTest):
         )
         assert (timestamp - now).total_seconds() < 1
 
+    def test_run_queue(self):
+        class MockProvider(AlwaysSuccessfulWorkCoverageProvider):
+            OPERATION = "the_operation"
+
+        provider = MockProvider(self._db)
+        other_work = self._work()
+
+        # Registering a work puts it on the provider's queue.
+        MockProvider.register(self.work)
+        provider.run_queue()
+
+        [record] = [
+            x for x in self.work.coverage_records if x.operation == provider.operation
+        ]
+        assert CoverageRecord.SUCCESS == record.status
+
+        # The other work wasn't on the queue, so it wasn't covered.
+        assert [] == other_work.coverage_records
+
     def test_transient_failure(self):
         class MockProvider(TransientFailureWorkCoverageProvider):
             OPERATION = "the_operation"
@@ -2149,8 +2395,18 @@ class MockWork(object):
     to recalculate its presentation.
     """
 
-    def calculate_presentation(self, policy):
+    presentation_changes = None
+
+    def presentation_policy_for_changes(self, **kwargs):
+        if not self.presentation_changes:
+            return None
+        return PresentationCalculationPolicy.for_changes(
+            self.presentation_changes, **kwargs
+        )
+
+    def calculate_presentation(self, policy, inputs=None):
         self.calculate_presentation_called_with = policy
+        self.calculate_presentation_inputs = inputs
 
 
 class TestWorkPresentationEditionCoverageProvider(DatabaseTest):
@@ -2175,6 +2431,77 @@ class TestWorkPresentationEditionCoverageProvider(DatabaseTest):
         assert not any(
             [policy.classify, policy.choose_summary, policy.calculate_quality]
         )
+        assert None == work.calculate_presentation_inputs
+
+    def test_policy_for(self):
+        provider = WorkPresentationEditionCoverageProvider(self._db)
+
+        # If we don't know what has changed about a Work, its
+        # presentation edition is rebuilt.
+        work = MockWork()
+        assert provider.POLICY == provider.policy_for(work)
+
+        # If we do know, only the parts of the Work's presentation
+        # that depend on what changed are recalculated -- even if
+        # they're expensive.
+        work.presentation_changes = [PresentationCalculationPolicy.MEASUREMENTS]
+        policy = provider.policy_for(work)
+        assert True == policy.calculate_quality
+        assert not any(
+            [
+                policy.choose_edition,
+                policy.set_edition_metadata,
+                policy.classify,
+                policy.choose_summary,
+                policy.choose_cover,
+            ]
+        )
+
+        # The OPDS entries are still regenerated, in case anything
+        # changed.
+        assert True == policy.regenerate_opds_entries
+
+        # process_item uses this policy.
+        provider.process_item(work)
+        policy = work.calculate_presentation_called_with
+        assert True == policy.calculate_quality
+        assert False == policy.choose_edition
+
+        # WorkClassificationCoverageProvider always recalculates
+        # everything.
+        provider = WorkClassificationCoverageProvider(self._db)
+        assert provider.POLICY == provider.policy_for(work)
+
+    def test_process_batch(self):
+        # The information needed to calculate the presentation of
+        # every Work in a batch is loaded before any of them is
+        # processed.
+        class Mock(WorkPresentationEditionCoverageProvider):
+            def process_item(self, work):
+                self.inputs_used = self.inputs
+                return work
+
+        provider = Mock(self._db)
+        work = self._work(with_license_pool=True)
+        work.presentation_changes = None
+        assert [work] == provider.process_batch([work])
+        assert isinstance(provider.inputs_used, PresentationInputs)
+        policy = provider.inputs_used.policy
+        assert True == policy.choose_edition
+        assert False == policy.calculate_quality
+
+        # Once the batch is done, the information is thrown away.
+        assert None == provider.inputs
+
+        # If any Work in the batch needs something more, it's loaded
+        # for the whole batch.
+        work2 = self._work(with_license_pool=True)
+        work2.presentation_changes = [PresentationCalculationPolicy.MEASUREMENTS]
+        provider.process_batch([work, work2])
+        policy = provider.inputs_used.policy
+        assert True == policy.choose_edition
+        assert True == policy.calculate_quality
+        assert False == policy.classify
 
 
 class TestWorkClassificationCoverageProvider(DatabaseTest):
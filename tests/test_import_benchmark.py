@@ -0,0 +1,161 @@
+import json
+from io import StringIO
+
+import feedparser
+import pytest
+
+from ..import_benchmark import (
+    ImportBenchmark,
+    SyntheticFeed,
+    benchmark_report,
+    compare_reports,
+)
+from ..model import Edition, Identifier
+from ..scripts import ImportBenchmarkScript
+from ..testing import DatabaseTest
+
+
+class TestSyntheticFeed(object):
+    def test_isbn(self):
+        assert "9780000000019" == SyntheticFeed.isbn(1)
+        assert "9781234567897" == SyntheticFeed.isbn(123456789)
+
+    def test_feeds(self):
+        feed = SyntheticFeed(
+            entries=4, contributors=3, subjects=2, links=1, formats=2, update_ratio=0.5
+        )
+        assert 2 == feed.updated_entries
+
+        parsed = feedparser.parse(feed.opds1())
+        assert 4 == len(parsed.entries)
+        entry = parsed.entries[0]
+        assert "urn:isbn:9780000000019" == entry.id
+        assert 3 == len(entry.authors)
+        assert 2 == len(entry.tags)
+        assert 3 == len(entry.links)
+
+        # The seed feed describes the books that will be updated.
+        seed = feedparser.parse(feed.opds1(seed=True))
+        assert [x.id for x in parsed.entries[:2]] == [x.id for x in seed.entries]
+        assert seed.entries[0].title != entry.title
+
+        publications = json.loads(feed.opds2())["publications"]
+        assert 4 == len(publications)
+        [publication] = json.loads(feed.opds2(seed=True))["publications"][:1]
+        assert "urn:isbn:9780000000019" == publication["metadata"]["identifier"]
+        assert 3 == len(publication["metadata"]["author"])
+        assert 2 == len(publication["metadata"]["subject"])
+        assert 1 == len(publication["images"])
+        assert 2 == len(publication["links"])
+
+
+class TestImportBenchmark(DatabaseTest):
+    def test_unknown_format(self):
+        with pytest.raises(ValueError) as excinfo:
+            ImportBenchmark(self._db, "opds3", SyntheticFeed())
+        assert "Unknown feed format: opds3" in str(excinfo.value)
+
+    @pytest.mark.parametrize("feed_format", ImportBenchmark.FORMATS)
+    def test_run(self, feed_format):
+        feed = SyntheticFeed(entries=3, update_ratio=1 / 3.0)
+        benchmark = ImportBenchmark(self._db, feed_format, feed, repeat=2)
+        result = benchmark.run()
+
+        assert feed_format == result["format"]
+        assert feed.as_dict() == result["feed"]
+        assert 2 == len(result["seconds"])
+        assert result["entries_per_second"] > 0
+        assert result["sql_statements_per_entry"] > 0
+        assert result["peak_memory_bytes"] > 0
+        assert 3 == result["imported"]
+        assert 0 == result["failures"]
+
+        # Everything the benchmark imported was rolled back.
+        assert 0 == self._db.query(Edition).count()
+        assert 0 == self._db.query(Identifier).count()
+
+    def test_compare_reports(self):
+        def result(feed_format, entries_per_second):
+            return dict(
+                format=feed_format,
+                feed=SyntheticFeed().as_dict(),
+                entries_per_second=entries_per_second,
+                sql_statements_per_entry=10,
+                peak_memory_bytes=None,
+            )
+
+        old = benchmark_report([result("opds1", 100), result("opds2", 10)])
+        new = benchmark_report([result("opds1", 150), result("opds2-streaming", 5)])
+        [comparison] = compare_reports(old, new)
+        assert "opds1" == comparison["format"]
+        assert dict(before=100, after=150, change=0.5) == (
+            comparison["entries_per_second"]
+        )
+        assert 0 == comparison["sql_statements_per_entry"]["change"]
+        assert None == comparison["peak_memory_bytes"]["change"]
+
+
+class TestImportBenchmarkScript(DatabaseTest):
+    def test_do_run(self, tmpdir):
+        path = str(tmpdir.join("results.jsonl"))
+        output = StringIO()
+        cmd_args = [
+            "--format=opds1",
+            "--entries=2",
+            "--repeat=1",
+            "--no-memory",
+            "--output=%s" % path,
+        ]
+        report = ImportBenchmarkScript(self._db).do_run(
+            cmd_args=cmd_args, output=output
+        )
+        assert "opds1: " in output.getvalue()
+        [result] = report["results"]
+        assert None == result["peak_memory_bytes"]
+
+        # The report was saved.
+        with open(path) as saved:
+            assert report == json.loads(saved.read())
+
+        # A later run compares itself against the last line of the
+        # --compare file, even when that's also the --output file.
+        baseline = dict(
+            commit="baseline",
+            results=[
+                dict(
+                    format="opds1",
+                    feed=SyntheticFeed(entries=2).as_dict(),
+                    entries_per_second=1000000.0,
+                    sql_statements_per_entry=1000.0,
+                    peak_memory_bytes=None,
+                )
+            ],
+        )
+        with open(path, "a") as out:
+            out.write(json.dumps(baseline) + "\n")
+
+        output = StringIO()
+        report = ImportBenchmarkScript(self._db).do_run(
+            cmd_args=cmd_args + ["--compare=%s" % path], output=output
+        )
+        [result] = report["results"]
+        [comparison] = compare_reports(baseline, report)
+        assert 1000000.0 == comparison["entries_per_second"]["before"]
+        assert result["entries_per_second"] == (
+            comparison["entries_per_second"]["after"]
+        )
+        expect = (
+            "opds1: entries_per_second %+.1f%%, sql_statements_per_entry %+.1f%%"
+            % (
+                comparison["entries_per_second"]["change"] * 100,
+                comparison["sql_statements_per_entry"]["change"] * 100,
+            )
+        )
+        assert "Compared to commit baseline:" in output.getvalue()
+        assert expect in output.getvalue()
+
+        # The new report was appended after the baseline.
+        with open(path) as saved:
+            lines = saved.readlines()
+        assert baseline == json.loads(lines[-2])
+        assert report == json.loads(lines[-1])
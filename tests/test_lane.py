@@ -5,7 +5,7 @@ import random
 
 import pytest
 from elasticsearch.exceptions import ElasticsearchException
-from mock import MagicMock, call
+from mock import MagicMock, call, patch
 from sqlalchemy import and_, func, text
 from sqlalchemy.sql.elements import Case
 
@@ -34,6 +34,7 @@ from ..lane import (
     Lane,
     Pagination,
     SearchFacets,
+    SpecificWorkList,
     TopLevelWorkList,
     WorkList,
 )
@@ -2374,6 +2375,53 @@ class TestWorkList(DatabaseTest):
             self._db.delete(lpdm)
             assert [[]] == m(self._db, [[hit2]])
 
+    def test_works_for_resultsets_from_read_replica(self):
+        wl = WorkList()
+        wl.initialize(self._default_library)
+        w1 = self._work(with_license_pool=True)
+        w2 = self._work(with_license_pool=True)
+        self._db.flush()
+
+        class MockHit(object):
+            def __init__(self, work):
+                self.work_id = work.id
+
+            def __contains__(self, k):
+                return False
+
+        # The Works are looked up on the replica, but they end up in
+        # the main session, as the same objects the session already
+        # had.
+        with self._mock_read_replica() as replicas:
+            [works] = wl.works_for_resultsets(self._db, [[MockHit(w2), MockHit(w1)]])
+        assert [w2, w1] == works
+        assert all(work is original for work, original in zip(works, [w2, w1]))
+        assert all(work in self._db for work in works)
+        assert 1 == len(replicas)
+
+        # If the replica doesn't have a Work yet, it's looked up in the
+        # primary database, rather than being left out.
+        w3 = self._work(with_license_pool=True)
+        self._db.flush()
+        original = SpecificWorkList.works_from_database
+        test = self
+
+        def lagging_replica(self, _db, *args, **kwargs):
+            qu = original(self, _db, *args, **kwargs)
+            if _db is not test._db:
+                qu = qu.filter(Work.id != w3.id)
+            return qu
+
+        with self._mock_read_replica() as replicas, patch.object(
+            SpecificWorkList, "works_from_database", lagging_replica
+        ):
+            [works] = wl.works_for_resultsets(
+                self._db, [[MockHit(w2), MockHit(w3), MockHit(w1)]]
+            )
+        assert [w2, w3, w1] == works
+        assert all(work in self._db for work in works)
+        assert 1 == len(replicas)
+
     def test_search_target(self):
         # A WorkList can be searched - it is its own search target.
         wl = WorkList()
@@ -5,12 +5,14 @@ from copy import deepcopy
 
 import pytest
 from parameterized import parameterized
+from sqlalchemy import event
 
 from ..analytics import Analytics
 from ..classifier import NO_NUMBER, NO_VALUE, Classifier
 from ..metadata_layer import (
     CirculationData,
     ContributorData,
+    ContributorResolver,
     CSVMetadataImporter,
     IdentifierData,
     LinkData,
@@ -29,6 +31,7 @@ from ..model import (
     Hyperlink,
     Identifier,
     Measurement,
+    PresentationCalculationPolicy,
     Representation,
     RightsStatus,
     Subject,
@@ -1107,7 +1110,7 @@ class TestContributorData(DatabaseTest):
         class Mock(ContributorData):
             # Simulate an integration error from the metadata wrangler side.
             def display_name_to_sort_name_through_canonicalizer(
-                self, _db, identifiers, metadata_client
+                self, _db, identifiers, metadata_client, resolver=None
             ):
                 self.called_with = (_db, identifiers, metadata_client)
                 raise RemoteIntegrationException(
@@ -1131,6 +1134,161 @@ class TestContributorData(DatabaseTest):
         assert "Banks, Iain M." == contributor_data.sort_name
 
 
+class TestContributorResolver(DatabaseTest):
+    def test_lookup_by_sort_name(self):
+        [existing], ignore = Contributor.lookup(self._db, "Author, Existing")
+        resolver = ContributorResolver(self._db)
+        resolver.prefetch(
+            [
+                ContributorData(sort_name="Author, Existing"),
+                ContributorData(sort_name="Author, New"),
+            ]
+        )
+
+        queries = []
+
+        def count(*args):
+            queries.append(args)
+
+        connection = self._db.connection()
+        event.listen(connection, "before_cursor_execute", count)
+        try:
+            # The prefetch already found the existing Contributor.
+            assert ([existing], False) == resolver.lookup(sort_name="Author, Existing")
+            assert [] == queries
+
+            # A Contributor the prefetch didn't find is created, and
+            # found in memory the next time.
+            [new], is_new = resolver.lookup(sort_name="Author, New")
+            assert True == is_new
+            assert "Author, New" == new.sort_name
+            queries_so_far = len(queries)
+            assert ([new], False) == resolver.lookup(sort_name="Author, New")
+            assert queries_so_far == len(queries)
+        finally:
+            event.remove(connection, "before_cursor_execute", count)
+
+        assert 2 / 3.0 == resolver.hit_rates[resolver.SORT_NAME]
+
+    def test_lookup_by_viaf_and_lc(self):
+        existing, ignore = self._contributor(viaf="viaf1")
+        resolver = ContributorResolver(self._db)
+        resolver.prefetch([ContributorData(viaf="viaf1"), ContributorData(lc="lc1")])
+
+        assert ([existing], False) == resolver.lookup(viaf="viaf1")
+        # A Contributor that's not there isn't created if create_new
+        # is False.
+        assert ([], False) == resolver.lookup(lc="lc1", create_new=False)
+        assert {resolver.VIAF_OR_LC: 1} == resolver.hit_rates
+
+        # But it is created if create_new is True, and remembered.
+        [new], is_new = resolver.lookup(sort_name="Author, New", lc="lc1")
+        assert True == is_new
+        assert "lc1" == new.lc
+        assert ([new], False) == resolver.lookup(lc="lc1", create_new=False)
+
+        # Contributors found by number are also found by their sort
+        # names.
+        resolver.prefetch([ContributorData(sort_name="Author, New")])
+        assert ([new], False) == resolver.lookup(sort_name="Author, New")
+
+        with pytest.raises(ValueError):
+            resolver.lookup()
+
+    def test_sort_name_for_display_name(self):
+        existing = self._contributor(sort_name="Author, Existing")[0]
+        existing.display_name = "Existing Author"
+        resolver = ContributorResolver(self._db)
+        resolver.prefetch(
+            [
+                ContributorData(display_name="Existing Author"),
+                ContributorData(display_name="Unknown Author"),
+            ]
+        )
+
+        assert "Author, Existing" == resolver.sort_name_for_display_name(
+            "Existing Author"
+        )
+        # The negative result was remembered.
+        assert None == resolver.sort_name_for_display_name("Unknown Author")
+        assert {resolver.DISPLAY_NAME: 1} == resolver.hit_rates
+
+        # A name that wasn't prefetched is looked up in the database,
+        # and remembered.
+        assert None == resolver.sort_name_for_display_name("Another Author")
+        assert None == resolver.sort_name_for_display_name("Another Author")
+        assert 3 / 4.0 == resolver.hit_rates[resolver.DISPLAY_NAME]
+
+        # Once a Contributor with the display name shows up, its sort
+        # name is used.
+        new = self._contributor(sort_name="Author, Unknown")[0]
+        new.display_name = "Unknown Author"
+        resolver.add(new)
+        assert "Author, Unknown" == resolver.sort_name_for_display_name(
+            "Unknown Author"
+        )
+
+    def test_canonicalize(self):
+        metadata_client = DummyMetadataClient()
+        metadata_client.lookups["Unknown Author"] = "Author, Unknown"
+        resolver = ContributorResolver(self._db)
+        identifier = self._identifier(Identifier.ISBN)
+
+        contributor_data = ContributorData(display_name="Unknown Author")
+        assert True == contributor_data.find_sort_name(
+            self._db,
+            [IdentifierData(identifier.type, identifier.identifier)],
+            metadata_client,
+            resolver,
+        )
+        assert "Author, Unknown" == contributor_data.sort_name
+
+        # The canonicalizer was only asked once about each identifier
+        # and display name, even though the sort name was looked up
+        # twice.
+        metadata_client.lookups["Unknown Author"] = "Changed"
+        contributor_data = ContributorData(display_name="Unknown Author")
+        contributor_data.find_sort_name(
+            self._db,
+            [IdentifierData(identifier.type, identifier.identifier)],
+            metadata_client,
+            resolver,
+        )
+        assert "Author, Unknown" == contributor_data.sort_name
+        assert 0.5 == resolver.hit_rates[resolver.CANONICALIZER]
+
+    def test_apply_batch(self):
+        # Metadata applied through a MetadataBatch finds its
+        # Contributors through the batch's ContributorResolver.
+        existing = self._contributor(sort_name="Author, Existing")[0]
+        source = DataSource.lookup(self._db, DataSource.GUTENBERG)
+
+        def metadata():
+            return Metadata(
+                data_source=source,
+                primary_identifier=IdentifierData(Identifier.GUTENBERG_ID, self._str),
+                title=self._str,
+                contributors=[
+                    ContributorData(sort_name="Author, Existing"),
+                    ContributorData(sort_name="Author, New", viaf="viaf1"),
+                ],
+            )
+
+        resolver = ContributorResolver(self._db)
+        results = Metadata.apply_batch(
+            self._db, [metadata(), metadata()], None, contributor_resolver=resolver
+        )
+        authors = [
+            set(x.contributor for x in edition.contributions)
+            for edition, ignore in results
+        ]
+        assert authors[0] == authors[1]
+        [new] = authors[0] - set([existing])
+        assert "viaf1" == new.viaf
+        assert 1 == self._db.query(Contributor).filter_by(viaf="viaf1").count()
+        assert 1 == resolver.hit_rates[resolver.SORT_NAME]
+
+
 class TestLinkData(DatabaseTest):
     @parameterized.expand(
         [
@@ -1300,6 +1458,9 @@ class TestMetadata(DatabaseTest):
     def test_apply_wipes_presentation_calculation_records(self):
         # We have a work.
         work = self._work(title="The Wrong Title", with_license_pool=True)
+        work.presentation_changes = None
+        P = PresentationCalculationPolicy
+        WCR = WorkCoverageRecord
 
         # We learn some more information about the work's identifier.
         metadata = Metadata(
@@ -1314,34 +1475,28 @@ class TestMetadata(DatabaseTest):
         assert "The Wrong Title" == work.title
 
         # However, the work is now slated to have its presentation
-        # edition recalculated -- that will fix it.
-        def assert_registered(full):
-            """Verify that the WorkCoverageRecord for a full (full=True) or
-            partial (full=false) presentation recalculation operation
-            is in the 'registered' state, and that the
-            WorkCoverageRecord for the other presentation
-            recalculation operation is in the 'success' state.
-
-            The verified WorkCoverageRecord will be reset to the 'success'
-            state so that this can be called over and over without any
-            extra setup.
+        # recalculated -- that will fix it.
+        def assert_registered(change):
+            """Verify that the Work knows that the given kind of
+            information has changed, and that the WorkCoverageRecord
+            for choosing a presentation edition is in the 'registered'
+            state. The WorkCoverageRecord for a full recalculation is
+            never touched; the presentation edition provider will only
+            recalculate what needs to be recalculated.
+
+            The Work and its WorkCoverageRecords are reset so that this
+            can be called over and over without any extra setup.
             """
-            WCR = WorkCoverageRecord
+            assert change in work.presentation_changes
             for x in work.coverage_records:
                 if x.operation == WCR.CLASSIFY_OPERATION:
-                    if full:
-                        assert WCR.REGISTERED == x.status
-                        x.status = WCR.SUCCESS
-                    else:
-                        assert WCR.SUCCESS == x.status
+                    assert WCR.SUCCESS == x.status
                 elif x.operation == WCR.CHOOSE_EDITION_OPERATION:
-                    if full:
-                        assert WCR.SUCCESS == x.status
-                    else:
-                        assert WCR.REGISTERED == x.status
-                        x.status = WCR.SUCCESS
+                    assert WCR.REGISTERED == x.status
+                    x.status = WCR.SUCCESS
+            work.presentation_changes = None
 
-        assert_registered(full=False)
+        assert_registered(P.EDITIONS)
 
         # We then learn about a subject under which the work
         # is classified.
@@ -1349,25 +1504,30 @@ class TestMetadata(DatabaseTest):
         metadata.subjects = [SubjectData(Subject.TAG, "subject")]
         metadata.apply(edition, None)
 
-        # The work is now slated to have its presentation completely
-        # recalculated.
-        record = assert_registered(full=True)
+        # The work is now slated to have its genres recalculated.
+        assert_registered(P.CLASSIFICATIONS)
 
         # We then find a new description for the work.
         metadata.subjects = None
         metadata.links = [LinkData(rel=Hyperlink.DESCRIPTION, content="a description")]
         metadata.apply(edition, None)
 
-        # We need to do a full recalculation again.
-        assert_registered(full=True)
+        # The work's summary needs to be chosen again.
+        assert_registered(P.LINKS)
 
         # We then find a new cover image for the work.
         metadata.subjects = None
         metadata.links = [LinkData(rel=Hyperlink.IMAGE, href="http://image/")]
         metadata.apply(edition, None)
 
-        # We need to choose a new presentation edition.
-        assert_registered(full=False)
+        # The work's cover needs to be chosen again.
+        assert_registered(P.LINKS)
+
+        # We then learn how popular the work is.
+        metadata.links = []
+        metadata.measurements = [MeasurementData(Measurement.POPULARITY, 100)]
+        metadata.apply(edition, None)
+        assert_registered(P.MEASUREMENTS)
 
     def test_apply_identifier_equivalency(self):
 
@@ -1665,7 +1825,7 @@ class TestCirculationData(DatabaseTest):
             # A CirculationData-like object that always says
             # update_availability ought to be called on a
             # specific MockLicensePool.
-            def license_pool(self, _db, collection, analytics):
+            def license_pool(self, _db, collection, analytics, batch=None):
                 self.license_pool_called_with = (_db, collection, analytics)
                 return pool, False
 
@@ -1700,6 +1860,120 @@ class TestCirculationData(DatabaseTest):
         assert analytics == pool.update_availability_called_with["analytics"]
 
 
+class TestMetadataBatch(DatabaseTest):
+    def test_apply_batch(self):
+        collection = self._default_collection
+        source = DataSource.lookup(self._db, DataSource.GUTENBERG)
+        edition, pool = self._edition(
+            data_source_name=DataSource.GUTENBERG, with_license_pool=True
+        )
+        identifier = edition.primary_identifier
+        identifier.classify(source, Subject.TAG, "tag1", weight=1)
+
+        def metadata(identifier_data, subjects):
+            return Metadata(
+                data_source=source,
+                primary_identifier=identifier_data,
+                title=self._str,
+                subjects=subjects,
+                identifiers=[IdentifierData(Identifier.ISBN, "9781937063012")],
+                links=[
+                    LinkData(
+                        rel=Hyperlink.IMAGE,
+                        href="http://example.com/%s.png" % identifier_data.identifier,
+                        thumbnail=LinkData(
+                            rel=Hyperlink.THUMBNAIL_IMAGE,
+                            href="http://example.com/%s-thumbnail.png"
+                            % identifier_data.identifier,
+                        ),
+                    )
+                ],
+                circulation=CirculationData(
+                    data_source=source,
+                    primary_identifier=identifier_data,
+                    licenses_owned=5,
+                    licenses_available=4,
+                ),
+            )
+
+        m1 = metadata(
+            IdentifierData(identifier.type, identifier.identifier),
+            [SubjectData(Subject.TAG, "tag1", weight=50)],
+        )
+        m2 = metadata(
+            IdentifierData(Identifier.GUTENBERG_ID, "new"),
+            [
+                SubjectData(Subject.TAG, "tag1", weight=10),
+                SubjectData(Subject.DDC, "300", "Social sciences"),
+            ],
+        )
+
+        def apply():
+            [(e1, ignore), (e2, ignore)] = Metadata.apply_batch(
+                self._db, [m1, m2], collection
+            )
+            return e1, e2
+
+        e1, e2 = apply()
+
+        # The existing Edition was updated, and a new one was created.
+        assert edition == e1
+        assert m1.title == e1.title
+        assert (Identifier.GUTENBERG_ID, "new") == (
+            e2.primary_identifier.type,
+            e2.primary_identifier.identifier,
+        )
+        assert m2.title == e2.title
+
+        # Both books are equivalent to the same ISBN.
+        [isbn] = set(
+            x.output for e in (e1, e2) for x in e.primary_identifier.equivalencies
+        )
+        assert "9781937063012" == isbn.identifier
+
+        # The existing Classification was given a new weight, rather
+        # than being duplicated.
+        [classification] = identifier.classifications
+        assert "tag1" == classification.subject.identifier
+        assert 50 == classification.weight
+
+        # The new book was classified under an existing Subject and
+        # a new one.
+        classifications = sorted(
+            e2.primary_identifier.classifications, key=lambda x: x.subject.type
+        )
+        assert [(Subject.DDC, "300", 1), (Subject.TAG, "tag1", 10)] == [
+            (x.subject.type, x.subject.identifier, x.weight) for x in classifications
+        ]
+        assert "Social sciences" == classifications[0].subject.name
+
+        # Both books got an image and a thumbnail.
+        for e in (e1, e2):
+            [image, thumbnail] = sorted(e.primary_identifier.links, key=lambda x: x.rel)
+            assert Hyperlink.IMAGE == image.rel
+            assert source == image.resource.data_source
+            assert Hyperlink.THUMBNAIL_IMAGE == thumbnail.rel
+            assert image.resource.representation == (
+                thumbnail.resource.representation.thumbnail_of
+            )
+
+        # The existing LicensePool was updated, and a new one was created.
+        [p1] = e1.license_pools
+        assert pool == p1
+        [p2] = e2.license_pools
+        for p in (p1, p2):
+            assert collection == p.collection
+            assert 5 == p.licenses_owned
+            assert 4 == p.licenses_available
+
+        # Applying the same batch again doesn't create anything new.
+        assert (e1, e2) == apply()
+        assert 1 == len(identifier.classifications)
+        assert 2 == len(e2.primary_identifier.classifications)
+        assert 2 == len(e2.primary_identifier.links)
+        assert 2 == self._db.query(Edition).count()
+
+
 class TestTimestampData(DatabaseTest):
     def test_constructor(self):
 
@@ -1,4 +1,5 @@
 import datetime
+from concurrent.futures import Future
 
 import pytest
 
@@ -10,6 +11,7 @@ from ..model import (
     Collection,
     CollectionMissing,
     ConfigurationSetting,
+    CoverageQueueItem,
     Credential,
     DataSource,
     Edition,
@@ -32,6 +34,7 @@ from ..monitor import (
     CollectionMonitor,
     CollectionReaper,
     CoverageProvidersFailed,
+    CoverageQueueReaper,
     CredentialReaper,
     CustomListEntrySweepMonitor,
     CustomListEntryWorkUpdateMonitor,
@@ -59,6 +62,8 @@ from ..testing import (
     NeverSuccessfulCoverageProvider,
 )
 from ..util.datetime_helpers import datetime_utc, utc_now
+from ..util.job_metrics import JobMetrics
+from ..util.query_profile import QueryProfile
 
 
 class MockMonitor(Monitor):
@@ -228,6 +233,23 @@ class TestMonitor(DatabaseTest):
         m = AlsoDoomed(self._db, self._default_collection)
         assert_run_sets_exception(m, "I'm also doomed")
 
+    def test_run_stops_profile_on_unhandled_exception(self, monkeypatch):
+        # If something goes wrong that Monitor.run doesn't handle, the
+        # run's SQL profile is stopped anyway, so that it isn't charged
+        # for statements run later on this thread.
+        monkeypatch.setenv(QueryProfile.ENVIRONMENT_VARIABLE, "true")
+
+        class Interrupted(MockMonitor):
+            SERVICE_NAME = "Interrupted"
+
+            def run_once(self, progress):
+                raise KeyboardInterrupt()
+
+        monitor = Interrupted(self._db, self._default_collection)
+        with pytest.raises(KeyboardInterrupt):
+            monitor.run()
+        assert [] == QueryProfile.running()
+
     def test_same_monitor_different_collections(self):
         """A single Monitor has different Timestamps when run against
         different Collections.
@@ -513,6 +535,23 @@ class MockSweepMonitor(SweepMonitor):
         self.cleanup_called.append(True)
 
 
+class SynchronousExecutor(object):
+    """Run each prefetch as soon as it's submitted."""
+
+    def __init__(self):
+        self.submitted = 0
+        self.shut_down = False
+
+    def submit(self, function, *args):
+        self.submitted += 1
+        future = Future()
+        future.set_result(function(*args))
+        return future
+
+    def shutdown(self):
+        self.shut_down = True
+
+
 class TestSweepMonitor(DatabaseTest):
     def setup_method(self):
         super(TestSweepMonitor, self).setup_method()
@@ -567,6 +606,33 @@ class TestSweepMonitor(DatabaseTest):
         # the entire run, not just the final batch.
         assert "Records processed: 3." == self.monitor.timestamp().achievements
 
+        # The run was also measured for export as metrics.
+        metrics = self.monitor.metrics
+        assert JobMetrics.MONITOR == metrics.job_type
+        assert self.monitor.service_name == metrics.service_name
+        assert 3 == metrics.items_processed
+        assert 3 == metrics.batch_count
+        assert False == metrics.failed
+        assert metrics.finish is not None
+
+        # SQL statements weren't profiled.
+        assert None == metrics.sql_statements
+
+    def test_run_profiles_sql(self, monkeypatch):
+        # If SQL profiling is turned on, each batch is profiled, and
+        # the totals become part of the metrics.
+        monkeypatch.setenv(QueryProfile.ENVIRONMENT_VARIABLE, "true")
+        [self._identifier() for i in range(3)]
+        self.monitor.run()
+        metrics = self.monitor.metrics
+        assert 3 == metrics.batch_count
+
+        # Each batch ran at least one statement to find its items.
+        assert metrics.sql_statements >= 3
+        assert metrics.sql_seconds > 0
+        assert 0 == metrics.n_plus_one_patterns
+        assert [] == QueryProfile.running()
+
     def test_run_starts_at_previous_counter(self):
         # Two Identifiers.
         i1, i2 = [self._identifier() for i in range(2)]
@@ -591,6 +657,22 @@ class TestSweepMonitor(DatabaseTest):
         # The monitor's counter has been reset.
         assert 0 == timestamp.counter
 
+    def test_run_stops_when_out_of_time(self):
+        # Three Identifiers -- the batch size is 2.
+        i1, i2, i3 = [self._identifier() for i in range(3)]
+
+        # The monitor runs out of time after its first batch, so it
+        # stops there and picks up where it left off on the next run.
+        self.monitor.time_budget = 0
+        self.monitor.run()
+        assert [i1, i2] == self.monitor.processed
+        assert i2.id == self.monitor.timestamp().counter
+
+        self.monitor.time_budget = None
+        self.monitor.run()
+        assert [i1, i2, i3] == self.monitor.processed
+        assert 0 == self.monitor.timestamp().counter
+
     def test_exception_interrupts_run(self):
 
         # Four Identifiers.
@@ -641,6 +723,208 @@ class TestSweepMonitor(DatabaseTest):
         # cleanup() is only called when the sweep completes successfully.
         assert [] == monitor.cleanup_called
 
+    def test_run_with_adaptive_batch_size(self):
+        identifiers = [self._identifier() for i in range(7)]
+
+        class Adaptive(MockSweepMonitor):
+            DEFAULT_BATCH_SIZE = 1
+            TARGET_BATCH_SECONDS = 1000
+
+        # Every batch is much faster than the target, so the batch
+        # size doubles each time.
+        monitor = Adaptive(self._db)
+        monitor.run()
+        assert identifiers == monitor.processed
+        assert [0, identifiers[0].id, identifiers[2].id, identifiers[6].id] == (
+            monitor.batches
+        )
+        assert 8 == monitor.batch_size
+
+        # The batch sizes are recorded in the timestamp.
+        achievements = monitor.timestamp().achievements
+        assert achievements.startswith(
+            "Records processed: 7. Batch sizes: 1-4, next 8."
+        )
+
+    def test_run_with_prefetch(self):
+        i1, i2, i3 = [self._identifier() for i in range(3)]
+
+        executor = SynchronousExecutor()
+        monitor = MockSweepMonitor(self._db, prefetch=True)
+        monitor.prefetch_executor = executor
+        monitor.run()
+
+        # The sweep went just as it would have without prefetching.
+        assert [i1, i2, i3] == monitor.processed
+        assert [0, i2.id, i3.id] == monitor.batches
+        assert 0 == monitor.timestamp().counter
+
+        # But the second and third batches were looked up while the
+        # batches before them were being processed.
+        assert 2 == executor.submitted
+        assert None == monitor.prefetch_executor
+        assert None == monitor.next_batch
+
+        # A prefetched batch is only used if it starts where the
+        # Monitor expects the next batch to start.
+        monitor.prefetch_executor = executor
+        assert [i1, i2] == monitor.fetch_prefetched_batch(0)
+        assert i2.id == monitor.next_batch[0]
+        assert [i2, i3] == monitor.fetch_prefetched_batch(i1.id)
+        assert i3.id == monitor.next_batch[0]
+
+    def test_prefetching_stops_when_sweep_stops_early(self):
+        i1, i2, i3 = [self._identifier() for i in range(3)]
+
+        def prefetching_monitor(cls=MockSweepMonitor, **kwargs):
+            monitor = cls(self._db, prefetch=True, **kwargs)
+            executor = SynchronousExecutor()
+            monitor.prefetch_executor = executor
+            return monitor, executor
+
+        def assert_stopped(monitor, executor):
+            # The background thread was shut down, and the batch it
+            # prefetched won't be used by the next run.
+            assert True == executor.shut_down
+            assert None == monitor.prefetch_executor
+            assert None == monitor.next_batch
+
+        # The monitor runs out of time after its first batch.
+        monitor, executor = prefetching_monitor()
+        monitor.time_budget = 0
+        monitor.run()
+        assert [i1, i2] == monitor.processed
+        assert 1 == executor.submitted
+        assert_stopped(monitor, executor)
+
+        # The monitor's first batch raises an exception.
+        class Doomed(MockSweepMonitor):
+            def process_item(self, item):
+                raise Exception("doomed")
+
+        monitor, executor = prefetching_monitor(Doomed)
+        with pytest.raises(Exception):
+            monitor.run_once()
+        assert 1 == executor.submitted
+        assert_stopped(monitor, executor)
+
+        # A partition stops at its end, before reaching the end of
+        # the table.
+        monitor, executor = prefetching_monitor()
+        monitor.sweep_partition(0, i2.id, lambda size: None)
+        assert [i1, i2] == monitor.processed
+        assert 1 == executor.submitted
+        assert_stopped(monitor, executor)
+
+    def test_run_once_with_partitions(self):
+        class Mock(MockSweepMonitor):
+            def run_partitions(self):
+                return "partitioned"
+
+        assert "partitioned" == Mock(self._db, partitions=2).run_once()
+
+    def test_partition_range(self):
+        monitor = MockSweepMonitor(self._db, partitions=3)
+        assert [(0, 3), (3, 6), (6, 10)] == [
+            monitor.partition_range(i, 10) for i in range(3)
+        ]
+
+    def test_sweep_partition(self):
+        i1, i2, i3, i4 = [self._identifier() for i in range(4)]
+        fail_on = set([i3])
+
+        class Flaky(MockSweepMonitor):
+            def process_item(self, item):
+                if item in fail_on:
+                    raise Exception("Not now")
+                super(Flaky, self).process_item(item)
+
+        # There's a single partition, covering every Identifier.
+        monitor = Flaky(self._db, partitions=1)
+        batches = []
+        with pytest.raises(Exception) as excinfo:
+            monitor.sweep_partition(0, i4.id, batches.append)
+        assert "Not now" in str(excinfo.value)
+
+        # The partition's counter was updated after the first batch.
+        timestamp = monitor.partition_timestamp(0)
+        assert "Sweep Monitor (partition 1 of 1)" == timestamp.service
+        assert i2.id == timestamp.counter
+        assert [2] == batches
+
+        # Sweeping the partition again starts where it left off, and
+        # stops at the end of the partition.
+        fail_on.clear()
+        i5 = self._identifier()
+        monitor.sweep_partition(0, i4.id, batches.append)
+        assert [i1, i2, i3, i4] == monitor.processed
+        assert i4.id == timestamp.counter
+        assert [2, 2] == batches
+
+        # Once the partition is done, there's nothing more to do.
+        monitor.sweep_partition(0, i4.id, batches.append)
+        assert [2, 2] == batches
+
+        # An Identifier beyond the end of the partition is left for
+        # the partition that covers it.
+        assert i5 not in monitor.processed
+        monitor.sweep_partition(0, i5.id, batches.append)
+        assert [i1, i2, i3, i4, i5] == monitor.processed
+        assert i5.id == timestamp.counter
+        assert [2, 2, 1] == batches
+
+    def test_run_partitions(self):
+        identifiers = [self._identifier() for i in range(5)]
+        max_id = identifiers[-1].id
+
+        class MockPool(object):
+            """Run jobs in this process, except for one that 'crashes'."""
+
+            def __init__(self, _db, crash=None):
+                self._db = _db
+                self.crash = crash
+
+            def run(self, jobs, on_message):
+                failed = []
+                for index, job in enumerate(jobs):
+                    if index == self.crash:
+                        failed.append(index)
+                        continue
+                    job.run(self._db, lambda message: on_message(index, message))
+                return failed
+
+        monitor = MockSweepMonitor(self._db, partitions=2)
+        first, second = [monitor.partition_range(i, max_id) for i in range(2)]
+        in_first = [x for x in identifiers if x.id <= first[1]]
+
+        # The second partition fails to finish.
+        data = monitor.run_partitions(MockPool(self._db, crash=1))
+        assert "1 of 2 partitions failed to finish." == data.exception
+        assert "Records processed: %d." % len(in_first) == data.achievements
+
+        # The sweep isn't complete, so the monitor's counter still
+        # holds the ID that marks the end of the sweep.
+        assert max_id == data.counter == monitor.timestamp().counter
+        assert first[1] == monitor.partition_timestamp(0).counter
+        assert None == monitor.partition_timestamp(1).counter
+
+        # Identifiers created after the sweep started will be left
+        # for the next sweep.
+        self._identifier()
+
+        # The next run finishes the second partition, without
+        # redoing the first.
+        data = monitor.run_partitions(MockPool(self._db))
+        assert None == data.exception
+        assert (
+            "Records processed: %d." % (len(identifiers) - len(in_first))
+            == data.achievements
+        )
+        assert max_id == monitor.partition_timestamp(1).counter
+
+        # The sweep is complete, so the monitor's counter is reset.
+        assert 0 == data.counter
+
 
 class TestIdentifierSweepMonitor(DatabaseTest):
     def test_scope_to_collection(self):
@@ -966,6 +1250,10 @@ class TestReaperMonitor(DatabaseTest):
             Patron.authorization_expires == PatronRecordReaper(self._db).timestamp_field
         )
         assert 60 == PatronRecordReaper.MAX_AGE
+        assert (
+            CoverageQueueItem.created == CoverageQueueReaper(self._db).timestamp_field
+        )
+        assert 7 == CoverageQueueReaper.MAX_AGE
 
     def test_where_clause(self):
         m = CachedFeedReaper(self._db)
@@ -995,11 +1283,69 @@ class TestReaperMonitor(DatabaseTest):
         result = m.run_once()
         assert "Items deleted: 2" == result.achievements
 
+        # The batch size can also be adjusted as the reaper runs.
+        for i in range(3):
+            self._credential().expires = expiration_date
+        m.TARGET_BATCH_SECONDS = 1000
+        result = m.run_once()
+        assert result.achievements.startswith(
+            "Items deleted: 3. Batch sizes: 1-2, next 4."
+        )
+
         # The expired credentials have been reaped; the others
         # are still in the database.
         remaining = set(self._db.query(Credential).all())
         assert set([active, eternal]) == remaining
 
+    def test_set_based_run_once(self):
+        now = utc_now()
+        old = now - datetime.timedelta(days=CachedFeedReaper.MAX_AGE + 1)
+        expired = [
+            create(self._db, CachedFeed, type="page", pagination="", timestamp=old)[0]
+            for i in range(5)
+        ]
+        recent, ignore = create(
+            self._db, CachedFeed, type="page", pagination="", timestamp=now
+        )
+        expired_ids = set(x.id for x in expired)
+
+        def remaining_ids():
+            return set(id for (id,) in self._db.query(CachedFeed.id))
+
+        class Mock(CachedFeedReaper):
+            BATCH_SIZE = 2
+
+            def delete(self, row):
+                raise Exception("Rows should be deleted without the ORM.")
+
+        # If the run is out of time after the first batch, the rest is
+        # left for the next run.
+        m = Mock(self._db)
+        m.MAX_RUN_SECONDS = 0
+        result = m.run_once()
+        assert "Items deleted: 2. Stopped after 0 seconds" == result.achievements
+        remaining = remaining_ids()
+        assert 4 == len(remaining)
+        assert 2 == len(expired_ids - remaining)
+        assert recent.id in remaining
+
+        # The Monitor's time budget has the same effect.
+        m.MAX_RUN_SECONDS = None
+        m.time_budget = 0
+        result = m.run_once()
+        assert "Items deleted: 2. Stopped after 0 seconds" == result.achievements
+        remaining = remaining_ids()
+        assert 2 == len(remaining)
+        assert 4 == len(expired_ids - remaining)
+        assert recent.id in remaining
+
+        # Exactly the expired rows are gone once the reaper finishes.
+        m.time_budget = None
+        result = m.run_once()
+        assert "Items deleted: 1" == result.achievements
+        assert set([recent.id]) == remaining_ids()
+        assert set() == expired_ids & remaining_ids()
+
     def test_reap_patrons(self):
         m = PatronRecordReaper(self._db)
         expired = self._patron()
@@ -1259,6 +1605,30 @@ class TestScrubberMonitor(DatabaseTest):
         for untouched in (new, recent):
             assert "loc" == untouched.location
 
+    def test_run_once_in_batches(self):
+        m = CirculationEventLocationScrubber(self._db)
+        m.BATCH_SIZE = 2
+        long_ago = m.cutoff - datetime.timedelta(days=1)
+        events = [
+            create(self._db, CirculationEvent, start=long_ago, location="loc")[0]
+            for i in range(5)
+        ]
+
+        # Rows are scrubbed two at a time, and the run stops once a
+        # batch comes up short.
+        batches = []
+        original_scrub_batch = m.scrub_batch
+
+        def scrub_batch(batch_size):
+            batches.append(original_scrub_batch(batch_size))
+            return batches[-1]
+
+        m.scrub_batch = scrub_batch
+        timestamp = m.run_once()
+        assert "Items scrubbed: 5" == timestamp.achievements
+        assert [2, 2, 1] == batches
+        assert [None] * 5 == [x.location for x in events]
+
     def test_specific_scrubbers(self):
         # Check that all specific ScrubberMonitors are set up
         # correctly.
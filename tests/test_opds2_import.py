@@ -1,4 +1,5 @@
 import datetime
+import json
 import os
 
 from parameterized import parameterized
@@ -15,7 +16,11 @@ from ..model import (
     MediaTypes,
     Work,
 )
-from ..opds2_import import OPDS2Importer, RWPMManifestParser
+from ..opds2_import import (
+    OPDS2Importer,
+    RWPMManifestParser,
+    StreamingRWPMManifestParser,
+)
 from .test_opds_import import OPDSTest
 
 
@@ -77,11 +82,21 @@ class TestOPDS2Importer(OPDS2Test):
 
     @parameterized.expand(
         [
-            ("manifest encoded as a string", "string"),
-            ("manifest encoded as a byte-string", "bytes"),
+            ("manifest encoded as a string", "string", RWPMManifestParser),
+            ("manifest encoded as a byte-string", "bytes", RWPMManifestParser),
+            (
+                "manifest encoded as a string, streaming",
+                "string",
+                StreamingRWPMManifestParser,
+            ),
+            (
+                "manifest encoded as a byte-string, streaming",
+                "bytes",
+                StreamingRWPMManifestParser,
+            ),
         ]
     )
-    def test(self, _, manifest_type):
+    def test(self, _, manifest_type, parser_class):
         # Arrange
         collection = self._default_collection
         data_source = DataSource.lookup(
@@ -91,7 +106,7 @@ class TestOPDS2Importer(OPDS2Test):
         collection.data_source = data_source
 
         importer = OPDS2Importer(
-            self._db, collection, RWPMManifestParser(OPDS2FeedParserFactory())
+            self._db, collection, parser_class(OPDS2FeedParserFactory())
         )
         content_server_feed = self.sample_opds("feed.json")
 
@@ -285,3 +300,72 @@ class TestOPDS2Importer(OPDS2Test):
             "December 1884 and in the United States in February 1885."
             == huckleberry_finn_work.summary_text
         )
+
+
+class TestStreamingRWPMManifestParser(OPDS2Test):
+    def sample_feed(self):
+        base_path = os.path.split(__file__)[0]
+        path = os.path.join(base_path, "files", "opds2", "feed.json")
+        with open(path) as f:
+            return json.load(f)
+
+    def test_parse_publications(self):
+        feed = self.sample_feed()
+        [moby_dick, huckleberry_finn] = feed["publications"]
+
+        # Break one of the publications.
+        del huckleberry_finn["metadata"]["title"]
+
+        # Put the publications ahead of the feed-level information, to
+        # make sure the parser doesn't depend on the order.
+        feed = dict(publications=feed.pop("publications"), **feed)
+        parser = StreamingRWPMManifestParser(OPDS2FeedParserFactory())
+        results = list(parser.parse_publications(json.dumps(feed)))
+
+        # Each publication was parsed separately, as part of a copy of
+        # the feed.
+        assert 2 == len(results)
+        for result, expect in zip(results, [moby_dick, huckleberry_finn]):
+            [publication] = result.root.publications
+            assert expect["metadata"]["identifier"] == publication.metadata.identifier
+            [self_link] = result.root.links.get_by_rel("self")
+            assert "http://example.com/new" == self_link.href
+
+        # The invalid publication only caused errors in its own result.
+        assert [] == results[0].errors
+        assert len(results[1].errors) > 0
+
+        # An empty feed still yields a result, with the feed-level
+        # information.
+        feed["publications"] = []
+        [result] = parser.parse_publications(json.dumps(feed).encode("utf8"))
+        [self_link] = result.root.links.get_by_rel("self")
+        assert "http://example.com/new" == self_link.href
+
+        # A feed that has already been decoded is parsed all at once.
+        feed["publications"] = [moby_dick, moby_dick]
+        [result] = parser.parse_publications(feed)
+        assert 2 == len(result.root.publications)
+
+    def test_import_with_invalid_publication(self):
+        collection = self._default_collection
+        collection.data_source = DataSource.lookup(
+            self._db, "OPDS 2.0 Data Source", autocreate=True
+        )
+        feed = self.sample_feed()
+        del feed["publications"][1]["metadata"]["title"]
+
+        importer = OPDS2Importer(
+            self._db,
+            collection,
+            StreamingRWPMManifestParser(OPDS2FeedParserFactory()),
+        )
+        imported_editions, pools, works, failures = importer.import_from_feed(
+            json.dumps(feed)
+        )
+
+        # The valid publication was imported. The invalid one was
+        # recorded as a failure.
+        [edition] = imported_editions
+        assert "Moby-Dick" == edition.title
+        assert ["9781234567897"] == list(failures.keys())
@@ -8,6 +8,7 @@ from urllib.parse import quote
 import feedparser
 import pytest
 from lxml import etree
+from mock import patch
 from psycopg2.extras import NumericRange
 
 from ..config import CannotLoadConfiguration, IntegrationException
@@ -21,6 +22,7 @@ from ..model import (
     DeliveryMechanism,
     Edition,
     ExternalIntegration,
+    HTTPValidators,
     Hyperlink,
     Identifier,
     Measurement,
@@ -49,7 +51,7 @@ from ..testing import (
     MockRequestsResponse,
 )
 from ..util.datetime_helpers import datetime_utc, utc_now
-from ..util.http import BadResponseException
+from ..util.http import HTTP, BadResponseException
 from ..util.opds_writer import AtomFeed, OPDSFeed, OPDSMessage
 
 
@@ -88,6 +90,34 @@ class OPDSTest(DatabaseTest):
         return open(os.path.join(resource_path, filename), file_type).read()
 
 
+class TestSimplifiedOPDSLookup(OPDSTest):
+    def test_conditional_get(self):
+        url = "http://lookup/lookup?urn=foo"
+
+        def get(lookup, status_code, headers):
+            response = MockRequestsResponse(status_code, headers, "content")
+            with patch.object(HTTP, "get_with_timeout", return_value=response) as m:
+                assert response == lookup._get(url)
+            args, kwargs = m.call_args
+            return kwargs.get("headers")
+
+        # Without a database session, requests are never conditional.
+        lookup = SimplifiedOPDSLookup("http://lookup/")
+        assert None == get(lookup, 200, {"ETag": "abc"})
+        assert [] == self._db.query(HTTPValidators).all()
+
+        # With a database session, validators are stored...
+        lookup = SimplifiedOPDSLookup("http://lookup/", _db=self._db)
+        assert {} == get(lookup, 200, {"ETag": "abc"})
+
+        # ...and sent along with the next request for the same URL.
+        assert {"If-None-Match": "abc"} == get(lookup, 304, {})
+
+        # A 304 response doesn't change the stored validators.
+        [validators] = self._db.query(HTTPValidators).all()
+        assert "abc" == validators.etag
+
+
 class TestMetadataWranglerOPDSLookup(OPDSTest):
     def setup_method(self):
         super(TestMetadataWranglerOPDSLookup, self).setup_method()
@@ -2485,6 +2515,60 @@ class TestOPDSImportMonitor(OPDSImporterTest):
         record.timestamp = datetime_utc(1970, 1, 1, 1, 1, 1)
         assert True == monitor.feed_contains_new_data(feed)
 
+    def test_parse_identifiers(self):
+        monitor = OPDSImportMonitor(
+            self._db,
+            self._default_collection,
+            import_class=OPDSImporter,
+        )
+        existing = self._identifier(Identifier.ISBN, "9781594632556")
+        new_urn = Identifier.URN_SCHEME_PREFIX + "Gutenberg%20ID/not-in-database"
+
+        identifiers_by_urn, failures = monitor._parse_identifiers(
+            ["urn:isbn:1594632553", new_urn, "not a urn"]
+        )
+
+        # The ISBN-10 URN was converted to the ISBN-13 Identifier
+        # already in the database, but it's still keyed by the
+        # original string.
+        assert existing == identifiers_by_urn["urn:isbn:1594632553"]
+
+        # A valid URN that doesn't correspond to any Identifier is
+        # mapped to None. No Identifier was created for it.
+        assert None == identifiers_by_urn[new_urn]
+        assert (
+            0
+            == self._db.query(Identifier)
+            .filter(Identifier.identifier == "not-in-database")
+            .count()
+        )
+
+        # A string that's not a URN at all is a failure.
+        assert ["not a urn"] == failures
+        assert "not a urn" not in identifiers_by_urn
+
+    def test_feed_contains_new_data_uses_bulk_lookups(self):
+        feed = self.content_server_mini_feed
+
+        class Mock(OPDSImportMonitor):
+            def _parse_identifier(self, identifier):
+                raise Exception("Identifiers should be parsed in bulk.")
+
+            def identifier_needs_import(self, identifier, last_updated_remote):
+                raise Exception("Coverage should be looked up in bulk.")
+
+        monitor = Mock(
+            self._db,
+            self._default_collection,
+            import_class=OPDSImporter,
+        )
+
+        # Nothing has been imported yet, so all data is new.
+        assert True == monitor.feed_contains_new_data(feed)
+
+        # Looking for new data didn't create any Identifiers.
+        assert [] == self._db.query(Identifier).all()
+
     def http_with_feed(self, feed, content_type=OPDSFeed.ACQUISITION_FEED_TYPE):
         """Helper method to make a DummyHTTPClient with a
         successful OPDS feed response queued.
@@ -2550,6 +2634,86 @@ class TestOPDSImportMonitor(OPDSImporterTest):
             follow()
         assert "Expected Atom feed, got not/atom" in str(excinfo.value)
 
+    def test_follow_one_link_conditional_request(self):
+        monitor = OPDSImportMonitor(
+            self._db, collection=self._default_collection, import_class=OPDSImporter
+        )
+        feed = self.content_server_mini_feed
+        url = "http://url"
+        requests = []
+
+        def do_get(url, headers):
+            requests.append(headers)
+            return responses.pop(0)
+
+        # The first request isn't conditional. The page has new data,
+        # so its validators aren't stored until it's been imported.
+        responses = [(200, {"content-type": AtomFeed.ATOM_TYPE, "etag": "v1"}, feed)]
+        next_links, content = monitor.follow_one_link(url, do_get=do_get)
+        assert feed == content
+        assert {} == requests.pop()
+        assert {"content-type": AtomFeed.ATOM_TYPE, "etag": "v1"} == (
+            monitor._pending_validators[url]
+        )
+        assert [] == self._db.query(HTTPValidators).all()
+
+        # Once a page is known to have nothing new on it, its
+        # validators are stored.
+        monitor.feed_contains_new_data = lambda feed: False
+        responses = [(200, {"content-type": AtomFeed.ATOM_TYPE, "etag": "v2"}, feed)]
+        assert ([], None) == monitor.follow_one_link(url, do_get=do_get)
+        [validators] = self._db.query(HTTPValidators).all()
+        assert "v2" == validators.etag
+
+        # The next request is conditional. A 304 response means there's
+        # nothing new, and the response isn't even checked.
+        monitor.feed_contains_new_data = object()
+        responses = [(304, {}, b"")]
+        assert ([], None) == monitor.follow_one_link(url, do_get=do_get)
+        assert {"If-None-Match": "v2"} == requests.pop()
+
+        # If the monitor is forcing a reimport, requests aren't
+        # conditional.
+        monitor.force_reimport = True
+        monitor.feed_contains_new_data = lambda feed: True
+        responses = [(200, {"content-type": AtomFeed.ATOM_TYPE}, feed)]
+        monitor.follow_one_link(url, do_get=do_get)
+        assert {} == requests.pop()
+
+    def test_follow_one_link_conditional_request_per_collection(self):
+        # Two collections import the same feed.
+        other = self._collection(data_source_name=DataSource.OA_CONTENT_SERVER)
+        monitor1, monitor2 = [
+            OPDSImportMonitor(self._db, collection=c, import_class=OPDSImporter)
+            for c in (self._default_collection, other)
+        ]
+        feed = self.content_server_mini_feed
+        url = "http://url"
+        requests = []
+
+        def do_get(url, headers):
+            requests.append(headers)
+            return (200, {"content-type": AtomFeed.ATOM_TYPE, "etag": "v1"}, feed)
+
+        # The first collection finds nothing new on the page, so its
+        # validators are stored.
+        monitor1.feed_contains_new_data = lambda feed: False
+        assert ([], None) == monitor1.follow_one_link(url, do_get=do_get)
+        [validators] = self._db.query(HTTPValidators).all()
+        assert self._default_collection.id == validators.collection_id
+
+        # The second collection has never imported the page, so its
+        # request isn't conditional, and the page is imported.
+        requests = []
+        next_links, content = monitor2.follow_one_link(url, do_get=do_get)
+        assert [{}] == requests
+        assert feed == content
+
+        # The first collection still makes a conditional request.
+        requests = []
+        monitor1.follow_one_link(url, do_get=do_get)
+        assert [{"If-None-Match": "v1"}] == requests
+
     def test_import_one_feed(self):
         # Check coverage records are created.
 
@@ -2663,6 +2827,32 @@ class TestOPDSImportMonitor(OPDSImporterTest):
         assert None == progress.start
         assert None == progress.finish
 
+    def test_run_once_stores_validators(self):
+        class MockOPDSImportMonitor(OPDSImportMonitor):
+            def _get_feeds(self):
+                return [("http://page1", "page 1"), ("http://page2", "page 2")]
+
+            def import_one_feed(self, feed):
+                # The second page has a failure.
+                if feed == "page 2":
+                    return [], {"identifier": "Failure"}
+                return [object()], {}
+
+        monitor = MockOPDSImportMonitor(
+            self._db, collection=self._default_collection, import_class=OPDSImporter
+        )
+        monitor._pending_validators["http://page1"] = {"ETag": "v1"}
+        monitor._pending_validators["http://page2"] = {"ETag": "v2"}
+        monitor.run_once(object())
+
+        # Only the validators for the page that was imported without
+        # failures were stored, so the other page will be downloaded
+        # and imported again next time.
+        [validators] = self._db.query(HTTPValidators).all()
+        assert "http://page1" == validators.url
+        assert "v1" == validators.etag
+        assert {} == monitor._pending_validators
+
     def test_update_headers(self):
         # Test the _update_headers helper method.
         monitor = OPDSImportMonitor(
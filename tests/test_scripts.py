@@ -1,3 +1,4 @@
+import datetime
 import os
 import random
 import shutil
@@ -59,12 +60,15 @@ from ..scripts import (
     MockStdin,
     OPDSImportScript,
     PatronInputScript,
+    RebuildEquivalentIdentifiersScript,
     RebuildSearchIndexScript,
     ReclassifyWorksForUncheckedSubjectsScript,
     RunCollectionMonitorScript,
     RunCoverageProviderScript,
+    RunCoverageQueueScript,
     RunMonitorScript,
     RunMultipleMonitorsScript,
+    RunMultiprocessCollectionCoverageProviderScript,
     RunReaperMonitorsScript,
     RunThreadedCollectionCoverageProviderScript,
     RunWorkCoverageProviderScript,
@@ -483,6 +487,74 @@ class TestRunMultipleMonitorsScript(DatabaseTest):
         assert "Doomed!" == str(m2.exception)
         assert None == getattr(m1, "exception", None)
 
+    def test_do_run_concurrently(self):
+        ran = []
+
+        class RecordingMonitor(CollectionMonitor):
+            SERVICE_NAME = "Recording Monitor"
+            PROTOCOL = ExternalIntegration.OPDS_IMPORT
+
+            def run(self):
+                ran.append((self.collection_id, self._db, self.time_budget))
+                if self.collection_id == c2.id:
+                    raise Exception("Doomed!")
+
+        # c1's monitor has never finished a run, c2's finished a long
+        # time ago and c3's finished recently.
+        c1, c2, c3 = [self._collection() for i in range(3)]
+        now = utc_now()
+        for collection, finish in (
+            (c2, now - datetime.timedelta(days=1)),
+            (c3, now),
+        ):
+            Timestamp.stamp(
+                self._db,
+                RecordingMonitor.SERVICE_NAME,
+                Timestamp.MONITOR_TYPE,
+                collection,
+                finish=finish,
+            )
+
+        class MockScript(RunMultipleMonitorsScript):
+            name = "Run three monitors"
+
+            def monitors(self, **kwargs):
+                return [RecordingMonitor(self._db, c) for c in (c3, c2, c1)]
+
+        class MockPool(object):
+            """Run each job right away, in this thread."""
+
+            def __init__(self):
+                self.jobs = []
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            def put(self, job):
+                self.jobs.append(job)
+                job()
+
+        script = MockScript(self._db, concurrency=2, time_budget=30)
+        pool = MockPool()
+        script.do_run(pool=pool)
+
+        # Each monitor was run as a separate job, most overdue first,
+        # even though the second one raised an exception.
+        assert 3 == len(pool.jobs)
+        assert [c1.id, c2.id, c3.id] == [
+            collection_id for collection_id, _db, budget in ran
+        ]
+
+        # Each monitor was run with a session of its own, and with the
+        # script's time budget.
+        sessions = [_db for collection_id, _db, budget in ran]
+        assert self._db not in sessions
+        assert 3 == len(set(sessions))
+        assert [30, 30, 30] == [budget for collection_id, _db, budget in ran]
+
 
 class TestRunCollectionMonitorScript(DatabaseTest):
     def test_monitors(self):
@@ -785,6 +857,101 @@ class TestRunThreadedCollectionCoverageProviderScript(DatabaseTest):
         assert new_timestamp > original_timestamp
 
 
+class TestRunCoverageQueueScript(DatabaseTest):
+    def test_do_run(self):
+        class MockListener(object):
+            def __init__(self):
+                self.waits = []
+
+            def wait(self, timeout):
+                self.waits.append(timeout)
+                return []
+
+        class MockProvider(AlwaysSuccessfulWorkCoverageProvider):
+            OPERATION = "the_operation"
+
+        work = self._work()
+        MockProvider.register(work)
+        provider = MockProvider(self._db)
+        script = RunCoverageQueueScript(None, _db=self._db, providers=[provider])
+
+        # Every provider's queue is emptied, then the script waits for
+        # a notification and checks the queues again, until it's told
+        # to stop.
+        listener = MockListener()
+        script.do_run(listener=listener, stop_after=0.1)
+        assert [work] == provider.attempts
+        assert len(listener.waits) >= 1
+        assert all(0 <= x <= 0.1 for x in listener.waits)
+
+
+class TestRunMultiprocessCollectionCoverageProviderScript(DatabaseTest):
+    class MockPool(object):
+        """Run each job in this process, in the test transaction,
+        instead of in a worker process of its own.
+        """
+
+        def __init__(self, _db, failed=None):
+            self._db = _db
+            self.failed = failed or []
+            self.jobs = []
+
+        def run(self, jobs, on_message):
+            for index, job in enumerate(jobs):
+                self.jobs.append(job)
+                job.run(self._db, lambda message: on_message(index, message))
+            return self.failed
+
+    def test_run(self):
+        provider = AlwaysSuccessfulCollectionCoverageProvider
+        script = RunMultiprocessCollectionCoverageProviderScript(
+            provider, worker_size=2, _db=self._db
+        )
+        collection = self._collection()
+        editions = [
+            self._edition(collection=collection, with_license_pool=True)[0]
+            for i in range(3)
+        ]
+        pool = self.MockPool(self._db)
+        script.run(pool=pool)
+
+        # The work was divided between two jobs, each with its own
+        # range of IDs. Each job now knows the last ID it covered, in
+        # case it has to be restarted.
+        [job1, job2] = pool.jobs
+        assert collection.id == job1.collection_id
+        assert job1.last_id == job1.end_id
+        assert job2.last_id > job1.end_id
+        assert None == job2.end_id
+
+        # Every identifier was covered.
+        source = DataSource.lookup(self._db, provider.DATA_SOURCE_NAME)
+        assert [] == (
+            Identifier.missing_coverage_from(
+                self._db, provider.INPUT_IDENTIFIER_TYPES, source
+            )
+            .filter(Identifier.id.in_([e.primary_identifier.id for e in editions]))
+            .all()
+        )
+
+        # Progress from both jobs went into a single timestamp.
+        timestamp = Timestamp.lookup(
+            self._db,
+            provider.SERVICE_NAME,
+            Timestamp.COVERAGE_PROVIDER_TYPE,
+            collection,
+        )
+        assert "Successes: 3" in timestamp.achievements
+        assert None == timestamp.exception
+
+        # If a worker never finishes, the timestamp says so. (Now that
+        # nothing needs coverage, there's only one worker.)
+        progress = script.run_for_collection(
+            collection, self.MockPool(self._db, failed=[0])
+        )
+        assert "1 of 1 workers failed to finish." == progress.exception
+
+
 class TestRunWorkCoverageProviderScript(DatabaseTest):
     def test_constructor(self):
         script = RunWorkCoverageProviderScript(
@@ -3010,6 +3177,26 @@ class TestSearchIndexCoverageRemover(DatabaseTest):
             assert sorted(remaining) == sorted(decoys)
 
 
+class TestRebuildEquivalentIdentifiersScript(DatabaseTest):
+    def test_do_run(self):
+        data_source = DataSource.lookup(self._db, DataSource.MANUAL)
+        a, b, c = [self._identifier() for i in range(3)]
+        a.equivalent_to(data_source, b, 1)
+        b.equivalent_to(data_source, c, 1)
+        self._db.flush()
+
+        # Change the Equivalencies behind the closure's back.
+        self._db.execute("DELETE FROM equivalentidentifiers")
+
+        script = RebuildEquivalentIdentifiersScript(self._db)
+        script.BATCH_SIZE = 2
+        result = script.do_run()
+        assert isinstance(result, TimestampData)
+        assert "Identifiers processed: 3. Stale rows deleted: 0." == result.achievements
+        equivalents = Identifier.recursively_equivalent_identifier_ids(self._db, [a.id])
+        assert set([a.id, b.id, c.id]) == set(equivalents[a.id])
+
+
 class TestUpdateLaneSizeScript(DatabaseTest):
     def test_do_run(self):
         lane = self._lane()
@@ -0,0 +1,65 @@
+from ...util.adaptive_batch import AdaptiveBatchSize
+
+
+class TestAdaptiveBatchSize(object):
+    def test_record(self):
+        sizer = AdaptiveBatchSize(100, 2)
+
+        # A batch of 100 took one second, so the next batch can be
+        # twice as big.
+        assert 200 == sizer.record(100, 1)
+
+        # A batch of 200 took eight seconds, so the next one should
+        # be a quarter the size -- but it only shrinks by half at a time.
+        assert 100 == sizer.record(200, 8)
+        assert 80 == sizer.record(100, 2.5)
+
+        # An empty batch or an instantaneous one doesn't throw things off.
+        assert 80 == sizer.record(0, 0)
+        assert 160 == sizer.record(80, 0)
+
+        assert [
+            (100, 100, 1),
+            (200, 200, 8),
+            (100, 100, 2.5),
+            (80, 0, 0),
+            (80, 80, 0),
+        ] == sizer.history
+
+    def test_bounds(self):
+        sizer = AdaptiveBatchSize(1000, 1, minimum=10, maximum=500)
+        assert 500 == sizer.size
+        assert 250 == sizer.record(500, 100)
+        assert 125 == sizer.record(250, 100)
+        for i in range(5):
+            sizer.record(sizer.size, 100)
+        assert 10 == sizer.size
+
+    def test_for_object(self):
+        class Fixed(object):
+            TARGET_BATCH_SECONDS = None
+
+        assert None == AdaptiveBatchSize.for_object(Fixed(), 100)
+
+        class Adaptive(object):
+            TARGET_BATCH_SECONDS = 5
+            MIN_BATCH_SIZE = 10
+            MAX_BATCH_SIZE = 1000
+
+        sizer = AdaptiveBatchSize.for_object(Adaptive(), 100)
+        assert (100, 5, 10, 1000) == (
+            sizer.size,
+            sizer.target_seconds,
+            sizer.minimum,
+            sizer.maximum,
+        )
+
+    def test_achievements(self):
+        sizer = AdaptiveBatchSize(100, 2)
+        assert "Batch size: 100." == sizer.achievements
+        sizer.record(100, 1)
+        sizer.record(200, 3)
+        assert (
+            "Batch sizes: 100-200, next 133. Seconds per batch: 1.00-3.00, average 2.00."
+            == sizer.achievements
+        )
@@ -0,0 +1,168 @@
+import datetime
+import json
+import logging
+import os
+
+from ...util.datetime_helpers import datetime_utc
+from ...util.job_metrics import (
+    JobMetrics,
+    JSONLogSink,
+    MetricsSink,
+    PrometheusTextfileSink,
+)
+from ...util.query_profile import QueryProfile
+
+
+class MockJob(object):
+    service_name = "Some Monitor"
+    collection = None
+
+
+def finished_metrics():
+    start = datetime_utc(2021, 1, 1)
+    metrics = JobMetrics(
+        JobMetrics.MONITOR, 'A "quoted" Monitor', collection_name="A collection"
+    )
+    metrics.start = start
+    metrics.finish = start + datetime.timedelta(seconds=90)
+    metrics.record_batch(10, 0.2)
+    metrics.record_batch(5, 45)
+    metrics.successes = 14
+    metrics.persistent_failures = 1
+    metrics.queue_depth = 100
+    return metrics
+
+
+class TestJobMetrics(object):
+    def test_for_job(self):
+        previous_finish = datetime_utc(2021, 1, 1)
+        metrics = JobMetrics.for_job(
+            JobMetrics.COVERAGE_PROVIDER, MockJob(), previous_finish=previous_finish
+        )
+        assert JobMetrics.COVERAGE_PROVIDER == metrics.job_type
+        assert "Some Monitor" == metrics.service_name
+        assert None == metrics.collection_name
+        assert (metrics.start - previous_finish).total_seconds() == metrics.lag_seconds
+
+        # If the job has never finished a run, there's no lag.
+        metrics = JobMetrics.for_job(JobMetrics.MONITOR, MockJob())
+        assert None == metrics.lag_seconds
+
+    def test_record_batch(self):
+        metrics = finished_metrics()
+        assert 15 == metrics.items_processed
+        assert 2 == metrics.batch_count
+        assert 45.2 == metrics.batch_seconds
+
+        # Each bucket counts the batches that took no longer than its
+        # upper bound.
+        assert [0, 1, 1, 1, 1, 1, 2, 2, 2] == metrics.batch_buckets
+
+    def test_record_queries(self):
+        metrics = finished_metrics()
+
+        # If SQL statements weren't profiled, there's nothing to record.
+        metrics.record_queries(None)
+        assert None == metrics.sql_statements
+        assert None == metrics.as_dict()["sql_statements"]
+
+        profile = QueryProfile("batch", n_plus_one_threshold=1)
+        profile.record("SELECT * FROM works WHERE id = 1", 0.5)
+        profile.record("SELECT * FROM works WHERE id = 2", 0.25)
+        metrics.record_queries(profile)
+        metrics.record_queries(QueryProfile("another batch"))
+        assert 2 == metrics.sql_statements
+        assert 0.75 == metrics.sql_seconds
+        assert 1 == metrics.n_plus_one_patterns
+
+    def test_export(self):
+        class Sink(MetricsSink):
+            def __init__(self):
+                self.exported = []
+
+            def export(self, metrics):
+                self.exported.append(metrics)
+
+        class BrokenSink(MetricsSink):
+            def export(self, metrics):
+                raise Exception("I'm broken.")
+
+        # A broken sink doesn't stop the metrics from going to other
+        # sinks.
+        metrics = JobMetrics(JobMetrics.MONITOR, "Some Monitor")
+        sink = Sink()
+        metrics.export([BrokenSink(), sink])
+        assert [metrics] == sink.exported
+
+        # The run was marked as finished.
+        assert metrics.finish is not None
+        assert metrics.duration_seconds >= 0
+
+
+class TestMetricsSink(object):
+    def test_configured(self, monkeypatch):
+        monkeypatch.delenv(
+            MetricsSink.TEXTFILE_DIRECTORY_ENVIRONMENT_VARIABLE, raising=False
+        )
+        monkeypatch.delenv(MetricsSink.JSON_LOG_ENVIRONMENT_VARIABLE, raising=False)
+        assert [] == MetricsSink.configured()
+
+        monkeypatch.setenv(MetricsSink.TEXTFILE_DIRECTORY_ENVIRONMENT_VARIABLE, "/tmp")
+        monkeypatch.setenv(MetricsSink.JSON_LOG_ENVIRONMENT_VARIABLE, "true")
+        textfile, json_log = MetricsSink.configured()
+        assert isinstance(textfile, PrometheusTextfileSink)
+        assert "/tmp" == textfile.directory
+        assert isinstance(json_log, JSONLogSink)
+
+
+class TestJSONLogSink(object):
+    def test_export(self, caplog):
+        caplog.set_level(logging.INFO)
+        JSONLogSink().export(finished_metrics())
+        [record] = caplog.records
+        data = json.loads(record.getMessage())
+        assert "monitor" == data["job_type"]
+        assert 'A "quoted" Monitor' == data["service"]
+        assert "A collection" == data["collection"]
+        assert 90 == data["duration_seconds"]
+        assert 15 == data["items_processed"]
+        assert 100 == data["queue_depth"]
+        assert None == data["lag_seconds"]
+        assert 2 == data["batch_seconds_buckets"]["60"]
+
+
+class TestPrometheusTextfileSink(object):
+    def test_render(self):
+        sink = PrometheusTextfileSink("/tmp")
+        lines = sink.render(finished_metrics()).splitlines()
+        labels = '{type="monitor",service="A \\"quoted\\" Monitor",collection="A collection"}'
+
+        assert "# TYPE circulation_job_items_processed gauge" in lines
+        assert "circulation_job_items_processed%s 15.0" % labels in lines
+        assert "circulation_job_queue_depth%s 100.0" % labels in lines
+        assert "circulation_job_failed%s 0.0" % labels in lines
+
+        # Metrics that weren't measured are left out.
+        assert not any(x.startswith("circulation_job_lag_seconds") for x in lines)
+
+        assert "# TYPE circulation_job_batch_seconds histogram" in lines
+        bucket_labels = labels[:-1] + ',le="%s"}'
+        assert "circulation_job_batch_seconds_bucket%s 1" % (bucket_labels % 1) in lines
+        assert (
+            "circulation_job_batch_seconds_bucket%s 2" % (bucket_labels % "+Inf")
+            in lines
+        )
+        assert "circulation_job_batch_seconds_count%s 2" % labels in lines
+
+    def test_export(self, tmpdir):
+        sink = PrometheusTextfileSink(str(tmpdir))
+        metrics = finished_metrics()
+        sink.export(metrics)
+        sink.export(metrics)
+
+        # The file is replaced each time, and nothing else is left
+        # behind.
+        [filename] = os.listdir(str(tmpdir))
+        assert "monitor_a_quoted_monitor_a_collection.prom" == filename
+        with open(os.path.join(str(tmpdir), filename)) as f:
+            assert sink.render(metrics) == f.read()
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from ...util.json_stream import decode_value, iterate_array, iterate_object, skip_value
+
+
+class TestJSONStream(object):
+    def test_skip_value(self):
+        document = ' {"a": [1, "]}\\"[", {"b": null}], "c": "}"} , 5'
+        end = skip_value(document)
+        assert json.loads(document[:end]) == {"a": [1, ']}"[', {"b": None}], "c": "}"}
+        assert document[end:].startswith(" , 5")
+
+        # Strings and scalars can be skipped too.
+        assert 4 == skip_value('"ab", 1')
+        assert 6 == skip_value(" 1.5e2]")
+        assert 4 == skip_value("true,")
+
+        with pytest.raises(json.JSONDecodeError):
+            skip_value('{"a": [1, 2}')
+        with pytest.raises(json.JSONDecodeError):
+            skip_value('"unterminated')
+
+    def test_decode_value(self):
+        document = '[1,  {"a": "b"} ]'
+        assert ({"a": "b"}, 15) == decode_value(document, 3)
+
+    def test_iterate_object(self):
+        document = '{"metadata": {"title": "A"}, "publications": [1, 2], "x": null}'
+        members = list(iterate_object(document))
+        assert ["metadata", "publications", "x"] == [key for key, _, _ in members]
+        for key, start, end in members:
+            assert json.loads(document)[key] == json.loads(document[start:end])
+
+        assert [] == list(iterate_object(" { } "))
+
+        with pytest.raises(json.JSONDecodeError):
+            list(iterate_object("[1, 2]"))
+        with pytest.raises(json.JSONDecodeError):
+            list(iterate_object('{"a": 1 "b": 2}'))
+
+    def test_iterate_array(self):
+        document = '{"publications": [{"a": 1}, "two", [3] ]}'
+        [(key, start, end)] = iterate_object(document)
+        assert [{"a": 1}, "two", [3]] == list(iterate_array(document, start))
+
+        assert [] == list(iterate_array("[ ]"))
+
+        # Elements are decoded one at a time, so elements before a
+        # syntax error are still available.
+        elements = iterate_array('[{"a": 1}, {"b": ]')
+        assert {"a": 1} == next(elements)
+        with pytest.raises(json.JSONDecodeError):
+            next(elements)
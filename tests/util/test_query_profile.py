@@ -0,0 +1,136 @@
+import logging
+
+import pytest
+
+from ...model import Identifier
+from ...testing import DatabaseTest, LogCaptureHandler
+from ...util.query_profile import QueryProfile
+
+
+class TestQueryProfile(object):
+    def test_shape(self):
+        m = QueryProfile.shape
+        assert "SELECT * FROM works WHERE id = ?" == m(
+            "SELECT * FROM works WHERE id = %(id_1)s"
+        )
+        assert "SELECT * FROM works WHERE id = ?" == m(
+            "SELECT *\n  FROM works\n  WHERE id = 10"
+        )
+        assert "SELECT * FROM editions WHERE title = ?" == m(
+            "SELECT * FROM editions WHERE title = 'It''s a title'"
+        )
+
+        # Lists of parameters of any length have the same shape.
+        assert "SELECT * FROM works WHERE works.id IN (?)" == m(
+            "SELECT * FROM works WHERE works.id IN (%(id_1)s, %(id_2)s, %(id_3)s)"
+        )
+        assert "SELECT * FROM works WHERE works.id IN (?)" == m(
+            "SELECT * FROM works WHERE works.id IN (%(id_1)s)"
+        )
+
+        # Numbers that are part of a name are left alone.
+        assert "SELECT anon_1.id FROM anon_1 LIMIT ?" == m(
+            "SELECT anon_1.id FROM anon_1 LIMIT %(param_1)s"
+        )
+
+    def test_record(self):
+        profile = QueryProfile("unit", n_plus_one_threshold=2)
+        profile.SLOWEST = 2
+        for i in range(3):
+            profile.record("SELECT * FROM works WHERE id = %d" % i, i)
+        profile.record("SELECT * FROM editions", 0.5)
+
+        assert 4 == profile.statements
+        assert 3.5 == profile.seconds
+        assert [
+            (2, "SELECT * FROM works WHERE id = 2"),
+            (1, "SELECT * FROM works WHERE id = 1"),
+        ] == profile.slowest
+
+        # The statement that was run three times looks like an N+1
+        # pattern. The statement that was run once doesn't.
+        assert [("SELECT * FROM works WHERE id = ?", 3)] == profile.n_plus_one
+
+    def test_report(self):
+        profile = QueryProfile("unit", n_plus_one_threshold=1)
+        profile.record("SELECT 1", 0.1)
+        profile.record("SELECT 2", 0.1)
+        log = logging.getLogger("test query profile")
+        log.setLevel(logging.DEBUG)
+        with LogCaptureHandler(log) as logs:
+            profile.report(log)
+        assert ["unit: 2 SQL statements in 0.200 sec."] == logs.info
+        assert 2 == len(logs.debug)
+        assert [
+            "unit: Possible N+1 pattern: 2 statements like SELECT ?"
+        ] == logs.warning
+
+    def test_start_when_disabled(self, monkeypatch):
+        monkeypatch.delenv(QueryProfile.ENVIRONMENT_VARIABLE, raising=False)
+        assert False == QueryProfile.enabled()
+        assert None == QueryProfile.start("unit")
+        with QueryProfile.measure("unit") as profile:
+            assert None == profile
+        assert [] == QueryProfile.running()
+
+        # A profile can be forced even when profiling is turned off.
+        profile = QueryProfile.start("unit", force=True)
+        assert [profile] == QueryProfile.running()
+        profile.stop(log=False)
+        assert [] == QueryProfile.running()
+
+        monkeypatch.setenv(QueryProfile.ENVIRONMENT_VARIABLE, "true")
+        assert True == QueryProfile.enabled()
+        with QueryProfile.measure("unit", log=False) as profile:
+            assert isinstance(profile, QueryProfile)
+
+
+class TestQueryProfileWithDatabase(DatabaseTest):
+    def test_measure(self):
+        identifiers = [self._identifier() for i in range(3)]
+        self._db.flush()
+        self._db.expire_all()
+
+        with QueryProfile.measure("job", force=True, log=False) as job:
+            with QueryProfile.measure(
+                "batch", force=True, log=False, n_plus_one_threshold=2
+            ) as batch:
+                for identifier in identifiers:
+                    self._db.query(Identifier).filter(
+                        Identifier.id == identifier.id
+                    ).one()
+            self._db.query(Identifier).count()
+
+        # Every statement run inside a profile counts toward it.
+        assert 3 == batch.statements
+        assert 4 == job.statements
+        assert job.seconds >= batch.seconds > 0
+
+        # Loading Identifiers one at a time looks like an N+1 pattern.
+        [(shape, count)] = batch.n_plus_one
+        assert 3 == count
+        assert "WHERE identifiers.id = ?" in shape
+
+        # Once the profiles stop, statements aren't counted.
+        self._db.query(Identifier).count()
+        assert 4 == job.statements
+
+    def test_assert_query_budget(self):
+        identifiers = [self._identifier() for i in range(3)]
+        self._db.flush()
+        ids = [x.id for x in identifiers]
+
+        with self.assert_query_budget(max_statements=1) as profile:
+            self._db.query(Identifier).filter(Identifier.id.in_(ids)).all()
+        assert 1 == profile.statements
+
+        with pytest.raises(AssertionError) as excinfo:
+            with self.assert_query_budget(max_statements=1):
+                for id in ids:
+                    self._db.query(Identifier).filter(Identifier.id == id).one()
+        assert "Expected at most 1 SQL statements, got 3" in str(excinfo.value)
+
+        with pytest.raises(AssertionError):
+            with self.assert_query_budget(n_plus_one_threshold=2):
+                for id in ids:
+                    self._db.query(Identifier).filter(Identifier.id == id).one()
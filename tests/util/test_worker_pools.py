@@ -1,3 +1,4 @@
+import sys
 import threading
 from contextlib import contextmanager
 
@@ -9,6 +10,7 @@ from ...util.worker_pools import (
     DatabaseWorker,
     Job,
     Pool,
+    ProcessPool,
     Queue,
     Worker,
 )
@@ -75,6 +77,53 @@ class TestPool(object):
         assert 1 / 3.0 == pool.success_rate
 
 
+class ReportingJob(object):
+    """A ProcessPool job that reports a message and then crashes a
+    given number of times before it succeeds.
+    """
+
+    def __init__(self, value, crashes=0):
+        self.value = value
+        self.crashes = crashes
+
+    def __call__(self, report):
+        report(self.value)
+        if self.crashes:
+            sys.exit(1)
+
+
+class TestProcessPool(object):
+    def test_run(self):
+        pool = ProcessPool(2)
+        messages = []
+        failed = pool.run(
+            [ReportingJob(i) for i in range(3)],
+            lambda index, message: messages.append((index, message)),
+        )
+        assert [] == failed
+        assert [(0, 0), (1, 1), (2, 2)] == sorted(messages)
+        assert 3 == pool.job_total
+        assert 0 == pool.restart_count
+
+    def test_crashed_jobs_are_restarted(self):
+        jobs = [ReportingJob("fine"), ReportingJob("flaky", 2), ReportingJob("bad", 5)]
+
+        def on_message(index, message):
+            # Each time the job reports progress, it gets closer to
+            # finishing.
+            if jobs[index].crashes:
+                jobs[index].crashes -= 1
+
+        pool = ProcessPool(3, max_restarts=2)
+        failed = pool.run(jobs, on_message)
+
+        # The flaky job crashed twice but finished on the third try.
+        # The bad job was given up on after it crashed three times.
+        assert 0 == jobs[1].crashes
+        assert [2] == failed == pool.failed
+        assert 4 == pool.restart_count
+
+
 class TestDatabasePool(DatabaseTest):
     def test_workers_are_created_with_sessions(self):
         session_factory = SessionManager.sessionmaker(session=self._db)
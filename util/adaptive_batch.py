@@ -0,0 +1,98 @@
+class AdaptiveBatchSize(object):
+    """Choose the size of each batch of work so that a batch takes about
+    the same amount of time, no matter how big the items are.
+
+    Small batches waste time on commits; large batches mean long
+    transactions that hold locks for too long. After each batch,
+    record() is called with the number of items processed and the time
+    it took, and the next batch is sized to take `target_seconds`.
+    """
+
+    # The size of a batch will never grow or shrink by more than this
+    # factor from one batch to the next, so a single unusually fast or
+    # slow batch won't throw things off.
+    MAX_CHANGE = 2.0
+
+    def __init__(self, size, target_seconds, minimum=1, maximum=None):
+        """Constructor.
+
+        :param size: The size of the first batch.
+        :param target_seconds: How long each batch should take.
+        :param minimum: The smallest batch size allowed.
+        :param maximum: The largest batch size allowed. If this is not
+            provided, batches may grow indefinitely.
+        """
+        self.target_seconds = target_seconds
+        self.minimum = max(minimum or 1, 1)
+        self.maximum = maximum
+        self.size = self.bounded(size)
+
+        # A list of (batch size, items processed, seconds) 3-tuples,
+        # one per batch.
+        self.history = []
+
+    @classmethod
+    def for_object(cls, obj, size):
+        """Create an AdaptiveBatchSize for a Monitor or CoverageProvider
+        from its TARGET_BATCH_SECONDS, MIN_BATCH_SIZE and MAX_BATCH_SIZE
+        constants.
+
+        :return: An AdaptiveBatchSize, or None if the object has no
+            TARGET_BATCH_SECONDS, meaning its batch size is fixed.
+        """
+        target = getattr(obj, "TARGET_BATCH_SECONDS", None)
+        if not target:
+            return None
+        return cls(
+            size,
+            target,
+            minimum=getattr(obj, "MIN_BATCH_SIZE", None),
+            maximum=getattr(obj, "MAX_BATCH_SIZE", None),
+        )
+
+    def bounded(self, size):
+        size = max(int(round(size)), self.minimum)
+        if self.maximum:
+            size = min(size, self.maximum)
+        return size
+
+    def record(self, items, seconds):
+        """Note how long a batch took, and choose the size of the next one.
+
+        :param items: The number of items processed in the batch.
+        :param seconds: The number of seconds it took to process them.
+        :return: The size of the next batch.
+        """
+        self.history.append((self.size, items, seconds))
+        if not items:
+            # An empty batch says nothing about how long an item takes.
+            return self.size
+
+        if seconds > 0:
+            ideal = items * self.target_seconds / seconds
+        else:
+            ideal = self.size * self.MAX_CHANGE
+        ideal = min(ideal, self.size * self.MAX_CHANGE)
+        ideal = max(ideal, self.size / self.MAX_CHANGE)
+        self.size = self.bounded(ideal)
+        return self.size
+
+    @property
+    def achievements(self):
+        """Summarize the batches so far, for Timestamp.achievements."""
+        batches = [x for x in self.history if x[1]]
+        if not batches:
+            return "Batch size: %d." % self.size
+        sizes = [size for size, items, seconds in batches]
+        seconds = [seconds for size, items, seconds in batches]
+        return (
+            "Batch sizes: %d-%d, next %d. Seconds per batch: %.2f-%.2f, average %.2f."
+            % (
+                min(sizes),
+                max(sizes),
+                self.size,
+                min(seconds),
+                max(seconds),
+                sum(seconds) / len(seconds),
+            )
+        )
@@ -0,0 +1,316 @@
+import json
+import logging
+import os
+import re
+import tempfile
+
+from .datetime_helpers import utc_now
+
+
+class JobMetrics(object):
+    """Measurements of a single run of a Monitor or CoverageProvider.
+
+    Timestamp.achievements says how a run went in a way a person can
+    read. This says the same thing in a way that can be graphed and
+    alerted on: the run is exported to every configured MetricsSink
+    when it finishes.
+    """
+
+    MONITOR = "monitor"
+    COVERAGE_PROVIDER = "coverage_provider"
+
+    # The upper bounds, in seconds, of the buckets in the histogram
+    # of batch durations. There's also an implicit +Inf bucket.
+    BATCH_SECONDS_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 600)
+
+    def __init__(self, job_type, service_name, collection_name=None, start=None):
+        self.job_type = job_type
+        self.service_name = service_name
+        self.collection_name = collection_name
+        self.start = start or utc_now()
+        self.finish = None
+
+        self.items_processed = 0
+        self.successes = 0
+        self.transient_failures = 0
+        self.persistent_failures = 0
+        self.failed = False
+
+        # How many items still needed processing, if that's known.
+        self.queue_depth = None
+
+        # How long it had been since the last run finished when this
+        # one started, if there was a last run.
+        self.lag_seconds = None
+
+        # The number of batches that took no longer than each of
+        # BATCH_SECONDS_BUCKETS, plus the total number and duration
+        # of the batches.
+        self.batch_buckets = [0] * len(self.BATCH_SECONDS_BUCKETS)
+        self.batch_count = 0
+        self.batch_seconds = 0.0
+
+        # If SQL statements were profiled (see QueryProfile), how many
+        # were run, how long they took, and how many statement shapes
+        # looked like N+1 patterns.
+        self.sql_statements = None
+        self.sql_seconds = None
+        self.n_plus_one_patterns = None
+
+    @classmethod
+    def for_job(cls, job_type, job, previous_finish=None):
+        """Start measuring a run of a Monitor or CoverageProvider.
+
+        :param previous_finish: When the job's previous run finished,
+            according to its Timestamp.
+        """
+        collection = job.collection
+        metrics = cls(
+            job_type,
+            job.service_name,
+            collection_name=collection.name if collection else None,
+        )
+        if previous_finish:
+            metrics.lag_seconds = (metrics.start - previous_finish).total_seconds()
+        return metrics
+
+    def record_batch(self, items, seconds):
+        """Note that a batch of `items` items took `seconds` seconds."""
+        self.items_processed += items
+        self.batch_count += 1
+        self.batch_seconds += seconds
+        for i, bound in enumerate(self.BATCH_SECONDS_BUCKETS):
+            if seconds <= bound:
+                self.batch_buckets[i] += 1
+
+    def record_queries(self, profile):
+        """Add the statements from a QueryProfile to the totals.
+
+        :param profile: A QueryProfile, or None if profiling is off.
+        """
+        if profile is None:
+            return
+        self.sql_statements = (self.sql_statements or 0) + profile.statements
+        self.sql_seconds = (self.sql_seconds or 0) + profile.seconds
+        self.n_plus_one_patterns = (self.n_plus_one_patterns or 0) + len(
+            profile.n_plus_one
+        )
+
+    @property
+    def duration_seconds(self):
+        if not self.finish:
+            return None
+        return (self.finish - self.start).total_seconds()
+
+    def as_dict(self):
+        return dict(
+            job_type=self.job_type,
+            service=self.service_name,
+            collection=self.collection_name,
+            start=self.start.isoformat(),
+            finish=self.finish.isoformat() if self.finish else None,
+            duration_seconds=self.duration_seconds,
+            failed=self.failed,
+            items_processed=self.items_processed,
+            successes=self.successes,
+            transient_failures=self.transient_failures,
+            persistent_failures=self.persistent_failures,
+            queue_depth=self.queue_depth,
+            lag_seconds=self.lag_seconds,
+            batches=self.batch_count,
+            batch_seconds=self.batch_seconds,
+            sql_statements=self.sql_statements,
+            sql_seconds=self.sql_seconds,
+            n_plus_one_patterns=self.n_plus_one_patterns,
+            batch_seconds_buckets=dict(
+                zip(
+                    [str(x) for x in self.BATCH_SECONDS_BUCKETS],
+                    self.batch_buckets,
+                )
+            ),
+        )
+
+    def export(self, sinks=None):
+        """Finish the measurements and send them to every sink.
+
+        A broken sink is logged, but never stops the job.
+
+        :param sinks: A list of MetricsSinks. By default, the sinks
+            configured through environment variables are used.
+        """
+        if not self.finish:
+            self.finish = utc_now()
+        if sinks is None:
+            sinks = MetricsSink.configured()
+        for sink in sinks:
+            try:
+                sink.export(self)
+            except Exception as e:
+                logging.getLogger(__name__).error(
+                    "Could not export metrics to %r", sink, exc_info=e
+                )
+
+
+class MetricsSink(object):
+    """Somewhere to send JobMetrics."""
+
+    # If this environment variable is set, a Prometheus textfile for
+    # each job is written to the directory it names.
+    TEXTFILE_DIRECTORY_ENVIRONMENT_VARIABLE = "SIMPLIFIED_METRICS_TEXTFILE_DIRECTORY"
+
+    # If this environment variable is set, each job's metrics are
+    # logged as a line of JSON.
+    JSON_LOG_ENVIRONMENT_VARIABLE = "SIMPLIFIED_METRICS_JSON_LOG"
+
+    @classmethod
+    def configured(cls):
+        """The sinks configured through environment variables."""
+        sinks = []
+        directory = os.environ.get(cls.TEXTFILE_DIRECTORY_ENVIRONMENT_VARIABLE)
+        if directory:
+            sinks.append(PrometheusTextfileSink(directory))
+        if os.environ.get(cls.JSON_LOG_ENVIRONMENT_VARIABLE):
+            sinks.append(JSONLogSink())
+        return sinks
+
+    def export(self, metrics):
+        raise NotImplementedError()
+
+
+class JSONLogSink(MetricsSink):
+    """Log each job's metrics as a single line of JSON."""
+
+    def __init__(self, logger=None):
+        self.log = logger or logging.getLogger("job metrics")
+
+    def export(self, metrics):
+        self.log.info(json.dumps(metrics.as_dict(), sort_keys=True))
+
+
+class PrometheusTextfileSink(MetricsSink):
+    """Write each job's metrics to a file in the format read by the
+    Prometheus node exporter's textfile collector.
+
+    Each job (and collection) gets a file of its own, which is
+    replaced after every run.
+    """
+
+    PREFIX = "circulation_job_"
+
+    # (name, help text, JobMetrics attribute)
+    GAUGES = [
+        ("items_processed", "Items processed by the last run.", "items_processed"),
+        ("successes", "Items covered by the last run.", "successes"),
+        (
+            "transient_failures",
+            "Transient failures in the last run.",
+            "transient_failures",
+        ),
+        (
+            "persistent_failures",
+            "Persistent failures in the last run.",
+            "persistent_failures",
+        ),
+        ("queue_depth", "Items that still needed processing.", "queue_depth"),
+        (
+            "lag_seconds",
+            "Seconds between the previous run's finish and the last run's start.",
+            "lag_seconds",
+        ),
+        ("duration_seconds", "How long the last run took.", "duration_seconds"),
+        ("failed", "Whether the last run failed.", "failed"),
+        ("sql_statements", "SQL statements run by the last run.", "sql_statements"),
+        ("sql_seconds", "Time spent running SQL statements.", "sql_seconds"),
+        (
+            "n_plus_one_patterns",
+            "Statement shapes that looked like N+1 patterns.",
+            "n_plus_one_patterns",
+        ),
+    ]
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __repr__(self):
+        return "<PrometheusTextfileSink: %s>" % self.directory
+
+    @classmethod
+    def escape(cls, value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def labels(self, metrics, **extra):
+        labels = [
+            ("type", metrics.job_type),
+            ("service", metrics.service_name),
+        ]
+        if metrics.collection_name:
+            labels.append(("collection", metrics.collection_name))
+        labels.extend(sorted(extra.items()))
+        return "{%s}" % ",".join(
+            '%s="%s"' % (name, self.escape(value)) for name, value in labels
+        )
+
+    def render(self, metrics):
+        """Render JobMetrics in the Prometheus text format."""
+        lines = []
+        labels = self.labels(metrics)
+
+        def metric(name, type, help, samples):
+            name = self.PREFIX + name
+            lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s %s" % (name, type))
+            for suffix, sample_labels, value in samples:
+                lines.append("%s%s%s %s" % (name, suffix, sample_labels, value))
+
+        for name, help, attribute in self.GAUGES:
+            value = getattr(metrics, attribute)
+            if value is None:
+                continue
+            metric(name, "gauge", help, [("", labels, float(value))])
+
+        metric(
+            "last_run_timestamp_seconds",
+            "gauge",
+            "When the last run finished.",
+            [("", labels, metrics.finish.timestamp())],
+        )
+
+        samples = [
+            ("_bucket", self.labels(metrics, le=bound), count)
+            for bound, count in zip(
+                metrics.BATCH_SECONDS_BUCKETS, metrics.batch_buckets
+            )
+        ]
+        samples.append(
+            ("_bucket", self.labels(metrics, le="+Inf"), metrics.batch_count)
+        )
+        samples.append(("_sum", labels, metrics.batch_seconds))
+        samples.append(("_count", labels, metrics.batch_count))
+        metric(
+            "batch_seconds",
+            "histogram",
+            "How long each batch in the last run took.",
+            samples,
+        )
+        return "\n".join(lines) + "\n"
+
+    def filename(self, metrics):
+        name = "%s %s %s" % (
+            metrics.job_type,
+            metrics.service_name,
+            metrics.collection_name or "",
+        )
+        return re.sub(r"[^A-Za-z0-9_]+", "_", name).strip("_").lower() + ".prom"
+
+    def export(self, metrics):
+        # The collector may read the file at any moment, so write it
+        # somewhere else and move it into place.
+        path = os.path.join(self.directory, self.filename(metrics))
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as out:
+                out.write(self.render(metrics))
+            os.replace(temporary, path)
+        except Exception:
+            os.remove(temporary)
+            raise
@@ -0,0 +1,137 @@
+# Helper functions for working through a large JSON document one
+# piece at a time, rather than decoding the whole thing into a single
+# Python object.
+
+import json
+import re
+
+_decoder = json.JSONDecoder()
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# A complete JSON string, including the quotation marks.
+_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+# The characters that matter when skipping over an object or array.
+_STRUCTURE = re.compile(r'["\[\]{}]')
+
+
+def _skip_whitespace(document, index):
+    return _WHITESPACE.match(document, index).end()
+
+
+def _expect(document, index, char):
+    """Make sure the next non-whitespace character is `char`.
+
+    :return: The index just past `char`.
+    """
+    index = _skip_whitespace(document, index)
+    if document[index : index + 1] != char:
+        raise json.JSONDecodeError("Expecting '%s'" % char, document, index)
+    return index + 1
+
+
+def _skip_string(document, index):
+    match = _STRING.match(document, index)
+    if not match:
+        raise json.JSONDecodeError("Unterminated string", document, index)
+    return match.end()
+
+
+def skip_value(document, index=0):
+    """Find the end of the JSON value that starts at `index`, without
+    decoding it.
+
+    :return: The index just past the end of the value.
+    """
+    index = _skip_whitespace(document, index)
+    char = document[index : index + 1]
+    if char == '"':
+        return _skip_string(document, index)
+    if char not in ("{", "["):
+        # A number, true, false or null. These are short enough to
+        # simply decode.
+        value, index = _decoder.raw_decode(document, index)
+        return index
+
+    depth = 0
+    while True:
+        match = _STRUCTURE.search(document, index)
+        if not match:
+            raise json.JSONDecodeError("Unterminated value", document, index)
+        index = match.start()
+        char = match.group()
+        if char == '"':
+            index = _skip_string(document, index)
+            continue
+        if char in ("{", "["):
+            depth += 1
+        else:
+            depth -= 1
+        index += 1
+        if depth == 0:
+            return index
+
+
+def decode_value(document, index=0):
+    """Decode the JSON value that starts at `index`.
+
+    :return: A 2-tuple (value, index just past the end of the value).
+    """
+    return _decoder.raw_decode(document, _skip_whitespace(document, index))
+
+
+def iterate_object(document, index=0):
+    """Iterate over the members of the JSON object that starts at
+    `index`, without decoding their values.
+
+    :yield: A sequence of 3-tuples (key, start, end), where `start` and
+        `end` delimit the member's value within `document`.
+    """
+    index = _skip_whitespace(document, _expect(document, index, "{"))
+    if document[index : index + 1] == "}":
+        return
+    while True:
+        index = _skip_whitespace(document, index)
+        if document[index : index + 1] != '"':
+            raise json.JSONDecodeError(
+                "Expecting property name enclosed in double quotes", document, index
+            )
+        key, index = _decoder.raw_decode(document, index)
+        start = _skip_whitespace(document, _expect(document, index, ":"))
+        end = skip_value(document, start)
+        yield key, start, end
+
+        index = _skip_whitespace(document, end)
+        char = document[index : index + 1]
+        if char == "}":
+            return
+        if char != ",":
+            raise json.JSONDecodeError("Expecting ',' delimiter", document, index)
+        index += 1
+
+
+def iterate_array(document, index=0):
+    """Decode the elements of the JSON array that starts at `index`,
+    one at a time.
+
+    Only one element is decoded at a time, so the memory used is
+    bounded by the size of the largest element rather than the size
+    of the array.
+
+    :yield: A sequence of decoded values.
+    """
+    index = _skip_whitespace(document, _expect(document, index, "["))
+    if document[index : index + 1] == "]":
+        return
+    while True:
+        value, index = decode_value(document, index)
+        yield value
+
+        index = _skip_whitespace(document, index)
+        char = document[index : index + 1]
+        if char == "]":
+            return
+        if char != ",":
+            raise json.JSONDecodeError("Expecting ',' delimiter", document, index)
+        index += 1
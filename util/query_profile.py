@@ -0,0 +1,213 @@
+import contextlib
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryProfile(object):
+    """The SQL statements issued during one unit of work: a web
+    request, or a batch of items handled by a Monitor or
+    CoverageProvider.
+
+    Profiling is opt-in, since it costs a little time per statement.
+    It's turned on by setting the SIMPLIFIED_SQL_PROFILE environment
+    variable. While a profile is running, every statement issued
+    by the thread that started it is counted and timed.
+
+    Statements that differ only in their parameters have the same
+    'shape'. If a unit of work runs more than
+    `n_plus_one_threshold` statements of the same shape, that's
+    probably an N+1 pattern: something is being loaded one row at a
+    time when it could be loaded all at once.
+    """
+
+    ENVIRONMENT_VARIABLE = "SIMPLIFIED_SQL_PROFILE"
+
+    # A unit of work may run this many statements of the same shape
+    # before it looks like an N+1 pattern.
+    N_PLUS_ONE_THRESHOLD = 20
+
+    # Keep track of this many of the slowest statements.
+    SLOWEST = 5
+
+    # The profiles running in each thread. A profile for a batch
+    # may be running inside a profile for the whole job, and a
+    # statement counts toward both.
+    _running = threading.local()
+
+    _installed = False
+
+    PARAMETER = re.compile(r"%\(\w+\)s|%s")
+    STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+    NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+    PARAMETER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+    WHITESPACE = re.compile(r"\s+")
+
+    def __init__(self, name, n_plus_one_threshold=None):
+        self.name = name
+        if n_plus_one_threshold is None:
+            n_plus_one_threshold = self.N_PLUS_ONE_THRESHOLD
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.statements = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+        # A heap of (seconds, statement) for the slowest statements.
+        self._slowest = []
+
+    def __repr__(self):
+        return "<QueryProfile %s: %d statements in %.3f sec>" % (
+            self.name,
+            self.statements,
+            self.seconds,
+        )
+
+    @classmethod
+    def enabled(cls):
+        return bool(os.environ.get(cls.ENVIRONMENT_VARIABLE))
+
+    @classmethod
+    def running(cls):
+        """The profiles running in this thread, outermost first."""
+        if not hasattr(cls._running, "profiles"):
+            cls._running.profiles = []
+        return cls._running.profiles
+
+    @classmethod
+    def install(cls):
+        """Listen for the statements run by every Engine.
+
+        This only needs to happen once per process.
+        """
+        if cls._installed:
+            return
+        event.listen(Engine, "before_cursor_execute", cls._before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", cls._after_cursor_execute)
+        cls._installed = True
+
+    @classmethod
+    def _before_cursor_execute(
+        cls, connection, cursor, statement, parameters, context, executemany
+    ):
+        if context is not None and cls.running():
+            context._query_profile_started_at = time.time()
+
+    @classmethod
+    def _after_cursor_execute(
+        cls, connection, cursor, statement, parameters, context, executemany
+    ):
+        started_at = getattr(context, "_query_profile_started_at", None)
+        if started_at is None:
+            return
+        seconds = time.time() - started_at
+        for profile in cls.running():
+            profile.record(statement, seconds)
+
+    @classmethod
+    def start(cls, name, force=False, **kwargs):
+        """Start profiling the statements run by this thread.
+
+        :param force: Profile even if profiling hasn't been turned on
+            for this process.
+        :return: A QueryProfile, or None if profiling is turned off.
+        """
+        if not force and not cls.enabled():
+            return None
+        cls.install()
+        profile = cls(name, **kwargs)
+        cls.running().append(profile)
+        return profile
+
+    def stop(self, log=None):
+        """Stop profiling and log the results.
+
+        :param log: Log the results here instead of to the default
+            logger. Pass False to not log them at all.
+        """
+        running = self.running()
+        if self in running:
+            running.remove(self)
+        if log is not False:
+            self.report(log or logging.getLogger("sql profile"))
+
+    @classmethod
+    @contextlib.contextmanager
+    def measure(cls, name, force=False, log=None, **kwargs):
+        """Profile the statements run inside a `with` block.
+
+        This yields None if profiling is turned off, so code that
+        uses the profile needs to check for that.
+        """
+        profile = cls.start(name, force=force, **kwargs)
+        try:
+            yield profile
+        finally:
+            if profile:
+                profile.stop(log=log)
+
+    @classmethod
+    def shape(cls, statement):
+        """Reduce a statement to its shape by replacing every literal
+        and parameter with a placeholder.
+
+        A list of parameters is collapsed into a single placeholder, so
+        that `IN` clauses of different lengths have the same shape.
+        """
+        shape = cls.STRING_LITERAL.sub("?", statement)
+        shape = cls.PARAMETER.sub("?", shape)
+        shape = cls.NUMBER_LITERAL.sub("?", shape)
+        shape = cls.PARAMETER_LIST.sub("?", shape)
+        return cls.WHITESPACE.sub(" ", shape).strip()
+
+    def record(self, statement, seconds):
+        self.statements += 1
+        self.seconds += seconds
+        self.shapes[self.shape(statement)] += 1
+        item = (seconds, statement)
+        if len(self._slowest) < self.SLOWEST:
+            heapq.heappush(self._slowest, item)
+        else:
+            heapq.heappushpop(self._slowest, item)
+
+    @property
+    def slowest(self):
+        """The slowest statements, slowest first, as (seconds,
+        statement) 2-tuples.
+        """
+        return sorted(self._slowest, reverse=True)
+
+    @property
+    def n_plus_one(self):
+        """The statement shapes that were run more than
+        `n_plus_one_threshold` times, most common first, as (shape,
+        count) 2-tuples.
+        """
+        return [
+            (shape, count)
+            for shape, count in self.shapes.most_common()
+            if count > self.n_plus_one_threshold
+        ]
+
+    def report(self, log):
+        log.info(
+            "%s: %d SQL statements in %.3f sec.",
+            self.name,
+            self.statements,
+            self.seconds,
+        )
+        for seconds, statement in self.slowest:
+            log.debug("%s: %.3f sec: %s", self.name, seconds, statement)
+        for shape, count in self.n_plus_one:
+            log.warning(
+                "%s: Possible N+1 pattern: %d statements like %s",
+                self.name,
+                count,
+                shape,
+            )
@@ -1,15 +1,14 @@
 import logging
+import multiprocessing
+from collections import Counter
 from contextlib import contextmanager
-from queue import Queue
+from queue import Empty, Queue
 from threading import RLock, Thread, settrace
 
 # Much of the work in this file is based on
 # https://github.com/shazow/workerpool, with
 # great appreciation.
 
-# TODO: Consider supporting multiprocessing as well as
-# (or instead of) multithreading.
-
 
 class Worker(Thread):
     """A Thread that performs jobs"""
@@ -146,6 +145,119 @@ class DatabasePool(Pool):
         return self.worker_factory(self, worker_session)
 
 
+class ProcessPool(object):
+    """Run a fixed list of jobs, each in its own worker process, with
+    at most `size` processes running at once.
+
+    Unlike Pool, the workers aren't bound by the GIL, so this is the
+    one to use for CPU-heavy work. A job is a callable that takes a
+    single argument, `report`, which it can call with a picklable
+    message to send to the parent process. If a worker process dies
+    without finishing its job, the job is started again in a new
+    process, up to `max_restarts` times.
+    """
+
+    log = logging.getLogger(__name__)
+
+    DEFAULT_MAX_RESTARTS = 3
+
+    # How long to wait for a message before checking on the workers.
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, size, max_restarts=None, context=None):
+        self.size = size
+        if max_restarts is None:
+            max_restarts = self.DEFAULT_MAX_RESTARTS
+        self.max_restarts = max_restarts
+        self.context = context or multiprocessing.get_context()
+
+        self.job_total = 0
+        self.restart_count = 0
+
+        # The indexes of jobs from the most recent run that crashed
+        # more than max_restarts times.
+        self.failed = []
+
+    def run(self, jobs, on_message=None):
+        """Run every job to completion.
+
+        :param jobs: A list of jobs.
+        :param on_message: A function to be called in this process with
+            (job index, message) whenever a job reports a message. Since
+            a restarted job is started over from its current state, this
+            function may modify the job to say where it should resume.
+        :return: A list of the indexes of jobs that never finished.
+        """
+        messages = self.context.Queue()
+        waiting = list(range(len(jobs)))
+        running = dict()
+        attempts = Counter()
+        self.failed = []
+        self.job_total += len(jobs)
+
+        def deliver(block):
+            try:
+                index, message = messages.get(block, self.POLL_INTERVAL)
+            except Empty:
+                return False
+            if on_message:
+                on_message(index, message)
+            return True
+
+        while waiting or running:
+            while waiting and len(running) < self.size:
+                index = waiting.pop(0)
+                attempts[index] += 1
+                process = self.context.Process(
+                    target=_run_in_process, args=(jobs[index], index, messages)
+                )
+                process.start()
+                running[index] = process
+
+            deliver(True)
+            for index, process in list(running.items()):
+                if process.is_alive():
+                    continue
+                # Make sure everything the job reported before it
+                # exited has been handled.
+                while deliver(False):
+                    pass
+                process.join()
+                del running[index]
+                if process.exitcode == 0:
+                    continue
+                if attempts[index] <= self.max_restarts:
+                    self.log.warning(
+                        "Job %d exited with code %s; restarting it.",
+                        index,
+                        process.exitcode,
+                    )
+                    self.restart_count += 1
+                    waiting.append(index)
+                else:
+                    self.log.error(
+                        "Job %d exited with code %s %d times; giving up.",
+                        index,
+                        process.exitcode,
+                        attempts[index],
+                    )
+                    self.failed.append(index)
+
+        while deliver(False):
+            pass
+        self.log.info(
+            "%d/%d jobs failed after %d restarts.",
+            len(self.failed),
+            len(jobs),
+            self.restart_count,
+        )
+        return self.failed
+
+
+def _run_in_process(job, index, messages):
+    job(lambda message: messages.put((index, message)))
+
+
 class Job(object):
     """Abstract parent class for a bit o' work that can be run in a Thread.
     For use with Worker.